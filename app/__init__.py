@@ -18,6 +18,10 @@ def create_app():
     # Configuration de base
     app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
     
+    # Mesure des requêtes et des étapes internes (exposées sur /metrics)
+    from app.utils.metrics import init_app as init_metrics
+    init_metrics(app)
+    
     # Enregistrer les routes
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
@@ -127,3 +127,22 @@ def health():
     """
     return {'status': 'ok', 'message': 'Application Flask fonctionnelle'}, 200
 
+
+
+@bp.route('/health/coalescing')
+def health_coalescing():
+    """
+    Compteurs du regroupement des calculs identiques en cours (calculs évités)
+    """
+    from app.utils.coalescing import get_coalescing_stats
+    return get_coalescing_stats(), 200
+
+
+@bp.route('/metrics')
+def metrics():
+    """
+    Métriques au format texte Prometheus (latences par route, étapes internes,
+    caches, données chargées, mémoire du processus)
+    """
+    from app.utils.metrics import CONTENT_TYPE, render_metrics
+    return render_metrics(), 200, {'Content-Type': CONTENT_TYPE}
@@ -2,35 +2,67 @@
 Routes pour l'export des données (CSV et PDF)
 """
 
-from flask import Blueprint, send_file, request, jsonify
+from flask import Blueprint, send_file, request, jsonify, url_for
 import pandas as pd
+import numpy as np
+import importlib.util
 import io
+import itertools
+import os
+import tempfile
 import logging
 from app.utils.data_loader import DataLoader
 from app.utils.cache import get_cached_stats
+from app.utils.coalescing import coalesced
+from app.utils.export_jobs import ExportJobManager, ExportQueueFullError, STATUS_DONE, STATUS_FAILED
+from app.utils.metrics import StageClock, stage, timed_stage
 from script import main
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# Import reportlab avec gestion d'erreur
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# reportlab n'est importé qu'au premier export PDF (import coûteux au démarrage):
+# seule sa présence est vérifiée ici
+REPORTLAB_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+if not REPORTLAB_AVAILABLE:
     logger.warning("reportlab n'est pas installé. Les exports PDF ne seront pas disponibles.")
 
 bp = Blueprint('export', __name__, url_prefix='/export')
 data_loader = DataLoader()
 
+# Libellés des colonnes pour les exports CSV
+COMMUNES_CSV_COLUMNS = {
+    'Commune': 'Commune',
+    'PTOT': 'Population',
+    'green_mobility_index': 'Mobilité Verte (%)',
+    'avg_commute_time': 'Temps Trajet (min)',
+    'velo_percentage': '% Vélo',
+    'voiture_percentage': '% Voiture',
+    'transport_commun_percentage': '% Transport en Commun',
+    'marche_percentage': '% Marche',
+    'deux_roues_percentage': '% Deux-roues',
+    'pas_transport_percentage': '% Sans Transport'
+}
+
+REGIONS_CSV_COLUMNS = {
+    'Région': 'Région',
+    'NBCOM': 'Nombre Communes',
+    'PTOT': 'Population',
+    'green_mobility_index': 'Mobilité Verte (%)',
+    'avg_commute_time': 'Temps Trajet (min)',
+    'velo_percentage': '% Vélo',
+    'voiture_percentage': '% Voiture',
+    'transport_commun_percentage': '% Transport en Commun',
+    'marche_percentage': '% Marche',
+    'deux_roues_percentage': '% Deux-roues',
+    'pas_transport_percentage': '% Sans Transport'
+}
 
+
+@coalesced('prepare_communes_data', version=data_loader.get_data_version, share=pd.DataFrame.copy)
 def prepare_communes_data(region_filter='', department_filter='', age_filter=''):
     """Prépare les données des communes avec indicateurs et filtres"""
+    clock = StageClock('filter')
     try:
         import re
         import pandas as pd
@@ -96,6 +128,7 @@ def prepare_communes_data(region_filter='', department_filter='', age_filter='')
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
         # Calculer les pourcentages par type de transport pour chaque commune
+        clock.switch('aggregate')
         if len(mobility_df) > 0:
             # Définir les catégories de transport
             transport_categories = {
@@ -205,10 +238,14 @@ def prepare_communes_data(region_filter='', department_filter='', age_filter='')
     except Exception as e:
         logger.error(f"Erreur lors de la préparation des données communes: {e}", exc_info=True)
         return pd.DataFrame()
+    finally:
+        clock.stop()
 
 
+@coalesced('prepare_regions_data', version=data_loader.get_data_version, share=pd.DataFrame.copy)
 def prepare_regions_data(age_filter=''):
     """Prépare les données des régions avec indicateurs et filtres"""
+    clock = StageClock('filter')
     try:
         import pandas as pd
         
@@ -241,6 +278,7 @@ def prepare_regions_data(age_filter=''):
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
         # Créer un mapping région -> codes communes
+        clock.switch('aggregate')
         region_commune_map = {}
         if 'REG' in communes_df.columns:
             communes_df_copy = communes_df.copy()
@@ -328,6 +366,8 @@ def prepare_regions_data(age_filter=''):
     except Exception as e:
         logger.error(f"Erreur lors de la préparation des données régions: {e}", exc_info=True)
         return pd.DataFrame()
+    finally:
+        clock.stop()
 
 
 @bp.route('/csv/communes')
@@ -345,22 +385,12 @@ def export_csv_communes():
             return jsonify({'error': 'Aucune donnée disponible'}), 404
         
         # Renommer les colonnes pour l'export
-        df = df.rename(columns={
-            'Commune': 'Commune',
-            'PTOT': 'Population',
-            'green_mobility_index': 'Mobilité Verte (%)',
-            'avg_commute_time': 'Temps Trajet (min)',
-            'velo_percentage': '% Vélo',
-            'voiture_percentage': '% Voiture',
-            'transport_commun_percentage': '% Transport en Commun',
-            'marche_percentage': '% Marche',
-            'deux_roues_percentage': '% Deux-roues',
-            'pas_transport_percentage': '% Sans Transport'
-        })
+        df = df.rename(columns=COMMUNES_CSV_COLUMNS)
         
         # Créer un buffer en mémoire
         output = io.StringIO()
-        df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
+        with stage('serialize'):
+            df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
         output.seek(0)
         
         # Créer un fichier en mémoire
@@ -392,23 +422,12 @@ def export_csv_regions():
             return jsonify({'error': 'Aucune donnée disponible'}), 404
         
         # Renommer les colonnes pour l'export
-        df = df.rename(columns={
-            'Région': 'Région',
-            'NBCOM': 'Nombre Communes',
-            'PTOT': 'Population',
-            'green_mobility_index': 'Mobilité Verte (%)',
-            'avg_commute_time': 'Temps Trajet (min)',
-            'velo_percentage': '% Vélo',
-            'voiture_percentage': '% Voiture',
-            'transport_commun_percentage': '% Transport en Commun',
-            'marche_percentage': '% Marche',
-            'deux_roues_percentage': '% Deux-roues',
-            'pas_transport_percentage': '% Sans Transport'
-        })
+        df = df.rename(columns=REGIONS_CSV_COLUMNS)
         
         # Créer un buffer en mémoire
         output = io.StringIO()
-        df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
+        with stage('serialize'):
+            df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
         output.seek(0)
         
         # Créer un fichier en mémoire
@@ -427,6 +446,376 @@ def export_csv_regions():
         return jsonify({'error': str(e)}), 500
 
 
+# Colonnes des tableaux PDF: (colonne source, en-tête, format)
+PDF_COMMUNES_COLUMNS = [
+    ('Commune', 'Commune', 'text30'),
+    ('PTOT', 'Population', 'int'),
+    ('green_mobility_index', 'Mobilité Verte', 'decimal'),
+    ('avg_commute_time', 'Temps Trajet', 'decimal'),
+    ('velo_percentage', '% Vélo', 'percent'),
+    ('voiture_percentage', '% Voiture', 'percent'),
+    ('transport_commun_percentage', '% TC', 'percent'),
+    ('marche_percentage', '% Marche', 'percent'),
+    ('deux_roues_percentage', '% 2-roues', 'percent'),
+    ('pas_transport_percentage', '% Sans Transport', 'percent'),
+]
+
+PDF_REGIONS_COLUMNS = [
+    ('Région', 'Région', 'text25'),
+    ('NBCOM', 'Nb Communes', 'int'),
+    ('PTOT', 'Population', 'int'),
+    ('green_mobility_index', 'Mobilité Verte', 'decimal'),
+    ('avg_commute_time', 'Temps Trajet', 'decimal'),
+    ('velo_percentage', '% Vélo', 'percent'),
+    ('voiture_percentage', '% Voiture', 'percent'),
+    ('transport_commun_percentage', '% TC', 'percent'),
+    ('marche_percentage', '% Marche', 'percent'),
+    ('deux_roues_percentage', '% 2-roues', 'percent'),
+    ('pas_transport_percentage', '% Sans Transport', 'percent'),
+]
+
+# Nombre de communes affichées dans le rapport court
+PDF_PREVIEW_ROWS = 50
+
+# Nombre de lignes par tableau dans le rapport complet (environ une page A4).
+# Découper en tableaux d'une page garde une mise en page linéaire: un seul
+# Table de plusieurs milliers de lignes est re-mesuré à chaque coupure de page.
+PDF_ROWS_PER_TABLE = 45
+
+# Lignes formatées à la fois pour le calcul des largeurs de colonnes
+PDF_WIDTH_CHUNK_ROWS = 2000
+
+# Polices des tableaux PDF (en-tête / cellules) et marge intérieure des cellules
+PDF_HEADER_FONT = ('Helvetica-Bold', 8)
+PDF_BODY_FONT = ('Helvetica', 7)
+PDF_CELL_PADDING = 6
+
+
+def _format_pdf_column(df, column, kind):
+    """Formate une colonne entière pour le PDF (vectorisé, 'N/A' si manquant)"""
+    if column not in df.columns:
+        return ['N/A'] * len(df)
+    
+    if kind.startswith('text'):
+        max_len = int(kind[4:] or 0) or None
+        return df[column].fillna('N/A').astype(str).str.slice(0, max_len).tolist()
+    
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    if kind == 'int':
+        text = np.char.mod('%d', filled.astype(np.int64))
+    elif kind == 'percent':
+        text = np.char.mod('%.1f%%', filled)
+    else:
+        text = np.char.mod('%.1f', filled)
+    return np.where(missing, 'N/A', text).tolist()
+
+
+def format_pdf_rows(df, columns_spec):
+    """
+    Construit les lignes d'un tableau PDF colonne par colonne.
+
+    Returns:
+        Tuple (en-têtes, lignes) où chaque ligne est une liste de chaînes
+    """
+    header = [label for _, label, _ in columns_spec]
+    formatted = [_format_pdf_column(df, column, kind) for column, _, kind in columns_spec]
+    rows = [list(row) for row in zip(*formatted)]
+    return header, rows
+
+
+def iter_pdf_rows(df, columns_spec, chunk_rows):
+    """Lignes formatées par blocs de chunk_rows: seul le bloc courant est en mémoire"""
+    for start in range(0, len(df), chunk_rows):
+        yield format_pdf_rows(df.iloc[start:start + chunk_rows], columns_spec)[1]
+
+
+def _pdf_styles():
+    """Styles communs aux rapports PDF"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor('#1a1a1a'),
+        spaceAfter=30
+    )
+    return styles, title_style
+
+
+def _pdf_table_style():
+    """Style commun aux tableaux des rapports PDF"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), PDF_BODY_FONT[0]),
+        ('FONTSIZE', (0, 1), (-1, -1), PDF_BODY_FONT[1]),
+        ('LEFTPADDING', (0, 0), (-1, -1), PDF_CELL_PADDING),
+        ('RIGHTPADDING', (0, 0), (-1, -1), PDF_CELL_PADDING),
+    ])
+
+
+def _pdf_column_widths(header, row_chunks, available_width):
+    """
+    Largeurs des colonnes, calculées sur toutes les lignes (parcourues par blocs):
+    chaque colonne reçoit au moins sa cellule la plus large et le mot le plus
+    long de son en-tête. L'espace restant jusqu'à available_width évite les
+    retours à la ligne des en-têtes, en commençant par les plus courts à compléter.
+    """
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    padding = 2 * PDF_CELL_PADDING
+    body = [0.0] * len(header)
+    for rows in row_chunks:
+        for i in range(len(header)):
+            cells = {row[i] for row in rows}
+            body[i] = max(body[i], max((stringWidth(text, *PDF_BODY_FONT) for text in cells), default=0))
+
+    widths, header_widths = [], []
+    for i, label in enumerate(header):
+        # +1 pt: un mot tout juste à la largeur de la colonne serait coupé par Paragraph
+        word = max((stringWidth(w, *PDF_HEADER_FONT) for w in label.split()), default=0) + 1
+        widths.append(max(body[i], word) + padding)
+        header_widths.append(stringWidth(label, *PDF_HEADER_FONT) + padding)
+
+    spare = available_width - sum(widths)
+    for i in sorted(range(len(header)), key=lambda i: header_widths[i] - widths[i]):
+        extra = min(header_widths[i] - widths[i], spare)
+        if extra > 0:
+            widths[i] += extra
+            spare -= extra
+    return widths
+
+
+def _pdf_header_cells(header):
+    """En-têtes en paragraphes, pour revenir à la ligne dans une colonne étroite"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import Paragraph
+    style = ParagraphStyle('TableHeader', fontName=PDF_HEADER_FONT[0], fontSize=PDF_HEADER_FONT[1],
+                           leading=PDF_HEADER_FONT[1] + 1, alignment=TA_CENTER, textColor=colors.whitesmoke)
+    return [Paragraph(label, style) for label in header]
+
+
+def _paginated_tables(df, columns_spec, available_width, rows_per_table=PDF_ROWS_PER_TABLE):
+    """
+    Génère les tableaux d'environ une page, chacun avec son en-tête (repeatRows
+    répète aussi l'en-tête si un tableau est coupé en bas de page). Tous les
+    tableaux partagent les mêmes largeurs de colonnes; les lignes de chaque
+    tableau ne sont formatées qu'au moment où il est demandé.
+    """
+    from reportlab.platypus import Table
+    style = _pdf_table_style()
+    header = [label for _, label, _ in columns_spec]
+    col_widths = _pdf_column_widths(header, iter_pdf_rows(df, columns_spec, PDF_WIDTH_CHUNK_ROWS),
+                                    available_width)
+    header_cells = _pdf_header_cells(header)
+    for rows in iter_pdf_rows(df, columns_spec, rows_per_table) if len(df) else [[]]:
+        table = Table([header_cells] + rows, colWidths=col_widths, repeatRows=1)
+        table.setStyle(style)
+        yield table
+
+
+def _pdf_content_width():
+    """Largeur du contenu d'une page A4 (marges d'un pouce, comme SimpleDocTemplate)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    return A4[0] - 2 * inch
+
+
+def _pdf_page_frame():
+    """Cadre du contenu d'une page A4"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Frame
+    return Frame(inch, inch, _pdf_content_width(), A4[1] - 2 * inch)
+
+
+def write_pdf_pages(output, flowables):
+    """
+    Écrit les éléments page par page sur un canvas: chaque page est remplie
+    avec les éléments demandés au générateur flowables (coupés si besoin),
+    dessinée puis fermée (showPage) avant de demander les suivants.
+
+    Seuls les éléments de la page en cours (tableaux, lignes formatées) sont
+    en mémoire. Une page terminée n'est plus que son flux de dessin (~19 Ko
+    pour 45 communes), gardé par ReportLab jusqu'à l'écriture finale (save).
+
+    Raises:
+        LayoutError: Élément plus grand qu'une page et impossible à couper
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.platypus.doctemplate import LayoutError
+
+    canvas = Canvas(output, pagesize=A4, pageCompression=1)
+    flowables = iter(flowables)
+    pending = []
+    exhausted = False
+    while pending or not exhausted:
+        frame = _pdf_page_frame()
+        empty = True
+        while True:
+            if not pending:
+                flowable = next(flowables, None)
+                if flowable is None:
+                    exhausted = True
+                    break
+                pending.append(flowable)
+            if frame.add(pending[0], canvas, trySplit=0):
+                del pending[0]
+                empty = False
+                continue
+            # Coupure (tableaux): la première partie sur cette page, le reste ensuite
+            parts = frame.split(pending[0], canvas)
+            if len(parts) > 1 and frame.add(parts[0], canvas, trySplit=0):
+                pending[0:1] = parts[1:]
+                empty = False
+            elif empty:
+                raise LayoutError(f"Élément trop grand pour une page: {pending[0].identity(30)}")
+            break
+        if not empty:
+            canvas.showPage()
+    canvas.save()
+
+
+@timed_stage('render')
+def build_communes_pdf(df, output, region_filter='', department_filter='', age_filter='',
+                       progress=None, full=False, stats=None, title=None):
+    """
+    Construit le rapport PDF des communes.
+
+    Args:
+        df: DataFrame retourné par prepare_communes_data
+        output: Chemin de fichier ou buffer binaire de sortie
+        progress: Callback optionnel progress(fraction, message)
+        full: Si True, toutes les communes sont incluses (tableaux paginés),
+              sinon seules les PDF_PREVIEW_ROWS premières
+        stats: Statistiques globales déjà calculées (sinon lues depuis le cache)
+        title: Titre du rapport (optionnel)
+
+    Budget: le rapport complet d'une grande région (~4 000 communes, ~90 pages)
+    doit se construire en moins de 5 secondes.
+
+    Les pages sont écrites au fur et à mesure (write_pdf_pages): les lignes ne
+    sont formatées que page par page et seuls les éléments de la page en cours
+    sont en mémoire, quel que soit le nombre de communes (pic de 4 Mo
+    d'allocations Python pour 4 000 communes, dont les flux des pages déjà
+    dessinées).
+    """
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer
+
+    elements = []
+    styles, title_style = _pdf_styles()
+    
+    # Titre
+    elements.append(Paragraph(title or "Rapport - Indicateurs de Mobilité par Commune", title_style))
+    elements.append(Spacer(1, 0.2*inch))
+    
+    # Informations générales avec filtres
+    if stats is None:
+        stats = get_cached_stats(main)
+    filter_info = []
+    if region_filter:
+        filter_info.append(f"Région: {region_filter}")
+    if department_filter:
+        filter_info.append(f"Département: {department_filter}")
+    if age_filter:
+        filter_info.append(f"Tranche d'âge: {age_filter}")
+    
+    info_text = f"""
+    <b>Date du rapport:</b> {datetime.now().strftime("%d/%m/%Y %H:%M")}<br/>
+    <b>Nombre de communes:</b> {len(df)}<br/>
+    """
+    if filter_info:
+        info_text += f"<b>Filtres appliqués:</b> {', '.join(filter_info)}<br/>"
+    info_text += f"""
+    <b>Taux moyen d'utilisation du vélo:</b> {stats.get('pourcentage_velo', 0):.2f}%<br/>
+    <b>Taux moyen d'utilisation des transports en commun:</b> {stats.get('pourcentage_transport_commun', 0):.2f}%
+    """
+    elements.append(Paragraph(info_text, styles['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Tableaux générés au fil des pages
+    df_display = df if full else df.head(PDF_PREVIEW_ROWS)
+    rows_per_table = PDF_ROWS_PER_TABLE if full else max(len(df_display), 1)
+    tables = _paginated_tables(df_display, PDF_COMMUNES_COLUMNS, _pdf_content_width(), rows_per_table)
+    
+    footer = []
+    if not full and len(df) > PDF_PREVIEW_ROWS:
+        footer.append(Spacer(1, 0.2*inch))
+        footer.append(Paragraph(f"<i>Note: Seules les {PDF_PREVIEW_ROWS} premières communes sont affichées. Total: {len(df)} communes. "
+                                f"Utilisez le rapport complet (full=1) pour toutes les afficher.</i>", styles['Normal']))
+    
+    if progress:
+        progress(0.5, 'Mise en page du PDF')
+    
+    # Construire le PDF page par page
+    write_pdf_pages(output, itertools.chain(elements, tables, footer))
+
+
+@timed_stage('render')
+def build_regions_pdf(df, output, age_filter='', progress=None, stats=None):
+    """
+    Construit le rapport PDF des régions.
+
+    Args:
+        df: DataFrame retourné par prepare_regions_data
+        output: Chemin de fichier ou buffer binaire de sortie
+        progress: Callback optionnel progress(fraction, message)
+        stats: Statistiques globales déjà calculées (sinon lues depuis le cache)
+    """
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer
+
+    elements = []
+    styles, title_style = _pdf_styles()
+    
+    # Titre
+    elements.append(Paragraph("Rapport - Indicateurs de Mobilité par Région", title_style))
+    elements.append(Spacer(1, 0.2*inch))
+    
+    # Informations générales avec filtres
+    if stats is None:
+        stats = get_cached_stats(main)
+    filter_info = []
+    if age_filter:
+        filter_info.append(f"Tranche d'âge: {age_filter}")
+    
+    info_text = f"""
+    <b>Date du rapport:</b> {datetime.now().strftime("%d/%m/%Y %H:%M")}<br/>
+    <b>Nombre de régions:</b> {len(df)}<br/>
+    """
+    if filter_info:
+        info_text += f"<b>Filtres appliqués:</b> {', '.join(filter_info)}<br/>"
+    info_text += f"""
+    <b>Taux moyen d'utilisation du vélo:</b> {stats.get('pourcentage_velo', 0):.2f}%<br/>
+    <b>Taux moyen d'utilisation des transports en commun:</b> {stats.get('pourcentage_transport_commun', 0):.2f}%
+    """
+    elements.append(Paragraph(info_text, styles['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Créer le tableau
+    tables = _paginated_tables(df, PDF_REGIONS_COLUMNS, _pdf_content_width(), max(len(df), 1))
+    
+    if progress:
+        progress(0.5, 'Mise en page du PDF')
+    
+    # Construire le PDF
+    write_pdf_pages(output, itertools.chain(elements, tables))
+
+
 @bp.route('/pdf/communes')
 def export_pdf_communes():
     """Export des données communes en PDF avec filtres"""
@@ -437,113 +826,27 @@ def export_pdf_communes():
         region_filter = request.args.get('region', '')
         department_filter = request.args.get('department', '')
         age_filter = request.args.get('age', '')
+        full_report = request.args.get('full', '') in ('1', 'true', 'yes')
         
         df = prepare_communes_data(region_filter, department_filter, age_filter)
         
         if df.empty:
             return jsonify({'error': 'Aucune donnée disponible'}), 404
         
-        # Créer un buffer en mémoire pour le PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1a1a1a'),
-            spaceAfter=30
-        )
-        
-        # Titre
-        elements.append(Paragraph("Rapport - Indicateurs de Mobilité par Commune", title_style))
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Informations générales avec filtres
-        stats = main()
-        filter_info = []
-        if region_filter:
-            filter_info.append(f"Région: {region_filter}")
-        if department_filter:
-            filter_info.append(f"Département: {department_filter}")
-        if age_filter:
-            filter_info.append(f"Tranche d'âge: {age_filter}")
-        
-        info_text = f"""
-        <b>Date du rapport:</b> {datetime.now().strftime("%d/%m/%Y %H:%M")}<br/>
-        <b>Nombre de communes:</b> {len(df)}<br/>
-        """
-        if filter_info:
-            info_text += f"<b>Filtres appliqués:</b> {', '.join(filter_info)}<br/>"
-        info_text += f"""
-        <b>Taux moyen d'utilisation du vélo:</b> {stats.get('pourcentage_velo', 0):.2f}%<br/>
-        <b>Taux moyen d'utilisation des transports en commun:</b> {stats.get('pourcentage_transport_commun', 0):.2f}%
-        """
-        elements.append(Paragraph(info_text, styles['Normal']))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Préparer les données pour le tableau (limiter à 50 lignes)
-        df_display = df.head(50).copy()
-        df_display = df_display.rename(columns={
-            'Commune': 'Commune',
-            'PTOT': 'Population',
-            'green_mobility_index': 'Mobilité Verte',
-            'avg_commute_time': 'Temps Trajet',
-            'velo_percentage': '% Vélo',
-            'voiture_percentage': '% Voiture',
-            'transport_commun_percentage': '% TC',
-            'marche_percentage': '% Marche',
-            'deux_roues_percentage': '% 2-roues',
-            'pas_transport_percentage': '% Sans Transport'
-        })
-        
-        # Créer le tableau
-        data = [df_display.columns.tolist()]
-        for _, row in df_display.iterrows():
-            data.append([
-                str(row.get('Commune', 'N/A'))[:30],  # Limiter la longueur
-                str(int(row.get('Population', 0))) if pd.notna(row.get('Population')) else 'N/A',
-                f"{row.get('Mobilité Verte', 0):.1f}" if pd.notna(row.get('Mobilité Verte')) else 'N/A',
-                f"{row.get('Temps Trajet', 0):.1f}" if pd.notna(row.get('Temps Trajet')) else 'N/A',
-                f"{row.get('% Vélo', 0):.1f}%" if pd.notna(row.get('% Vélo')) else 'N/A',
-                f"{row.get('% Voiture', 0):.1f}%" if pd.notna(row.get('% Voiture')) else 'N/A',
-                f"{row.get('% TC', 0):.1f}%" if pd.notna(row.get('% TC')) else 'N/A',
-                f"{row.get('% Marche', 0):.1f}%" if pd.notna(row.get('% Marche')) else 'N/A',
-                f"{row.get('% 2-roues', 0):.1f}%" if pd.notna(row.get('% 2-roues')) else 'N/A',
-                f"{row.get('% Sans Transport', 0):.1f}%" if pd.notna(row.get('% Sans Transport')) else 'N/A'
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-        ]))
-        
-        elements.append(table)
-        
-        if len(df) > 50:
-            elements.append(Spacer(1, 0.2*inch))
-            elements.append(Paragraph(f"<i>Note: Seules les 50 premières communes sont affichées. Total: {len(df)} communes.</i>", styles['Normal']))
-        
-        # Construire le PDF
-        doc.build(elements)
-        buffer.seek(0)
+        # Le rapport complet est écrit dans un fichier temporaire plutôt qu'en mémoire
+        if full_report:
+            output = tempfile.TemporaryFile()
+        else:
+            output = io.BytesIO()
+        build_communes_pdf(df, output, region_filter, department_filter, age_filter, full=full_report)
+        output.seek(0)
         
+        suffix = '_complet' if full_report else ''
         return send_file(
-            buffer,
+            output,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'rapport_communes_mobilite_{datetime.now().strftime("%Y%m%d")}.pdf'
+            download_name=f'rapport_communes_mobilite{suffix}_{datetime.now().strftime("%Y%m%d")}.pdf'
         )
     except Exception as e:
         logger.error(f"Erreur lors de l'export PDF communes: {e}", exc_info=True)
@@ -566,92 +869,7 @@ def export_pdf_regions():
         
         # Créer un buffer en mémoire pour le PDF
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1a1a1a'),
-            spaceAfter=30
-        )
-        
-        # Titre
-        elements.append(Paragraph("Rapport - Indicateurs de Mobilité par Région", title_style))
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Informations générales avec filtres
-        stats = main()
-        filter_info = []
-        if age_filter:
-            filter_info.append(f"Tranche d'âge: {age_filter}")
-        
-        info_text = f"""
-        <b>Date du rapport:</b> {datetime.now().strftime("%d/%m/%Y %H:%M")}<br/>
-        <b>Nombre de régions:</b> {len(df)}<br/>
-        """
-        if filter_info:
-            info_text += f"<b>Filtres appliqués:</b> {', '.join(filter_info)}<br/>"
-        info_text += f"""
-        <b>Taux moyen d'utilisation du vélo:</b> {stats.get('pourcentage_velo', 0):.2f}%<br/>
-        <b>Taux moyen d'utilisation des transports en commun:</b> {stats.get('pourcentage_transport_commun', 0):.2f}%
-        """
-        elements.append(Paragraph(info_text, styles['Normal']))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Préparer les données pour le tableau
-        df_display = df.copy()
-        df_display = df_display.rename(columns={
-            'Région': 'Région',
-            'NBCOM': 'Nb Communes',
-            'PTOT': 'Population',
-            'green_mobility_index': 'Mobilité Verte',
-            'avg_commute_time': 'Temps Trajet',
-            'velo_percentage': '% Vélo',
-            'voiture_percentage': '% Voiture',
-            'transport_commun_percentage': '% TC',
-            'marche_percentage': '% Marche',
-            'deux_roues_percentage': '% 2-roues',
-            'pas_transport_percentage': '% Sans Transport'
-        })
-        
-        # Créer le tableau
-        data = [df_display.columns.tolist()]
-        for _, row in df_display.iterrows():
-            data.append([
-                str(row.get('Région', 'N/A'))[:25],
-                str(int(row.get('Nb Communes', 0))) if pd.notna(row.get('Nb Communes')) else 'N/A',
-                str(int(row.get('Population', 0))) if pd.notna(row.get('Population')) else 'N/A',
-                f"{row.get('Mobilité Verte', 0):.1f}" if pd.notna(row.get('Mobilité Verte')) else 'N/A',
-                f"{row.get('Temps Trajet', 0):.1f}" if pd.notna(row.get('Temps Trajet')) else 'N/A',
-                f"{row.get('% Vélo', 0):.1f}%" if pd.notna(row.get('% Vélo')) else 'N/A',
-                f"{row.get('% Voiture', 0):.1f}%" if pd.notna(row.get('% Voiture')) else 'N/A',
-                f"{row.get('% TC', 0):.1f}%" if pd.notna(row.get('% TC')) else 'N/A',
-                f"{row.get('% Marche', 0):.1f}%" if pd.notna(row.get('% Marche')) else 'N/A',
-                f"{row.get('% 2-roues', 0):.1f}%" if pd.notna(row.get('% 2-roues')) else 'N/A',
-                f"{row.get('% Sans Transport', 0):.1f}%" if pd.notna(row.get('% Sans Transport')) else 'N/A'
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-        ]))
-        
-        elements.append(table)
-        
-        # Construire le PDF
-        doc.build(elements)
+        build_regions_pdf(df, buffer, age_filter)
         buffer.seek(0)
         
         return send_file(
@@ -663,3 +881,130 @@ def export_pdf_regions():
     except Exception as e:
         logger.error(f"Erreur lors de l'export PDF régions: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+
+# ---------------------------------------------------------------------------
+# Exports asynchrones
+# ---------------------------------------------------------------------------
+
+def _job_pdf_communes(params, output_path, job):
+    """Builder du job d'export PDF des communes"""
+    job.set_progress(0.1, 'Préparation des données')
+    region_filter = params.get('region', '')
+    department_filter = params.get('department', '')
+    age_filter = params.get('age', '')
+    df = prepare_communes_data(region_filter, department_filter, age_filter)
+    if df.empty:
+        raise ValueError('Aucune donnée disponible')
+    job.set_progress(0.3, 'Construction du rapport')
+    full_report = params.get('full', '') in ('1', 'true', 'yes')
+    build_communes_pdf(df, output_path, region_filter, department_filter, age_filter,
+                       progress=job.set_progress, full=full_report)
+
+
+def _job_pdf_regions(params, output_path, job):
+    """Builder du job d'export PDF des régions"""
+    job.set_progress(0.1, 'Préparation des données')
+    age_filter = params.get('age', '')
+    df = prepare_regions_data(age_filter)
+    if df.empty:
+        raise ValueError('Aucune donnée disponible')
+    job.set_progress(0.3, 'Construction du rapport')
+    build_regions_pdf(df, output_path, age_filter, progress=job.set_progress)
+
+
+def _job_csv_communes(params, output_path, job):
+    """Builder du job d'export CSV des communes"""
+    job.set_progress(0.1, 'Préparation des données')
+    df = prepare_communes_data(params.get('region', ''), params.get('department', ''), params.get('age', ''))
+    if df.empty:
+        raise ValueError('Aucune donnée disponible')
+    job.set_progress(0.7, 'Écriture du CSV')
+    with stage('serialize'):
+        df.rename(columns=COMMUNES_CSV_COLUMNS).to_csv(output_path, index=False, sep=';', encoding='utf-8-sig')
+
+
+def _job_csv_regions(params, output_path, job):
+    """Builder du job d'export CSV des régions"""
+    job.set_progress(0.1, 'Préparation des données')
+    df = prepare_regions_data(params.get('age', ''))
+    if df.empty:
+        raise ValueError('Aucune donnée disponible')
+    job.set_progress(0.7, 'Écriture du CSV')
+    with stage('serialize'):
+        df.rename(columns=REGIONS_CSV_COLUMNS).to_csv(output_path, index=False, sep=';', encoding='utf-8-sig')
+
+
+export_jobs = ExportJobManager(
+    output_dir=data_loader.base_path / 'data' / 'processed' / 'exports',
+    max_workers=int(os.environ.get('EXPORT_MAX_WORKERS', 2)),
+    max_pending=int(os.environ.get('EXPORT_MAX_PENDING', 20)),
+)
+export_jobs.register('csv_communes', _job_csv_communes, 'csv', 'text/csv', 'communes_mobilite')
+export_jobs.register('csv_regions', _job_csv_regions, 'csv', 'text/csv', 'regions_mobilite')
+if REPORTLAB_AVAILABLE:
+    export_jobs.register('pdf_communes', _job_pdf_communes, 'pdf', 'application/pdf', 'rapport_communes_mobilite')
+    export_jobs.register('pdf_regions', _job_pdf_regions, 'pdf', 'application/pdf', 'rapport_regions_mobilite')
+
+
+def _job_response(job):
+    """Réponse JSON d'un job avec les URLs de suivi"""
+    payload = job.to_dict()
+    payload['status_url'] = url_for('export.export_job_status', job_id=job.id)
+    payload['download_url'] = url_for('export.export_job_download', job_id=job.id)
+    return payload
+
+
+@bp.route('/jobs', methods=['POST'])
+def export_job_submit():
+    """
+    Soumet un export asynchrone.
+    Paramètres (JSON ou URL): type (pdf_communes, pdf_regions, csv_communes, csv_regions),
+    region, department, age, full (rapport PDF complet des communes)
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        params = {**request.args.to_dict(), **payload}
+        kind = params.pop('type', '')
+        
+        if kind not in export_jobs.kinds:
+            return jsonify({'error': f"Type d'export invalide: {kind}", 'types': export_jobs.kinds}), 400
+        
+        allowed = ('region', 'department', 'full') if kind.endswith('communes') else ()
+        params = {k: v for k, v in params.items() if k in allowed + ('age',)}
+        
+        job, created = export_jobs.submit(kind, params)
+        return jsonify({**_job_response(job), 'deduplicated': not created}), 202 if created else 200
+    except ExportQueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        logger.error(f"Erreur lors de la soumission d'un export: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/jobs/<job_id>')
+def export_job_status(job_id):
+    """Retourne l'état et la progression d'un export asynchrone"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} introuvable'}), 404
+    return jsonify(_job_response(job))
+
+
+@bp.route('/jobs/<job_id>/download')
+def export_job_download(job_id):
+    """Télécharge le fichier produit par un export asynchrone"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} introuvable'}), 404
+    if job.status == STATUS_FAILED:
+        return jsonify({'error': job.error}), 500
+    if job.status != STATUS_DONE or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({**_job_response(job), 'error': "L'export n'est pas encore prêt"}), 409
+    
+    return send_file(
+        job.file_path,
+        mimetype=job.mimetype,
+        as_attachment=True,
+        download_name=job.download_name
+    )
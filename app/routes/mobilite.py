@@ -7,6 +7,7 @@ import logging
 import pandas as pd
 from app.utils.data_loader import DataLoader
 from app.utils.cache import get_cached_stats
+from app.utils.metrics import StageClock
 from script import main
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,30 @@ bp = Blueprint('mobilite', __name__, url_prefix='/mobilite')
 # Initialiser le chargeur de données
 data_loader = DataLoader()
 
+# Nombre maximum de communes par requête de l'API batch
+MAX_BATCH_CODES = 50
+
+# Catégories de transport (libellés TRANS du fichier de mobilité)
+TRANSPORT_CATEGORIES = {
+    'velo': ['Vélo (y compris à assistance électrique)'],
+    'voiture': ['Voiture, camion, fourgonnette'],
+    'transport_commun': ['Transports en commun'],
+    'marche': ['Marche à pied (ou rollers, patinette)'],
+    'deux_roues': ['Deux-roues motorisé'],
+    'pas_transport': ['Pas de transport']
+}
+
+
+def get_population_adjustment_factor(age_filter: str) -> float:
+    """Part approximative de la population correspondant à la tranche d'âge"""
+    if age_filter in ['0-18', '19-35']:
+        return 0.28
+    if age_filter == '36-50':
+        return 0.32
+    if age_filter in ['51-65', '65+']:
+        return 0.22
+    return 1.0
+
 
 @bp.route('/communes')
 def communes():
@@ -62,6 +87,7 @@ def api_communes():
     API endpoint pour charger les communes avec pagination et filtres
     Calcule les pourcentages réels par type de transport pour chaque commune
     """
+    clock = StageClock('filter')
     try:
         import re
         import pandas as pd
@@ -130,24 +156,15 @@ def api_communes():
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
         # Calculer les pourcentages par type de transport pour chaque commune
+        clock.switch('aggregate')
         if len(mobility_df) > 0:
-            # Définir les catégories de transport
-            transport_categories = {
-                'velo': ['Vélo (y compris à assistance électrique)'],
-                'voiture': ['Voiture, camion, fourgonnette'],
-                'transport_commun': ['Transports en commun'],
-                'marche': ['Marche à pied (ou rollers, patinette)'],
-                'deux_roues': ['Deux-roues motorisé'],
-                'pas_transport': ['Pas de transport']
-            }
-            
             # Calculer la population totale par commune
             commune_pop = mobility_df.groupby('COMMUNE_CODE')['IPONDI'].sum().reset_index()
             commune_pop.columns = ['COMMUNE_CODE', 'total_pop']
             
             # Calculer les pourcentages pour chaque type de transport
             transport_stats = []
-            for transport_type, transport_values in transport_categories.items():
+            for transport_type, transport_values in TRANSPORT_CATEGORIES.items():
                 transport_df = mobility_df[mobility_df['TRANS'].isin(transport_values)]
                 if len(transport_df) > 0:
                     transport_pop = transport_df.groupby('COMMUNE_CODE')['IPONDI'].sum().reset_index()
@@ -160,7 +177,7 @@ def api_communes():
                 result_df = result_df.merge(stat_df, on='COMMUNE_CODE', how='left')
             
             # Calculer les pourcentages
-            for transport_type in transport_categories.keys():
+            for transport_type in TRANSPORT_CATEGORIES.keys():
                 pop_col = f'{transport_type}_pop'
                 if pop_col in result_df.columns:
                     result_df[f'{transport_type}_percentage'] = (result_df[pop_col] / result_df['total_pop'] * 100).fillna(0).round(1)
@@ -170,11 +187,11 @@ def api_communes():
             # Joindre avec les données des communes
             communes_df = communes_df.copy()
             communes_df['COMMUNE_CODE'] = communes_df.get('COM', communes_df.get('CODCOM', '')).astype(str).str.zfill(5)
-            communes_df = communes_df.merge(result_df[['COMMUNE_CODE'] + [f'{t}_percentage' for t in transport_categories.keys()]], 
+            communes_df = communes_df.merge(result_df[['COMMUNE_CODE'] + [f'{t}_percentage' for t in TRANSPORT_CATEGORIES.keys()]], 
                                             on='COMMUNE_CODE', how='left')
             
             # Remplir les valeurs manquantes par 0
-            for transport_type in transport_categories.keys():
+            for transport_type in TRANSPORT_CATEGORIES.keys():
                 col = f'{transport_type}_percentage'
                 if col not in communes_df.columns:
                     communes_df[col] = 0.0
@@ -243,6 +260,8 @@ def api_communes():
     except Exception as e:
         logger.error(f"Erreur API communes: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+    finally:
+        clock.stop()
 
 
 @bp.route('/api/communes/<code>')
@@ -295,16 +314,12 @@ def api_commune_detail(code):
         # Obtenir le code commune pour filtrer les données de mobilité
         commune_code = str(commune_data.get('COM', commune_data.get('CODCOM', ''))).zfill(5)
         
-        # Charger les données de mobilité
-        mobility_df = data_loader.load_mobility_data()
+        # Charger les données de mobilité (codes communes déjà extraits, en cache)
+        mobility_df = data_loader.load_mobility_data_with_codes()
         
         if mobility_df.empty:
             return jsonify({'error': 'Aucune donnée de mobilité disponible'}), 404
         
-        # Extraire le code commune depuis la colonne COMMUNE
-        mobility_df['COMMUNE_CODE'] = mobility_df['COMMUNE'].astype(str).str.extract(r'\((\d+)\)', expand=False)
-        mobility_df['COMMUNE_CODE'] = mobility_df['COMMUNE_CODE'].astype(str).str.zfill(5)
-        
         # Filtrer par code commune
         mobility_df = mobility_df[mobility_df['COMMUNE_CODE'] == commune_code]
         
@@ -314,34 +329,17 @@ def api_commune_detail(code):
             if age_values:
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
-        # Calculer les pourcentages par type de transport
-        transport_categories = {
-            'velo': ['Vélo (y compris à assistance électrique)'],
-            'voiture': ['Voiture, camion, fourgonnette'],
-            'transport_commun': ['Transports en commun'],
-            'marche': ['Marche à pied (ou rollers, patinette)'],
-            'deux_roues': ['Deux-roues motorisé'],
-            'pas_transport': ['Pas de transport']
-        }
-        
         # Calculer la population totale
         total_pop = mobility_df['IPONDI'].sum() if len(mobility_df) > 0 else 0
         
         # Calculer les pourcentages pour chaque type de transport
         transport_percentages = {}
-        for transport_type, transport_values in transport_categories.items():
+        for transport_type, transport_values in TRANSPORT_CATEGORIES.items():
             transport_pop = mobility_df[mobility_df['TRANS'].isin(transport_values)]['IPONDI'].sum()
             transport_percentages[f'{transport_type}_percentage'] = (transport_pop / total_pop * 100).round(1) if total_pop > 0 else 0.0
         
         # Ajuster la population selon la tranche d'âge sélectionnée
-        population_adjustment_factor = 1.0
-        if age_filter:
-            if age_filter in ['0-18', '19-35']:
-                population_adjustment_factor = 0.28
-            elif age_filter == '36-50':
-                population_adjustment_factor = 0.32
-            elif age_filter in ['51-65', '65+']:
-                population_adjustment_factor = 0.22
+        population_adjustment_factor = get_population_adjustment_factor(age_filter)
         
         adjusted_population = int(commune_data.get('PTOT', 0) * population_adjustment_factor)
         
@@ -375,6 +373,147 @@ def api_commune_detail(code):
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/api/communes/batch', methods=['GET', 'POST'])
+def api_communes_batch():
+    """
+    API endpoint pour charger les détails de plusieurs communes en une requête
+    Paramètres: codes (liste séparée par des virgules, ou JSON {"codes": [...]} ou
+    {"codes": "01001,01002"}), region, department, age. Les valeurs sont identiques
+    à /api/communes/<code>.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'Corps JSON attendu: {"codes": [...]}'}), 400
+        
+        # Récupérer les codes demandés (liste JSON, ou texte séparé par des virgules)
+        codes = payload.get('codes')
+        if codes is None:
+            codes = request.args.get('codes', '')
+        if isinstance(codes, str):
+            codes = codes.split(',')
+        if not isinstance(codes, list) or not all(
+                isinstance(c, (str, int)) and not isinstance(c, bool) for c in codes):
+            return jsonify({'error': 'Paramètre codes invalide: liste de codes commune attendue'}), 400
+        codes = [str(c).strip().zfill(5) for c in codes if str(c).strip()]
+        codes = list(dict.fromkeys(codes))  # Dédupliquer en gardant l'ordre
+        
+        if not codes:
+            return jsonify({'error': 'Paramètre codes manquant'}), 400
+        if len(codes) > MAX_BATCH_CODES:
+            return jsonify({'error': f'Maximum {MAX_BATCH_CODES} communes par requête ({len(codes)} demandées)'}), 400
+        
+        # Récupérer les paramètres de filtres
+        region_filter = payload.get('region', request.args.get('region', ''))
+        department_filter = payload.get('department', request.args.get('department', ''))
+        age_filter = payload.get('age', request.args.get('age', ''))
+        
+        # Charger les statistiques globales (avec cache)
+        stats = get_cached_stats(main)
+        
+        # Charger les communes
+        communes_df = data_loader.load_communes_data()
+        
+        if communes_df.empty:
+            return jsonify({'error': 'Aucune donnée de commune disponible'}), 404
+        
+        # Appliquer les filtres géographiques
+        if region_filter and 'REG' in communes_df.columns:
+            communes_df = communes_df[communes_df['REG'].astype(str) == str(region_filter)]
+        
+        if department_filter and 'DEP' in communes_df.columns:
+            communes_df = communes_df[communes_df['DEP'].astype(str) == str(department_filter)]
+        
+        # Trouver les communes par code (COM d'abord, puis CODCOM comme pour le détail)
+        matches = pd.DataFrame()
+        if 'COM' in communes_df.columns:
+            com_codes = communes_df['COM'].astype(str).str.zfill(5)
+            mask = com_codes.isin(codes)
+            matches = communes_df[mask].assign(REQUESTED_CODE=com_codes[mask])
+        if 'CODCOM' in communes_df.columns:
+            found = set(matches['REQUESTED_CODE']) if not matches.empty else set()
+            remaining = [c for c in codes if c not in found]
+            if remaining:
+                codcom_codes = communes_df['CODCOM'].astype(str).str.zfill(5)
+                mask = codcom_codes.isin(remaining)
+                extra = communes_df[mask].assign(REQUESTED_CODE=codcom_codes[mask])
+                matches = pd.concat([matches, extra])
+        if not matches.empty:
+            matches = matches.drop_duplicates('REQUESTED_CODE')
+        
+        # Charger les données de mobilité (codes communes déjà extraits, en cache)
+        mobility_df = data_loader.load_mobility_data_with_codes()
+        
+        if mobility_df.empty:
+            return jsonify({'error': 'Aucune donnée de mobilité disponible'}), 404
+        
+        # Codes utilisés pour la mobilité (COM/CODCOM de chaque commune trouvée)
+        if not matches.empty:
+            matches['MOBILITY_CODE'] = matches.get('COM', matches.get('CODCOM')).astype(str).str.zfill(5)
+            mobility_df = mobility_df[mobility_df['COMMUNE_CODE'].isin(matches['MOBILITY_CODE'])]
+        else:
+            mobility_df = mobility_df.iloc[0:0]
+        
+        # Filtrer par tranche d'âge si spécifié
+        if age_filter:
+            age_values = data_loader.map_age_filter_to_agerevq_values(age_filter)
+            if age_values:
+                mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
+        
+        # Population totale et par type de transport, en une seule agrégation
+        total_pop = mobility_df.groupby('COMMUNE_CODE')['IPONDI'].sum()
+        trans_pop = mobility_df.groupby(['COMMUNE_CODE', 'TRANS'])['IPONDI'].sum().unstack(fill_value=0)
+        
+        # Communes sans navetteur pondéré (IPONDI nul): 0.0 comme pour le détail, pas NaN
+        total_pop_nonzero = total_pop.where(total_pop > 0)
+        percentages = pd.DataFrame(index=total_pop.index)
+        for transport_type, transport_values in TRANSPORT_CATEGORIES.items():
+            present = [v for v in transport_values if v in trans_pop.columns]
+            transport_pop = trans_pop[present].sum(axis=1) if present else 0.0
+            percentages[f'{transport_type}_percentage'] = (transport_pop / total_pop_nonzero * 100).round(1).fillna(0.0)
+        
+        # Ajuster la population selon la tranche d'âge sélectionnée
+        population_adjustment_factor = get_population_adjustment_factor(age_filter)
+        
+        # Temps de trajet: même référence de population que le détail d'une commune
+        base_avg_commute = stats.get('pourcentage_temps_moyen', 30)
+        population_max = communes_df['PTOT'].max() if 'PTOT' in communes_df.columns and not communes_df.empty else 1
+        
+        records = {}
+        for commune_data in matches.to_dict('records'):
+            transport_percentages = {}
+            if commune_data['MOBILITY_CODE'] in percentages.index:
+                row = percentages.loc[commune_data['MOBILITY_CODE']]
+                transport_percentages = {col: float(row[col]) for col in percentages.columns}
+            else:
+                transport_percentages = {f'{t}_percentage': 0.0 for t in TRANSPORT_CATEGORIES}
+            
+            population = commune_data.get('PTOT', 0)
+            adjusted_population = int((population if pd.notna(population) else 0) * population_adjustment_factor)
+            velo_pct = transport_percentages.get('velo_percentage', 0.0)
+            tc_pct = transport_percentages.get('transport_commun_percentage', 0.0)
+            population_factor = (adjusted_population / population_max) if population_max > 0 else 0
+            
+            records[commune_data['REQUESTED_CODE']] = {
+                'LIBGEO': commune_data.get('Commune', commune_data.get('LIBGEO', 'N/A')),
+                'COM': commune_data.get('COM', commune_data.get('CODCOM', 'N/A')),
+                'CODCOM': commune_data.get('CODCOM', commune_data.get('COM', 'N/A')),
+                'PTOT': adjusted_population,
+                'green_mobility_index': round(velo_pct + tc_pct * 0.8, 1),
+                'avg_commute_time': round(base_avg_commute + (population_factor * 5), 1),
+                **transport_percentages
+            }
+        
+        return jsonify({
+            'communes': [records[c] for c in codes if c in records],
+            'not_found': [c for c in codes if c not in records],
+            'count': len(records)
+        })
+    except Exception as e:
+        logger.error(f"Erreur API batch communes: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/api/departments')
 def api_departments():
     """
@@ -424,6 +563,7 @@ def api_regions():
     API endpoint pour charger les régions avec pagination et filtres
     Calcule les pourcentages réels par type de transport pour chaque région
     """
+    clock = StageClock('filter')
     try:
         import pandas as pd
         
@@ -473,6 +613,7 @@ def api_regions():
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
         # Créer un mapping région -> codes communes
+        clock.switch('aggregate')
         region_commune_map = {}
         if 'REG' in communes_df.columns:
             # Convertir REG en string pour le groupby
@@ -492,16 +633,6 @@ def api_regions():
                 region_commune_map = communes_df.groupby('REG_STR')['COMMUNE_CODE'].apply(set).to_dict()
                 logger.info(f"Mapping région->communes créé: {len(region_commune_map)} régions trouvées")
         
-        # Définir les catégories de transport
-        transport_categories = {
-            'velo': ['Vélo (y compris à assistance électrique)'],
-            'voiture': ['Voiture, camion, fourgonnette'],
-            'transport_commun': ['Transports en commun'],
-            'marche': ['Marche à pied (ou rollers, patinette)'],
-            'deux_roues': ['Deux-roues motorisé'],
-            'pas_transport': ['Pas de transport']
-        }
-        
         # Calculer les pourcentages par région
         regions_list = []
         for _, region_row in regions_df.iterrows():
@@ -515,7 +646,7 @@ def api_regions():
                 # Logger pour déboguer
                 logger.warning(f"Aucune commune trouvée pour la région {region_code} ({region_name}). Mapping disponible: {list(region_commune_map.keys())[:5] if region_commune_map else 'vide'}")
                 # Si pas de communes, utiliser des valeurs par défaut
-                transport_percentages = {f'{t}_percentage': 0.0 for t in transport_categories.keys()}
+                transport_percentages = {f'{t}_percentage': 0.0 for t in TRANSPORT_CATEGORIES.keys()}
                 total_pop = 0
             else:
                 # Filtrer les données de mobilité pour cette région
@@ -535,7 +666,7 @@ def api_regions():
                 
                 # Calculer les pourcentages pour chaque type de transport
                 transport_percentages = {}
-                for transport_type, transport_values in transport_categories.items():
+                for transport_type, transport_values in TRANSPORT_CATEGORIES.items():
                     transport_pop = region_mobility[region_mobility['TRANS'].isin(transport_values)]['IPONDI'].sum()
                     transport_percentages[f'{transport_type}_percentage'] = (transport_pop / total_pop * 100).round(1) if total_pop > 0 else 0.0
             
@@ -593,6 +724,8 @@ def api_regions():
     except Exception as e:
         logger.error(f"Erreur API régions: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+    finally:
+        clock.stop()
 
 
 @bp.route('/api/regions/<code>')
@@ -655,22 +788,12 @@ def api_region_detail(code):
             if age_values:
                 mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
         
-        # Calculer les pourcentages par type de transport
-        transport_categories = {
-            'velo': ['Vélo (y compris à assistance électrique)'],
-            'voiture': ['Voiture, camion, fourgonnette'],
-            'transport_commun': ['Transports en commun'],
-            'marche': ['Marche à pied (ou rollers, patinette)'],
-            'deux_roues': ['Deux-roues motorisé'],
-            'pas_transport': ['Pas de transport']
-        }
-        
         # Calculer la population totale
         total_pop = mobility_df['IPONDI'].sum() if len(mobility_df) > 0 else 0
         
         # Calculer les pourcentages pour chaque type de transport
         transport_percentages = {}
-        for transport_type, transport_values in transport_categories.items():
+        for transport_type, transport_values in TRANSPORT_CATEGORIES.items():
             transport_pop = mobility_df[mobility_df['TRANS'].isin(transport_values)]['IPONDI'].sum()
             transport_percentages[f'{transport_type}_percentage'] = (transport_pop / total_pop * 100).round(1) if total_pop > 0 else 0.0
         
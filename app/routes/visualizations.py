@@ -2,17 +2,41 @@
 Routes pour les visualisations (cartes, graphiques)
 """
 
-from flask import Blueprint, render_template_string, Response, request
+from flask import Blueprint, render_template_string, Response, request, jsonify, url_for
 import logging
-import base64
+import os
 from app.utils.data_loader import DataLoader
-from app.visualizations.maps import (
-    create_communes_map,
-    create_green_mobility_map
+from app.utils.gazetteer import get_gazetteer_version, lookup_coordinates
+from app.utils.metrics import register_render_cache, stage
+from app.utils.render_cache import RenderCache, get_code_version, make_cache_key
+from app.visualizations.popups import get_popup_index, get_popup_record
+from app.visualizations.points import get_point_table
+from app.visualizations.tiles import TILE_LAYERS, get_tile
+from app.visualizations.grid import GRID_SHAPES, get_grid
+from app.visualizations.viewport import DEFAULT_POINT_LIMIT, get_viewport_points
+from app.visualizations.nearest import (
+    DEFAULT_NEIGHBOURS,
+    DEFAULT_TRANSIT_THRESHOLD,
+    find_nearest_well_served,
+    get_nearest_well_served_json
 )
-from app.visualizations.charts import (
-    create_histogram,
-    create_bar_chart
+from app.visualizations.boundaries import (
+    BOUNDARY_LEVELS,
+    MAX_BOUNDARY_ZOOM,
+    MIN_BOUNDARY_ZOOM,
+    get_boundaries_version,
+    get_topojson
+)
+from app.visualizations.choropleth import get_choropleth_values
+from app.visualizations.chart_data import DEFAULT_HISTOGRAM_BINS, get_histogram_data, get_region_series
+from app.visualizations.dashboard import get_dashboard
+from app.visualizations.chart_images import (
+    CHART_SPECS,
+    ChartUnavailable,
+    get_chart,
+    get_chart_etag,
+    normalize_chart_filters,
+    validate_chart
 )
 from script import main
 
@@ -21,6 +45,92 @@ logger = logging.getLogger(__name__)
 bp = Blueprint('visualizations', __name__, url_prefix='/visualizations')
 data_loader = DataLoader()
 
+# Cache des cartes rendues (mémoire + disque), par route, filtres, version des données et du code
+map_cache = RenderCache(
+    cache_dir=os.environ.get('MAP_CACHE_DIR') or data_loader.base_path / 'data' / 'processed' / 'map_cache',
+    max_entries=int(os.environ.get('MAP_CACHE_MAX_ENTRIES', 16)),
+    max_files=int(os.environ.get('MAP_CACHE_MAX_FILES', 200)),
+    suffix='.html'
+)
+register_render_cache('maps', map_cache)
+
+
+def get_render_mode() -> str:
+    """Mode de rendu des cartes (?mode=geojson par défaut, markers, tiles ou grid)"""
+    from app.visualizations.maps import RENDER_MODES
+    mode = request.args.get('mode', 'geojson')
+    return mode if mode in RENDER_MODES else 'geojson'
+
+
+def get_grid_shape() -> str:
+    """Forme des cellules en mode grid (?shape=hex par défaut, ou square)"""
+    shape = request.args.get('shape', 'hex')
+    return shape if shape in GRID_SHAPES else 'hex'
+
+
+def get_map_cache_key(kind: str, region_filter: str, department_filter: str, age_filter: str,
+                      render_mode: str) -> str:
+    """Clé du cache de cartes: route, filtres normalisés, version des données, des coordonnées et du code"""
+    version = f"{data_loader.get_data_version()}-{get_gazetteer_version()}-{get_code_version()}"
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter, 'mode': render_mode}
+    if render_mode == 'grid':
+        filters['shape'] = get_grid_shape()
+    return make_cache_key(f'map/{kind}', filters, version)
+
+
+def has_fallback_positions(communes_df) -> bool:
+    """
+    Vrai si une commune n'est pas placée par le gazetteer (géocodeur ou centre
+    du département): la carte est servie, mais pas écrite dans le cache disque,
+    pour ne pas survivre à une panne du géocodeur ni à la reconstruction du gazetteer.
+    """
+    codes = communes_df['COMMUNE_CODE'].dropna().astype(str).str.strip()
+    _, _, found = lookup_coordinates(codes[codes != ''].str.zfill(5))
+    return not found.all()
+
+
+def get_popup_url(region_filter: str, department_filter: str, age_filter: str) -> str:
+    """URL des popups chargés au clic (__CODE__ est remplacé par le code commune)"""
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+    return url_for('visualizations.api_commune_popup', code='__CODE__',
+                   **{k: v for k, v in filters.items() if v})
+
+
+def get_tile_url(layer: str, region_filter: str, department_filter: str, age_filter: str) -> str:
+    """URL des tuiles d'une couche ({z}, {x} et {y} sont remplacés par la carte)"""
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+    # La version des données dans l'URL évite de réutiliser des tuiles périmées du navigateur
+    url = url_for('visualizations.map_tile', layer=layer, z=0, x=0, y=0, v=data_loader.get_data_version(),
+                  **{k: v for k, v in filters.items() if v})
+    return url.replace('/0/0/0', '/{z}/{x}/{y}', 1)
+
+
+def get_grid_url(indicator: str, shape: str, region_filter: str, department_filter: str, age_filter: str) -> str:
+    """URL de la grille d'un indicateur ({z} est remplacé par la carte)"""
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+    url = url_for('visualizations.api_grid', shape=shape, z=0, indicator=indicator, v=data_loader.get_data_version(),
+                  **{k: v for k, v in filters.items() if v})
+    return url.replace(f'/{shape}/0', f'/{shape}/{{z}}', 1)
+
+
+def get_map_layer_urls(render_mode: str, layer: str, region_filter: str, department_filter: str,
+                       age_filter: str, communes_df) -> dict:
+    """
+    Pré-remplit les index (popups, et points en mode tiles ou grid) avec les données
+    déjà calculées et retourne les URL à passer à la carte (popup_url, tile_url, grid_url).
+    """
+    get_popup_index(region_filter, department_filter, age_filter, communes_df)
+    urls = {'popup_url': get_popup_url(region_filter, department_filter, age_filter),
+            'tile_url': None, 'grid_url': None}
+    if render_mode == 'tiles':
+        get_point_table(region_filter, department_filter, age_filter, communes_df)
+        urls['tile_url'] = get_tile_url(layer, region_filter, department_filter, age_filter)
+    elif render_mode == 'grid':
+        get_point_table(region_filter, department_filter, age_filter, communes_df)
+        urls['grid_url'] = get_grid_url(TILE_LAYERS[layer], get_grid_shape(), region_filter,
+                                        department_filter, age_filter)
+    return urls
+
 
 @bp.route('/map/communes')
 def map_communes():
@@ -29,12 +139,20 @@ def map_communes():
     Supporte les filtres: region, department, age
     """
     try:
+        from app.visualizations.maps import create_communes_map
         from app.routes.export import prepare_communes_data
         
         # Récupérer les filtres
         region_filter = request.args.get('region', '')
         department_filter = request.args.get('department', '')
         age_filter = request.args.get('age', '')
+        render_mode = get_render_mode()
+        
+        # Servir la carte depuis le cache si elle a déjà été générée
+        cache_key = get_map_cache_key('communes', region_filter, department_filter, age_filter, render_mode)
+        cached_html = map_cache.get(cache_key)
+        if cached_html is not None:
+            return cached_html.decode('utf-8')
         
         # Préparer les données avec les mêmes calculs que l'export
         communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
@@ -42,11 +160,18 @@ def map_communes():
         if communes_df.empty:
             return "<p>Aucune donnée disponible</p>", 404
         
+        # Pré-remplir les index (popups, tuiles) avec les données déjà calculées
+        urls = get_map_layer_urls(render_mode, 'green_mobility', region_filter, department_filter,
+                                  age_filter, communes_df)
+        
         # Créer la carte
-        m = create_communes_map(communes_df, show_legend=True)
+        m = create_communes_map(communes_df, show_legend=True, render_mode=render_mode, **urls)
         
         # Retourner le HTML de la carte
-        return m._repr_html_()
+        with stage('render'):
+            html = m._repr_html_()
+        map_cache.set(cache_key, html.encode('utf-8'), persist=not has_fallback_positions(communes_df))
+        return html
     except Exception as e:
         logger.error(f"Erreur lors de la génération de la carte: {e}", exc_info=True)
         return f"<p>Erreur: {str(e)}</p>", 500
@@ -58,69 +183,41 @@ def map_underserved():
     Génère une carte avec les zones mal desservies
     """
     try:
+        from app.visualizations.maps import add_underserved_layer, create_communes_map
         from app.routes.export import prepare_communes_data
         
         # Récupérer les filtres
         region_filter = request.args.get('region', '')
         department_filter = request.args.get('department', '')
         age_filter = request.args.get('age', '')
+        render_mode = get_render_mode()
+        
+        # Servir la carte depuis le cache si elle a déjà été générée
+        cache_key = get_map_cache_key('zones-mal-desservies', region_filter, department_filter, age_filter, render_mode)
+        cached_html = map_cache.get(cache_key)
+        if cached_html is not None:
+            return cached_html.decode('utf-8')
         
         communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
         
         if communes_df.empty:
             return "<p>Aucune donnée disponible</p>", 404
         
-        # Identifier les zones mal desservies (mobilité verte faible et pas de transport élevé)
-        if 'green_mobility_index' in communes_df.columns and 'pas_transport_percentage' in communes_df.columns:
-            # Seuil: mobilité verte < 20% OU pas de transport > 15%
-            communes_df['is_underserved'] = (
-                (communes_df['green_mobility_index'] < 20) | 
-                (communes_df['pas_transport_percentage'] > 15)
-            )
-        else:
-            communes_df['is_underserved'] = False
-        
         # Créer la carte
-        m = create_communes_map(communes_df, show_legend=True)
-        
-        # Ajouter des marqueurs spéciaux pour les zones mal desservies
-        if 'is_underserved' in communes_df.columns:
-            import folium
-            from app.visualizations.maps import get_commune_coordinates
-            
-            underserved = communes_df[communes_df['is_underserved'] == True]
-            
-            # Identifier les colonnes
-            commune_col = None
-            name_col = None
-            for col in ['COM', 'CODCOM']:
-                if col in communes_df.columns:
-                    commune_col = col
-                    break
-            for col in ['Commune', 'LIBGEO']:
-                if col in communes_df.columns:
-                    name_col = col
-                    break
-            
-            for idx, row in underserved.iterrows():
-                commune_code = str(row.get(commune_col, '')).zfill(5) if commune_col else ''
-                commune_name = str(row.get(name_col, '')) if name_col else commune_code
-                lat, lon = get_commune_coordinates(commune_code, commune_name)
-                
-                if lat and lon:
-                    folium.CircleMarker(
-                        location=[lat, lon],
-                        radius=10,
-                        popup=folium.Popup(f"<b>{commune_name}</b><br>Zone mal desservie", max_width=200),
-                        tooltip=f"{commune_name} - Zone mal desservie",
-                        color='red',
-                        fill=True,
-                        fillColor='red',
-                        fillOpacity=0.5,
-                        weight=3
-                    ).add_to(m)
-        
-        return m._repr_html_()
+        urls = get_map_layer_urls(render_mode, 'green_mobility', region_filter, department_filter,
+                                  age_filter, communes_df)
+        m = create_communes_map(communes_df, show_legend=True, render_mode=render_mode, **urls)
+        
+        # Zones mal desservies (mobilité verte faible ou pas de transport élevé) en surimpression
+        underserved_tile_url = (get_tile_url('underserved', region_filter, department_filter, age_filter)
+                                if render_mode == 'tiles' else None)
+        add_underserved_layer(m, communes_df, radius=10 if render_mode == 'markers' else 6,
+                              popup_url=urls['popup_url'], tile_url=underserved_tile_url)
+        
+        with stage('render'):
+            html = m._repr_html_()
+        map_cache.set(cache_key, html.encode('utf-8'), persist=not has_fallback_positions(communes_df))
+        return html
     except Exception as e:
         logger.error(f"Erreur lors de la génération de la carte: {e}", exc_info=True)
         return f"<p>Erreur: {str(e)}</p>", 500
@@ -132,12 +229,20 @@ def map_green_mobility():
     Génère une carte de mobilité verte
     """
     try:
+        from app.visualizations.maps import create_green_mobility_map
         from app.routes.export import prepare_communes_data
         
         # Récupérer les filtres
         region_filter = request.args.get('region', '')
         department_filter = request.args.get('department', '')
         age_filter = request.args.get('age', '')
+        render_mode = get_render_mode()
+        
+        # Servir la carte depuis le cache si elle a déjà été générée
+        cache_key = get_map_cache_key('green-mobility', region_filter, department_filter, age_filter, render_mode)
+        cached_html = map_cache.get(cache_key)
+        if cached_html is not None:
+            return cached_html.decode('utf-8')
         
         communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
         
@@ -145,209 +250,398 @@ def map_green_mobility():
             return "<p>Aucune donnée disponible</p>", 404
         
         # Créer la carte
-        m = create_green_mobility_map(communes_df)
-        
-        return m._repr_html_()
+        urls = get_map_layer_urls(render_mode, 'green_mobility', region_filter, department_filter,
+                                  age_filter, communes_df)
+        m = create_green_mobility_map(communes_df, render_mode=render_mode, **urls)
+        
+        with stage('render'):
+            html = m._repr_html_()
+        map_cache.set(cache_key, html.encode('utf-8'), persist=not has_fallback_positions(communes_df))
+        return html
     except Exception as e:
         logger.error(f"Erreur lors de la génération de la carte: {e}", exc_info=True)
         return f"<p>Erreur: {str(e)}</p>", 500
 
 
-@bp.route('/chart/histogram/travel-time')
-def chart_histogram_travel_time():
+@bp.route('/api/communes/<code>/popup')
+def api_commune_popup(code):
     """
-    Génère un histogramme de la distribution du temps de trajet
-    Les données proviennent de Commune_1001-13101_2.csv via load_mobility_data()
+    Contenu du popup d'une commune, chargé au clic sur la carte
+    Supporte les filtres: region, department, age (mêmes valeurs que la carte)
     """
     try:
-        from app.routes.export import prepare_communes_data
-        
-        # Récupérer les filtres
-        region_filter = request.args.get('region', '')
-        department_filter = request.args.get('department', '')
-        age_filter = request.args.get('age', '')
-        
-        # prepare_communes_data() utilise load_mobility_data() qui charge Commune_1001-13101_2.csv
-        communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
-        
-        if communes_df.empty or 'avg_commute_time' not in communes_df.columns:
-            return "<p>Données non disponibles</p>", 404
-        
-        # Générer l'histogramme en base64
-        img_base64 = create_histogram(
-            communes_df, 
-            'avg_commute_time',
-            title="Distribution du Temps de Trajet Domicile-Travail",
-            xlabel="Temps (minutes)",
-            ylabel="Nombre de communes",
-            bins=30,
-            return_base64=True
+        record = get_popup_record(
+            code,
+            request.args.get('region', ''),
+            request.args.get('department', ''),
+            request.args.get('age', '')
         )
+        if record is None:
+            return jsonify({'error': f'Commune avec le code {code} non trouvée'}), 404
         
-        if img_base64:
-            html = f'<img src="data:image/png;base64,{img_base64}" alt="Histogramme Temps de Trajet" style="width: 100%;" />'
-            return html
-        else:
-            return "<p>Erreur lors de la génération du graphique</p>", 500
+        response = jsonify(record)
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
     except Exception as e:
-        logger.error(f"Erreur lors de la génération de l'histogramme: {e}", exc_info=True)
-        return f"<p>Erreur: {str(e)}</p>", 500
+        logger.error(f"Erreur lors du chargement du popup {code}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
 
-@bp.route('/chart/histogram/bike-usage')
-def chart_histogram_bike_usage():
+@bp.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>')
+def map_tile(layer, z, x, y):
     """
-    Génère un histogramme de la distribution du taux d'utilisation du vélo
-    Les données proviennent de Commune_1001-13101_2.csv via load_mobility_data()
+    Tuile GeoJSON des communes d'une couche (propriétés code, name, value)
+    Couches: green_mobility, commute_time, velo, voiture, transport_commun, marche,
+    deux_roues, pas_transport, underserved
+    Supporte les filtres: region, department, age (mêmes valeurs que la carte)
     """
     try:
-        from app.routes.export import prepare_communes_data
-        
-        # Récupérer les filtres
-        region_filter = request.args.get('region', '')
-        department_filter = request.args.get('department', '')
-        age_filter = request.args.get('age', '')
-        
-        communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
-        
-        if communes_df.empty or 'velo_percentage' not in communes_df.columns:
-            return "<p>Données non disponibles</p>", 404
-        
-        # Générer l'histogramme en base64
-        img_base64 = create_histogram(
-            communes_df, 
-            'velo_percentage',
-            title="Distribution du Taux d'Utilisation du Vélo",
-            xlabel="Taux (%)",
-            ylabel="Nombre de communes",
-            bins=30,
-            return_base64=True
+        if layer not in TILE_LAYERS:
+            return jsonify({'error': f"Couche inconnue: {layer}", 'layers': list(TILE_LAYERS)}), 404
+        
+        content = get_tile(
+            layer, z, x, y,
+            request.args.get('region', ''),
+            request.args.get('department', ''),
+            request.args.get('age', '')
         )
-        
-        if img_base64:
-            html = f'<img src="data:image/png;base64,{img_base64}" alt="Histogramme Taux Vélo" style="width: 100%;" />'
-            return html
+        response = Response(content, mimetype='application/geo+json')
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération de la tuile {layer}/{z}/{x}/{y}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/points')
+def api_viewport_points():
+    """
+    Communes visibles dans une emprise, les plus importantes d'abord (GeoJSON)
+    Paramètres: bbox (ouest,sud,est,nord), zoom, limit (500 par défaut),
+    indicator (green_mobility_index par défaut); filtres: region, department, age
+    """
+    try:
+        content = get_viewport_points(
+            request.args.get('bbox', ''),
+            request.args.get('zoom', 6, type=int),
+            request.args.get('indicator', 'green_mobility_index'),
+            request.args.get('limit', DEFAULT_POINT_LIMIT, type=int),
+            request.args.get('region', ''),
+            request.args.get('department', ''),
+            request.args.get('age', '')
+        )
+        response = Response(content, mimetype='application/geo+json')
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche des communes de l'emprise: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/underserved/nearest')
+def api_underserved_nearest():
+    """
+    Pour chaque commune mal desservie, les k communes bien desservies les plus proches
+    (part des transports en commun >= min_transit) et leur distance en km
+    Paramètres: k (3 par défaut), min_transit (15 par défaut), code (une seule commune),
+    limit (les plus isolées seulement); filtres: region, department, age
+    """
+    try:
+        filters = (request.args.get('region', ''), request.args.get('department', ''), request.args.get('age', ''))
+        k = request.args.get('k', DEFAULT_NEIGHBOURS, type=int)
+        transit_threshold = request.args.get('min_transit', DEFAULT_TRANSIT_THRESHOLD, type=float)
+        code = request.args.get('code', '').strip()
+        limit = request.args.get('limit', type=int)
+        
+        if code or limit is not None:
+            result = find_nearest_well_served(*filters, k=k, transit_threshold=transit_threshold)
+            communes = result['communes']
+            if code:
+                communes = [c for c in communes if c['code'] == code.zfill(5)]
+                if not communes and any(c['code'] == code.zfill(5) for c in result['unlocated']):
+                    return jsonify({'error': f"Commune {code} sans position précise: distance non calculée"}), 404
+                if not communes:
+                    return jsonify({'error': f"Commune {code} absente ou non mal desservie"}), 404
+            if limit is not None:
+                communes = communes[:max(0, limit)]
+            response = jsonify({**result, 'communes': communes})
         else:
-            return "<p>Erreur lors de la génération du graphique</p>", 500
+            # Lot complet: réponse encodée une seule fois
+            content = get_nearest_well_served_json(*filters, k=k, transit_threshold=transit_threshold)
+            response = Response(content, mimetype='application/json')
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche des communes bien desservies: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/grid/<shape>/<int:z>')
+def api_grid(shape, z):
+    """
+    Communes agrégées en cellules (hex ou square) pour le zoom z, en GeoJSON:
+    moyenne de l'indicateur pondérée par IPONDI, nombre de communes et population
+    Paramètres: indicator (green_mobility_index par défaut); filtres: region, department, age
+    """
+    try:
+        content = get_grid(
+            shape, z,
+            request.args.get('indicator', 'green_mobility_index'),
+            request.args.get('region', ''),
+            request.args.get('department', ''),
+            request.args.get('age', '')
+        )
+        response = Response(content, mimetype='application/geo+json')
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Erreur lors de la génération de l'histogramme: {e}", exc_info=True)
+        logger.error(f"Erreur lors du calcul de la grille {shape}/{z}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/map/choropleth')
+def map_choropleth():
+    """
+    Génère une carte choroplèthe d'un indicateur
+    Paramètres: level (communes, departements, regions), indicator
+    (green_mobility_index par défaut, avg_commute_time ou *_percentage)
+    Supporte les filtres: region, department, age
+    """
+    try:
+        from app.visualizations.maps import create_choropleth_map
+        level = request.args.get('level', 'departements')
+        indicator = request.args.get('indicator', 'green_mobility_index')
+        filters = {k: request.args.get(k, '') for k in ('region', 'department', 'age')}
+        
+        if level not in BOUNDARY_LEVELS:
+            return f"<p>Niveau inconnu: {level}</p>", 400
+        if not get_boundaries_version(level):
+            return (f"<p>Contours absents pour {level}: ils ne sont pas livrés avec le dépôt, "
+                    f"générer avec scripts/build_boundaries.py --level {level}</p>"), 404
+        
+        # La version des contours dans l'URL évite de réutiliser des contours périmés du navigateur
+        topology_url = url_for('visualizations.boundaries_topojson', level=level, z=0,
+                               v=get_boundaries_version(level))
+        topology_url = topology_url.replace(f'/{level}/0', f'/{level}/{{z}}', 1)
+        values_url = url_for('visualizations.api_choropleth', level=level, indicator=indicator,
+                             v=data_loader.get_data_version(), **{k: v for k, v in filters.items() if v})
+        
+        m = create_choropleth_map(topology_url, values_url, min_zoom=MIN_BOUNDARY_ZOOM,
+                                  max_zoom=MAX_BOUNDARY_ZOOM)
+        with stage('render'):
+            return m._repr_html_()
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération de la carte choroplèthe: {e}", exc_info=True)
         return f"<p>Erreur: {str(e)}</p>", 500
 
 
-@bp.route('/chart/histogram/public-transport')
-def chart_histogram_public_transport():
+@bp.route('/boundaries/<level>/<int:z>')
+def boundaries_topojson(level, z):
     """
-    Génère un histogramme de la distribution du taux d'utilisation des transports en commun
-    Les données proviennent de Commune_1001-13101_2.csv via load_mobility_data()
+    Contours TopoJSON d'un niveau (communes, departements, regions), simplifiés pour le zoom z
+    """
+    try:
+        # Version gzip pré-calculée si le navigateur l'accepte
+        compressed = 'gzip' in request.accept_encodings
+        content = get_topojson(level, z, compressed=compressed)
+        response = Response(content, mimetype='application/json')
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération des contours {level}/{z}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/choropleth/<level>')
+def api_choropleth(level):
+    """
+    Valeurs d'un indicateur par territoire et classes de couleur
+    Paramètres: indicator; filtres: region, department, age
+    """
+    try:
+        result = get_choropleth_values(
+            level,
+            request.args.get('indicator', 'green_mobility_index'),
+            request.args.get('region', ''),
+            request.args.get('department', ''),
+            request.args.get('age', '')
+        )
+        response = jsonify(result)
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul des valeurs choroplèthes {level}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/chart/histogram/<indicator>')
+def api_chart_histogram(indicator):
+    """
+    Histogramme d'un indicateur des communes en JSON (bornes et effectifs des classes)
+    Paramètres: bins (30 par défaut, 200 au plus), weighted=1 (effectifs pondérés par IPONDI);
+    filtres: region, department, age
+    """
+    try:
+        result = get_histogram_data(
+            indicator,
+            bins=request.args.get('bins', DEFAULT_HISTOGRAM_BINS, type=int),
+            weighted=request.args.get('weighted', '').lower() in ('1', 'true', 'yes'),
+            region_filter=request.args.get('region', ''),
+            department_filter=request.args.get('department', ''),
+            age_filter=request.args.get('age', '')
+        )
+        response = jsonify(result)
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul de l'histogramme {indicator}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/chart/regions/<indicator>')
+def api_chart_regions(indicator):
+    """
+    Valeur d'un indicateur par région en JSON (série des bar charts), la plus forte d'abord
+    Supporte le filtre: age
+    """
+    try:
+        response = jsonify(get_region_series(indicator, request.args.get('age', '')))
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul de la série par région {indicator}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/dashboard')
+def api_dashboard():
+    """
+    Données complètes du tableau de bord en une réponse: KPIs, séries des graphiques,
+    top communes et régions, données des couches de carte et URL des couches
+    Supporte les filtres: region, department, age
     """
     try:
-        from app.routes.export import prepare_communes_data
-        
-        # Récupérer les filtres
         region_filter = request.args.get('region', '')
         department_filter = request.args.get('department', '')
         age_filter = request.args.get('age', '')
+        payload = dict(get_dashboard(region_filter, department_filter, age_filter))
+
+        filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+        payload['urls'] = {
+            'popup': get_popup_url(region_filter, department_filter, age_filter),
+            'tiles': get_tile_url('green_mobility', region_filter, department_filter, age_filter),
+            'grid': get_grid_url('green_mobility_index', 'hex', region_filter, department_filter, age_filter),
+            'points': url_for('visualizations.api_viewport_points', **{k: v for k, v in filters.items() if v}),
+            'charts': {
+                name: url_for('visualizations.chart_image', name=name, image_format='png',
+                              **{k: v for k, v in normalize_chart_filters(name, filters).items() if v})
+                for name in CHART_SPECS
+            },
+        }
+        response = jsonify(payload)
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul du tableau de bord: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+def chart_image_html(name: str) -> str:
+    """Balise <img> vers l'image du graphique (mêmes filtres que la requête)"""
+    filters = normalize_chart_filters(name, request.args)
+    src = url_for('visualizations.chart_image', name=name, image_format='png', **{k: v for k, v in filters.items() if v})
+    return f'<img src="{src}" alt="{CHART_SPECS[name]["alt"]}" style="width: 100%;" />'
+
+
+@bp.route('/chart/<name>.<any(png, svg):image_format>')
+def chart_image(name, image_format):
+    """
+    Image d'un graphique (PNG ou SVG), servie depuis le cache
+    Graphiques: travel-time, bike-usage, public-transport (filtres region, department, age),
+    green-mobility-by-region, travel-time-by-region (filtre age)
+    """
+    try:
+        validate_chart(name, image_format)
+        version = data_loader.get_data_version()
+        etag = get_chart_etag(name, image_format, request.args, version)
         
-        communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
-        
-        if communes_df.empty or 'transport_commun_percentage' not in communes_df.columns:
-            return "<p>Données non disponibles</p>", 404
-        
-        # Générer l'histogramme en base64
-        img_base64 = create_histogram(
-            communes_df, 
-            'transport_commun_percentage',
-            title="Distribution du Taux d'Utilisation des Transports en Commun",
-            xlabel="Taux (%)",
-            ylabel="Nombre de communes",
-            bins=30,
-            return_base64=True
-        )
-        
-        if img_base64:
-            html = f'<img src="data:image/png;base64,{img_base64}" alt="Histogramme TC" style="width: 100%;" />'
-            return html
+        # Le navigateur a déjà cette version: rien à renvoyer
+        if etag in request.if_none_match:
+            response = Response(status=304)
         else:
-            return "<p>Erreur lors de la génération du graphique</p>", 500
+            response = Response(get_chart(name, image_format, request.args, version),
+                                mimetype='image/svg+xml' if image_format == 'svg' else 'image/png')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, max-age=300'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except ChartUnavailable:
+        return jsonify({'error': 'Données non disponibles'}), 404
     except Exception as e:
-        logger.error(f"Erreur lors de la génération de l'histogramme: {e}", exc_info=True)
-        return f"<p>Erreur: {str(e)}</p>", 500
+        logger.error(f"Erreur lors de la génération du graphique {name}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/chart/histogram/travel-time')
+def chart_histogram_travel_time():
+    """
+    Génère un histogramme de la distribution du temps de trajet
+    Retourne une balise <img> vers /visualizations/chart/travel-time.png (image en cache)
+    """
+    return chart_image_html('travel-time')
+
+
+@bp.route('/chart/histogram/bike-usage')
+def chart_histogram_bike_usage():
+    """
+    Génère un histogramme de la distribution du taux d'utilisation du vélo
+    Retourne une balise <img> vers /visualizations/chart/bike-usage.png (image en cache)
+    """
+    return chart_image_html('bike-usage')
+
+
+@bp.route('/chart/histogram/public-transport')
+def chart_histogram_public_transport():
+    """
+    Génère un histogramme de la distribution du taux d'utilisation des transports en commun
+    Retourne une balise <img> vers /visualizations/chart/public-transport.png (image en cache)
+    """
+    return chart_image_html('public-transport')
 
 
 @bp.route('/chart/bar/green-mobility-by-region')
 def chart_bar_green_mobility_by_region():
     """
     Génère un bar chart de la mobilité verte par région
-    Les données proviennent de Commune_1001-13101_2.csv via load_mobility_data()
+    Retourne une balise <img> vers /visualizations/chart/green-mobility-by-region.png (image en cache)
     """
-    try:
-        from app.routes.export import prepare_regions_data
-        
-        # Récupérer les filtres
-        age_filter = request.args.get('age', '')
-        
-        regions_df = prepare_regions_data(age_filter)
-        
-        if regions_df.empty or 'green_mobility_index' not in regions_df.columns or 'Région' not in regions_df.columns:
-            return "<p>Données non disponibles</p>", 404
-        
-        # Générer le bar chart en base64
-        img_base64 = create_bar_chart(
-            regions_df,
-            'Région',
-            'green_mobility_index',
-            title="Indicateur de Mobilité Verte par Région",
-            xlabel="Région",
-            ylabel="Indicateur de Mobilité Verte",
-            horizontal=True,
-            return_base64=True
-        )
-        
-        if img_base64:
-            html = f'<img src="data:image/png;base64,{img_base64}" alt="Bar chart Mobilité Verte par Région" style="width: 100%;" />'
-            return html
-        else:
-            return "<p>Erreur lors de la génération du graphique</p>", 500
-    except Exception as e:
-        logger.error(f"Erreur lors de la génération du bar chart: {e}", exc_info=True)
-        return f"<p>Erreur: {str(e)}</p>", 500
+    return chart_image_html('green-mobility-by-region')
 
 
 @bp.route('/chart/bar/travel-time-by-region')
 def chart_bar_travel_time_by_region():
     """
     Génère un bar chart du temps de trajet moyen par région
-    Les données proviennent de Commune_1001-13101_2.csv via load_mobility_data()
+    Retourne une balise <img> vers /visualizations/chart/travel-time-by-region.png (image en cache)
     """
-    try:
-        from app.routes.export import prepare_regions_data
-        
-        # Récupérer les filtres
-        age_filter = request.args.get('age', '')
-        
-        regions_df = prepare_regions_data(age_filter)
-        
-        if regions_df.empty or 'avg_commute_time' not in regions_df.columns or 'Région' not in regions_df.columns:
-            return "<p>Données non disponibles</p>", 404
-        
-        # Générer le bar chart en base64
-        img_base64 = create_bar_chart(
-            regions_df,
-            'Région',
-            'avg_commute_time',
-            title="Temps de Trajet Moyen par Région",
-            xlabel="Région",
-            ylabel="Temps (minutes)",
-            horizontal=True,
-            return_base64=True
-        )
-        
-        if img_base64:
-            html = f'<img src="data:image/png;base64,{img_base64}" alt="Bar chart Temps Trajet par Région" style="width: 100%;" />'
-            return html
-        else:
-            return "<p>Erreur lors de la génération du graphique</p>", 500
-    except Exception as e:
-        logger.error(f"Erreur lors de la génération du bar chart: {e}", exc_info=True)
-        return f"<p>Erreur: {str(e)}</p>", 500
-
+    return chart_image_html('travel-time-by-region')
@@ -5,6 +5,8 @@ Module de cache pour optimiser les performances
 from functools import lru_cache
 import time
 import logging
+from app.utils.coalescing import get_flight
+from app.utils.metrics import cache_eviction, cache_hit, cache_miss, stage
 
 logger = logging.getLogger(__name__)
 
@@ -23,13 +25,19 @@ def get_cached_stats(main_func):
     current_time = time.time()
     
     # Vérifier si le cache est valide
-    if _stats_cache is not None and (current_time - _stats_cache_timestamp) < _stats_cache_ttl:
-        logger.debug("Utilisation du cache pour les statistiques globales")
-        return _stats_cache
+    if _stats_cache is not None:
+        if (current_time - _stats_cache_timestamp) < _stats_cache_ttl:
+            logger.debug("Utilisation du cache pour les statistiques globales")
+            cache_hit('stats', 'main')
+            return _stats_cache
+        cache_eviction('stats', 'main')
+    cache_miss('stats', 'main')
     
     # Calculer et mettre en cache
     logger.info("Calcul des statistiques globales (pas de cache)")
-    _stats_cache = main_func()
+    # Les requêtes simultanées à l'expiration du cache partagent un seul calcul
+    with stage('aggregate'):
+        _stats_cache = get_flight('stats').do(main_func, main_func)
     _stats_cache_timestamp = current_time
     
     return _stats_cache
@@ -38,6 +46,8 @@ def get_cached_stats(main_func):
 def clear_cache():
     """Efface le cache (utile pour les tests ou après modification des données)"""
     global _stats_cache, _stats_cache_timestamp
+    if _stats_cache is not None:
+        cache_eviction('stats', 'main')
     _stats_cache = None
     _stats_cache_timestamp = 0
     logger.info("Cache effacé")
@@ -0,0 +1,169 @@
+"""
+Regroupement des calculs identiques en cours (single flight)
+
+Quand plusieurs requêtes simultanées demandent le même calcul (même fonction,
+mêmes paramètres, même version des données), une seule l'exécute: les autres
+attendent son résultat et le partagent. Typiquement, la page des
+visualisations charge trois cartes et cinq graphiques avec les mêmes filtres,
+qui appellent tous prepare_communes_data en parallèle.
+
+Rien n'est gardé une fois le calcul terminé: ce n'est pas un cache, seulement
+un regroupement des appels concurrents. Les compteurs (appels, exécutions,
+calculs évités) sont exposés par /health/coalescing.
+"""
+
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Calcul en cours: résultat ou exception partagés avec les appels en attente"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Exécute une seule fois les calculs concurrents de même clé.
+
+    Args:
+        name: Nom du groupe de calculs (pour les métriques)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+
+    def do(self, key, compute, share=None):
+        """
+        Retourne compute(), exécuté une seule fois pour les appels concurrents de même clé.
+
+        Args:
+            key: Clé du calcul (hashable: paramètres et version des données)
+            compute: Fonction sans argument qui fait le calcul
+            share: Fonction appliquée au résultat remis aux appels en attente
+                (ex: copie d'un DataFrame que l'appelant pourrait modifier)
+
+        Raises:
+            L'exception levée par compute, pour l'appel qui l'exécute comme pour ceux en attente
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result) if share is not None else call.result
+
+        start = time.perf_counter()
+        try:
+            call.result = compute()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                del self._calls[key]
+                self._stats['compute_ms'] += elapsed * 1000
+                # Temps de calcul évité: chaque appel en attente aurait refait le calcul
+                self._stats['saved_ms'] += elapsed * 1000 * call.waiters
+            call.done.set()
+            if call.waiters:
+                logger.debug(f"{self.name}: {call.waiters} appel(s) regroupé(s) sur un calcul de {elapsed:.2f}s")
+
+    def get_stats(self) -> dict:
+        """Compteurs du groupe (calculs évités = coalesced)"""
+        with self._lock:
+            return {
+                'calls': self._stats['calls'],
+                'executions': self._stats['executions'],
+                'coalesced': self._stats['coalesced'],
+                'errors': self._stats['errors'],
+                'in_flight': len(self._calls),
+                'compute_ms': round(self._stats['compute_ms'], 1),
+                'saved_ms': round(self._stats['saved_ms'], 1),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Groupes déclarés par nom, pour les métriques
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Retourne le groupe de calculs de ce nom (créé au premier appel)"""
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
+
+
+def coalesced(name: str, version=None, share=None):
+    """
+    Décorateur: regroupe les appels concurrents de même paramètres.
+
+    Args:
+        name: Nom du calcul
+        version: Fonction sans argument retournant la version des données, ajoutée à la clé
+        share: Voir SingleFlight.do
+
+    Les paramètres doivent être hashables (filtres en texte).
+    """
+    flight = get_flight(name)
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Arguments normalisés: f('84') et f(region_filter='84') partagent le calcul
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (tuple(bound.arguments.items()), version() if version is not None else None)
+            return flight.do(key, lambda: func(*args, **kwargs), share=share)
+        wrapper.flight = flight
+        return wrapper
+    return decorator
+
+
+def get_coalescing_stats() -> dict:
+    """Compteurs de chaque groupe et totaux"""
+    with _flights_lock:
+        flights = dict(_flights)
+    groups = {name: flight.get_stats() for name, flight in sorted(flights.items())}
+    totals = {
+        key: round(sum(stats[key] for stats in groups.values()), 1)
+        for key in ('calls', 'executions', 'coalesced', 'errors', 'in_flight', 'compute_ms', 'saved_ms')
+    }
+    totals['saved_ratio'] = round(totals['coalesced'] / totals['calls'], 3) if totals['calls'] else 0.0
+    return {'totals': totals, 'computations': groups}
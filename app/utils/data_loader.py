@@ -8,6 +8,8 @@ import logging
 from pathlib import Path
 from functools import lru_cache
 import hashlib
+from app.utils.coalescing import get_flight
+from app.utils.metrics import cache_eviction, cache_hit, cache_miss, timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +22,16 @@ class DataLoader:
     """Charge les données depuis les fichiers CSV"""
     
     def __init__(self, base_path: str = None):
+        if base_path is None:
+            # Racine alternative des données (ex: jeu synthétique de scripts/generate_synthetic_mobpro.py)
+            base_path = os.environ.get('DATA_ROOT') or None
         if base_path is None:
             # Trouver le répertoire racine du projet
             current_file = os.path.abspath(__file__)
             base_path = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
         self.base_path = Path(base_path)
     
+    @timed_stage('load')
     def load_communes_data(self, use_cache=True) -> pd.DataFrame:
         """Charge les données des communes avec cache"""
         cache_key = 'communes_data'
@@ -49,7 +55,11 @@ class DataLoader:
             
             if not file_modified:
                 logger.debug(f"Utilisation du cache pour les données communes ({len(cached_data)} lignes)")
+                cache_hit('data', cache_key)
                 return cached_data.copy()
+            cache_eviction('data', cache_key)
+        if use_cache:
+            cache_miss('data', cache_key)
         
         try:
             # Essayer plusieurs chemins possibles
@@ -61,7 +71,12 @@ class DataLoader:
             for path in paths:
                 if path.exists():
                     # Les fichiers CSV utilisent des points-virgules comme séparateurs
-                    df = pd.read_csv(path, sep=';', encoding='utf-8')
+                    # (lectures simultanées du même fichier regroupées)
+                    df = get_flight('read_communes_csv').do(
+                        (str(path), path.stat().st_mtime_ns),
+                        lambda: pd.read_csv(path, sep=';', encoding='utf-8'),
+                        share=pd.DataFrame.copy
+                    )
                     logger.info(f"Données communes chargées depuis {path}: {len(df)} lignes, colonnes: {list(df.columns)}")
                     
                     # Mettre en cache
@@ -77,6 +92,7 @@ class DataLoader:
             logger.error(f"Erreur lors du chargement des données communes: {e}")
             return pd.DataFrame()
     
+    @timed_stage('load')
     def load_regions_data(self) -> pd.DataFrame:
         """Charge les données des régions"""
         try:
@@ -88,7 +104,12 @@ class DataLoader:
             for path in paths:
                 if path.exists():
                     # Les fichiers CSV utilisent des points-virgules comme séparateurs
-                    df = pd.read_csv(path, sep=';', encoding='utf-8')
+                    # (lectures simultanées du même fichier regroupées)
+                    df = get_flight('read_regions_csv').do(
+                        (str(path), path.stat().st_mtime_ns),
+                        lambda: pd.read_csv(path, sep=';', encoding='utf-8'),
+                        share=pd.DataFrame.copy
+                    )
                     logger.info(f"Données régions chargées depuis {path}: {len(df)} lignes, colonnes: {list(df.columns)}")
                     return df
             
@@ -169,6 +190,7 @@ class DataLoader:
             logger.error(f"Erreur lors de la récupération des régions: {e}")
             return []
     
+    @timed_stage('load')
     def load_departments_data(self) -> pd.DataFrame:
         """Charge les données des départements"""
         try:
@@ -552,6 +574,7 @@ class DataLoader:
             logger.error(f"Erreur lors du mapping des types de transport: {e}")
             return []
     
+    @timed_stage('load')
     def load_mobility_data(self, use_cache=True) -> pd.DataFrame:
         """
         Charge les données de mobilité depuis le fichier CSV avec cache
@@ -578,7 +601,11 @@ class DataLoader:
             
             if not file_modified:
                 logger.debug(f"Utilisation du cache pour les données de mobilité ({len(cached_data)} lignes)")
+                cache_hit('data', cache_key)
                 return cached_data.copy()
+            cache_eviction('data', cache_key)
+        if use_cache:
+            cache_miss('data', cache_key)
         
         try:
             paths = [
@@ -590,7 +617,12 @@ class DataLoader:
                 if path.exists():
                     logger.info(f"Chargement des données de mobilité depuis {path}")
                     # Charger seulement les colonnes nécessaires pour économiser la mémoire
-                    df = pd.read_csv(path, usecols=['COMMUNE', 'TRANS', 'AGEREVQ', 'IPONDI'])
+                    # (lectures simultanées du même fichier regroupées)
+                    df = get_flight('read_mobility_csv').do(
+                        (str(path), path.stat().st_mtime_ns),
+                        lambda: pd.read_csv(path, usecols=['COMMUNE', 'TRANS', 'AGEREVQ', 'IPONDI']),
+                        share=pd.DataFrame.copy
+                    )
                     logger.info(f"Données de mobilité chargées: {len(df)} lignes")
                     
                     # Mettre en cache
@@ -607,3 +639,98 @@ class DataLoader:
             logger.error(f"Erreur lors du chargement des données de mobilité: {e}", exc_info=True)
             return pd.DataFrame()
 
+    @timed_stage('load')
+    def load_mobility_data_with_codes(self) -> pd.DataFrame:
+        """
+        Charge les données de mobilité avec la colonne COMMUNE_CODE déjà extraite.
+        L'extraction par regex n'est faite qu'une fois par version du fichier.
+
+        Le DataFrame retourné est partagé entre les requêtes: il ne doit pas
+        être modifié en place (filtrer crée une nouvelle copie).
+        """
+        cache_key = 'mobility_data_coded'
+        paths = [
+            self.base_path / 'data' / 'RP2021_mobpro' / 'Commune_1001-13101_2.csv',
+            self.base_path / 'data' / 'RP2021_mobpro' / 'Commune_1001-13101.csv',
+        ]
+        source = next((path for path in paths if path.exists()), None)
+        if source is None:
+            logger.warning("Aucun fichier de données de mobilité trouvé")
+            return pd.DataFrame()
+
+        source_mtime = source.stat().st_mtime
+        if cache_key in _data_cache:
+            if _cache_timestamps.get(cache_key) == source_mtime:
+                cache_hit('data', cache_key)
+                return _data_cache[cache_key]
+            cache_eviction('data', cache_key)
+        cache_miss('data', cache_key)
+
+        df = self.load_mobility_data()
+        if df.empty:
+            return df
+
+        # Extraire le code commune depuis la colonne COMMUNE (format: "Nom (CODE)")
+        df['COMMUNE_CODE'] = df['COMMUNE'].astype(str).str.extract(r'\((\d+)\)', expand=False)
+        df['COMMUNE_CODE'] = df['COMMUNE_CODE'].astype(str).str.zfill(5)
+
+        _data_cache[cache_key] = df
+        _cache_timestamps[cache_key] = source_mtime
+        logger.info(f"Codes communes extraits et mis en cache ({len(df)} lignes)")
+        return df
+
+    @timed_stage('aggregate')
+    def get_commune_weights(self, age_filter: str = '') -> pd.Series:
+        """
+        Poids de chaque commune: somme des coefficients IPONDI des navetteurs
+        (pour une tranche d'âge si age_filter est donné).
+
+        Returns:
+            Series indexée par COMMUNE_CODE (partagée entre les requêtes, à ne pas modifier)
+        """
+        mobility_df = self.load_mobility_data_with_codes()
+        if mobility_df.empty or 'IPONDI' not in mobility_df.columns:
+            return pd.Series(dtype=float)
+
+        cache_key = f'commune_weights:{age_filter or ""}'
+        source_mtime = _cache_timestamps.get('mobility_data_coded')
+        if cache_key in _data_cache:
+            if _cache_timestamps.get(cache_key) == source_mtime:
+                cache_hit('data', 'commune_weights')
+                return _data_cache[cache_key]
+            cache_eviction('data', 'commune_weights')
+        cache_miss('data', 'commune_weights')
+
+        if age_filter:
+            age_values = self.map_age_filter_to_agerevq_values(age_filter)
+            if age_values:
+                mobility_df = mobility_df[mobility_df['AGEREVQ'].isin(age_values)]
+
+        weights = pd.to_numeric(mobility_df['IPONDI'], errors='coerce').groupby(mobility_df['COMMUNE_CODE']).sum()
+        _data_cache[cache_key] = weights
+        _cache_timestamps[cache_key] = source_mtime
+        return weights
+
+
+    def get_data_version(self) -> str:
+        """
+        Identifiant court de la version des données sources (communes, régions, mobilité).
+
+        Calculé à partir du chemin, de la taille et de la date de modification des
+        fichiers: il change dès qu'un fichier est remplacé. Sert de clé aux caches
+        dérivés (index de popups, cartes rendues, etc.).
+        """
+        paths = [
+            self.base_path / 'ensemble' / 'donnees_communes.csv',
+            self.base_path / 'data' / 'raw' / 'demographic' / 'donnees_communes.csv',
+            self.base_path / 'ensemble' / 'donnees_regions.csv',
+            self.base_path / 'data' / 'raw' / 'demographic' / 'donnees_regions.csv',
+            self.base_path / 'data' / 'RP2021_mobpro' / 'Commune_1001-13101_2.csv',
+            self.base_path / 'data' / 'RP2021_mobpro' / 'Commune_1001-13101.csv',
+        ]
+        digest = hashlib.sha1()
+        for path in paths:
+            if path.exists():
+                stat = path.stat()
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+        return digest.hexdigest()[:12]
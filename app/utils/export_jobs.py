@@ -0,0 +1,215 @@
+"""
+File d'attente locale pour les exports asynchrones (PDF/CSV)
+
+Les exports lourds sont construits par un pool de threads borné, en dehors
+du thread de la requête HTTP. Aucun broker externe n'est nécessaire : l'état
+des jobs est conservé en mémoire et les fichiers produits sont écrits sur disque.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# États possibles d'un job
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class ExportQueueFullError(Exception):
+    """Levée quand trop de jobs sont déjà en attente"""
+
+
+class ExportJob:
+    """Représente un export en cours ou terminé"""
+
+    def __init__(self, kind: str, params: dict, dedup_key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.dedup_key = dedup_key
+        self.status = STATUS_PENDING
+        self.progress = 0.0
+        self.message = 'En attente'
+        self.file_path = None
+        self.download_name = None
+        self.mimetype = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def set_progress(self, progress: float, message: str = None):
+        """Met à jour la progression (entre 0 et 1)"""
+        self.progress = max(0.0, min(1.0, float(progress)))
+        if message:
+            self.message = message
+
+    def to_dict(self) -> dict:
+        """Représentation JSON du job"""
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            'job_id': self.id,
+            'type': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': round(self.progress * 100, 1),
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at,
+            'duration': duration,
+        }
+
+
+class ExportJobManager:
+    """
+    Gère la soumission, l'exécution et le suivi des jobs d'export.
+
+    Les soumissions identiques (même type, mêmes paramètres) sont dédupliquées :
+    tant qu'un job équivalent est en attente, en cours ou terminé depuis moins
+    de `ttl` secondes, c'est ce job qui est renvoyé.
+    """
+
+    def __init__(self, output_dir, max_workers: int = 2, max_pending: int = 20, ttl: int = 600):
+        self.output_dir = Path(output_dir)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._builders = {}
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def register(self, kind: str, builder, extension: str, mimetype: str, download_name: str):
+        """
+        Enregistre un type d'export.
+
+        Args:
+            kind: Identifiant du type (ex: 'pdf_communes')
+            builder: Fonction builder(params, output_path, job) qui écrit le fichier
+            extension: Extension du fichier produit
+            mimetype: Type MIME pour le téléchargement
+            download_name: Préfixe du nom de fichier proposé au téléchargement
+        """
+        self._builders[kind] = {
+            'builder': builder,
+            'extension': extension,
+            'mimetype': mimetype,
+            'download_name': download_name,
+        }
+
+    @property
+    def kinds(self) -> list:
+        return sorted(self._builders.keys())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Création paresseuse pour ne pas démarrer de threads à l'import
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='export-job')
+        return self._executor
+
+    @staticmethod
+    def _make_key(kind: str, params: dict) -> str:
+        payload = json.dumps({'kind': kind, 'params': params}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def submit(self, kind: str, params: dict):
+        """
+        Soumet un export.
+
+        Returns:
+            Tuple (job, created) où created vaut False si un job identique existait déjà
+        """
+        if kind not in self._builders:
+            raise ValueError(f"Type d'export inconnu: {kind}")
+
+        # Normaliser les paramètres (les filtres vides sont ignorés)
+        params = {k: str(v) for k, v in sorted(params.items()) if v not in (None, '')}
+        key = self._make_key(kind, params)
+
+        with self._lock:
+            self._purge_expired()
+
+            existing_id = self._by_key.get(key)
+            existing = self._jobs.get(existing_id) if existing_id else None
+            if existing is not None and existing.status != STATUS_FAILED:
+                if existing.status != STATUS_DONE or (existing.file_path and os.path.exists(existing.file_path)):
+                    logger.debug(f"Job d'export dédupliqué: {existing.id} ({kind})")
+                    return existing, False
+
+            pending = sum(1 for j in self._jobs.values() if j.status in (STATUS_PENDING, STATUS_RUNNING))
+            if pending >= self.max_pending:
+                raise ExportQueueFullError(f"Trop d'exports en attente ({pending})")
+
+            job = ExportJob(kind, params, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        self._get_executor().submit(self._run, job)
+        logger.info(f"Job d'export soumis: {job.id} ({kind}, {params})")
+        return job, True
+
+    def get(self, job_id: str):
+        """Retourne le job correspondant ou None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ExportJob):
+        spec = self._builders[job.kind]
+        job.status = STATUS_RUNNING
+        job.started_at = time.time()
+        job.set_progress(0.0, 'Démarrage')
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = self.output_dir / f"{job.id}.{spec['extension']}"
+        tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+
+        try:
+            spec['builder'](job.params, str(tmp_path), job)
+            os.replace(tmp_path, output_path)
+
+            job.file_path = str(output_path)
+            job.mimetype = spec['mimetype']
+            job.download_name = f"{spec['download_name']}_{time.strftime('%Y%m%d')}.{spec['extension']}"
+            job.status = STATUS_DONE
+            job.set_progress(1.0, 'Terminé')
+            logger.info(f"Job d'export terminé: {job.id} en {time.time() - job.started_at:.2f}s")
+        except Exception as e:
+            job.status = STATUS_FAILED
+            job.error = str(e)
+            job.message = 'Échec'
+            logger.error(f"Erreur lors du job d'export {job.id}: {e}", exc_info=True)
+            if tmp_path.exists():
+                tmp_path.unlink()
+        finally:
+            job.finished_at = time.time()
+
+    def _purge_expired(self):
+        """Supprime les jobs terminés plus vieux que le TTL (appelé sous verrou)"""
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job in expired:
+            self._jobs.pop(job.id, None)
+            if self._by_key.get(job.dedup_key) == job.id:
+                self._by_key.pop(job.dedup_key, None)
+            if job.file_path and os.path.exists(job.file_path):
+                try:
+                    os.remove(job.file_path)
+                except OSError as e:
+                    logger.debug(f"Impossible de supprimer {job.file_path}: {e}")
@@ -0,0 +1,158 @@
+"""
+Gazetteer local des centroïdes de communes
+
+Les coordonnées sont stockées dans un tableau numpy structuré
+(data/processed/communes_centroids.npy sous la racine des données, DATA_ROOT, ou
+GAZETTEER_PATH) trié par code commune entier. Le fichier
+est chargé une seule fois puis interrogé de façon vectorisée (np.searchsorted)
+pour tout un DataFrame, sans aucun appel réseau.
+
+Le fichier est produit par scripts/build_commune_gazetteer.py. S'il manque,
+les cartes restent servies, les communes étant placées au centre de leur
+département (précision 'departement'), sans appel au géocodeur.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Format du fichier: code INSEE entier, latitude, longitude (12 octets par commune)
+GAZETTEER_DTYPE = np.dtype([('code', '<i4'), ('lat', '<f4'), ('lon', '<f4')])
+
+
+def get_default_gazetteer_path() -> Path:
+    """Fichier gazetteer par défaut: GAZETTEER_PATH, sinon sous la racine des données"""
+    if os.environ.get('GAZETTEER_PATH'):
+        return Path(os.environ['GAZETTEER_PATH'])
+    from app.utils.data_loader import DataLoader
+    return DataLoader().base_path / 'data' / 'processed' / 'communes_centroids.npy'
+
+
+# Codes de la Corse: 2A004 -> 200004, 2B033 -> 210033 (au-delà des codes numériques)
+CORSICA_OFFSETS = {'2A': 200000, '2B': 210000}
+
+# Cache global: (chemin, mtime) -> tableau
+_gazetteer = None
+_gazetteer_key = None
+
+
+def encode_commune_codes(codes) -> np.ndarray:
+    """
+    Convertit des codes INSEE (texte ou nombres) en entiers.
+
+    Returns:
+        Tableau int64, -1 pour les codes invalides
+    """
+    s = pd.Series(codes, dtype=object).astype(str).str.strip().str.upper().str.zfill(5)
+    prefix = s.str[:2]
+    encoded = pd.to_numeric(s, errors='coerce')
+
+    for corsica_prefix, offset in CORSICA_OFFSETS.items():
+        mask = prefix == corsica_prefix
+        if mask.any():
+            encoded[mask] = offset + pd.to_numeric(s[mask].str[2:], errors='coerce')
+
+    return encoded.fillna(-1).astype(np.int64).to_numpy()
+
+
+def build_gazetteer(codes, lats, lons) -> np.ndarray:
+    """Construit le tableau trié (codes invalides et doublons écartés)"""
+    table = np.empty(len(codes), dtype=GAZETTEER_DTYPE)
+    table['code'] = encode_commune_codes(codes)
+    table['lat'] = pd.to_numeric(pd.Series(lats), errors='coerce').to_numpy()
+    table['lon'] = pd.to_numeric(pd.Series(lons), errors='coerce').to_numpy()
+
+    valid = (table['code'] >= 0) & np.isfinite(table['lat']) & np.isfinite(table['lon'])
+    table = table[valid]
+    table = table[np.argsort(table['code'], kind='stable')]
+    _, first = np.unique(table['code'], return_index=True)
+    return table[first]
+
+
+def save_gazetteer(table: np.ndarray, path=None) -> Path:
+    """Écrit le tableau de façon atomique"""
+    path = Path(path or get_default_gazetteer_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, table.astype(GAZETTEER_DTYPE), allow_pickle=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_gazetteer(path=None):
+    """
+    Charge le gazetteer (avec cache, rechargé si le fichier change).
+
+    Returns:
+        Tableau structuré trié par code, ou None si le fichier est absent
+    """
+    global _gazetteer, _gazetteer_key
+
+    path = Path(path or get_default_gazetteer_path())
+    if not path.exists():
+        if _gazetteer_key != (str(path), None):
+            logger.warning(f"Gazetteer des communes absent: {path} "
+                           f"(générer avec scripts/build_commune_gazetteer.py)")
+            _gazetteer, _gazetteer_key = None, (str(path), None)
+        return None
+
+    key = (str(path), path.stat().st_mtime)
+    if _gazetteer_key == key:
+        return _gazetteer
+
+    try:
+        table = np.load(path, allow_pickle=False)
+        if table.dtype != GAZETTEER_DTYPE:
+            table = table.astype(GAZETTEER_DTYPE)
+        if len(table) > 1 and np.any(np.diff(table['code']) <= 0):
+            table = build_gazetteer(table['code'], table['lat'], table['lon'])
+        logger.info(f"Gazetteer chargé: {len(table)} communes ({path})")
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement du gazetteer {path}: {e}", exc_info=True)
+        table = None
+
+    _gazetteer, _gazetteer_key = table, key
+    return table
+
+
+def lookup_coordinates(codes, path=None):
+    """
+    Recherche vectorisée des centroïdes.
+
+    Args:
+        codes: Codes INSEE (liste, Series ou tableau)
+
+    Returns:
+        Tuple (lat, lon, found) de tableaux numpy; NaN pour les codes inconnus
+    """
+    encoded = encode_commune_codes(codes)
+    lat = np.full(len(encoded), np.nan)
+    lon = np.full(len(encoded), np.nan)
+    found = np.zeros(len(encoded), dtype=bool)
+
+    table = load_gazetteer(path)
+    if table is None or len(table) == 0 or len(encoded) == 0:
+        return lat, lon, found
+
+    positions = np.searchsorted(table['code'], encoded)
+    positions = np.minimum(positions, len(table) - 1)
+    found = (table['code'][positions] == encoded) & (encoded >= 0)
+
+    lat[found] = table['lat'][positions[found]]
+    lon[found] = table['lon'][positions[found]]
+    return lat, lon, found
+
+
+def get_gazetteer_version(path=None) -> str:
+    """Version du fichier gazetteer (date de modification), '' s'il est absent"""
+    path = Path(path or get_default_gazetteer_path())
+    try:
+        return str(path.stat().st_mtime_ns)
+    except OSError:
+        return ''
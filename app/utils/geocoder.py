@@ -0,0 +1,261 @@
+"""
+Géocodage par lot des communes absentes du gazetteer local
+
+Les codes sont résolus en parallèle (pool de threads sur une session HTTP
+partagée), les résultats sont conservés dans un cache SQLite sur disque et un
+disjoncteur (circuit breaker) coupe les appels tant que l'API est en panne.
+
+L'URL de l'API se configure avec GEOCODER_BASE_URL ou le paramètre base_url
+(utile pour pointer vers un serveur local de test, voir scripts/check_geocoder.py)
+et le géocodage se désactive avec GEOCODER_ENABLED=0. Le cache est placé sous la
+racine des données (DATA_ROOT), ou à l'emplacement donné par GEOCODER_CACHE_PATH.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://geo.api.gouv.fr'
+
+
+def get_default_cache_path() -> Path:
+    """Cache SQLite par défaut: GEOCODER_CACHE_PATH, sinon sous la racine des données"""
+    if os.environ.get('GEOCODER_CACHE_PATH'):
+        return Path(os.environ['GEOCODER_CACHE_PATH'])
+    from app.utils.data_loader import DataLoader
+    return DataLoader().base_path / 'data' / 'processed' / 'geocode_cache.sqlite'
+
+
+# Durée de conservation d'un code inconnu de l'API (réponse 404)
+NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple: après `failure_threshold` échecs consécutifs, les appels
+    sont refusés pendant `reset_timeout` secondes, puis un appel d'essai est autorisé.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Indique si un appel peut être tenté"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"API de géocodage indisponible ({self.failures} échecs), "
+                                   f"appels suspendus {self.reset_timeout:.0f}s")
+                self.opened_at = time.monotonic()
+
+
+class CoordinateCache:
+    """Cache SQLite des coordonnées (code -> lat, lon), partagé entre les requêtes"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or get_default_cache_path())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS coordinates ('
+                'code TEXT PRIMARY KEY, lat REAL, lon REAL, fetched_at REAL NOT NULL)'
+            )
+
+    def get_many(self, codes) -> dict:
+        """
+        Returns:
+            Dictionnaire code -> (lat, lon), ou code -> None pour un code connu comme introuvable
+        """
+        codes = list(codes)
+        result = {}
+        now = time.time()
+        with self._lock:
+            # Par paquets pour rester sous la limite de paramètres SQLite
+            for i in range(0, len(codes), 500):
+                chunk = codes[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT code, lat, lon, fetched_at FROM coordinates WHERE code IN ({placeholders})',
+                    chunk
+                ).fetchall()
+                for code, lat, lon, fetched_at in rows:
+                    if lat is not None and lon is not None:
+                        result[code] = (lat, lon)
+                    elif now - fetched_at < NEGATIVE_CACHE_TTL:
+                        result[code] = None
+        return result
+
+    def put_many(self, entries: dict):
+        """Enregistre code -> (lat, lon) ou code -> None (introuvable)"""
+        if not entries:
+            return
+        now = time.time()
+        rows = [
+            (code, coords[0] if coords else None, coords[1] if coords else None, now)
+            for code, coords in entries.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO coordinates VALUES (?, ?, ?, ?)', rows)
+
+
+class BatchGeocoder:
+    """
+    Résout un ensemble de codes INSEE en coordonnées via l'API GéoAPI.
+
+    Les codes déjà en cache ne génèrent aucun appel; les autres sont demandés
+    en parallèle sur une session HTTP à connexions réutilisées.
+    """
+
+    def __init__(self, base_url: str = None, cache_path=None, max_workers: int = 8,
+                 timeout: float = 2, breaker: CircuitBreaker = None):
+        self.base_url = (base_url or os.environ.get('GEOCODER_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = CoordinateCache(cache_path)
+        self.stats = {'cache_hits': 0, 'requests': 0, 'failures': 0, 'skipped': 0}
+        self._stats_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _fetch_one(self, code: str):
+        """
+        Returns:
+            (lat, lon), None si le code est inconnu de l'API, ou False si l'appel a échoué
+        """
+        if not self.breaker.allow():
+            self._count('skipped')
+            return False
+
+        self._count('requests')
+        try:
+            response = self.session.get(
+                f"{self.base_url}/communes/{code}",
+                params={'fields': 'centre', 'format': 'json', 'geometry': 'centre'},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.debug(f"Erreur API GéoAPI pour {code}: {e}")
+            self._count('failures')
+            self.breaker.record_failure()
+            return False
+
+        if response.status_code == 404:
+            self.breaker.record_success()
+            return None
+        if response.status_code != 200:
+            self._count('failures')
+            self.breaker.record_failure()
+            return False
+
+        self.breaker.record_success()
+        try:
+            # L'API retourne [longitude, latitude]
+            lon, lat = response.json()['centre']['coordinates']
+            return (float(lat), float(lon))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def geocode_many(self, codes) -> dict:
+        """
+        Géocode un ensemble de codes.
+
+        Returns:
+            Dictionnaire code -> (lat, lon) pour les codes résolus uniquement
+        """
+        codes = list(dict.fromkeys(str(c).zfill(5) for c in codes if c))
+        if not codes:
+            return {}
+
+        cached = self.cache.get_many(codes)
+        self._count('cache_hits', len(cached))
+        result = {code: coords for code, coords in cached.items() if coords}
+        to_fetch = [code for code in codes if code not in cached]
+
+        if to_fetch and self.breaker.state != CircuitBreaker.OPEN:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch)),
+                                    thread_name_prefix='geocoder') as executor:
+                fetched = dict(zip(to_fetch, executor.map(self._fetch_one, to_fetch)))
+
+            # Les échecs réseau (False) ne sont pas mis en cache
+            resolved = {code: coords for code, coords in fetched.items() if coords is not False}
+            self.cache.put_many(resolved)
+            result.update({code: coords for code, coords in resolved.items() if coords})
+            logger.info(f"Géocodage: {len(resolved)}/{len(to_fetch)} codes résolus via l'API "
+                        f"en {time.perf_counter() - start:.2f}s")
+        elif to_fetch:
+            self._count('skipped', len(to_fetch))
+            logger.debug(f"Disjoncteur ouvert: {len(to_fetch)} codes non géocodés")
+
+        return result
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """
+    Retourne l'instance partagée du géocodeur, ou None si désactivé (GEOCODER_ENABLED=0)
+    """
+    global _geocoder
+    if os.environ.get('GEOCODER_ENABLED', '1') == '0':
+        return None
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = BatchGeocoder()
+    return _geocoder
@@ -0,0 +1,484 @@
+"""
+Métriques de fonctionnement au format Prometheus (/metrics)
+
+- Latence des requêtes HTTP, par route (règle Flask), méthode et statut.
+- Durée des étapes internes: chargement des données (load), filtrage (filter),
+  agrégation (aggregate), sérialisation (serialize) et rendu (render). Les
+  durées sont exclusives: une étape imbriquée dans une autre (chargement
+  pendant le filtrage) n'est comptée qu'une fois. Chaque réponse porte un
+  en-tête Server-Timing avec le détail des étapes de la requête (étapes
+  exécutées dans le thread de la requête uniquement).
+- Succès, échecs et évictions des caches (_data_cache de DataLoader, cache des
+  statistiques globales, caches de rendu des cartes et graphiques).
+- Au moment de la collecte: version et génération des données, lignes en
+  cache, regroupement des calculs et mémoire résidente du processus.
+
+Pas de dépendance externe: histogrammes et compteurs sont tenus ici, sous
+verrou. Budget de l'instrumentation: STAGE_OVERHEAD_BUDGET_US par étape
+mesurée et REQUEST_OVERHEAD_BUDGET_US par requête (vérifiés par
+measure_overhead(), utilisé par scripts/benchmark.py). METRICS_ENABLED=0
+désactive les mesures (les métriques collectées à la demande restent servies).
+"""
+
+import contextvars
+import functools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+# Surcoût maximal de l'instrumentation (microsecondes)
+STAGE_OVERHEAD_BUDGET_US = 5
+REQUEST_OVERHEAD_BUDGET_US = 50
+
+# Étapes mesurées, dans l'ordre de l'en-tête Server-Timing
+STAGES = ('load', 'filter', 'aggregate', 'serialize', 'render')
+
+# Bornes des histogrammes (secondes)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+# Caches de rendu exposés (nom -> RenderCache) et versions des données observées
+_render_caches = {}
+_data_versions = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Compteur monotone par combinaison de labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                  for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Histogramme à bornes fixes par combinaison de labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def remove(self, *labels):
+        """Supprime une série (mesures synthétiques de measure_overhead)"""
+        with self._lock:
+            self._series.pop(labels, None)
+
+    def collect(self) -> list:
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._series.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('mobilite_http_request_duration_seconds',
+                             'Durée de traitement des requêtes HTTP', ('method', 'route', 'status'))
+STAGE_DURATION = Histogram('mobilite_stage_duration_seconds',
+                           'Durée exclusive des étapes internes (load, filter, aggregate, serialize, render)',
+                           ('stage',), buckets=STAGE_BUCKETS)
+CACHE_HITS = Counter('mobilite_cache_hits_total', 'Lectures servies par un cache', ('cache', 'entry'))
+CACHE_MISSES = Counter('mobilite_cache_misses_total', 'Lectures absentes d\'un cache', ('cache', 'entry'))
+CACHE_EVICTIONS = Counter('mobilite_cache_evictions_total',
+                          'Entrées de cache invalidées (données modifiées, expiration) ou évincées',
+                          ('cache', 'entry'))
+
+
+def cache_hit(cache: str, entry: str):
+    CACHE_HITS.inc(cache, entry)
+
+
+def cache_miss(cache: str, entry: str):
+    CACHE_MISSES.inc(cache, entry)
+
+
+def cache_eviction(cache: str, entry: str):
+    CACHE_EVICTIONS.inc(cache, entry)
+
+
+# ---------------------------------------------------------------------------
+# Étapes internes
+# ---------------------------------------------------------------------------
+
+class _StageState:
+    """Étapes en cours (pile: nom, début, temps des étapes imbriquées) et totaux du contexte"""
+    __slots__ = ('stack', 'totals')
+
+    def __init__(self):
+        self.stack = []
+        self.totals = {}
+
+
+_stage_state = contextvars.ContextVar('mobilite_stage_state', default=None)
+
+
+def _current_state() -> _StageState:
+    state = _stage_state.get()
+    if state is None:
+        state = _StageState()
+        _stage_state.set(state)
+    return state
+
+
+def _push_stage(state: _StageState, name: str):
+    state.stack.append([name, time.perf_counter(), 0.0])
+
+
+def _pop_stage(state: _StageState):
+    """Termine l'étape en cours: durée exclusive enregistrée, durée totale reportée sur l'étape englobante"""
+    name, start, children = state.stack.pop()
+    elapsed = time.perf_counter() - start
+    own = elapsed - children
+    if state.stack:
+        state.stack[-1][2] += elapsed
+    state.totals[name] = state.totals.get(name, 0.0) + own
+    STAGE_DURATION.observe(own, name)
+
+
+class stage:
+    """
+    Mesure une étape (gestionnaire de contexte):
+
+        with stage('filter'):
+            ...
+    """
+    __slots__ = ('name', '_state')
+
+    def __init__(self, name: str):
+        self.name = name
+        self._state = None
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self._state = _current_state()
+            _push_stage(self._state, self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._state is not None and self._state.stack:
+            _pop_stage(self._state)
+        return False
+
+
+def timed_stage(name: str):
+    """Décorateur: mesure chaque appel de la fonction comme une étape"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageClock:
+    """
+    Étapes successives d'une même fonction, sans bloc par étape:
+
+        clock = StageClock('filter')
+        try:
+            ...
+            clock.switch('aggregate')
+            ...
+        finally:
+            clock.stop()
+    """
+
+    def __init__(self, name: str):
+        self._stage = stage(name).__enter__()
+
+    def switch(self, name: str):
+        self.stop()
+        self._stage = stage(name).__enter__()
+
+    def stop(self):
+        if self._stage is not None:
+            self._stage.__exit__(None, None, None)
+            self._stage = None
+
+
+def server_timing(totals: dict, total: float) -> str:
+    """Valeur de l'en-tête Server-Timing (durées en ms)"""
+    names = [name for name in STAGES if name in totals] + sorted(set(totals) - set(STAGES))
+    parts = [f'{name};dur={totals[name] * 1000:.1f}' for name in names]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Intégration Flask
+# ---------------------------------------------------------------------------
+
+def _before_request():
+    from flask import g
+    _stage_state.set(_StageState())
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    from flask import g, request
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_DURATION.observe(elapsed, request.method, route, str(response.status_code))
+    state = _stage_state.get()
+    response.headers['Server-Timing'] = server_timing(state.totals if state is not None else {}, elapsed)
+    return response
+
+
+def _template_started(sender, template, context, **extra):
+    _push_stage(_current_state(), 'render')
+
+
+def _template_rendered(sender, template, context, **extra):
+    state = _stage_state.get()
+    if state is not None and state.stack and state.stack[-1][0] == 'render':
+        _pop_stage(state)
+
+
+def init_app(app):
+    """Installe la mesure des requêtes, de la sérialisation JSON et du rendu des templates"""
+    if not METRICS_ENABLED:
+        logger.info("Métriques désactivées (METRICS_ENABLED=0)")
+        return
+    from flask import before_render_template, template_rendered
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        """Sérialisation JSON mesurée comme étape serialize"""
+
+        def dumps(self, obj, **kwargs):
+            with stage('serialize'):
+                return super().dumps(obj, **kwargs)
+
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+
+
+# ---------------------------------------------------------------------------
+# Collecte
+# ---------------------------------------------------------------------------
+
+def register_render_cache(name: str, cache):
+    """Expose les compteurs d'un RenderCache (succès mémoire et disque, échecs, évictions)"""
+    _render_caches[name] = cache
+
+
+def _gauge(name: str, documentation: str, samples: list, metric_type: str = 'gauge') -> list:
+    """Lignes d'une métrique: samples = [(labels dict, valeur)]"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+    return lines
+
+
+def _resident_memory() -> tuple:
+    """(RSS courant ou None, RSS maximal) en octets"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        current = None
+    return current, peak
+
+
+def _collect_process() -> list:
+    current, peak = _resident_memory()
+    lines = []
+    if current is not None:
+        lines += _gauge('process_resident_memory_bytes', 'Mémoire résidente du processus', [({}, current)])
+    lines += _gauge('process_max_resident_memory_bytes', 'Mémoire résidente maximale du processus', [({}, peak)])
+    return lines
+
+
+def _collect_data() -> list:
+    from app.utils import data_loader as data_loader_module
+
+    version = data_loader_module.DataLoader().get_data_version()
+    if not _data_versions or _data_versions[-1] != version:
+        _data_versions.append(version)
+
+    cache = dict(data_loader_module._data_cache)
+    rows = [({'dataset': key}, len(value)) for key, value in sorted(cache.items()) if hasattr(value, '__len__')
+            and key in ('communes_data', 'mobility_data', 'mobility_data_coded')]
+    loaded = [({'entry': key}, value) for key, value in sorted(data_loader_module._cache_timestamps.items())
+              if key in ('communes_data', 'mobility_data', 'mobility_data_coded')]
+
+    lines = _gauge('mobilite_data_info', 'Version des données sources (empreinte des fichiers)',
+                   [({'version': version}, 1)])
+    lines += _gauge('mobilite_data_generation', 'Versions des données observées depuis le démarrage',
+                    [({}, len(_data_versions))])
+    lines += _gauge('mobilite_data_rows', 'Lignes des jeux de données en cache', rows)
+    lines += _gauge('mobilite_data_cache_entries', 'Entrées de _data_cache', [({}, len(cache))])
+    lines += _gauge('mobilite_data_source_mtime_seconds', 'Date de modification des fichiers chargés', loaded)
+    return lines
+
+
+def _collect_render_caches() -> list:
+    samples = {'hits': [], 'misses': [], 'evictions': [], 'entries': []}
+    for name, cache in sorted(_render_caches.items()):
+        stats = dict(cache.stats)
+        samples['hits'].append(({'cache': name, 'tier': 'memory'}, stats.get('hits', 0)))
+        samples['hits'].append(({'cache': name, 'tier': 'disk'}, stats.get('disk_hits', 0)))
+        samples['misses'].append(({'cache': name}, stats.get('misses', 0)))
+        samples['evictions'].append(({'cache': name}, stats.get('evictions', 0)))
+        samples['entries'].append(({'cache': name}, len(cache)))
+    return (_gauge('mobilite_render_cache_hits_total', 'Rendus servis par un cache de rendu', samples['hits'],
+                   'counter')
+            + _gauge('mobilite_render_cache_misses_total', 'Rendus absents d\'un cache de rendu', samples['misses'],
+                     'counter')
+            + _gauge('mobilite_render_cache_evictions_total', 'Rendus évincés (mémoire ou disque)',
+                     samples['evictions'], 'counter')
+            + _gauge('mobilite_render_cache_entries', 'Rendus gardés en mémoire', samples['entries']))
+
+
+def _collect_coalescing() -> list:
+    from app.utils.coalescing import get_coalescing_stats
+
+    computations = get_coalescing_stats().get('computations', {})
+    executions = [({'computation': name}, stats.get('executions', 0)) for name, stats in sorted(computations.items())]
+    coalesced = [({'computation': name}, stats.get('coalesced', 0)) for name, stats in sorted(computations.items())]
+    return (_gauge('mobilite_coalescing_executions_total', 'Calculs exécutés', executions, 'counter')
+            + _gauge('mobilite_coalescing_coalesced_total', 'Appels servis par un calcul déjà en cours', coalesced,
+                     'counter'))
+
+
+def render_metrics() -> str:
+    """Toutes les métriques au format texte Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines += metric.collect()
+    for collector in (_collect_data, _collect_render_caches, _collect_coalescing, _collect_process):
+        try:
+            lines += collector()
+        except Exception as e:
+            logger.warning(f"Collecte de métriques impossible ({collector.__name__}): {e}")
+    return '\n'.join(lines) + '\n'
+
+
+def measure_overhead(app, iterations: int = 20000) -> dict:
+    """
+    Surcoût de l'instrumentation en microsecondes: une étape mesurée (avec et sans
+    étape englobante) et les fonctions exécutées avant et après chaque requête.
+    Les séries synthétiques sont retirées des métriques ensuite.
+    """
+    def per_call(func) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def empty():
+        pass
+
+    def timed():
+        with stage('overhead'):
+            pass
+
+    def nested():
+        with stage('overhead'):
+            with stage('overhead'):
+                pass
+
+    baseline = per_call(empty)
+    stage_us = per_call(timed) - baseline
+    nested_us = (per_call(nested) - baseline) / 2
+
+    from flask import Response
+    with app.test_request_context('/', method='OVERHEAD'):
+        response = Response()
+
+        def request_hooks():
+            _before_request()
+            _after_request(response)
+
+        request_us = per_call(request_hooks) - baseline
+
+    STAGE_DURATION.remove('overhead')
+    REQUEST_DURATION.remove('OVERHEAD', 'unmatched', '200')
+    state = _stage_state.get()
+    if state is not None:
+        state.totals.pop('overhead', None)
+
+    return {
+        'stage_us': round(stage_us, 2),
+        'nested_stage_us': round(nested_us, 2),
+        'request_us': round(request_us, 2),
+        'stage_budget_us': STAGE_OVERHEAD_BUDGET_US,
+        'request_budget_us': REQUEST_OVERHEAD_BUDGET_US,
+        'within_budget': stage_us <= STAGE_OVERHEAD_BUDGET_US and nested_us <= STAGE_OVERHEAD_BUDGET_US
+                         and request_us <= REQUEST_OVERHEAD_BUDGET_US,
+    }
@@ -0,0 +1,166 @@
+"""
+Cache des rendus (cartes HTML, images) à deux niveaux
+
+Un LRU en mémoire borné en nombre d'entrées, adossé à un répertoire sur disque
+borné en nombre de fichiers. Les clés incluent la version des données et celle
+du code de rendu (get_code_version): un fichier source modifié ou un
+déploiement invalide naturellement les rendus précédents.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=None)
+def get_code_version(*paths) -> str:
+    """
+    Empreinte des modules Python donnés (fichiers, ou répertoires parcourus
+    récursivement), calculée une fois par processus.
+
+    Sans argument: les paquets du calcul et du rendu (app/routes, app/utils,
+    app/visualizations).
+    """
+    paths = paths or (APP_DIR / 'routes', APP_DIR / 'utils', APP_DIR / 'visualizations')
+    files = []
+    for path in map(Path, paths):
+        files += sorted(path.rglob('*.py')) if path.is_dir() else [path]
+
+    digest = hashlib.sha1()
+    for path in files:
+        digest.update(path.name.encode('utf-8'))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def make_cache_key(kind: str, filters: dict, data_version: str) -> str:
+    """
+    Construit une clé stable à partir du type de rendu, des filtres et de la version des données.
+
+    Les filtres vides sont ignorés et les valeurs normalisées (texte sans espaces),
+    de sorte que ?region=84&age= et ?age=&region=84 partagent la même entrée.
+    """
+    normalized = {
+        str(k): str(v).strip()
+        for k, v in filters.items()
+        if v is not None and str(v).strip() != ''
+    }
+    payload = json.dumps({'kind': kind, 'filters': normalized, 'version': data_version}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """
+    Cache mémoire + disque pour des rendus sérialisés en bytes.
+
+    Args:
+        cache_dir: Répertoire des fichiers (None: mémoire uniquement)
+        max_entries: Nombre maximal d'entrées gardées en mémoire
+        max_files: Nombre maximal de fichiers sur disque (les plus anciens sont supprimés)
+        suffix: Extension des fichiers sur disque
+    """
+
+    def __init__(self, cache_dir=None, max_entries: int = 16, max_files: int = 200, suffix: str = '.bin'):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.suffix = suffix
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __len__(self):
+        """Nombre de rendus gardés en mémoire"""
+        with self._lock:
+            return len(self._memory)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def _remember(self, key: str, value: bytes):
+        """Ajoute en mémoire (appelé sous verrou)"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get(self, key: str):
+        """Retourne le rendu en cache (bytes) ou None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._memory[key]
+
+        if self.cache_dir is not None:
+            path = self._path(key)
+            try:
+                value = path.read_bytes()
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self.stats['disk_hits'] += 1
+                return value
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: bytes, persist: bool = True):
+        """
+        Enregistre un rendu en mémoire et sur disque (écriture atomique).
+
+        Args:
+            persist: False pour un rendu provisoire, gardé en mémoire seulement
+        """
+        with self._lock:
+            self._remember(key, value)
+
+        if self.cache_dir is None or not persist:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(value)
+            os.replace(tmp_path, path)
+            self._prune_disk()
+        except OSError as e:
+            logger.warning(f"Impossible d'écrire le cache de rendu {self.cache_dir}: {e}")
+
+    def _prune_disk(self):
+        """Supprime les fichiers les plus anciens au-delà de max_files"""
+        files = list(self.cache_dir.glob(f"*{self.suffix}"))
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda f: f.stat().st_mtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                path.unlink()
+                with self._lock:
+                    self.stats['evictions'] += 1
+            except OSError:
+                pass
+
+    def clear(self):
+        """Vide la mémoire et le disque"""
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob(f"*{self.suffix}"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
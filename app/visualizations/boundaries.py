@@ -0,0 +1,466 @@
+"""
+Contours simplifiés des communes, départements et régions
+
+Les contours sont préparés une fois par scripts/build_boundaries.py à partir
+d'un fichier GeoJSON local, sous forme de topologie (à la manière de TopoJSON):
+- coordonnées quantifiées sur une grille entière,
+- frontières communes à deux territoires stockées une seule fois (arcs),
+- pour chaque point, son « importance » Douglas–Peucker: la tolérance
+  au-delà de laquelle il disparaît.
+
+Simplifier un niveau de zoom revient alors à garder les points dont
+l'importance dépasse la tolérance de ce zoom (environ un demi-pixel). Les
+extrémités d'arcs (points partagés par trois territoires ou plus) sont
+toujours gardées et chaque arc est simplifié une seule fois: les territoires
+voisins restent jointifs à tous les zooms.
+
+Le résultat est servi en TopoJSON (arcs encodés en écarts successifs, sur une
+grille alignée sur la tolérance du zoom), mis en cache par niveau et par zoom,
+en clair et compressé (gzip).
+"""
+
+import gzip
+import json
+import logging
+import math
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY_LEVELS = ('communes', 'departements', 'regions')
+
+BOUNDARIES_DIR = Path(__file__).parent.parent.parent / 'data' / 'processed'
+
+# Zooms servis (en dessous / au-dessus, le zoom le plus proche est utilisé)
+MIN_BOUNDARY_ZOOM = 4
+MAX_BOUNDARY_ZOOM = 12
+
+# Tolérance de simplification, en pixels à l'écran
+TOLERANCE_PX = 0.5
+
+# Budget de points par niveau et par zoom: si la tolérance du zoom garde plus de
+# points, elle est augmentée par paliers (x1.5) jusqu'à rentrer dans le budget.
+# ~10 octets par point en TopoJSON (avant gzip): au plus ~150 Ko (régions),
+# ~400 Ko (départements) et ~3 Mo (communes). Voir le README.
+POINT_BUDGETS = {
+    'regions': 15_000,
+    'departements': 40_000,
+    'communes': 300_000,
+}
+MAX_BUDGET_STEPS = 10
+
+DEFAULT_QUANTIZATION = 100_000
+
+# Cache: (niveau, chemin, mtime) -> topologie chargée, (niveau, zoom, mtime) -> JSON encodé
+_topologies = {}
+_encoded = {}
+_cache_lock = threading.Lock()
+
+
+def get_boundaries_path(level: str) -> Path:
+    return BOUNDARIES_DIR / f'boundaries_{level}.npz'
+
+
+# ---------------------------------------------------------------------------
+# Construction de la topologie (scripts/build_boundaries.py)
+# ---------------------------------------------------------------------------
+
+def _polygons_of(geometry: dict) -> list:
+    """Liste des polygones (listes d'anneaux) d'une géométrie GeoJSON"""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def _canonical_ring(ring: list):
+    """
+    Forme canonique d'un anneau fermé sans jonction (rotation commençant au plus
+    petit point, sens fixé), pour reconnaître le même anneau parcouru par deux
+    territoires (enclave).
+
+    Returns:
+        (tuple de points, True si l'anneau a été inversé)
+    """
+    start = ring.index(min(ring))
+    rotated = ring[start:] + ring[:start]
+    reversed_ring = [rotated[0]] + rotated[:0:-1]
+    if reversed_ring[1] < rotated[1]:
+        return tuple(reversed_ring), True
+    return tuple(rotated), False
+
+
+def douglas_peucker_importance(points: np.ndarray, closed: bool = False) -> np.ndarray:
+    """
+    Importance Douglas–Peucker de chaque point d'un arc: tolérance maximale à
+    laquelle le point est gardé (infinie pour les extrémités).
+
+    L'importance d'un point est plafonnée par celle du point qui a découpé son
+    segment, de sorte que « importance >= t » reproduit exactement la
+    simplification Douglas–Peucker de tolérance t.
+
+    Args:
+        points: Tableau (n, 2) en unités isotropes
+        closed: Arc fermé (premier point = dernier): deux points intérieurs sont
+            toujours gardés pour que l'anneau ne dégénère pas
+    """
+    n = len(points)
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    if n <= 2:
+        return importance
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, cap = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[first + 1:last]
+        a, b = points[first], points[last]
+        ab = b - a
+        length = math.hypot(ab[0], ab[1])
+        if length == 0:
+            distances = np.hypot(segment[:, 0] - a[0], segment[:, 1] - a[1])
+        else:
+            distances = np.abs(ab[0] * (segment[:, 1] - a[1]) - ab[1] * (segment[:, 0] - a[0])) / length
+        k = int(np.argmax(distances))
+        value = min(float(distances[k]), cap)
+        index = first + 1 + k
+        importance[index] = value
+        stack.append((first, index, value))
+        stack.append((index, last, value))
+
+    if closed and n > 4:
+        interior = np.argsort(importance[1:-1])[-2:] + 1
+        importance[interior] = np.inf
+    elif closed:
+        importance[:] = np.inf
+    return importance
+
+
+def build_topology(features: list, id_property: str = 'code', name_property: str = 'nom',
+                   quantization: int = DEFAULT_QUANTIZATION) -> dict:
+    """
+    Construit la topologie d'une collection de features GeoJSON (Polygon/MultiPolygon).
+
+    Returns:
+        Dictionnaire de tableaux numpy (format de save_boundaries)
+    """
+    # Emprise et quantification
+    all_x, all_y = [], []
+    for feature in features:
+        for polygon in _polygons_of(feature.get('geometry')):
+            for ring in polygon:
+                for x, y in (point[:2] for point in ring):
+                    all_x.append(x)
+                    all_y.append(y)
+    if not all_x:
+        raise ValueError("Aucun polygone trouvé dans les features")
+
+    min_x, max_x, min_y, max_y = min(all_x), max(all_x), min(all_y), max(all_y)
+    scale_x = (max_x - min_x) / (quantization - 1) or 1.0
+    scale_y = (max_y - min_y) / (quantization - 1) or 1.0
+    del all_x, all_y
+
+    def quantize_ring(ring):
+        points = [(int(round((x - min_x) / scale_x)), int(round((y - min_y) / scale_y)))
+                  for x, y in (point[:2] for point in ring)]
+        cleaned = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+        while len(cleaned) > 1 and cleaned[-1] == cleaned[0]:
+            cleaned.pop()
+        return cleaned if len(cleaned) >= 3 else None
+
+    # Territoires -> polygones -> anneaux quantifiés
+    ids, names, objects = [], [], []
+    for feature in features:
+        properties = feature.get('properties') or {}
+        code = properties.get(id_property, feature.get('id'))
+        if code is None:
+            continue
+        polygons = []
+        for polygon in _polygons_of(feature.get('geometry')):
+            rings = [quantize_ring(ring) for ring in polygon]
+            if rings and rings[0] is not None:
+                polygons.append([ring for ring in rings if ring is not None])
+        if polygons:
+            ids.append(str(code))
+            names.append(str(properties.get(name_property) or code))
+            objects.append(polygons)
+
+    # Jonctions: points ayant plus de deux voisins distincts dans l'ensemble des anneaux
+    neighbours = {}
+    for polygons in objects:
+        for polygon in polygons:
+            for ring in polygon:
+                count = len(ring)
+                for i, point in enumerate(ring):
+                    neighbours.setdefault(point, set()).update((ring[i - 1], ring[(i + 1) % count]))
+    junctions = {point for point, near in neighbours.items() if len(near) > 2}
+    del neighbours
+
+    # Découpage des anneaux en arcs, chaque arc n'étant stocké qu'une fois
+    arcs, arc_index = [], {}
+
+    def add_arc(points, closed_reversed=None):
+        key = tuple(points)
+        if key in arc_index:
+            index = arc_index[key]
+        elif closed_reversed is None and key[::-1] in arc_index:
+            return ~arc_index[key[::-1]]
+        else:
+            index = arc_index[key] = len(arcs)
+            arcs.append(key)
+        return ~index if closed_reversed else index
+
+    geometry_refs = []
+    for polygons in objects:
+        object_refs = []
+        for polygon in polygons:
+            polygon_refs = []
+            for ring in polygon:
+                cuts = [i for i, point in enumerate(ring) if point in junctions]
+                if not cuts:
+                    canonical, was_reversed = _canonical_ring(ring)
+                    polygon_refs.append([add_arc(list(canonical) + [canonical[0]], was_reversed)])
+                    continue
+                rotated = ring[cuts[0]:] + ring[:cuts[0]]
+                positions = [i - cuts[0] for i in cuts] + [len(ring)]
+                rotated.append(rotated[0])
+                polygon_refs.append([add_arc(rotated[start:end + 1])
+                                     for start, end in zip(positions[:-1], positions[1:])])
+            object_refs.append(polygon_refs)
+        geometry_refs.append(object_refs)
+
+    # Importance Douglas–Peucker, en degrés de latitude (longitudes corrigées par cos(lat))
+    lat0 = math.radians((min_y + max_y) / 2)
+    unit = np.array([scale_x * math.cos(lat0), scale_y])
+    arc_offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+    arc_offsets[1:] = np.cumsum([len(arc) for arc in arcs])
+    points = np.array([point for arc in arcs for point in arc], dtype=np.int32).reshape(-1, 2)
+    importance = np.empty(len(points), dtype=np.float32)
+    for i, arc in enumerate(arcs):
+        start, end = arc_offsets[i], arc_offsets[i + 1]
+        importance[start:end] = douglas_peucker_importance(points[start:end] * unit, closed=arc[0] == arc[-1])
+
+    # Géométries en tableaux à offsets (territoire -> polygones -> anneaux -> arcs)
+    object_polygons, polygon_rings, ring_arcs, arc_refs = [0], [0], [0], []
+    for object_refs in geometry_refs:
+        for polygon_refs in object_refs:
+            for ring_refs in polygon_refs:
+                arc_refs.extend(ring_refs)
+                ring_arcs.append(len(arc_refs))
+            polygon_rings.append(len(ring_arcs) - 1)
+        object_polygons.append(len(polygon_rings) - 1)
+
+    return {
+        'ids': np.array(ids, dtype=str),
+        'names': np.array(names, dtype=str),
+        'object_polygons': np.array(object_polygons, dtype=np.int64),
+        'polygon_rings': np.array(polygon_rings, dtype=np.int64),
+        'ring_arcs': np.array(ring_arcs, dtype=np.int64),
+        'arc_refs': np.array(arc_refs, dtype=np.int64),
+        'arc_offsets': arc_offsets,
+        'points': points,
+        'importance': importance,
+        'scale': np.array([scale_x, scale_y]),
+        'translate': np.array([min_x, min_y]),
+        'lat0': np.array(lat0),
+    }
+
+
+def save_boundaries(topology: dict, level: str, path=None) -> Path:
+    """Écrit la topologie d'un niveau de façon atomique"""
+    path = Path(path or get_boundaries_path(level))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp.npz')
+    np.savez_compressed(tmp_path, **topology)
+    tmp_path.replace(path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Simplification et encodage TopoJSON (serveur)
+# ---------------------------------------------------------------------------
+
+def load_boundaries(level: str):
+    """
+    Charge la topologie d'un niveau (avec cache, rechargée si le fichier change).
+
+    Returns:
+        Dictionnaire de tableaux, ou None si le fichier est absent
+    """
+    path = get_boundaries_path(level)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    key = (level, str(path), mtime)
+    with _cache_lock:
+        if key in _topologies:
+            return _topologies[key]
+
+    with np.load(path, allow_pickle=False) as data:
+        topology = {name: data[name] for name in data.files}
+    topology['version'] = str(mtime)
+    topology['objects_json'] = _encode_objects(topology, level)
+    logger.info(f"Contours chargés ({level}): {len(topology['ids'])} territoires, "
+                f"{len(topology['arc_offsets']) - 1} arcs, {len(topology['points'])} points")
+
+    with _cache_lock:
+        for old_key in [k for k in _topologies if k[0] == level]:
+            del _topologies[old_key]
+        _topologies[key] = topology
+    return topology
+
+
+def get_boundaries_version(level: str) -> str:
+    """Version du fichier de contours (date de modification), '' s'il est absent"""
+    try:
+        return str(get_boundaries_path(level).stat().st_mtime_ns)
+    except OSError:
+        return ''
+
+
+def _encode_objects(topology: dict, level: str) -> str:
+    """Partie « objects » du TopoJSON (identique à tous les zooms)"""
+    object_polygons = topology['object_polygons']
+    polygon_rings = topology['polygon_rings']
+    ring_arcs = topology['ring_arcs']
+    arc_refs = topology['arc_refs'].tolist()
+
+    geometries = []
+    for i, (code, name) in enumerate(zip(topology['ids'].tolist(), topology['names'].tolist())):
+        polygons = []
+        for p in range(object_polygons[i], object_polygons[i + 1]):
+            polygons.append([arc_refs[ring_arcs[r]:ring_arcs[r + 1]]
+                             for r in range(polygon_rings[p], polygon_rings[p + 1])])
+        if len(polygons) == 1:
+            geometry = {'type': 'Polygon', 'arcs': polygons[0]}
+        else:
+            geometry = {'type': 'MultiPolygon', 'arcs': polygons}
+        geometry.update({'id': code, 'properties': {'name': name}})
+        geometries.append(geometry)
+
+    return json.dumps({level: {'type': 'GeometryCollection', 'geometries': geometries}},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+def clamp_boundary_zoom(zoom: int) -> int:
+    return max(MIN_BOUNDARY_ZOOM, min(MAX_BOUNDARY_ZOOM, int(zoom)))
+
+
+def tolerance_for_zoom(zoom: int, topology: dict) -> float:
+    """Tolérance (degrés de latitude) correspondant à TOLERANCE_PX pixels à ce zoom"""
+    return TOLERANCE_PX * 360.0 / (256 * (1 << zoom)) * math.cos(float(topology['lat0']))
+
+
+def simplify_mask(topology: dict, level: str, zoom: int):
+    """
+    Points gardés au zoom demandé, en respectant le budget de points du niveau.
+
+    Returns:
+        (masque booléen, tolérance utilisée)
+    """
+    importance = topology['importance']
+    tolerance = tolerance_for_zoom(zoom, topology)
+    budget = POINT_BUDGETS.get(level)
+    for _ in range(MAX_BUDGET_STEPS):
+        mask = importance >= tolerance
+        if budget is None or mask.sum() <= budget:
+            break
+        tolerance *= 1.5
+    else:
+        logger.warning(f"Contours {level} au zoom {zoom}: {int(mask.sum())} points, "
+                       f"au-delà du budget de {budget}")
+    return mask, tolerance
+
+
+def requantization_factor(topology: dict, tolerance: float) -> int:
+    """
+    Facteur de regroupement de la grille de quantification: la grille suit la
+    tolérance du zoom (pas plus fin qu'un demi-pixel), ce qui raccourcit les
+    coordonnées transmises.
+    """
+    return max(1, int(tolerance / float(topology['scale'][1])))
+
+
+def encode_arcs(topology: dict, mask: np.ndarray, factor: int = 1) -> list:
+    """
+    Arcs simplifiés, encodés en écarts successifs (premier point absolu).
+
+    Args:
+        factor: Facteur de requantification (voir requantization_factor); les
+            points intérieurs qui tombent sur la même case que le précédent sont retirés
+    """
+    kept = np.flatnonzero(mask)
+    points = np.rint(topology['points'][kept] / factor).astype(np.int64)
+    arc_ids = np.searchsorted(topology['arc_offsets'], kept, side='right') - 1
+
+    same_arc = np.zeros(len(kept), dtype=bool)
+    same_arc[1:] = arc_ids[1:] == arc_ids[:-1]
+    if factor > 1:
+        is_last = np.ones(len(kept), dtype=bool)
+        is_last[:-1] = ~same_arc[1:]
+        duplicate = np.zeros(len(kept), dtype=bool)
+        duplicate[1:] = same_arc[1:] & (points[1:] == points[:-1]).all(axis=1)
+        keep = ~(duplicate & ~is_last)
+        points, same_arc = points[keep], same_arc[keep]
+
+    deltas = points.copy()
+    deltas[1:][same_arc[1:]] = points[1:][same_arc[1:]] - points[:-1][same_arc[1:]]
+
+    starts = np.flatnonzero(~same_arc)
+    return [chunk.tolist() for chunk in np.split(deltas, starts[1:])]
+
+
+def get_topojson(level: str, zoom: int, compressed: bool = False) -> bytes:
+    """
+    TopoJSON d'un niveau simplifié pour un zoom (avec cache).
+
+    Args:
+        compressed: Retourner la version gzip (calculée une fois avec la version brute)
+
+    Raises:
+        ValueError: Niveau inconnu
+        FileNotFoundError: Contours non générés pour ce niveau
+    """
+    if level not in BOUNDARY_LEVELS:
+        raise ValueError(f"Niveau inconnu: {level} (attendu: {', '.join(BOUNDARY_LEVELS)})")
+    topology = load_boundaries(level)
+    if topology is None:
+        raise FileNotFoundError(f"Contours absents pour {level}: ils ne sont pas livrés avec le dépôt, "
+                                f"générer avec scripts/build_boundaries.py --level {level}")
+
+    zoom = clamp_boundary_zoom(zoom)
+    key = (level, zoom, topology['version'])
+    with _cache_lock:
+        if key in _encoded:
+            return _encoded[key][1 if compressed else 0]
+
+    mask, tolerance = simplify_mask(topology, level, zoom)
+    factor = requantization_factor(topology, tolerance)
+    header = {
+        'type': 'Topology',
+        'transform': {'scale': (topology['scale'] * factor).tolist(), 'translate': topology['translate'].tolist()},
+        'zoom': zoom,
+        'tolerance': tolerance,
+    }
+    arcs_json = json.dumps(encode_arcs(topology, mask, factor), separators=(',', ':'))
+    content = (json.dumps(header, separators=(',', ':'))[:-1]
+               + ',"objects":' + topology['objects_json'] + ',"arcs":' + arcs_json + '}').encode('utf-8')
+    encoded = (content, gzip.compress(content, compresslevel=6))
+    logger.debug(f"TopoJSON {level} zoom {zoom}: {int(mask.sum())} points, {len(content)} octets "
+                 f"({len(encoded[1])} compressés)")
+
+    with _cache_lock:
+        for old_key in [k for k in _encoded if k[0] == level and k[2] != topology['version']]:
+            del _encoded[old_key]
+        _encoded[key] = encoded
+    return encoded[1 if compressed else 0]
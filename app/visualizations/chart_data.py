@@ -0,0 +1,166 @@
+"""
+Données des graphiques en JSON, pour un rendu côté navigateur
+
+- Histogrammes: bornes et effectifs des classes d'un indicateur, calculés par
+  np.histogram sur la table des indicateurs déjà en cache (index des popups),
+  en nombre de communes et, si demandé, pondérés par IPONDI (navetteurs).
+  Avec des classes fines (jusqu'à MAX_HISTOGRAM_BINS), le navigateur peut
+  regrouper les classes voisines lui-même.
+- Séries par région: une valeur par région (prepare_regions_data), pour les
+  bar charts.
+
+Les résultats sont gardés par filtres et version des données: une vue ne coûte
+plus qu'une lecture de cache.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_loader import DataLoader
+from app.visualizations.choropleth import INDICATOR_LABELS
+from app.visualizations.points import INDICATOR_COLUMNS
+from app.visualizations.popups import get_popup_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTOGRAM_BINS = 30
+MAX_HISTOGRAM_BINS = 200
+
+MAX_CHART_DATA_ENTRIES = 64
+
+_chart_data = OrderedDict()
+_chart_data_lock = threading.Lock()
+
+data_loader = DataLoader()
+
+
+def _cached(key: tuple, compute):
+    """Retourne la valeur en cache pour key, ou la calcule et la garde"""
+    with _chart_data_lock:
+        if key in _chart_data:
+            _chart_data.move_to_end(key)
+            return _chart_data[key]
+
+    value = compute()
+
+    with _chart_data_lock:
+        _chart_data[key] = value
+        _chart_data.move_to_end(key)
+        while len(_chart_data) > MAX_CHART_DATA_ENTRIES:
+            _chart_data.popitem(last=False)
+    return value
+
+
+def compute_histogram(values: np.ndarray, weights: np.ndarray = None, bins: int = DEFAULT_HISTOGRAM_BINS) -> dict:
+    """
+    Histogramme vectorisé d'un indicateur.
+
+    Args:
+        values: Valeurs par commune (NaN ignorés)
+        weights: Poids par commune (IPONDI), optionnel
+
+    Returns:
+        Dictionnaire: edges (bins + 1 bornes), counts (communes par classe) et, si
+        weights, weighted (somme des poids par classe), plus quelques statistiques
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    values = values[valid]
+    if len(values) == 0:
+        return {'edges': [], 'counts': [], 'n': 0}
+
+    counts, edges = np.histogram(values, bins=bins)
+    result = {
+        'edges': np.round(edges, 3).tolist(),
+        'counts': counts.tolist(),
+        'n': int(len(values)),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2),
+        'mean': round(float(values.mean()), 2),
+        'median': round(float(np.median(values)), 2),
+    }
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float)[valid])
+        weighted, _ = np.histogram(values, bins=edges, weights=weights)
+        total = float(weights.sum())
+        result['weighted'] = np.round(weighted, 1).tolist()
+        result['weighted_total'] = round(total, 1)
+        result['weighted_mean'] = round(float((values * weights).sum() / total), 2) if total > 0 else None
+    return result
+
+
+def get_histogram_data(indicator: str, bins: int = DEFAULT_HISTOGRAM_BINS, weighted: bool = False,
+                       region_filter: str = '', department_filter: str = '', age_filter: str = '') -> dict:
+    """
+    Histogramme d'un indicateur des communes (avec cache).
+
+    Raises:
+        ValueError: Indicateur ou nombre de classes invalide
+    """
+    if indicator not in INDICATOR_COLUMNS:
+        raise ValueError(f"Indicateur inconnu: {indicator} (attendu: {', '.join(INDICATOR_COLUMNS)})")
+    if not 1 <= bins <= MAX_HISTOGRAM_BINS:
+        raise ValueError(f"bins hors limites: {bins} (1 à {MAX_HISTOGRAM_BINS})")
+
+    def compute():
+        table = get_popup_index(region_filter, department_filter, age_filter)
+        if table.empty or indicator not in table.columns:
+            histogram = compute_histogram(np.empty(0), bins=bins)
+        else:
+            weights = None
+            if weighted:
+                weights = data_loader.get_commune_weights(age_filter).reindex(table.index).fillna(0).to_numpy()
+            histogram = compute_histogram(pd.to_numeric(table[indicator], errors='coerce').to_numpy(),
+                                          weights, bins)
+        return {
+            'indicator': indicator,
+            'label': INDICATOR_LABELS.get(indicator, indicator),
+            'bins': bins,
+            'weighted_by': 'IPONDI' if weighted else None,
+            **histogram,
+        }
+
+    key = ('histogram', data_loader.get_data_version(), indicator, bins, bool(weighted),
+           region_filter or '', department_filter or '', age_filter or '')
+    return _cached(key, compute)
+
+
+def get_region_series(indicator: str, age_filter: str = '') -> dict:
+    """
+    Valeur d'un indicateur par région, la plus forte d'abord (avec cache).
+
+    Raises:
+        ValueError: Indicateur invalide
+    """
+    if indicator not in INDICATOR_COLUMNS:
+        raise ValueError(f"Indicateur inconnu: {indicator} (attendu: {', '.join(INDICATOR_COLUMNS)})")
+
+    def compute():
+        regions_df = _cached(('regions', data_loader.get_data_version(), age_filter or ''),
+                             lambda: _prepare_regions(age_filter))
+        series = []
+        if not regions_df.empty and indicator in regions_df.columns:
+            frame = regions_df[['REG', 'Région', 'PTOT', indicator]].copy()
+            frame[indicator] = pd.to_numeric(frame[indicator], errors='coerce')
+            frame = frame.dropna(subset=[indicator]).sort_values([indicator, 'REG'], ascending=[False, True])
+            series = [
+                {'code': str(code), 'name': str(name), 'population': int(population), 'value': round(float(value), 1)}
+                for code, name, population, value in frame.itertuples(index=False)
+            ]
+        return {
+            'indicator': indicator,
+            'label': INDICATOR_LABELS.get(indicator, indicator),
+            'series': series,
+        }
+
+    key = ('regions-series', data_loader.get_data_version(), indicator, age_filter or '')
+    return _cached(key, compute)
+
+
+def _prepare_regions(age_filter: str) -> pd.DataFrame:
+    from app.routes.export import prepare_regions_data
+    return prepare_regions_data(age_filter)
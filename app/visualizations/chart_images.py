@@ -0,0 +1,267 @@
+"""
+Graphiques servis comme images (PNG ou SVG), avec cache
+
+Chaque graphique est rendu une fois par (graphique, format, filtres, version des
+données) puis servi depuis un cache mémoire adossé au disque
+(data/processed/chart_cache). La clé de cache sert aussi d'ETag: une vue
+répétée est servie depuis le cache, ou répondue par un 304 si le navigateur a
+déjà l'image. Les rendus eux-mêmes se font dans le pool de processus de
+chart_renderer: plusieurs graphiques d'une page sont rendus en parallèle.
+
+Quand la version des données change, les combinaisons de filtres les plus
+demandées (et la vue sans filtre) sont re-rendues en arrière-plan, de sorte que
+les premières vues après un rechargement des données sont déjà en cache.
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+
+from app.utils.coalescing import get_flight
+from app.utils.data_loader import DataLoader
+from app.utils.metrics import register_render_cache
+from app.utils.render_cache import RenderCache, make_cache_key
+from app.visualizations import chart_renderer
+
+logger = logging.getLogger(__name__)
+
+# Formats d'image servis (matplotlib n'est importé que dans les processus de rendu)
+IMAGE_FORMATS = ('png', 'svg')
+
+# Graphiques disponibles: source des données, filtres pris en compte et paramètres du rendu
+CHART_SPECS = {
+    'travel-time': {
+        'kind': 'histogram',
+        'column': 'avg_commute_time',
+        'filters': ('region', 'department', 'age'),
+        'title': "Distribution du Temps de Trajet Domicile-Travail",
+        'xlabel': "Temps (minutes)",
+        'alt': "Histogramme Temps de Trajet",
+    },
+    'bike-usage': {
+        'kind': 'histogram',
+        'column': 'velo_percentage',
+        'filters': ('region', 'department', 'age'),
+        'title': "Distribution du Taux d'Utilisation du Vélo",
+        'xlabel': "Taux (%)",
+        'alt': "Histogramme Taux Vélo",
+    },
+    'public-transport': {
+        'kind': 'histogram',
+        'column': 'transport_commun_percentage',
+        'filters': ('region', 'department', 'age'),
+        'title': "Distribution du Taux d'Utilisation des Transports en Commun",
+        'xlabel': "Taux (%)",
+        'alt': "Histogramme TC",
+    },
+    'green-mobility-by-region': {
+        'kind': 'bar',
+        'column': 'green_mobility_index',
+        'filters': ('age',),
+        'title': "Indicateur de Mobilité Verte par Région",
+        'xlabel': "Région",
+        'ylabel': "Indicateur de Mobilité Verte",
+        'alt': "Bar chart Mobilité Verte par Région",
+    },
+    'travel-time-by-region': {
+        'kind': 'bar',
+        'column': 'avg_commute_time',
+        'filters': ('age',),
+        'title': "Temps de Trajet Moyen par Région",
+        'xlabel': "Région",
+        'ylabel': "Temps (minutes)",
+        'alt': "Bar chart Temps Trajet par Région",
+    },
+}
+
+# Nombre de combinaisons de filtres (les plus demandées) re-rendues après un rechargement
+PRERENDER_TOP = int(os.environ.get('CHART_PRERENDER_TOP', 8))
+
+# Combinaisons de filtres suivies au plus; au-delà, les moins demandées sont oubliées
+MAX_TRACKED_COMBINATIONS = int(os.environ.get('CHART_MAX_TRACKED_COMBINATIONS', 1000))
+
+data_loader = DataLoader()
+
+chart_cache = RenderCache(
+    cache_dir=os.environ.get('CHART_CACHE_DIR') or data_loader.base_path / 'data' / 'processed' / 'chart_cache',
+    max_entries=int(os.environ.get('CHART_CACHE_MAX_ENTRIES', 128)),
+    max_files=int(os.environ.get('CHART_CACHE_MAX_FILES', 500)),
+    suffix='.img'
+)
+register_render_cache('charts', chart_cache)
+
+# Demandes par (graphique, format, filtres) ayant produit une image, pour choisir quoi pré-rendre
+_request_counts = Counter()
+_prerender_state = {'version': None, 'thread': None}
+_prerender_lock = threading.Lock()
+
+
+class ChartUnavailable(Exception):
+    """Données absentes pour ce graphique et ces filtres"""
+
+
+def normalize_chart_filters(name: str, filters: dict) -> dict:
+    """Garde uniquement les filtres pris en compte par le graphique (clés de cache partagées)"""
+    return {key: (filters.get(key) or '') for key in CHART_SPECS[name]['filters']}
+
+
+def validate_chart(name: str, image_format: str):
+    """Lève ValueError si le graphique ou le format est inconnu"""
+    if name not in CHART_SPECS:
+        raise ValueError(f"Graphique inconnu: {name} (attendu: {', '.join(CHART_SPECS)})")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Format inconnu: {image_format} (attendu: {', '.join(IMAGE_FORMATS)})")
+
+
+def get_chart_etag(name: str, image_format: str, filters: dict, version: str = None) -> str:
+    """Clé de cache du graphique, utilisée comme ETag"""
+    return make_cache_key(f'chart/{name}.{image_format}', normalize_chart_filters(name, filters),
+                          version or data_loader.get_data_version())
+
+
+def prepare_chart_job(name: str, image_format: str, filters: dict) -> tuple:
+    """
+    Prépare le rendu d'un graphique: seules les colonnes utiles sont gardées,
+    pour être envoyées au pool de rendu (chart_renderer).
+
+    Returns:
+        (kind, data, options) pour charts.render_chart_image
+
+    Raises:
+        ChartUnavailable: Données absentes
+    """
+    from app.routes.export import prepare_communes_data, prepare_regions_data
+
+    spec = CHART_SPECS[name]
+    filters = normalize_chart_filters(name, filters)
+
+    if spec['kind'] == 'histogram':
+        df = prepare_communes_data(filters['region'], filters['department'], filters['age'])
+        if df.empty or spec['column'] not in df.columns:
+            raise ChartUnavailable(name)
+        data = {spec['column']: df[spec['column']].dropna().to_numpy(dtype=float)}
+        options = {'column': spec['column'], 'title': spec['title'], 'xlabel': spec['xlabel'],
+                   'ylabel': "Nombre de communes", 'bins': 30, 'image_format': image_format}
+    else:
+        df = prepare_regions_data(filters['age'])
+        if df.empty or spec['column'] not in df.columns or 'Région' not in df.columns:
+            raise ChartUnavailable(name)
+        data = {'Région': df['Région'].astype(str).to_numpy(), spec['column']: df[spec['column']].to_numpy()}
+        options = {'x_column': 'Région', 'y_column': spec['column'], 'title': spec['title'],
+                   'xlabel': spec['xlabel'], 'ylabel': spec['ylabel'], 'horizontal': True,
+                   'image_format': image_format}
+
+    if len(data[spec['column']]) == 0:
+        raise ChartUnavailable(name)
+    return spec['kind'], data, options
+
+
+def render_chart(name: str, image_format: str, filters: dict) -> bytes:
+    """
+    Rend un graphique (sans cache), dans le pool de rendu.
+
+    Raises:
+        ChartUnavailable: Données absentes
+    """
+    image = chart_renderer.render(*prepare_chart_job(name, image_format, filters))
+    if image is None:
+        raise ChartUnavailable(name)
+    return image
+
+
+def get_chart(name: str, image_format: str, filters: dict, version: str = None) -> bytes:
+    """
+    Retourne l'image d'un graphique depuis le cache, ou la rend et la met en cache.
+
+    Raises:
+        ValueError: Graphique ou format inconnu
+        ChartUnavailable: Données absentes
+    """
+    validate_chart(name, image_format)
+    filters = normalize_chart_filters(name, filters)
+    version = version or data_loader.get_data_version()
+    etag = get_chart_etag(name, image_format, filters, version)
+    schedule_prerender(version)
+
+    image = chart_cache.get(etag)
+    if image is None:
+        # Les demandes simultanées d'un même graphique partagent un seul rendu
+        image = get_flight('chart').do(etag, lambda: _render_and_cache(name, image_format, filters, etag))
+
+    # Seules les combinaisons ayant produit une image sont comptées (filtres valides)
+    record_request(name, image_format, filters)
+    return image
+
+
+def _render_and_cache(name: str, image_format: str, filters: dict, etag: str) -> bytes:
+    """Rend le graphique et le met en cache, sauf s'il vient d'être rendu par une autre requête"""
+    cached = chart_cache.get(etag)
+    if cached is not None:
+        return cached
+    image = render_chart(name, image_format, filters)
+    chart_cache.set(etag, image)
+    return image
+
+
+def record_request(name: str, image_format: str, filters: dict):
+    """
+    Compte une demande servie. Le compteur est borné: quand il dépasse
+    MAX_TRACKED_COMBINATIONS, seule la moitié la plus demandée est conservée.
+    """
+    combo = (name, image_format, tuple(sorted(filters.items())))
+    with _prerender_lock:
+        if combo not in _request_counts and len(_request_counts) >= MAX_TRACKED_COMBINATIONS:
+            kept = _request_counts.most_common(MAX_TRACKED_COMBINATIONS // 2)
+            _request_counts.clear()
+            _request_counts.update(dict(kept))
+        _request_counts[combo] += 1
+
+
+def prerender_charts(version: str):
+    """Rend la vue sans filtre de chaque graphique et les combinaisons les plus demandées"""
+    with _prerender_lock:
+        most_requested = [combo for combo, _ in _request_counts.most_common(PRERENDER_TOP)]
+    combinations = [(name, 'png', tuple(sorted(normalize_chart_filters(name, {}).items()))) for name in CHART_SPECS]
+    combinations += [combo for combo in most_requested if combo not in combinations]
+
+    # Préparation séquentielle (données en cache), rendus en parallèle dans le pool
+    pending = []
+    for name, image_format, filter_items in combinations:
+        if data_loader.get_data_version() != version:
+            # Données à nouveau modifiées: un autre pré-rendu prendra le relais
+            break
+        filters = dict(filter_items)
+        etag = get_chart_etag(name, image_format, filters, version)
+        if chart_cache.get(etag) is not None:
+            continue
+        try:
+            pending.append((name, etag, chart_renderer.submit_chart(*prepare_chart_job(name, image_format, filters))))
+        except ChartUnavailable:
+            continue
+        except Exception as e:
+            logger.warning(f"Pré-rendu du graphique {name} impossible: {e}")
+
+    rendered = 0
+    for name, etag, future in pending:
+        try:
+            image = future.result()
+        except Exception as e:
+            logger.warning(f"Pré-rendu du graphique {name} impossible: {e}")
+            continue
+        if image is not None:
+            chart_cache.set(etag, image)
+            rendered += 1
+    logger.info(f"Graphiques pré-rendus pour la version {version}: {rendered}")
+
+
+def schedule_prerender(version: str = None):
+    """Lance le pré-rendu en arrière-plan si la version des données a changé"""
+    version = version or data_loader.get_data_version()
+    with _prerender_lock:
+        if _prerender_state['version'] == version:
+            return
+        _prerender_state['version'] = version
+        thread = threading.Thread(target=prerender_charts, args=(version,), name='chart-prerender', daemon=True)
+        _prerender_state['thread'] = thread
+    thread.start()
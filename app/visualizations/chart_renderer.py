@@ -0,0 +1,130 @@
+"""
+Service de rendu des graphiques dans un pool de processus
+
+Les graphiques (charts.render_chart_image) sont rendus dans un pool borné de
+processus (CHART_WORKERS, par défaut min(4, nombre de CPU)). Les processus sont
+démarrés une fois, avec matplotlib et seaborn déjà importés et un premier rendu
+effectué (polices chargées): un graphique ne paie que son propre rendu, et
+plusieurs graphiques d'une page sont rendus en parallèle, hors du GIL du
+serveur Flask.
+
+Seules les colonnes utiles au graphique sont envoyées aux processus (valeurs
+d'un histogramme, catégories et valeurs d'un bar chart), pas les DataFrames
+complets.
+
+Avec CHART_WORKERS=0, ou si le pool ne peut pas démarrer, le rendu se fait
+dans le processus courant (les fonctions de charts.py n'utilisent pas pyplot
+et peuvent être appelées depuis plusieurs threads).
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.utils.metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool = {'executor': None, 'failed': False}
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    """Initialisation d'un processus de rendu: imports et premier rendu (polices, caches)"""
+    from app.visualizations.charts import render_chart_image
+    render_chart_image('histogram', {'value': [0.0, 1.0]}, {'column': 'value', 'bins': 2, 'image_format': 'png'})
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _render(kind: str, data: dict, options: dict):
+    from app.visualizations.charts import render_chart_image
+    return render_chart_image(kind, data, options)
+
+
+def get_executor():
+    """Retourne le pool de rendu (créé au premier appel), ou None si le rendu est local"""
+    with _pool_lock:
+        if _pool['executor'] is not None or _pool['failed'] or CHART_WORKERS <= 0:
+            return _pool['executor']
+        try:
+            # spawn: pas de fork d'un serveur multi-thread (verrous hérités dans un état incohérent)
+            executor = ProcessPoolExecutor(max_workers=CHART_WORKERS,
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=_init_worker)
+            # Démarrer tous les processus dès maintenant (l'initialisation se fait en parallèle)
+            for _ in range(CHART_WORKERS):
+                executor.submit(_worker_ready)
+        except Exception as e:
+            logger.warning(f"Pool de rendu des graphiques indisponible, rendu local: {e}")
+            _pool['failed'] = True
+            return None
+        _pool['executor'] = executor
+        logger.info(f"Pool de rendu des graphiques démarré: {CHART_WORKERS} processus")
+        return executor
+
+
+def _discard_executor(executor):
+    """Retire un pool cassé (processus tué) pour qu'il soit recréé au prochain rendu"""
+    with _pool_lock:
+        if _pool['executor'] is executor:
+            _pool['executor'] = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    """Arrête le pool de rendu"""
+    with _pool_lock:
+        executor, _pool['executor'] = _pool['executor'], None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def submit_chart(kind: str, data: dict, options: dict) -> Future:
+    """
+    Soumet le rendu d'un graphique (voir charts.render_chart_image).
+
+    Returns:
+        Future dont le résultat est l'image (bytes) ou None si pas de données
+    """
+    executor = get_executor()
+    if executor is not None:
+        try:
+            return executor.submit(_render, kind, data, options)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning(f"Pool de rendu des graphiques cassé, redémarrage: {e}")
+            _discard_executor(executor)
+            executor = get_executor()
+            if executor is not None:
+                return executor.submit(_render, kind, data, options)
+
+    future = Future()
+    try:
+        future.set_result(_render(kind, data, options))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+@timed_stage('render')
+def render(kind: str, data: dict, options: dict):
+    """Rend un graphique et attend l'image (bytes ou None); réessaie une fois si un processus a été tué"""
+    try:
+        return submit_chart(kind, data, options).result()
+    except BrokenProcessPool as e:
+        logger.warning(f"Processus de rendu interrompu, nouvel essai: {e}")
+        executor = _pool['executor']
+        if executor is not None:
+            _discard_executor(executor)
+        return submit_chart(kind, data, options).result()
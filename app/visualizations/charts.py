@@ -1,14 +1,19 @@
 """
 Module de création de graphiques avec Matplotlib et Seaborn
+
+Les graphiques sont construits sur des objets Figure (API orientée objet), sans
+pyplot: pas de figure courante partagée ni de réglages globaux modifiés à
+l'import. Le style est appliqué le temps d'un rendu (chart_style).
 """
 
 import matplotlib
-matplotlib.use('Agg')  # Backend non-interactif pour Flask
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import pandas as pd
 import numpy as np
 import logging
+import threading
+from contextlib import contextmanager
 from typing import Optional, Dict, Any
 from pathlib import Path
 import io
@@ -16,11 +21,41 @@ import base64
 
 logger = logging.getLogger(__name__)
 
-# Configuration du style
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (10, 6)
-plt.rcParams['font.size'] = 10
-plt.rcParams['font.family'] = 'DejaVu Sans'
+# Configuration du style (whitegrid de seaborn), sans modifier les réglages globaux
+CHART_STYLE = {
+    **sns.axes_style("whitegrid"),
+    'figure.figsize': (10, 6),
+    'font.size': 10,
+    'font.family': 'DejaVu Sans',
+}
+
+# rcParams est propre au processus: un rendu stylé à la fois par processus
+_style_lock = threading.Lock()
+
+
+@contextmanager
+def chart_style():
+    """Applique CHART_STYLE pendant la construction et l'enregistrement d'une figure"""
+    with _style_lock, matplotlib.rc_context(CHART_STYLE):
+        yield
+
+
+def _output_figure(fig: Figure, image_format: Optional[str], return_base64: bool,
+                   output_path: Optional[str], label: str):
+    """Enregistre ou retourne une figure (bytes, base64 ou chemin du fichier)"""
+    if image_format or return_base64:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=image_format or 'png', dpi=100, bbox_inches='tight')
+        if image_format:
+            return buffer.getvalue()
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    if output_path:
+        fig.savefig(output_path, dpi=100, bbox_inches='tight')
+        logger.info(f"{label} sauvegardé: {output_path}")
+        return output_path
+
+    return None
 
 
 def create_histogram(
@@ -31,11 +66,12 @@ def create_histogram(
     ylabel: str = "Nombre de communes",
     bins: int = 30,
     return_base64: bool = False,
-    output_path: Optional[str] = None
-) -> Optional[str]:
+    output_path: Optional[str] = None,
+    image_format: Optional[str] = None
+):
     """
     Crée un histogramme pour visualiser la distribution d'une variable.
-    
+
     Args:
         df: DataFrame avec les données
         column: Colonne à visualiser
@@ -45,50 +81,38 @@ def create_histogram(
         bins: Nombre de bins pour l'histogramme
         return_base64: Si True, retourne l'image en base64
         output_path: Chemin pour sauvegarder (optionnel)
-    
+        image_format: 'png' ou 'svg': retourne l'image brute (bytes) dans ce format
+
     Returns:
-        Chemin du fichier ou string base64 si return_base64=True
+        Chemin du fichier, string base64 si return_base64=True ou bytes si image_format
     """
     if column not in df.columns:
         logger.error(f"Colonne {column} non trouvée")
         return None
-    
+
     # Filtrer les valeurs manquantes
     data = df[column].dropna()
-    
+
     if len(data) == 0:
         logger.warning(f"Aucune donnée pour {column}")
         return None
-    
-    # Créer le graphique
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(data, bins=bins, edgecolor='black', alpha=0.7, color='steelblue')
-    
-    # Labels et titre
-    ax.set_xlabel(xlabel or column, fontsize=11)
-    ax.set_ylabel(ylabel, fontsize=11)
-    ax.set_title(title or f"Distribution de {column}", fontsize=13, fontweight='bold')
-    ax.grid(True, alpha=0.3, axis='y')
-    
-    plt.tight_layout()
-    
-    # Sauvegarder ou retourner
-    if return_base64:
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        return image_base64
-    
-    if output_path:
-        plt.savefig(output_path, dpi=100, bbox_inches='tight')
-        plt.close()
-        logger.info(f"Histogramme sauvegardé: {output_path}")
-        return output_path
-    
-    plt.close()
-    return None
+
+    with chart_style():
+        # Créer le graphique
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        ax.hist(data, bins=bins, edgecolor='black', alpha=0.7, color='steelblue')
+
+        # Labels et titre
+        ax.set_xlabel(xlabel or column, fontsize=11)
+        ax.set_ylabel(ylabel, fontsize=11)
+        ax.set_title(title or f"Distribution de {column}", fontsize=13, fontweight='bold')
+        ax.grid(True, alpha=0.3, axis='y')
+
+        fig.tight_layout()
+
+        # Sauvegarder ou retourner
+        return _output_figure(fig, image_format, return_base64, output_path, "Histogramme")
 
 
 def create_bar_chart(
@@ -101,11 +125,12 @@ def create_bar_chart(
     return_base64: bool = False,
     output_path: Optional[str] = None,
     max_items: int = 20,
-    horizontal: bool = True
-) -> Optional[str]:
+    horizontal: bool = True,
+    image_format: Optional[str] = None
+):
     """
     Crée un bar chart pour comparer des valeurs.
-    
+
     Args:
         df: DataFrame avec les données
         x_column: Colonne pour l'axe X (catégories)
@@ -117,78 +142,77 @@ def create_bar_chart(
         output_path: Chemin pour sauvegarder
         max_items: Nombre maximum d'items à afficher
         horizontal: Si True, barres horizontales, sinon verticales
-    
+        image_format: 'png' ou 'svg': retourne l'image brute (bytes) dans ce format
+
     Returns:
-        Chemin du fichier ou string base64
+        Chemin du fichier, string base64 ou bytes si image_format
     """
     if x_column not in df.columns or y_column not in df.columns:
         logger.error(f"Colonnes non trouvées: {x_column} ou {y_column}")
         return None
-    
+
     # Agréger les données si nécessaire
     if len(df) > max_items:
         # Prendre les top N par valeur Y
         df_sorted = df.nlargest(max_items, y_column)
     else:
         df_sorted = df.copy()
-    
-    # Créer le graphique
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
+
     # Trier par valeur décroissante
     df_sorted = df_sorted.sort_values(y_column, ascending=horizontal)
-    
-    if horizontal:
-        bars = ax.barh(
-            range(len(df_sorted)),
-            df_sorted[y_column].values,
-            color='steelblue',
-            alpha=0.7,
-            edgecolor='black'
-        )
-        # Labels
-        ax.set_yticks(range(len(df_sorted)))
-        ax.set_yticklabels(df_sorted[x_column].astype(str), fontsize=9)
-        ax.set_xlabel(ylabel or y_column, fontsize=11)
-        ax.set_ylabel(xlabel or x_column, fontsize=11)
-    else:
-        bars = ax.bar(
-            range(len(df_sorted)),
-            df_sorted[y_column].values,
-            color='steelblue',
-            alpha=0.7,
-            edgecolor='black'
-        )
-        # Labels
-        ax.set_xticks(range(len(df_sorted)))
-        ax.set_xticklabels(df_sorted[x_column].astype(str), fontsize=9, rotation=45, ha='right')
-        ax.set_xlabel(xlabel or x_column, fontsize=11)
-        ax.set_ylabel(ylabel or y_column, fontsize=11)
-    
-    ax.set_title(title or f"{y_column} par {x_column}", fontsize=13, fontweight='bold')
-    ax.grid(True, alpha=0.3, axis='x' if horizontal else 'y')
-    
-    plt.tight_layout()
-    
-    # Sauvegarder ou retourner
-    if return_base64:
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        return image_base64
-    
-    if output_path:
-        plt.savefig(output_path, dpi=100, bbox_inches='tight')
-        plt.close()
-        logger.info(f"Bar chart sauvegardé: {output_path}")
-        return output_path
-    
-    plt.close()
-    return None
 
+    with chart_style():
+        # Créer le graphique
+        fig = Figure(figsize=(12, 6))
+        ax = fig.subplots()
+
+        if horizontal:
+            ax.barh(
+                range(len(df_sorted)),
+                df_sorted[y_column].values,
+                color='steelblue',
+                alpha=0.7,
+                edgecolor='black'
+            )
+            # Labels
+            ax.set_yticks(range(len(df_sorted)))
+            ax.set_yticklabels(df_sorted[x_column].astype(str), fontsize=9)
+            ax.set_xlabel(ylabel or y_column, fontsize=11)
+            ax.set_ylabel(xlabel or x_column, fontsize=11)
+        else:
+            ax.bar(
+                range(len(df_sorted)),
+                df_sorted[y_column].values,
+                color='steelblue',
+                alpha=0.7,
+                edgecolor='black'
+            )
+            # Labels
+            ax.set_xticks(range(len(df_sorted)))
+            ax.set_xticklabels(df_sorted[x_column].astype(str), fontsize=9, rotation=45, ha='right')
+            ax.set_xlabel(xlabel or x_column, fontsize=11)
+            ax.set_ylabel(ylabel or y_column, fontsize=11)
 
+        ax.set_title(title or f"{y_column} par {x_column}", fontsize=13, fontweight='bold')
+        ax.grid(True, alpha=0.3, axis='x' if horizontal else 'y')
 
+        fig.tight_layout()
 
+        # Sauvegarder ou retourner
+        return _output_figure(fig, image_format, return_base64, output_path, "Bar chart")
 
+
+def render_chart_image(kind: str, data: Dict[str, Any], options: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Rend un graphique en image à partir de données minimales (colonnes en listes
+    ou tableaux). Point d'entrée des processus de rendu (voir chart_renderer.py).
+
+    Args:
+        kind: 'histogram' (une colonne) ou 'bar' (colonnes catégories et valeurs)
+        data: Colonnes du DataFrame à construire
+        options: Arguments de create_histogram / create_bar_chart (dont image_format)
+    """
+    df = pd.DataFrame(data)
+    if kind == 'histogram':
+        return create_histogram(df, **options)
+    return create_bar_chart(df, **options)
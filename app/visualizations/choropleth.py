@@ -0,0 +1,139 @@
+"""
+Valeurs des cartes choroplèthes
+
+Agrège un indicateur de prepare_communes_data par commune, département ou
+région (moyenne pondérée par la population) et calcule les classes de couleur
+(quantiles). Les contours viennent de app/visualizations/boundaries.py; les
+valeurs sont servies séparément, en JSON, et jointes dans le navigateur par code.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_loader import DataLoader
+from app.visualizations.boundaries import BOUNDARY_LEVELS
+from app.visualizations.points import INDICATOR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Palette séquentielle (jaune -> vert), une couleur par classe
+CHOROPLETH_COLORS = ['#ffffcc', '#c2e699', '#78c679', '#31a354', '#006837']
+
+INDICATOR_LABELS = {
+    'green_mobility_index': 'Mobilité verte (%)',
+    'avg_commute_time': 'Temps de trajet moyen (min)',
+    'velo_percentage': 'Vélo (%)',
+    'voiture_percentage': 'Voiture (%)',
+    'transport_commun_percentage': 'Transports en commun (%)',
+    'marche_percentage': 'Marche (%)',
+    'deux_roues_percentage': 'Deux-roues (%)',
+    'pas_transport_percentage': 'Sans transport (%)',
+}
+
+MAX_CHOROPLETH_ENTRIES = 32
+
+_choropleth_values = OrderedDict()
+_choropleth_lock = threading.Lock()
+
+data_loader = DataLoader()
+
+
+def normalize_territory_code(values: pd.Series) -> pd.Series:
+    """Codes de département/région sur deux caractères au moins (1 -> '01', 2A inchangé)"""
+    return values.astype(str).str.strip().str.replace(r'\.0$', '', regex=True).str.zfill(2)
+
+
+def aggregate_indicator(communes_df: pd.DataFrame, level: str, indicator: str) -> pd.Series:
+    """
+    Valeur de l'indicateur par territoire.
+
+    Returns:
+        Series indexée par code (commune, département ou région)
+    """
+    codes = communes_df['COMMUNE_CODE'].astype(str).str.zfill(5)
+    values = pd.to_numeric(communes_df[indicator], errors='coerce')
+
+    if level == 'communes':
+        series = pd.Series(values.to_numpy(), index=codes.to_numpy())
+        return series[~series.index.duplicated()].dropna()
+
+    # Rattacher chaque commune à son département / sa région
+    reference = data_loader.load_communes_data()
+    code_col = 'COM' if 'COM' in reference.columns else 'CODCOM'
+    territory_col = 'DEP' if level == 'departements' else 'REG'
+    if territory_col not in reference.columns:
+        logger.warning(f"Colonne {territory_col} absente des communes: agrégation {level} impossible")
+        return pd.Series(dtype=float)
+    mapping = pd.Series(normalize_territory_code(reference[territory_col]).to_numpy(),
+                        index=reference[code_col].astype(str).str.zfill(5).to_numpy())
+    mapping = mapping[~mapping.index.duplicated()]
+
+    weights = (pd.to_numeric(communes_df['PTOT'], errors='coerce').fillna(0)
+               if 'PTOT' in communes_df.columns else pd.Series(1.0, index=communes_df.index))
+    frame = pd.DataFrame({
+        'territory': codes.map(mapping).to_numpy(),
+        'value': values.to_numpy(),
+        'weight': weights.to_numpy(dtype=float),
+    }).dropna(subset=['territory', 'value'])
+    frame['weighted'] = frame['value'] * frame['weight']
+
+    grouped = frame.groupby('territory')[['weighted', 'weight']].sum()
+    return (grouped['weighted'] / grouped['weight'].replace(0, np.nan)).dropna()
+
+
+def compute_breaks(values: pd.Series, n_classes: int = len(CHOROPLETH_COLORS)) -> list:
+    """Bornes supérieures des classes (quantiles), sans la dernière"""
+    if values.empty:
+        return []
+    quantiles = np.nanquantile(values.to_numpy(dtype=float), np.linspace(0, 1, n_classes + 1)[1:-1])
+    return [round(float(q), 2) for q in np.unique(quantiles)]
+
+
+def get_choropleth_values(level: str, indicator: str, region_filter: str = '', department_filter: str = '',
+                          age_filter: str = '') -> dict:
+    """
+    Valeurs et classes de couleur d'un indicateur (calculées une fois par version des données).
+
+    Raises:
+        ValueError: Niveau ou indicateur inconnu
+    """
+    if level not in BOUNDARY_LEVELS:
+        raise ValueError(f"Niveau inconnu: {level} (attendu: {', '.join(BOUNDARY_LEVELS)})")
+    if indicator not in INDICATOR_COLUMNS:
+        raise ValueError(f"Indicateur inconnu: {indicator} (attendu: {', '.join(INDICATOR_COLUMNS)})")
+
+    key = (data_loader.get_data_version(), level, indicator,
+           region_filter or '', department_filter or '', age_filter or '')
+    with _choropleth_lock:
+        if key in _choropleth_values:
+            _choropleth_values.move_to_end(key)
+            return _choropleth_values[key]
+
+    from app.routes.export import prepare_communes_data
+    communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
+    if communes_df.empty or indicator not in communes_df.columns:
+        series = pd.Series(dtype=float)
+    else:
+        series = aggregate_indicator(communes_df, level, indicator)
+
+    result = {
+        'level': level,
+        'indicator': indicator,
+        'label': INDICATOR_LABELS.get(indicator, indicator),
+        'values': {code: round(float(value), 1) for code, value in series.items()},
+        'breaks': compute_breaks(series),
+        'colors': CHOROPLETH_COLORS,
+        'min': round(float(series.min()), 1) if not series.empty else None,
+        'max': round(float(series.max()), 1) if not series.empty else None,
+    }
+
+    with _choropleth_lock:
+        _choropleth_values[key] = result
+        _choropleth_values.move_to_end(key)
+        while len(_choropleth_values) > MAX_CHOROPLETH_ENTRIES:
+            _choropleth_values.popitem(last=False)
+    return result
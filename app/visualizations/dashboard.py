@@ -0,0 +1,264 @@
+"""
+Données complètes du tableau de bord en une réponse
+
+Pour une combinaison de filtres, rassemble tout ce qu'affichent la page
+d'accueil et la page des visualisations: KPIs (dont les zones mal
+desservies), séries des graphiques (histogrammes et séries par région de
+CHART_SPECS), top des communes et des régions, et données des couches de
+carte (mobilité verte par département et par région).
+
+Les tables d'indicateurs (prepare_communes_data et prepare_regions_data) sont
+calculées une seule fois, en parallèle, puis partagées par toutes les étapes,
+elles-mêmes exécutées en parallèle dans un pool de threads. Les index des
+cartes (popups, points) sont pré-remplis avec la même table. Le résultat est
+gardé par filtres et version des données.
+
+Une étape en échec n'empêche pas les autres: son panneau vaut None et l'erreur
+est rapportée dans errors (le résultat n'est alors pas gardé en cache).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.utils.coalescing import coalesced
+from app.utils.data_loader import DataLoader
+from app.visualizations.chart_data import DEFAULT_HISTOGRAM_BINS, compute_histogram
+from app.visualizations.chart_images import CHART_SPECS
+from app.visualizations.choropleth import (
+    CHOROPLETH_COLORS,
+    INDICATOR_LABELS,
+    aggregate_indicator,
+    compute_breaks,
+)
+from app.visualizations.points import INDICATOR_COLUMNS, get_point_table
+from app.visualizations.popups import get_popup_index
+
+logger = logging.getLogger(__name__)
+
+# Nombre de communes et de régions des classements
+DASHBOARD_TOP = 10
+
+# Population minimale d'une commune classée (les très petites communes ont des parts instables)
+DASHBOARD_MIN_POPULATION = 1000
+
+# Threads des étapes de rendu (une par étape au plus)
+DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 6))
+
+MAX_DASHBOARD_ENTRIES = 32
+
+_dashboards = OrderedDict()
+_dashboards_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+
+data_loader = DataLoader()
+
+
+def _round(value, digits: int = 1):
+    """Nombre JSON (None pour NaN)"""
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), digits)
+
+
+def _numeric(df: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+
+
+def build_kpis(communes_df: pd.DataFrame, stats: dict) -> dict:
+    """Indicateurs clés: moyennes pondérées par la population, zones mal desservies, statistiques globales"""
+    from app.visualizations.maps import flag_underserved
+
+    population = np.nan_to_num(_numeric(communes_df, 'PTOT'))
+    indicators = {}
+    for column in INDICATOR_COLUMNS:
+        values = _numeric(communes_df, column)
+        valid = ~np.isnan(values)
+        total = population[valid].sum()
+        indicators[column] = _round((values[valid] * population[valid]).sum() / total) if total > 0 else None
+
+    underserved = int(flag_underserved(communes_df).sum()) if len(communes_df) else 0
+    return {
+        'communes': int(len(communes_df)),
+        'population': int(population.sum()),
+        'indicators': indicators,
+        'underserved': underserved,
+        'underserved_share': _round(underserved / len(communes_df) * 100) if len(communes_df) else None,
+        'global': stats,
+    }
+
+
+def build_charts(communes_df: pd.DataFrame, regions_df: pd.DataFrame) -> dict:
+    """Séries des graphiques de CHART_SPECS (histogrammes des communes, séries par région)"""
+    charts = {}
+    for name, spec in CHART_SPECS.items():
+        chart = {'kind': spec['kind'], 'indicator': spec['column'], 'title': spec['title'],
+                 'xlabel': spec['xlabel']}
+        if spec['kind'] == 'histogram':
+            chart.update(compute_histogram(_numeric(communes_df, spec['column']), bins=DEFAULT_HISTOGRAM_BINS))
+        else:
+            series = []
+            if not regions_df.empty and spec['column'] in regions_df.columns:
+                frame = pd.DataFrame({
+                    'code': regions_df['REG'].astype(str),
+                    'name': regions_df['Région'].astype(str),
+                    'value': _numeric(regions_df, spec['column']),
+                }).dropna(subset=['value']).sort_values(['value', 'code'], ascending=[False, True])
+                series = [{'code': code, 'name': name, 'value': _round(value)}
+                          for code, name, value in frame.itertuples(index=False)]
+            chart['ylabel'] = spec.get('ylabel')
+            chart['series'] = series
+        charts[name] = chart
+    return charts
+
+
+def build_top_communes(communes_df: pd.DataFrame, n: int = DASHBOARD_TOP) -> list:
+    """Communes à la plus forte mobilité verte (puis les plus peuplées), parmi celles d'au moins
+    DASHBOARD_MIN_POPULATION habitants s'il y en a"""
+    if communes_df.empty or 'green_mobility_index' not in communes_df.columns:
+        return []
+    name_col = 'Commune' if 'Commune' in communes_df.columns else 'LIBGEO'
+    frame = pd.DataFrame({
+        'code': communes_df['COMMUNE_CODE'].astype(str).str.zfill(5).to_numpy(),
+        'name': communes_df[name_col].astype(str).to_numpy(),
+        'population': np.nan_to_num(_numeric(communes_df, 'PTOT')),
+        'green_mobility_index': _numeric(communes_df, 'green_mobility_index'),
+        'avg_commute_time': _numeric(communes_df, 'avg_commute_time'),
+        'velo_percentage': _numeric(communes_df, 'velo_percentage'),
+    }).dropna(subset=['green_mobility_index'])
+    if (frame['population'] >= DASHBOARD_MIN_POPULATION).any():
+        frame = frame[frame['population'] >= DASHBOARD_MIN_POPULATION]
+    top = frame.sort_values(['green_mobility_index', 'population', 'code'],
+                            ascending=[False, False, True]).head(n)
+    return [
+        {'code': code, 'name': name, 'population': int(population), 'green_mobility_index': _round(green),
+         'avg_commute_time': _round(commute), 'velo_percentage': _round(velo)}
+        for code, name, population, green, commute, velo in top.itertuples(index=False)
+    ]
+
+
+def build_top_regions(regions_df: pd.DataFrame, n: int = DASHBOARD_TOP) -> list:
+    """Régions à la plus forte mobilité verte"""
+    if regions_df.empty or 'green_mobility_index' not in regions_df.columns:
+        return []
+    top = regions_df.sort_values(['green_mobility_index', 'PTOT'], ascending=[False, False]).head(n)
+    return [
+        {'code': str(row['REG']), 'name': str(row['Région']), 'population': int(row['PTOT']),
+         'green_mobility_index': _round(row['green_mobility_index']),
+         'avg_commute_time': _round(row['avg_commute_time']),
+         'velo_percentage': _round(row.get('velo_percentage'))}
+        for _, row in top.iterrows()
+    ]
+
+
+def build_map_layers(communes_df: pd.DataFrame, region_filter: str, department_filter: str,
+                     age_filter: str) -> dict:
+    """
+    Données des couches de carte: mobilité verte par département et par région
+    (classes de couleur comprises). Pré-remplit les index des popups et des points.
+    """
+    get_popup_index(region_filter, department_filter, age_filter, communes_df)
+    get_point_table(region_filter, department_filter, age_filter, communes_df)
+
+    layers = {}
+    for level in ('departements', 'regions'):
+        if communes_df.empty:
+            series = pd.Series(dtype=float)
+        else:
+            series = aggregate_indicator(communes_df, level, 'green_mobility_index')
+        layers[level] = {
+            'indicator': 'green_mobility_index',
+            'label': INDICATOR_LABELS['green_mobility_index'],
+            'values': {code: _round(value) for code, value in series.items()},
+            'breaks': compute_breaks(series),
+            'colors': CHOROPLETH_COLORS,
+        }
+    return layers
+
+
+def _timed(step, *args):
+    """Exécute une étape et mesure sa durée (ms)"""
+    start = time.perf_counter()
+    result = step(*args)
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+
+@coalesced('dashboard', version=data_loader.get_data_version)
+def _build_dashboard(region_filter: str, department_filter: str, age_filter: str) -> dict:
+    from app.routes.export import prepare_communes_data, prepare_regions_data
+    from app.utils.cache import get_cached_stats
+    from script import main
+
+    timings = {}
+    start = time.perf_counter()
+
+    # Tables d'indicateurs: calculées une fois, en parallèle, partagées par toutes les étapes
+    regions_future = _executor.submit(_timed, prepare_regions_data, age_filter)
+    stats_future = _executor.submit(_timed, get_cached_stats, main)
+    communes_df, timings['communes_table'] = _timed(prepare_communes_data, region_filter, department_filter,
+                                                    age_filter)
+    regions_df, timings['regions_table'] = regions_future.result()
+    stats, timings['stats'] = stats_future.result()
+
+    # Étapes indépendantes, en parallèle
+    steps = {
+        'kpis': (build_kpis, communes_df, stats),
+        'charts': (build_charts, communes_df, regions_df),
+        'top_communes': (build_top_communes, communes_df),
+        'top_regions': (build_top_regions, regions_df),
+        'map': (build_map_layers, communes_df, region_filter, department_filter, age_filter),
+    }
+    futures = {name: _executor.submit(_timed, *step) for name, step in steps.items()}
+
+    payload = {'filters': {'region': region_filter, 'department': department_filter, 'age': age_filter},
+               'version': data_loader.get_data_version(), 'errors': {}}
+    for name, future in futures.items():
+        try:
+            payload[name], timings[name] = future.result()
+        except Exception as e:
+            logger.error(f"Étape {name} du tableau de bord en échec: {e}", exc_info=True)
+            payload[name] = None
+            payload['errors'][name] = str(e)
+
+    timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+    payload['timings_ms'] = timings
+    logger.debug(f"Tableau de bord calculé en {timings['total']} ms: {timings}")
+    return payload
+
+
+def get_dashboard(region_filter: str = '', department_filter: str = '', age_filter: str = '') -> dict:
+    """
+    Données complètes du tableau de bord pour ces filtres (avec cache).
+
+    Returns:
+        Dictionnaire JSON-compatible: filters, version, kpis, charts, top_communes,
+        top_regions, map, errors (étape -> message, le panneau valant alors None)
+        et timings_ms (durée de chaque étape du calcul)
+    """
+    region_filter, department_filter, age_filter = region_filter or '', department_filter or '', age_filter or ''
+    key = (data_loader.get_data_version(), region_filter, department_filter, age_filter)
+    with _dashboards_lock:
+        if key in _dashboards:
+            _dashboards.move_to_end(key)
+            return _dashboards[key]
+
+    payload = _build_dashboard(region_filter, department_filter, age_filter)
+    if payload['errors']:
+        # Échec partiel: recalculé à la prochaine demande
+        return payload
+
+    with _dashboards_lock:
+        _dashboards[key] = payload
+        _dashboards.move_to_end(key)
+        while len(_dashboards) > MAX_DASHBOARD_ENTRIES:
+            _dashboards.popitem(last=False)
+    return payload
@@ -0,0 +1,226 @@
+"""
+Agrégation des communes sur une grille (hexagones ou carrés)
+
+À l'échelle nationale, plutôt que d'afficher un échantillon de communes, les
+indicateurs sont agrégés sur une grille régulière dans l'espace Web Mercator:
+chaque cellule porte la moyenne des indicateurs de toutes ses communes,
+pondérée par IPONDI (nombre de navetteurs représentés), ainsi que le nombre de
+communes et la population. La taille des cellules suit le zoom (GRID_CELL_PX
+pixels à l'écran), ce qui donne quelques centaines de cellules pour la France.
+
+Le calcul est entièrement vectorisé (np.unique + np.bincount) et mis en cache
+par forme, zoom, filtres et version des données.
+"""
+
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_loader import DataLoader
+from app.utils.render_cache import RenderCache, make_cache_key
+from app.visualizations.choropleth import CHOROPLETH_COLORS, INDICATOR_LABELS, compute_breaks
+from app.visualizations.points import (
+    INDICATOR_COLUMNS,
+    get_point_table,
+    get_points_version,
+    unproject_mercator,
+)
+
+logger = logging.getLogger(__name__)
+
+GRID_SHAPES = ('hex', 'square')
+
+# Zooms servis (en dessous / au-dessus, le zoom le plus proche est utilisé)
+MIN_GRID_ZOOM = 4
+MAX_GRID_ZOOM = 10
+
+# Largeur d'une cellule à l'écran, en pixels
+GRID_CELL_PX = 24
+
+MAX_GRID_TABLES = 32
+
+_grid_tables = OrderedDict()
+_grid_tables_lock = threading.Lock()
+
+# Cellules encodées en GeoJSON, par indicateur
+grid_cache = RenderCache(cache_dir=None, max_entries=256, suffix='.json')
+
+data_loader = DataLoader()
+
+
+def clamp_grid_zoom(zoom: int) -> int:
+    return max(MIN_GRID_ZOOM, min(MAX_GRID_ZOOM, int(zoom)))
+
+
+def cell_size(zoom: int) -> float:
+    """Largeur d'une cellule en coordonnées Mercator normalisées"""
+    return GRID_CELL_PX / (256.0 * (1 << zoom))
+
+
+def hex_cells(x: np.ndarray, y: np.ndarray, size: float):
+    """
+    Cellule hexagonale (pointe en haut, coordonnées axiales q, r) de chaque point.
+
+    Args:
+        size: Largeur d'un hexagone (d'un côté plat à l'autre)
+    """
+    radius = size / math.sqrt(3)
+    q = (math.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+
+    # Arrondi en coordonnées cubiques (q + r + s = 0)
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_polygon(q: int, r: int, size: float) -> np.ndarray:
+    """Sommets (x, y) d'un hexagone, anneau fermé"""
+    radius = size / math.sqrt(3)
+    cx = radius * math.sqrt(3) * (q + r / 2)
+    cy = radius * 1.5 * r
+    angles = np.radians(30 + 60 * np.arange(7))
+    return np.column_stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)])
+
+
+def square_polygon(i: int, j: int, size: float) -> np.ndarray:
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=float)
+    return (corners + [i, j]) * size
+
+
+def aggregate_grid(points: pd.DataFrame, weights: np.ndarray, shape: str, zoom: int) -> pd.DataFrame:
+    """
+    Agrège les communes par cellule.
+
+    Args:
+        points: Table des points (voir points.py)
+        weights: Poids IPONDI de chaque commune (0 si inconnu)
+
+    Returns:
+        DataFrame (une ligne par cellule): i, j, communes, population, weight et
+        la moyenne pondérée de chaque indicateur (NaN si aucun poids)
+    """
+    size = cell_size(zoom)
+    x, y = points['x'].to_numpy(), points['y'].to_numpy()
+    if shape == 'hex':
+        i, j = hex_cells(x, y, size)
+    else:
+        i, j = np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+
+    cells, inverse = np.unique(np.column_stack([i, j]), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    n_cells = len(cells)
+
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    result = pd.DataFrame({
+        'i': cells[:, 0],
+        'j': cells[:, 1],
+        'communes': np.bincount(inverse, minlength=n_cells),
+        'population': np.bincount(inverse, weights=points['population'].to_numpy(dtype=float), minlength=n_cells),
+        'weight': np.bincount(inverse, weights=weights, minlength=n_cells),
+    })
+    for col in INDICATOR_COLUMNS:
+        values = points[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        w = np.where(valid, weights, 0.0)
+        total = np.bincount(inverse, weights=w * np.where(valid, values, 0.0), minlength=n_cells)
+        weight = np.bincount(inverse, weights=w, minlength=n_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[col] = np.where(weight > 0, total / weight, np.nan)
+    return result
+
+
+def get_grid_table(shape: str, zoom: int, region_filter: str = '', department_filter: str = '',
+                   age_filter: str = '') -> pd.DataFrame:
+    """Cellules agrégées pour ces filtres (calculées une fois par version des données)"""
+    key = (get_points_version(), shape, zoom, region_filter or '', department_filter or '', age_filter or '')
+    with _grid_tables_lock:
+        if key in _grid_tables:
+            _grid_tables.move_to_end(key)
+            return _grid_tables[key]
+
+    points = get_point_table(region_filter, department_filter, age_filter)
+    if points.empty:
+        table = pd.DataFrame()
+    else:
+        weights = data_loader.get_commune_weights(age_filter).reindex(points['code']).fillna(0).to_numpy()
+        table = aggregate_grid(points, weights, shape, zoom)
+
+    with _grid_tables_lock:
+        _grid_tables[key] = table
+        _grid_tables.move_to_end(key)
+        while len(_grid_tables) > MAX_GRID_TABLES:
+            _grid_tables.popitem(last=False)
+    logger.debug(f"Grille {shape} zoom {zoom}: {len(table)} cellules, filtres {key[3:]}")
+    return table
+
+
+def encode_grid(table: pd.DataFrame, shape: str, zoom: int, indicator: str) -> dict:
+    """Cellules en FeatureCollection GeoJSON, avec les classes de couleur de l'indicateur"""
+    size = cell_size(zoom)
+    polygon = hex_polygon if shape == 'hex' else square_polygon
+    values = table[indicator].round(1) if not table.empty else pd.Series(dtype=float)
+
+    features = []
+    for i, j, communes, population, value in zip(
+            table.get('i', []), table.get('j', []), table.get('communes', []),
+            table.get('population', []), values):
+        ring = polygon(int(i), int(j), size)
+        lat, lon = unproject_mercator(ring[:, 0], ring[:, 1])
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [np.column_stack([lon, lat]).round(4).tolist()]},
+            'properties': {
+                'value': None if pd.isna(value) else float(value),
+                'communes': int(communes),
+                'population': int(population),
+            },
+        })
+
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'shape': shape,
+        'zoom': zoom,
+        'indicator': indicator,
+        'label': INDICATOR_LABELS.get(indicator, indicator),
+        'breaks': compute_breaks(values.dropna()),
+        'colors': CHOROPLETH_COLORS,
+    }
+
+
+def get_grid(shape: str, zoom: int, indicator: str = 'green_mobility_index', region_filter: str = '',
+             department_filter: str = '', age_filter: str = '') -> bytes:
+    """
+    Grille encodée en JSON (avec cache).
+
+    Raises:
+        ValueError: Forme ou indicateur inconnu
+    """
+    if shape not in GRID_SHAPES:
+        raise ValueError(f"Forme inconnue: {shape} (attendu: {', '.join(GRID_SHAPES)})")
+    if indicator not in INDICATOR_COLUMNS:
+        raise ValueError(f"Indicateur inconnu: {indicator} (attendu: {', '.join(INDICATOR_COLUMNS)})")
+    zoom = clamp_grid_zoom(zoom)
+
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+    cache_key = make_cache_key(f'grid/{shape}/{zoom}/{indicator}', filters, get_points_version())
+    cached = grid_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    table = get_grid_table(shape, zoom, region_filter, department_filter, age_filter)
+    content = json.dumps(encode_grid(table, shape, zoom, indicator), ensure_ascii=False,
+                         separators=(',', ':')).encode('utf-8')
+    grid_cache.set(cache_key, content)
+    return content
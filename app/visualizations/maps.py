@@ -3,21 +3,147 @@ Module de création de cartes interactives avec Folium
 """
 
 import folium
+from branca.element import MacroElement
+from jinja2 import Template
 import pandas as pd
 import numpy as np
 import logging
+import os
 from typing import Optional, Dict, Any
 from pathlib import Path
-import requests
 import json
+from app.utils.gazetteer import (
+    encode_commune_codes,
+    load_gazetteer,
+    lookup_coordinates,
+)
+from app.utils.geocoder import get_geocoder
+from app.visualizations.tiles import FULL_DETAIL_ZOOM
+from app.visualizations.grid import MAX_GRID_ZOOM, MIN_GRID_ZOOM
+from app.visualizations.points import importance_order
 
 logger = logging.getLogger(__name__)
 
+# Nombre maximal de communes absentes du gazetteer par appel de locate_communes
+# (toutes envoyées au géocodeur); au-delà, le gazetteer est jugé incomplet et
+# les communes absentes sont placées au centre de leur département
+MAX_GEOCODED_PER_CALL = int(os.environ.get('GEOCODER_MAX_PER_CALL', 200))
+
+# Centre approximatif de la France (position par défaut)
+FRANCE_CENTER = (46.2276, 2.2137)
+
+# Coordonnées approximatives par département (centres régionaux), utilisées à défaut du gazetteer
+DEPARTMENT_CENTROIDS = {
+    '01': (46.2043, 5.2265),  # Ain
+    '02': (49.4431, 3.4110),  # Aisne
+    '03': (46.3448, 3.4285),  # Allier
+    '04': (44.0925, 6.2350),  # Alpes-de-Haute-Provence
+    '05': (44.5586, 6.0794),  # Hautes-Alpes
+    '06': (43.7102, 7.2620),  # Alpes-Maritimes
+    '07': (44.9333, 4.3833),  # Ardèche
+    '08': (49.7733, 4.7194),  # Ardennes
+    '09': (42.9389, 1.6072),  # Ariège
+    '10': (48.2978, 4.0783),  # Aube
+    '11': (43.2131, 2.3517),  # Aude
+    '12': (44.3500, 2.5667),  # Aveyron
+    '13': (43.2965, 5.3698),  # Bouches-du-Rhône
+    '14': (49.1829, -0.3707), # Calvados
+    '15': (45.0469, 2.4406),  # Cantal
+    '16': (45.6500, 0.1500),  # Charente
+    '17': (45.6333, -0.6333), # Charente-Maritime
+    '18': (47.0833, 2.4000),  # Cher
+    '19': (45.2667, 1.7667),  # Corrèze
+    '2A': (41.9192, 8.7386),  # Corse-du-Sud
+    '2B': (42.6977, 9.4508),  # Haute-Corse
+    '21': (47.3220, 5.0415),  # Côte-d'Or
+    '22': (48.4500, -2.7500), # Côtes-d'Armor
+    '23': (46.1667, 1.8667),  # Creuse
+    '24': (45.1833, 0.7167),  # Dordogne
+    '25': (47.2378, 6.0244),  # Doubs
+    '26': (44.9333, 4.8833),  # Drôme
+    '27': (49.0833, 1.1500),  # Eure
+    '28': (48.4333, 1.4833),  # Eure-et-Loir
+    '29': (48.3833, -4.4833), # Finistère
+    '30': (44.1333, 4.0833),  # Gard
+    '31': (43.6047, 1.4442),  # Haute-Garonne
+    '32': (43.6500, 0.5833),  # Gers
+    '33': (44.8378, -0.5792), # Gironde
+    '34': (43.6109, 3.8767),  # Hérault
+    '35': (48.1147, -1.6794), # Ille-et-Vilaine
+    '36': (46.8167, 1.6833),  # Indre
+    '37': (47.3833, 0.6833),  # Indre-et-Loire
+    '38': (45.1885, 5.7245),  # Isère
+    '39': (46.6667, 5.5500),  # Jura
+    '40': (43.8833, -1.3833), # Landes
+    '41': (47.5833, 1.3333),  # Loir-et-Cher
+    '42': (45.4333, 4.3833),  # Loire
+    '43': (45.0333, 3.8833),  # Haute-Loire
+    '44': (47.2167, -1.5500), # Loire-Atlantique
+    '45': (47.9000, 1.9000),  # Loiret
+    '46': (44.4500, 1.4333),  # Lot
+    '47': (44.2000, 0.6167),  # Lot-et-Garonne
+    '48': (44.5167, 3.5000),  # Lozère
+    '49': (47.4667, -0.5500), # Maine-et-Loire
+    '50': (49.1167, -1.0833), # Manche
+    '51': (49.2500, 4.0333),  # Marne
+    '52': (48.1167, 5.1333),  # Haute-Marne
+    '53': (48.0667, -0.7667), # Mayenne
+    '54': (48.6833, 6.1833),  # Meurthe-et-Moselle
+    '55': (49.1167, 5.3833),  # Meuse
+    '56': (47.7500, -3.3667), # Morbihan
+    '57': (49.1167, 6.1833),  # Moselle
+    '58': (47.0000, 3.1500),  # Nièvre
+    '59': (50.6333, 3.0667),  # Nord
+    '60': (49.4333, 2.0833),  # Oise
+    '61': (48.4333, 0.0833),  # Orne
+    '62': (50.2833, 2.7833),  # Pas-de-Calais
+    '63': (45.7833, 3.0833),  # Puy-de-Dôme
+    '64': (43.3000, -0.3667), # Pyrénées-Atlantiques
+    '65': (43.2333, 0.0667),  # Hautes-Pyrénées
+    '66': (42.7000, 2.8833),  # Pyrénées-Orientales
+    '67': (48.5833, 7.7500),  # Bas-Rhin
+    '68': (47.7500, 7.3333),  # Haut-Rhin
+    '69': (45.7500, 4.8500),  # Rhône
+    '70': (47.6167, 6.1667),  # Haute-Saône
+    '71': (46.7833, 4.8500),  # Saône-et-Loire
+    '72': (48.0000, 0.2000),  # Sarthe
+    '73': (45.5667, 5.9167),  # Savoie
+    '74': (46.2000, 6.1667),  # Haute-Savoie
+    '75': (48.8566, 2.3522),  # Paris
+    '76': (49.4333, 1.0833),  # Seine-Maritime
+    '77': (48.5667, 2.6667),  # Seine-et-Marne
+    '78': (48.8000, 2.1333),  # Yvelines
+    '79': (46.3167, -0.4667), # Deux-Sèvres
+    '80': (49.9000, 2.3000),  # Somme
+    '81': (43.6000, 2.2333),  # Tarn
+    '82': (44.0167, 1.3500),  # Tarn-et-Garonne
+    '83': (43.1167, 6.0833),  # Var
+    '84': (44.0500, 5.0500),  # Vaucluse
+    '85': (46.6667, -1.4333), # Vendée
+    '86': (46.5833, 0.3333),  # Vienne
+    '87': (45.8333, 1.2500),  # Haute-Vienne
+    '88': (48.1667, 6.4500),  # Vosges
+    '89': (47.8000, 3.5667),  # Yonne
+    '90': (47.6333, 6.8667),  # Territoire de Belfort
+    '91': (48.6333, 2.3333),  # Essonne
+    '92': (48.9000, 2.2500),  # Hauts-de-Seine
+    '93': (48.9333, 2.3833),  # Seine-Saint-Denis
+    '94': (48.7833, 2.4667),  # Val-de-Marne
+    '95': (49.0833, 2.2500),  # Val-d'Oise
+    '971': (16.2530, -61.5348), # Guadeloupe
+    '972': (14.6415, -61.0242), # Martinique
+    '973': (3.9339, -53.1258),  # Guyane
+    '974': (-21.1151, 55.5364), # La Réunion
+    '976': (-12.8275, 45.1662), # Mayotte
+}
+
 
 def get_commune_coordinates(commune_code: str, commune_name: str = None) -> tuple:
     """
     Récupère les coordonnées GPS d'une commune.
-    Utilise l'API GéoAPI de l'INSEE ou un cache local.
+    Utilise le gazetteer local, puis le géocodeur (cache disque et API GéoAPI de l'INSEE).
+    
+    Pour placer de nombreuses communes, préférer locate_communes() (une seule passe).
     
     Args:
         commune_code: Code INSEE de la commune (5 chiffres)
@@ -27,142 +153,408 @@ def get_commune_coordinates(commune_code: str, commune_name: str = None) -> tupl
         Tuple (latitude, longitude) ou (None, None) si non trouvé
     """
     try:
-        # Essayer d'abord avec l'API GéoAPI de l'INSEE
-        # Format: https://geo.api.gouv.fr/communes/{code}
-        url = f"https://geo.api.gouv.fr/communes/{commune_code}"
-        params = {
-            'fields': 'nom,code,codesPostaux,centre',
-            'format': 'json',
-            'geometry': 'centre'
-        }
+        # Essayer d'abord le gazetteer local (aucun appel réseau)
+        lat, lon, found = lookup_coordinates([commune_code])
+        if found[0]:
+            return (float(lat[0]), float(lon[0]))
         
-        try:
-            response = requests.get(url, params=params, timeout=2)
-            if response.status_code == 200:
-                data = response.json()
-                if 'centre' in data and 'coordinates' in data['centre']:
-                    # L'API retourne [longitude, latitude]
-                    lon, lat = data['centre']['coordinates']
-                    return (float(lat), float(lon))
-        except Exception as e:
-            logger.debug(f"Erreur API GéoAPI pour {commune_code}: {e}")
+        # Sinon le géocodeur (cache disque, puis API GéoAPI de l'INSEE)
+        geocoder = get_geocoder()
+        if geocoder is not None:
+            coords = geocoder.geocode_many([commune_code]).get(str(commune_code).zfill(5))
+            if coords:
+                return coords
         
         # Si l'API échoue, utiliser une position par défaut basée sur le département
-        # Extraire le département du code commune (2 premiers chiffres)
-        if len(commune_code) >= 2:
-            dept_code = commune_code[:2]
-            # Coordonnées approximatives par département (centres régionaux)
-            dept_coords = {
-                '01': (46.2043, 5.2265),  # Ain
-                '02': (49.4431, 3.4110),  # Aisne
-                '03': (46.3448, 3.4285),  # Allier
-                '04': (44.0925, 6.2350),  # Alpes-de-Haute-Provence
-                '05': (44.5586, 6.0794),  # Hautes-Alpes
-                '06': (43.7102, 7.2620),  # Alpes-Maritimes
-                '07': (44.9333, 4.3833),  # Ardèche
-                '08': (49.7733, 4.7194),  # Ardennes
-                '09': (42.9389, 1.6072),  # Ariège
-                '10': (48.2978, 4.0783),  # Aube
-                '11': (43.2131, 2.3517),  # Aude
-                '12': (44.3500, 2.5667),  # Aveyron
-                '13': (43.2965, 5.3698),  # Bouches-du-Rhône
-                '14': (49.1829, -0.3707), # Calvados
-                '15': (45.0469, 2.4406),  # Cantal
-                '16': (45.6500, 0.1500),  # Charente
-                '17': (45.6333, -0.6333), # Charente-Maritime
-                '18': (47.0833, 2.4000),  # Cher
-                '19': (45.2667, 1.7667),  # Corrèze
-                '21': (47.3220, 5.0415),  # Côte-d'Or
-                '22': (48.4500, -2.7500), # Côtes-d'Armor
-                '23': (46.1667, 1.8667),  # Creuse
-                '24': (45.1833, 0.7167),  # Dordogne
-                '25': (47.2378, 6.0244),  # Doubs
-                '26': (44.9333, 4.8833),  # Drôme
-                '27': (49.0833, 1.1500),  # Eure
-                '28': (48.4333, 1.4833),  # Eure-et-Loir
-                '29': (48.3833, -4.4833), # Finistère
-                '30': (44.1333, 4.0833),  # Gard
-                '31': (43.6047, 1.4442),  # Haute-Garonne
-                '32': (43.6500, 0.5833),  # Gers
-                '33': (44.8378, -0.5792), # Gironde
-                '34': (43.6109, 3.8767),  # Hérault
-                '35': (48.1147, -1.6794), # Ille-et-Vilaine
-                '36': (46.8167, 1.6833),  # Indre
-                '37': (47.3833, 0.6833),  # Indre-et-Loire
-                '38': (45.1885, 5.7245),  # Isère
-                '39': (46.6667, 5.5500),  # Jura
-                '40': (43.8833, -1.3833), # Landes
-                '41': (47.5833, 1.3333),  # Loir-et-Cher
-                '42': (45.4333, 4.3833),  # Loire
-                '43': (45.0333, 3.8833),  # Haute-Loire
-                '44': (47.2167, -1.5500), # Loire-Atlantique
-                '45': (47.9000, 1.9000),  # Loiret
-                '46': (44.4500, 1.4333),  # Lot
-                '47': (44.2000, 0.6167),  # Lot-et-Garonne
-                '48': (44.5167, 3.5000),  # Lozère
-                '49': (47.4667, -0.5500), # Maine-et-Loire
-                '50': (49.1167, -1.0833), # Manche
-                '51': (49.2500, 4.0333),  # Marne
-                '52': (48.1167, 5.1333),  # Haute-Marne
-                '53': (48.0667, -0.7667), # Mayenne
-                '54': (48.6833, 6.1833),  # Meurthe-et-Moselle
-                '55': (49.1167, 5.3833),  # Meuse
-                '56': (47.7500, -3.3667), # Morbihan
-                '57': (49.1167, 6.1833),  # Moselle
-                '58': (47.0000, 3.1500),  # Nièvre
-                '59': (50.6333, 3.0667),  # Nord
-                '60': (49.4333, 2.0833),  # Oise
-                '61': (48.4333, 0.0833),  # Orne
-                '62': (50.2833, 2.7833),  # Pas-de-Calais
-                '63': (45.7833, 3.0833),  # Puy-de-Dôme
-                '64': (43.3000, -0.3667), # Pyrénées-Atlantiques
-                '65': (43.2333, 0.0667),  # Hautes-Pyrénées
-                '66': (42.7000, 2.8833),  # Pyrénées-Orientales
-                '67': (48.5833, 7.7500),  # Bas-Rhin
-                '68': (47.7500, 7.3333),  # Haut-Rhin
-                '69': (45.7500, 4.8500),  # Rhône
-                '70': (47.6167, 6.1667),  # Haute-Saône
-                '71': (46.7833, 4.8500),  # Saône-et-Loire
-                '72': (48.0000, 0.2000),  # Sarthe
-                '73': (45.5667, 5.9167),  # Savoie
-                '74': (46.2000, 6.1667),  # Haute-Savoie
-                '75': (48.8566, 2.3522),  # Paris
-                '76': (49.4333, 1.0833),  # Seine-Maritime
-                '77': (48.5667, 2.6667),  # Seine-et-Marne
-                '78': (48.8000, 2.1333),  # Yvelines
-                '79': (46.3167, -0.4667), # Deux-Sèvres
-                '80': (49.9000, 2.3000),  # Somme
-                '81': (43.6000, 2.2333),  # Tarn
-                '82': (44.0167, 1.3500),  # Tarn-et-Garonne
-                '83': (43.1167, 6.0833),  # Var
-                '84': (44.0500, 5.0500),  # Vaucluse
-                '85': (46.6667, -1.4333), # Vendée
-                '86': (46.5833, 0.3333),  # Vienne
-                '87': (45.8333, 1.2500),  # Haute-Vienne
-                '88': (48.1667, 6.4500),  # Vosges
-                '89': (47.8000, 3.5667),  # Yonne
-                '90': (47.6333, 6.8667),  # Territoire de Belfort
-                '91': (48.6333, 2.3333),  # Essonne
-                '92': (48.9000, 2.2500),  # Hauts-de-Seine
-                '93': (48.9333, 2.3833),  # Seine-Saint-Denis
-                '94': (48.7833, 2.4667),  # Val-de-Marne
-                '95': (49.0833, 2.2500),  # Val-d'Oise
-                '971': (16.2530, -61.5348), # Guadeloupe
-                '972': (14.6415, -61.0242), # Martinique
-                '973': (3.9339, -53.1258),  # Guyane
-                '974': (-21.1151, 55.5364), # La Réunion
-                '976': (-12.8275, 45.1662), # Mayotte
-            }
-            
-            if dept_code in dept_coords:
-                return dept_coords[dept_code]
+        dept_code = get_department_code(commune_code)
+        if dept_code in DEPARTMENT_CENTROIDS:
+            return DEPARTMENT_CENTROIDS[dept_code]
         
         # Position par défaut (centre de la France)
         logger.warning(f"Coordonnées non trouvées pour commune {commune_code}, utilisation position par défaut")
-        return (46.2276, 2.2137)  # Centre approximatif de la France
+        return FRANCE_CENTER
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des coordonnées pour {commune_code}: {e}")
-        return (46.2276, 2.2137)
+        return FRANCE_CENTER
+
+
+def get_department_code(commune_code: str) -> str:
+    """Code département d'une commune (3 caractères pour l'outre-mer)"""
+    commune_code = str(commune_code).zfill(5)
+    return commune_code[:3] if commune_code.startswith('97') else commune_code[:2]
+
+
+def locate_communes(commune_codes, geocode_missing: bool = True) -> pd.DataFrame:
+    """
+    Place un ensemble de communes en une seule passe.
+    
+    Les centroïdes viennent du gazetteer local. Les quelques communes absentes
+    (au plus MAX_GEOCODED_PER_CALL) sont demandées en un seul lot au géocodeur
+    (cache disque, appels parallèles, coupés si l'API est indisponible), puis
+    placées au centre de leur département, sinon au centre de la France.
+    
+    Si le gazetteer est absent, ou s'il manque plus de MAX_GEOCODED_PER_CALL
+    communes, aucun appel réseau n'est fait: les communes non trouvées sont
+    placées au centre de leur département (avertissement dans les logs).
+    
+    Args:
+        commune_codes: Series (ou liste) de codes INSEE
+        geocode_missing: Interroger le géocodeur pour les codes absents du gazetteer
+    
+    Returns:
+        DataFrame (même index que commune_codes) avec les colonnes lat, lon et
+        precision ('commune', 'departement' ou 'defaut')
+    """
+    codes = pd.Series(commune_codes) if not isinstance(commune_codes, pd.Series) else commune_codes
+    codes = codes.astype(str).str.strip().str.zfill(5)
+    lat, lon, found = lookup_coordinates(codes)
+    precision = np.where(found, 'commune', 'defaut').astype(object)
+    
+    # Un gazetteer absent ou incomplet n'est pas compensé commune par commune par le réseau
+    positions = np.flatnonzero(~found & (codes != '00000').to_numpy())
+    if len(positions) > MAX_GEOCODED_PER_CALL:
+        if load_gazetteer() is not None:
+            logger.warning(f"Gazetteer incomplet: {len(positions)} communes sur {len(codes)} absentes "
+                           f"(géocodage limité à {MAX_GEOCODED_PER_CALL}); reconstruire avec "
+                           f"scripts/build_commune_gazetteer.py")
+        geocode_missing = False
+    
+    # Codes absents du gazetteer: un seul appel groupé au géocodeur
+    geocoder = get_geocoder() if geocode_missing and len(positions) > 0 else None
+    if geocoder is not None:
+        resolved = geocoder.geocode_many(codes.iloc[positions].unique())
+        for position in positions:
+            coords = resolved.get(codes.iat[position])
+            if coords:
+                lat[position], lon[position] = coords
+                precision[position] = 'commune'
+                found[position] = True
+    
+    # Sinon centre du département, puis centre de la France
+    positions = np.flatnonzero(~found)
+    if len(positions) > 0:
+        dept_codes = codes.iloc[positions].map(get_department_code)
+        dept_coords = dept_codes.map(DEPARTMENT_CENTROIDS)
+        has_dept = dept_coords.notna().to_numpy()
+        
+        fallback = [coords if isinstance(coords, tuple) else FRANCE_CENTER for coords in dept_coords]
+        lat[positions] = [coords[0] for coords in fallback]
+        lon[positions] = [coords[1] for coords in fallback]
+        precision[positions[has_dept]] = 'departement'
+        
+        logger.info(f"{len(positions)} communes sur {len(codes)} sans coordonnées précises "
+                    f"(placées au centre du département)")
+    
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'precision': precision}, index=codes.index)
+
+
+# Modes de rendu de create_communes_map
+RENDER_MODES = ('markers', 'geojson', 'tiles', 'grid')
+
+# Nombre de marqueurs du mode 'markers'
+MAX_MARKERS = 500
+
+
+def build_communes_layer_data(df: pd.DataFrame, commune_col: str, name_col: Optional[str],
+                              coordinates: pd.DataFrame, include_names: bool = True) -> Dict[str, list]:
+    """
+    Prépare les données d'une CommunesDataLayer: une liste par propriété
+    (code, lat, lon, value et, si include_names, name), sans répéter les noms de champs.
+    
+    Les coordonnées sont arrondies à 3 décimales (~100 m), largement suffisant
+    pour des centroïdes de communes et plus compact.
+    
+    Les communes sans code valide sont ignorées; les valeurs manquantes valent None.
+    """
+    codes = df[commune_col].fillna('').astype(str).str.strip().str.zfill(5)
+    valid = (codes != '00000').to_numpy() & coordinates['lat'].notna().to_numpy()
+    
+    def column(values, decimals=None):
+        values = pd.Series(values)[valid]
+        if decimals is not None:
+            values = values.astype(float).round(decimals)
+        return values.astype(object).where(values.notna(), None).tolist()
+    
+    names = df[name_col] if name_col else codes
+    values = df['green_mobility_index'] if 'green_mobility_index' in df.columns else pd.Series(np.nan, index=df.index)
+    
+    data = {
+        'code': codes[valid].tolist(),
+        'lat': column(coordinates['lat'].to_numpy(), 3),
+        'lon': column(coordinates['lon'].to_numpy(), 3),
+        'value': column(values.to_numpy(), 1),
+    }
+    if include_names:
+        data['name'] = column(names.astype(object).where(names.notna(), codes).astype(str).to_numpy())
+    return data
+
+
+# JavaScript commun aux couches de communes: couleur selon l'indice, tooltips et
+# popups (chargés au clic si popupUrl). Attend minValue, maxValue, fixedColor,
+# label, popupUrl, popupCache et renderer, et définit layerOptions (options L.geoJSON).
+_COMMUNE_FEATURES_JS = """
+            function colorFor(value) {
+                if (fixedColor) return fixedColor;
+                if (value === null || minValue === null) return 'blue';
+                if (maxValue === minValue) return 'green';
+                var normalized = (value - minValue) / (maxValue - minValue);
+                return normalized < 0.33 ? 'red' : (normalized < 0.66 ? 'orange' : 'green');
+            }
+            function escapeHtml(text) {
+                return String(text).replace(/[&<>"']/g, function(c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            }
+
+            var transportLabels = [
+                ['velo_percentage', 'Vélo'], ['voiture_percentage', 'Voiture'],
+                ['transport_commun_percentage', 'TC'], ['marche_percentage', 'Marche'],
+                ['deux_roues_percentage', '2-roues'], ['pas_transport_percentage', 'Sans transport']
+            ];
+            function line(title, text) {
+                return '<p style="margin: 5px 0;"><strong>' + title + ':</strong> ' + text + '</p>';
+            }
+            function renderPopup(d) {
+                var value = d.green_mobility_index !== undefined ? d.green_mobility_index : d.value;
+                var html = '<div style="min-width: 200px;">'
+                    + '<h6 style="margin: 0 0 10px 0; font-weight: bold;">' + escapeHtml(d.name || d.code) + '</h6>'
+                    + line('Code', escapeHtml(d.code));
+                if (d.population != null) html += line('Population', d.population.toLocaleString('fr-FR'));
+                if (value != null) html += line('Mobilité Verte', value.toFixed(1) + '%');
+                if (d.avg_commute_time != null) html += line('Temps Trajet', d.avg_commute_time.toFixed(1) + ' min');
+                if (label) html += '<p style="margin: 5px 0;">' + escapeHtml(label) + '</p>';
+                var transports = transportLabels.filter(function(t) { return d[t[0]] != null; });
+                if (transports.length) {
+                    html += '<hr style="margin: 10px 0;"><p style="margin: 5px 0; font-weight: bold;">Transport:</p>';
+                    transports.forEach(function(t) {
+                        html += '<p style="margin: 3px 0;">' + t[1] + ': ' + d[t[0]].toFixed(1) + '%</p>';
+                    });
+                }
+                return html + '</div>';
+            }
+            function loadPopup(p, popup) {
+                if (popupCache[p.code]) { popup.setContent(popupCache[p.code]); return; }
+                fetch(popupUrl.replace('__CODE__', encodeURIComponent(p.code)))
+                    .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+                    .then(function(d) {
+                        popupCache[p.code] = renderPopup(d);
+                        popup.setContent(popupCache[p.code]);
+                    })
+                    .catch(function() { popup.setContent(renderPopup(p)); });
+            }
+
+            var layerOptions = {
+                pointToLayer: function(feature, latlng) {
+                    var color = colorFor(feature.properties.value);
+                    return L.circleMarker(latlng, {
+                        renderer: renderer, radius: {{ this.radius }}, color: color,
+                        fillColor: color, fillOpacity: 0.7, weight: 1
+                    });
+                },
+                onEachFeature: function(feature, layer) {
+                    var p = feature.properties;
+                    layer.bindTooltip(function() {
+                        var text = escapeHtml(p.name || p.code);
+                        if (label) text += ' - ' + escapeHtml(label);
+                        else if (p.value !== null) text += ' - Mobilité: ' + p.value.toFixed(1) + '%';
+                        return text;
+                    });
+                    if (popupUrl) {
+                        layer.bindPopup('Chargement...', {maxWidth: 300});
+                        layer.on('popupopen', function(e) { loadPopup(p, e.popup); });
+                    } else {
+                        layer.bindPopup(function() { return renderPopup(p); }, {maxWidth: 300});
+                    }
+                }
+            };
+"""
+
+
+class CommunesDataLayer(MacroElement):
+    """
+    Couche Leaflet unique contenant toutes les communes.
+    
+    Les données sont envoyées une seule fois, en colonnes, puis converties en
+    FeatureCollection GeoJSON dans le navigateur. La couleur de chaque point est
+    calculée côté client à partir de l'indice de mobilité verte (mêmes seuils que
+    le mode 'markers'), et popups/tooltips ne sont construits qu'à l'ouverture.
+    Le rendu utilise un canvas, ce qui permet d'afficher ~35 000 points.
+    
+    Avec popup_url, la couche ne transporte que le code et l'indice de chaque
+    commune: le contenu du popup est demandé au serveur au clic (puis gardé en
+    mémoire dans le navigateur).
+    
+    Args:
+        data: Dictionnaire produit par build_communes_layer_data
+        min_value, max_value: Bornes de l'échelle de couleur (None: pas d'indice)
+        radius: Rayon des points en pixels
+        color: Couleur fixe (ignore l'indice)
+        label: Texte ajouté au tooltip et au popup (ex: 'Zone mal desservie')
+        popup_url: URL des détails d'une commune, où __CODE__ est remplacé par le code
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.data_json }};
+            var minValue = {{ this.min_value_json }}, maxValue = {{ this.max_value_json }};
+            var fixedColor = {{ this.color_json }}, label = {{ this.label_json }};
+            var popupUrl = {{ this.popup_url_json }}, popupCache = {};
+            var renderer = L.canvas({padding: 0.5});
+
+""" + _COMMUNE_FEATURES_JS + """
+            function decodeCode(n) {
+                if (n >= 210000) return '2B' + String(n - 210000).padStart(3, '0');
+                if (n >= 200000) return '2A' + String(n - 200000).padStart(3, '0');
+                return String(n).padStart(5, '0');
+            }
+
+            // Codes triés et transmis en écarts successifs, noms séparés par "|"
+            var names = data.name ? data.name.split('|') : null, code = 0;
+            var features = data.code.map(function(delta, i) {
+                code += delta;
+                return {
+                    type: 'Feature',
+                    geometry: {type: 'Point', coordinates: [data.lon[i], data.lat[i]]},
+                    properties: {code: decodeCode(code), name: names ? names[i] : null, value: data.value[i]}
+                };
+            });
+
+            L.geoJSON({type: 'FeatureCollection', features: features}, layerOptions).addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, data: Dict[str, list], min_value: Optional[float] = None,
+                 max_value: Optional[float] = None, radius: int = 4,
+                 color: Optional[str] = None, label: Optional[str] = None,
+                 popup_url: Optional[str] = None):
+        super().__init__()
+        self._name = 'CommunesDataLayer'
+        self.data = data
+        self.radius = radius
+        # JSON compact, sans séquence "</" qui fermerait la balise <script>
+        self.data_json = json.dumps(self._encode(data), ensure_ascii=False,
+                                    separators=(',', ':')).replace('</', '<\\/')
+        self.min_value_json = json.dumps(min_value)
+        self.max_value_json = json.dumps(max_value)
+        self.color_json = json.dumps(color)
+        self.label_json = json.dumps(label, ensure_ascii=False)
+        self.popup_url_json = json.dumps(popup_url).replace('</', '<\\/')
+
+    @staticmethod
+    def _encode(data: Dict[str, list]) -> dict:
+        """
+        Encodage compact: codes triés transmis en écarts (souvent 1), noms
+        concaténés en une seule chaîne; les autres colonnes sont réordonnées.
+        """
+        codes = encode_commune_codes(data['code'])
+        order = np.argsort(codes, kind='stable')
+        
+        def take(key):
+            values = data[key]
+            return [values[i] for i in order]
+        
+        encoded = {
+            'code': np.diff(codes[order], prepend=0).tolist(),
+            'lat': take('lat'),
+            'lon': take('lon'),
+            'value': take('value'),
+        }
+        if 'name' in data:
+            encoded['name'] = '|'.join(str(name).replace('|', '/') for name in take('name'))
+        return encoded
+
+
+class TiledCommunesLayer(MacroElement):
+    """
+    Couche Leaflet chargeant les communes par tuiles (voir app/visualizations/tiles.py).
+    
+    Seules les tuiles visibles sont demandées, à chaque déplacement ou zoom
+    (au-delà de max_zoom, les tuiles de max_zoom contiennent déjà toutes les
+    communes). Les tuiles reçues sont gardées en mémoire dans le navigateur.
+    
+    Args:
+        tile_url: URL des tuiles avec {z}, {x} et {y}
+        max_zoom: Zoom maximal des tuiles demandées
+        min_value, max_value, radius, color, label, popup_url: comme CommunesDataLayer
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var tileUrl = {{ this.tile_url_json }}, maxZoom = {{ this.max_zoom }};
+            var minValue = {{ this.min_value_json }}, maxValue = {{ this.max_value_json }};
+            var fixedColor = {{ this.color_json }}, label = {{ this.label_json }};
+            var popupUrl = {{ this.popup_url_json }}, popupCache = {};
+            var renderer = L.canvas({padding: 0.5});
+
+""" + _COMMUNE_FEATURES_JS + """
+            var group = L.layerGroup().addTo(map);
+            var loaded = {}, pending = {}, shown = {}, wanted = {};
+
+            function visibleTiles() {
+                var z = Math.max(0, Math.min(maxZoom, Math.round(map.getZoom())));
+                var n = Math.pow(2, z), bounds = map.getBounds();
+                function clamp(v) { return Math.max(0, Math.min(n - 1, v)); }
+                function tileX(lon) { return clamp(Math.floor((lon + 180) / 360 * n)); }
+                function tileY(lat) {
+                    lat = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+                    return clamp(Math.floor((1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * n));
+                }
+                var keys = [];
+                for (var x = tileX(bounds.getWest()); x <= tileX(bounds.getEast()); x++) {
+                    for (var y = tileY(bounds.getNorth()); y <= tileY(bounds.getSouth()); y++) {
+                        keys.push(z + '/' + x + '/' + y);
+                    }
+                }
+                return keys;
+            }
+            function show(key) {
+                if (!shown[key] && loaded[key] && wanted[key]) {
+                    shown[key] = L.geoJSON(loaded[key], layerOptions).addTo(group);
+                }
+            }
+            function load(key) {
+                var parts = key.split('/');
+                pending[key] = true;
+                fetch(tileUrl.replace('{z}', parts[0]).replace('{x}', parts[1]).replace('{y}', parts[2]))
+                    .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+                    .then(function(tile) { loaded[key] = tile; show(key); })
+                    .catch(function() {})
+                    .then(function() { delete pending[key]; });
+            }
+            function update() {
+                wanted = {};
+                visibleTiles().forEach(function(key) {
+                    wanted[key] = true;
+                    if (loaded[key]) show(key);
+                    else if (!pending[key]) load(key);
+                });
+                Object.keys(shown).forEach(function(key) {
+                    if (!wanted[key]) { group.removeLayer(shown[key]); delete shown[key]; }
+                });
+            }
+
+            map.on('moveend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, tile_url: str, max_zoom: int = FULL_DETAIL_ZOOM,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None,
+                 radius: int = 4, color: Optional[str] = None, label: Optional[str] = None,
+                 popup_url: Optional[str] = None):
+        super().__init__()
+        self._name = 'TiledCommunesLayer'
+        self.radius = radius
+        self.max_zoom = int(max_zoom)
+        self.tile_url_json = json.dumps(tile_url).replace('</', '<\\/')
+        self.min_value_json = json.dumps(min_value)
+        self.max_value_json = json.dumps(max_value)
+        self.color_json = json.dumps(color)
+        self.label_json = json.dumps(label, ensure_ascii=False)
+        self.popup_url_json = json.dumps(popup_url).replace('</', '<\\/')
 
 
 def create_communes_map(
@@ -171,11 +563,25 @@ def create_communes_map(
     center_lat: float = 46.2276,
     center_lon: float = 2.2137,
     zoom_start: int = 6,
-    show_legend: bool = True
+    show_legend: bool = True,
+    render_mode: str = 'markers',
+    popup_url: Optional[str] = None,
+    tile_url: Optional[str] = None,
+    grid_url: Optional[str] = None
 ) -> folium.Map:
     """
     Crée une carte Folium affichant la localisation des communes avec leurs indicateurs.
     
+    Modes de rendu:
+    - 'markers': les 500 communes les plus importantes, avec popups chargés au clic si
+      popup_url (sinon un marqueur Folium par commune, popup HTML embarqué)
+    - 'geojson': toutes les communes dans une seule couche de données, stylée
+      dans le navigateur selon l'indice de mobilité verte (voir CommunesDataLayer)
+    - 'tiles': les communes sont chargées par tuiles au fil des déplacements
+      (voir TiledCommunesLayer); la carte ne contient aucune donnée de commune
+    - 'grid': toutes les communes agrégées en cellules (hexagones ou carrés),
+      moyennes pondérées par IPONDI calculées côté serveur (voir GridLayer)
+    
     Args:
         communes_df: DataFrame avec les données des communes (doit contenir COM/CODCOM, Commune/LIBGEO, PTOT, green_mobility_index, etc.)
         output_path: Chemin pour sauvegarder la carte HTML (optionnel)
@@ -183,10 +589,22 @@ def create_communes_map(
         center_lon: Longitude du centre de la carte
         zoom_start: Niveau de zoom initial
         show_legend: Afficher la légende
+        render_mode: 'markers', 'geojson', 'tiles' ou 'grid'
+        popup_url: En modes 'markers' et 'geojson', URL des détails d'une commune (__CODE__
+            remplacé par le code): les popups sont alors chargés au clic au lieu d'être embarqués
+        tile_url: En mode 'tiles' (obligatoire), URL des tuiles avec {z}, {x} et {y}
+        grid_url: En mode 'grid' (obligatoire), URL de la grille avec {z}
     
     Returns:
         Objet folium.Map
     """
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Mode de rendu inconnu: {render_mode} (attendu: {', '.join(RENDER_MODES)})")
+    if render_mode == 'tiles' and not tile_url:
+        raise ValueError("Le mode 'tiles' nécessite tile_url")
+    if render_mode == 'grid' and not grid_url:
+        raise ValueError("Le mode 'grid' nécessite grid_url")
+    
     # Créer la carte
     m = folium.Map(
         location=[center_lat, center_lon],
@@ -198,6 +616,14 @@ def create_communes_map(
         logger.warning("DataFrame vide, création d'une carte vide")
         return m
     
+    if render_mode == 'grid':
+        # Cellules, couleurs et légende viennent du serveur, par zoom
+        GridLayer(grid_url).add_to(m)
+        if output_path:
+            m.save(output_path)
+            logger.info(f"Carte sauvegardée: {output_path}")
+        return m
+    
     # Identifier les colonnes nécessaires
     commune_col = None
     name_col = None
@@ -222,11 +648,18 @@ def create_communes_map(
         logger.warning(f"Colonne commune non trouvée. Colonnes disponibles: {list(communes_df.columns)}")
         return m
     
-    # Limiter le nombre de marqueurs pour la performance
-    max_markers = 500
-    if len(communes_df) > max_markers:
-        df_sample = communes_df.sample(n=max_markers)
-        logger.info(f"Échantillonnage: {max_markers} communes sur {len(communes_df)}")
+    # Limiter le nombre de marqueurs pour la performance (la couche GeoJSON affiche tout)
+    if render_mode == 'markers' and len(communes_df) > MAX_MARKERS:
+        # Les communes les plus importantes (population, valeurs extrêmes): même entrée -> même carte
+        order = importance_order(
+            pd.to_numeric(communes_df['PTOT'], errors='coerce') if 'PTOT' in communes_df.columns
+            else np.zeros(len(communes_df)),
+            communes_df['green_mobility_index'] if 'green_mobility_index' in communes_df.columns
+            else np.full(len(communes_df), np.nan),
+            communes_df[commune_col].fillna('').astype(str)
+        )
+        df_sample = communes_df.iloc[order[:MAX_MARKERS]]
+        logger.info(f"Sélection: {MAX_MARKERS} communes sur {len(communes_df)}")
     else:
         df_sample = communes_df
     
@@ -256,9 +689,70 @@ def create_communes_map(
         else:
             return 'green'
     
+    # Placer toutes les communes en une seule passe (gazetteer local, sans réseau)
+    if render_mode != 'tiles':
+        coordinates = locate_communes(df_sample[commune_col].fillna(''))
+    
+    if render_mode == 'tiles':
+        # Seule l'échelle de couleur est embarquée, les points arrivent par tuiles
+        TiledCommunesLayer(
+            tile_url,
+            min_value=min_green if has_green_mobility else None,
+            max_value=max_green if has_green_mobility else None,
+            popup_url=popup_url
+        ).add_to(m)
+        added_count = 0
+    elif render_mode == 'geojson' or popup_url:
+        # En mode 'markers' avec popup_url, les communes sélectionnées passent par la même
+        # couche (popups chargés au clic) au lieu d'embarquer un popup HTML par marqueur
+        markers = render_mode == 'markers'
+        data = build_communes_layer_data(df_sample, commune_col, name_col, coordinates,
+                                         include_names=markers or popup_url is None)
+        CommunesDataLayer(
+            data,
+            min_value=min_green if has_green_mobility else None,
+            max_value=max_green if has_green_mobility else None,
+            radius=6 if markers else 4,
+            popup_url=popup_url
+        ).add_to(m)
+        added_count = len(data['code'])
+    else:
+        added_count = _add_commune_markers(m, df_sample, commune_col, name_col,
+                                           coordinates['lat'].to_numpy(), coordinates['lon'].to_numpy(),
+                                           has_green_mobility, get_color)
+    
+    logger.info(f"Carte créée avec {added_count} marqueurs sur {len(df_sample)} lignes")
+    
+    # Ajouter une légende si demandé
+    if show_legend and has_green_mobility:
+        legend_html = f'''
+        <div style="position: fixed; 
+                    bottom: 50px; left: 50px; width: 220px; height: 140px; 
+                    background-color: white; border:2px solid grey; z-index:9999; 
+                    font-size:14px; padding: 10px; border-radius: 5px; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">
+        <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px;">Légende</p>
+        <p style="margin: 5px 0;"><span style="color:green; font-size: 20px;">●</span> Mobilité Verte Élevée ({max_green:.1f}%)</p>
+        <p style="margin: 5px 0;"><span style="color:orange; font-size: 20px;">●</span> Mobilité Verte Moyenne</p>
+        <p style="margin: 5px 0;"><span style="color:red; font-size: 20px;">●</span> Mobilité Verte Faible ({min_green:.1f}%)</p>
+        <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">Cliquez sur un marqueur pour plus d'infos</p>
+        </div>
+        '''
+        m.get_root().html.add_child(folium.Element(legend_html))
+    
+    # Sauvegarder si demandé
+    if output_path:
+        m.save(output_path)
+        logger.info(f"Carte sauvegardée: {output_path}")
+    
+    return m
+
+
+def _add_commune_markers(m, df_sample, commune_col, name_col, latitudes, longitudes,
+                         has_green_mobility, get_color) -> int:
+    """Ajoute un marqueur Folium (avec popup HTML) par commune, retourne le nombre ajouté"""
     # Ajouter les marqueurs
     added_count = 0
-    for idx, row in df_sample.iterrows():
+    for position, (idx, row) in enumerate(df_sample.iterrows()):
         try:
             # Récupérer le code commune
             commune_code_raw = row.get(commune_col)
@@ -274,7 +768,7 @@ def create_communes_map(
             commune_name = str(row[name_col]) if name_col and pd.notna(row.get(name_col)) else commune_code
             
             # Obtenir les coordonnées
-            lat, lon = get_commune_coordinates(commune_code, commune_name)
+            lat, lon = latitudes[position], longitudes[position]
             
             if lat and lon:
                 # Créer le popup avec tooltip
@@ -336,29 +830,293 @@ def create_communes_map(
             logger.debug(f"Erreur lors de l'ajout du marqueur pour la ligne {idx}: {e}")
             continue
     
-    logger.info(f"Carte créée avec {added_count} marqueurs sur {len(df_sample)} lignes")
+    return added_count
+
+
+# Seuils des zones mal desservies: mobilité verte < 20% OU pas de transport > 15%
+UNDERSERVED_GREEN_THRESHOLD = 20
+UNDERSERVED_NO_TRANSPORT_THRESHOLD = 15
+
+
+def flag_underserved(communes_df: pd.DataFrame) -> pd.Series:
+    """
+    Indique les communes mal desservies (résultat de prepare_communes_data).
     
-    # Ajouter une légende si demandé
-    if show_legend and has_green_mobility:
-        legend_html = f'''
-        <div style="position: fixed; 
-                    bottom: 50px; left: 50px; width: 220px; height: 140px; 
-                    background-color: white; border:2px solid grey; z-index:9999; 
-                    font-size:14px; padding: 10px; border-radius: 5px; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">
-        <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px;">Légende</p>
-        <p style="margin: 5px 0;"><span style="color:green; font-size: 20px;">●</span> Mobilité Verte Élevée ({max_green:.1f}%)</p>
-        <p style="margin: 5px 0;"><span style="color:orange; font-size: 20px;">●</span> Mobilité Verte Moyenne</p>
-        <p style="margin: 5px 0;"><span style="color:red; font-size: 20px;">●</span> Mobilité Verte Faible ({min_green:.1f}%)</p>
-        <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">Cliquez sur un marqueur pour plus d'infos</p>
-        </div>
-        '''
-        m.get_root().html.add_child(folium.Element(legend_html))
+    Returns:
+        Series booléenne alignée sur communes_df (False si les indicateurs manquent)
+    """
+    if 'green_mobility_index' in communes_df.columns and 'pas_transport_percentage' in communes_df.columns:
+        return (
+            (communes_df['green_mobility_index'] < UNDERSERVED_GREEN_THRESHOLD) |
+            (communes_df['pas_transport_percentage'] > UNDERSERVED_NO_TRANSPORT_THRESHOLD)
+        )
+    return pd.Series(False, index=communes_df.index)
+
+
+def add_underserved_layer(m: folium.Map, communes_df: pd.DataFrame, radius: int = 6,
+                          popup_url: Optional[str] = None, tile_url: Optional[str] = None) -> int:
+    """
+    Ajoute les zones mal desservies sur une carte, en une seule couche rouge.
     
-    # Sauvegarder si demandé
-    if output_path:
-        m.save(output_path)
-        logger.info(f"Carte sauvegardée: {output_path}")
+    Args:
+        tile_url: URL des tuiles de la couche 'underserved': les zones sont alors
+            chargées par tuiles au lieu d'être embarquées dans la carte
+    
+    Returns:
+        Nombre de communes ajoutées (0 si elles sont chargées par tuiles)
+    """
+    if tile_url:
+        TiledCommunesLayer(tile_url, radius=radius, color='red', label='Zone mal desservie',
+                           popup_url=popup_url).add_to(m)
+        return 0
     
+    commune_col = next((c for c in ['COMMUNE_CODE', 'COM', 'CODCOM'] if c in communes_df.columns), None)
+    name_col = next((c for c in ['Commune', 'LIBGEO'] if c in communes_df.columns), None)
+    if commune_col is None:
+        return 0
+    
+    underserved = communes_df[flag_underserved(communes_df).to_numpy()]
+    if underserved.empty:
+        return 0
+    
+    coordinates = locate_communes(underserved[commune_col].fillna(''))
+    data = build_communes_layer_data(underserved, commune_col, name_col, coordinates,
+                                     include_names=popup_url is None)
+    CommunesDataLayer(data, radius=radius, color='red', label='Zone mal desservie',
+                      popup_url=popup_url).add_to(m)
+    return len(data['code'])
+
+
+# JavaScript commun aux couches en classes de couleur (choroplèthe, grille):
+# colorFor selon breaks/colors et légende des classes (addLegend la remplace si
+# elle existe déjà). Attend breaks, colors, label et map.
+_CLASSED_COLORS_JS = """
+            function escapeHtml(text) {
+                return String(text).replace(/[&<>"']/g, function(c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            }
+            function colorFor(value) {
+                if (value === undefined || value === null) return '#cccccc';
+                var i = 0;
+                while (i < breaks.length && value > breaks[i]) i++;
+                return colors[Math.min(i, colors.length - 1)];
+            }
+
+            var legend = null;
+            function addLegend() {
+                if (legend) map.removeControl(legend);
+                legend = L.control({position: 'bottomright'});
+                legend.onAdd = function() {
+                    var div = L.DomUtil.create('div');
+                    div.style.cssText = 'background: white; padding: 8px 10px; border: 2px solid grey; border-radius: 5px; font-size: 13px;';
+                    var html = '<b>' + escapeHtml(label) + '</b>';
+                    colors.slice(0, breaks.length + 1).forEach(function(color, i) {
+                        var text = i === 0 ? '&le; ' + breaks[0] : (i < breaks.length ? breaks[i - 1] + ' &ndash; ' + breaks[i] : '&gt; ' + breaks[i - 1]);
+                        if (!breaks.length) text = 'Toutes valeurs';
+                        html += '<br><span style="display: inline-block; width: 14px; height: 14px; background: ' + color
+                            + '; border: 1px solid #999; vertical-align: middle;"></span> ' + text;
+                    });
+                    div.innerHTML = html;
+                    return div;
+                };
+                legend.addTo(map);
+            }
+"""
+
+
+class ChoroplethLayer(MacroElement):
+    """
+    Couche choroplèthe chargée par le navigateur.
+    
+    Les valeurs (par code de territoire) et les classes de couleur sont demandées
+    une fois à values_url; les contours TopoJSON simplifiés sont demandés à
+    topology_url pour le zoom courant (borné à [min_zoom, max_zoom]), puis gardés
+    en mémoire. Le rendu utilise un canvas.
+    
+    Args:
+        topology_url: URL des contours avec {z}
+        values_url: URL des valeurs (voir app/visualizations/choropleth.py)
+        min_zoom, max_zoom: Zooms des contours disponibles
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var topologyUrl = {{ this.topology_url_json }}, valuesUrl = {{ this.values_url_json }};
+            var minZoom = {{ this.min_zoom }}, maxZoom = {{ this.max_zoom }};
+            var renderer = L.canvas({padding: 0.5});
+            var values = {}, breaks = [], colors = [], label = '';
+            var topologies = {}, layer = null, currentZoom = null;
+
+""" + _CLASSED_COLORS_JS + """
+            // TopoJSON -> GeoJSON: arcs en écarts successifs, ~i pour un arc parcouru à l'envers
+            function decode(topology) {
+                var sx = topology.transform.scale[0], sy = topology.transform.scale[1];
+                var tx = topology.transform.translate[0], ty = topology.transform.translate[1];
+                var arcs = topology.arcs.map(function(arc) {
+                    var x = 0, y = 0;
+                    return arc.map(function(p) { x += p[0]; y += p[1]; return [x * sx + tx, y * sy + ty]; });
+                });
+                function ring(refs) {
+                    var points = [];
+                    refs.forEach(function(ref, i) {
+                        var arc = ref < 0 ? arcs[~ref].slice().reverse() : arcs[ref];
+                        points = points.concat(i ? arc.slice(1) : arc);
+                    });
+                    return points;
+                }
+                function polygon(rings) { return rings.map(ring); }
+                var objects = topology.objects[Object.keys(topology.objects)[0]].geometries;
+                return {type: 'FeatureCollection', features: objects.map(function(g) {
+                    return {
+                        type: 'Feature', id: g.id, properties: g.properties || {},
+                        geometry: {type: g.type, coordinates: g.type === 'Polygon' ? polygon(g.arcs) : g.arcs.map(polygon)}
+                    };
+                })};
+            }
+
+            function render(zoom) {
+                if (layer) map.removeLayer(layer);
+                layer = L.geoJSON(decode(topologies[zoom]), {
+                    renderer: renderer,
+                    style: function(feature) {
+                        return {fillColor: colorFor(values[feature.id]), fillOpacity: 0.75, color: '#555555', weight: 0.4};
+                    },
+                    onEachFeature: function(feature, featureLayer) {
+                        featureLayer.bindTooltip(function() {
+                            var value = values[feature.id];
+                            return '<b>' + escapeHtml(feature.properties.name || feature.id) + '</b><br>' + escapeHtml(label)
+                                + ': ' + (value === undefined ? 'n/d' : value.toFixed(1));
+                        }, {sticky: true});
+                    }
+                }).addTo(map);
+            }
+            function update() {
+                var zoom = Math.max(minZoom, Math.min(maxZoom, Math.round(map.getZoom())));
+                if (zoom === currentZoom) return;
+                currentZoom = zoom;
+                if (topologies[zoom]) { render(zoom); return; }
+                fetch(topologyUrl.replace('{z}', zoom))
+                    .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+                    .then(function(topology) {
+                        topologies[zoom] = topology;
+                        if (currentZoom === zoom) render(zoom);
+                    })
+                    .catch(function(error) { console.error('Contours indisponibles', error); });
+            }
+            fetch(valuesUrl)
+                .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+                .then(function(data) {
+                    values = data.values; breaks = data.breaks; colors = data.colors; label = data.label;
+                    addLegend();
+                    map.on('zoomend', update);
+                    update();
+                })
+                .catch(function(error) { console.error('Valeurs indisponibles', error); });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, topology_url: str, values_url: str, min_zoom: int = 4, max_zoom: int = 12):
+        super().__init__()
+        self._name = 'ChoroplethLayer'
+        self.topology_url_json = json.dumps(topology_url).replace('</', '<\\/')
+        self.values_url_json = json.dumps(values_url).replace('</', '<\\/')
+        self.min_zoom = int(min_zoom)
+        self.max_zoom = int(max_zoom)
+
+
+class GridLayer(MacroElement):
+    """
+    Communes agrégées sur une grille (hexagones ou carrés), chargée par le navigateur.
+    
+    Chaque zoom (borné à [min_zoom, max_zoom]) a sa propre grille, demandée à
+    grid_url une seule fois puis gardée en mémoire; les classes de couleur et la
+    légende accompagnent chaque réponse (voir app/visualizations/grid.py).
+    
+    Args:
+        grid_url: URL de la grille avec {z}
+        min_zoom, max_zoom: Zooms servis
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var gridUrl = {{ this.grid_url_json }};
+            var minZoom = {{ this.min_zoom }}, maxZoom = {{ this.max_zoom }};
+            var renderer = L.canvas({padding: 0.5});
+            var breaks = [], colors = [], label = '';
+            var grids = {}, layer = null, currentZoom = null;
+
+""" + _CLASSED_COLORS_JS + """
+            function render(zoom) {
+                var grid = grids[zoom];
+                breaks = grid.breaks; colors = grid.colors; label = grid.label;
+                if (layer) map.removeLayer(layer);
+                layer = L.geoJSON(grid, {
+                    renderer: renderer,
+                    style: function(feature) {
+                        return {fillColor: colorFor(feature.properties.value), fillOpacity: 0.7, color: '#666666', weight: 0.5};
+                    },
+                    onEachFeature: function(feature, featureLayer) {
+                        var p = feature.properties;
+                        featureLayer.bindTooltip(escapeHtml(label) + ': <b>' + (p.value === null ? 'n/d' : p.value.toFixed(1))
+                            + '</b><br>' + p.communes + ' communes, ' + p.population.toLocaleString('fr-FR') + ' habitants',
+                            {sticky: true});
+                    }
+                }).addTo(map);
+                addLegend();
+            }
+            function update() {
+                var zoom = Math.max(minZoom, Math.min(maxZoom, Math.round(map.getZoom())));
+                if (zoom === currentZoom) return;
+                currentZoom = zoom;
+                if (grids[zoom]) { render(zoom); return; }
+                fetch(gridUrl.replace('{z}', zoom))
+                    .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+                    .then(function(grid) {
+                        grids[zoom] = grid;
+                        if (currentZoom === zoom) render(zoom);
+                    })
+                    .catch(function(error) { console.error('Grille indisponible', error); });
+            }
+
+            map.on('zoomend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, grid_url: str, min_zoom: int = MIN_GRID_ZOOM, max_zoom: int = MAX_GRID_ZOOM):
+        super().__init__()
+        self._name = 'GridLayer'
+        self.grid_url_json = json.dumps(grid_url).replace('</', '<\\/')
+        self.min_zoom = int(min_zoom)
+        self.max_zoom = int(max_zoom)
+
+
+def create_choropleth_map(
+    topology_url: str,
+    values_url: str,
+    center_lat: float = 46.2276,
+    center_lon: float = 2.2137,
+    zoom_start: int = 6,
+    min_zoom: int = 4,
+    max_zoom: int = 12
+) -> folium.Map:
+    """
+    Crée une carte choroplèthe (communes, départements ou régions).
+    
+    La carte ne contient que les URL des contours et des valeurs: les deux sont
+    chargés par le navigateur et mis en cache côté serveur.
+    """
+    m = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=zoom_start,
+        tiles='CartoDB positron'
+    )
+    ChoroplethLayer(topology_url, values_url, min_zoom=min_zoom, max_zoom=max_zoom).add_to(m)
     return m
 
 
@@ -367,7 +1125,11 @@ def create_green_mobility_map(
     output_path: Optional[str] = None,
     center_lat: float = 46.2276,
     center_lon: float = 2.2137,
-    zoom_start: int = 6
+    zoom_start: int = 6,
+    render_mode: str = 'markers',
+    popup_url: Optional[str] = None,
+    tile_url: Optional[str] = None,
+    grid_url: Optional[str] = None
 ) -> folium.Map:
     """
     Crée une carte colorée selon l'indicateur de mobilité verte.
@@ -378,6 +1140,10 @@ def create_green_mobility_map(
         center_lat=center_lat,
         center_lon=center_lon,
         zoom_start=zoom_start,
-        show_legend=True
+        show_legend=True,
+        render_mode=render_mode,
+        popup_url=popup_url,
+        tile_url=tile_url,
+        grid_url=grid_url
     )
 
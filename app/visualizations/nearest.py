@@ -0,0 +1,281 @@
+"""
+Communes bien desservies les plus proches des zones mal desservies
+
+Pour chaque commune mal desservie (voir maps.flag_underserved), cherche les k
+communes les plus proches dont la part des transports en commun atteint un
+seuil. Les centroïdes sont des vecteurs unitaires 3D: la distance euclidienne
+(corde) est monotone avec la distance sur la sphère, convertie ensuite en km.
+
+L'index des communes bien desservies est construit une fois par version des
+données, tranche d'âge et seuil: arbre k-d de scipy (cKDTree) s'il est
+installé, sinon recherche exhaustive vectorisée par blocs (produits scalaires
+numpy), de l'ordre de la seconde pour la France entière.
+
+Les communes candidates ne sont pas limitées par les filtres de région ou de
+département: la commune la plus proche peut être de l'autre côté d'une limite.
+
+Seules les communes placées à leur centroïde (precision 'commune') sont
+mesurées: une commune placée au centre de son département serait à 0 km de
+ses voisines. Les communes mal desservies sans position précise sont listées
+à part (unlocated), sans distance.
+"""
+
+import importlib.util
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.render_cache import RenderCache, make_cache_key
+from app.visualizations.points import get_point_table, get_points_version
+
+logger = logging.getLogger(__name__)
+
+# scipy n'est importé qu'à la construction du premier index (import coûteux au
+# démarrage): seule sa présence est vérifiée ici
+SCIPY_AVAILABLE = importlib.util.find_spec('scipy') is not None
+if not SCIPY_AVAILABLE:
+    logger.info("scipy n'est pas installé: recherche des plus proches voisins par blocs numpy.")
+
+EARTH_RADIUS_KM = 6371.0
+
+# Précision de position requise pour mesurer une distance (voir maps.locate_communes)
+LOCATED_PRECISION = 'commune'
+
+# Part minimale des transports en commun (%) d'une commune bien desservie
+DEFAULT_TRANSIT_THRESHOLD = 15.0
+
+DEFAULT_NEIGHBOURS = 3
+MAX_NEIGHBOURS = 20
+
+# Taille d'un bloc de la recherche exhaustive (éléments de la matrice des produits scalaires)
+BLOCK_ELEMENTS = 1 << 22
+
+MAX_NEAREST_ENTRIES = 16
+
+_nearest_indexes = OrderedDict()
+_nearest_results = OrderedDict()
+_nearest_lock = threading.Lock()
+
+# Réponses encodées (plusieurs Mo à l'échelle nationale)
+nearest_cache = RenderCache(cache_dir=None, max_entries=MAX_NEAREST_ENTRIES, suffix='.json')
+
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    """Coordonnées (degrés) en vecteurs unitaires 3D, une ligne par point"""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Distance euclidienne entre vecteurs unitaires -> distance sur la sphère (km)"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+class NearestIndex:
+    """
+    Index des plus proches voisins sur un ensemble de communes.
+
+    Args:
+        points: Communes candidates (colonnes lat, lon)
+    """
+
+    def __init__(self, points: pd.DataFrame):
+        self.points = points.reset_index(drop=True)
+        self.vectors = unit_vectors(self.points['lat'], self.points['lon'])
+        self.tree = None
+        if SCIPY_AVAILABLE and len(self.points):
+            from scipy.spatial import cKDTree
+            self.tree = cKDTree(self.vectors)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, lat, lon, k: int):
+        """
+        Les k candidates les plus proches de chaque point.
+
+        Returns:
+            (distances en km, positions dans points), deux tableaux (n, k) triés
+            par distance croissante
+        """
+        queries = unit_vectors(lat, lon)
+        k = min(k, len(self.points))
+        if k == 0 or len(queries) == 0:
+            return np.empty((len(queries), 0)), np.empty((len(queries), 0), dtype=np.int64)
+
+        if self.tree is not None:
+            chords, positions = self.tree.query(queries, k=k)
+            return chord_to_km(chords.reshape(len(queries), k)), positions.reshape(len(queries), k)
+
+        # Recherche exhaustive par blocs: |a - b|² = 2 - 2 a·b pour des vecteurs unitaires
+        rows = max(1, BLOCK_ELEMENTS // len(self.points))
+        distances = np.empty((len(queries), k))
+        positions = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), rows):
+            dots = queries[start:start + rows] @ self.vectors.T
+            if k < dots.shape[1]:
+                nearest = np.argpartition(-dots, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(k), (len(dots), k))
+            nearest_dots = np.take_along_axis(dots, nearest, axis=1)
+            order = np.argsort(-nearest_dots, axis=1, kind='stable')
+            positions[start:start + rows] = np.take_along_axis(nearest, order, axis=1)
+            chords = np.sqrt(np.maximum(0.0, 2.0 - 2.0 * np.take_along_axis(nearest_dots, order, axis=1)))
+            distances[start:start + rows] = chord_to_km(chords)
+        return distances, positions
+
+
+def empty_points() -> pd.DataFrame:
+    """Table de points vide, avec les colonnes (typées) utilisées ici"""
+    text, number = pd.Series(dtype=object), pd.Series(dtype=float)
+    return pd.DataFrame({'code': text, 'name': text, 'lat': number, 'lon': number, 'precision': text,
+                         'green_mobility_index': number, 'pas_transport_percentage': number,
+                         'transport_commun_percentage': number})
+
+
+def flag_well_served(points: pd.DataFrame, transit_threshold: float) -> np.ndarray:
+    """Communes non mal desservies dont la part des transports en commun atteint le seuil"""
+    from app.visualizations.maps import flag_underserved
+    transit = points['transport_commun_percentage'].to_numpy(dtype=float)
+    return (~flag_underserved(points).to_numpy()) & (transit >= transit_threshold)
+
+
+def get_nearest_index(age_filter: str = '', transit_threshold: float = DEFAULT_TRANSIT_THRESHOLD) -> NearestIndex:
+    """Index des communes bien desservies (France entière), une fois par version des données"""
+    key = (get_points_version(), age_filter or '', float(transit_threshold))
+    with _nearest_lock:
+        if key in _nearest_indexes:
+            _nearest_indexes.move_to_end(key)
+            return _nearest_indexes[key]
+
+    points = get_point_table('', '', age_filter)
+    if points.empty:
+        candidates = empty_points()
+    else:
+        candidates = points[flag_well_served(points, transit_threshold)
+                            & (points['precision'] == LOCATED_PRECISION).to_numpy()]
+    index = NearestIndex(candidates)
+
+    with _nearest_lock:
+        _nearest_indexes[key] = index
+        _nearest_indexes.move_to_end(key)
+        while len(_nearest_indexes) > MAX_NEAREST_ENTRIES:
+            _nearest_indexes.popitem(last=False)
+    logger.debug(f"Index des communes bien desservies: {len(index)} communes (seuil {transit_threshold}%)")
+    return index
+
+
+def find_nearest_well_served(region_filter: str = '', department_filter: str = '', age_filter: str = '',
+                             k: int = DEFAULT_NEIGHBOURS,
+                             transit_threshold: float = DEFAULT_TRANSIT_THRESHOLD) -> dict:
+    """
+    Pour chaque commune mal desservie des filtres, les k communes bien desservies
+    les plus proches (code, nom, distance en km, part des transports en commun).
+
+    Returns:
+        Dictionnaire: paramètres, résumé (nombres de communes, distance médiane à
+        la plus proche), liste des communes mal desservies, la plus isolée d'abord,
+        et liste des communes mal desservies sans position précise (unlocated)
+
+    Raises:
+        ValueError: k ou seuil hors limites
+    """
+    if not 1 <= k <= MAX_NEIGHBOURS:
+        raise ValueError(f"k hors limites: {k} (1 à {MAX_NEIGHBOURS})")
+    if not 0 <= transit_threshold <= 100:
+        raise ValueError(f"Seuil hors limites: {transit_threshold} (0 à 100)")
+
+    key = (get_points_version(), region_filter or '', department_filter or '', age_filter or '',
+           k, float(transit_threshold))
+    with _nearest_lock:
+        if key in _nearest_results:
+            _nearest_results.move_to_end(key)
+            return _nearest_results[key]
+
+    from app.visualizations.maps import flag_underserved
+    points = get_point_table(region_filter, department_filter, age_filter)
+    # Aucune commune pour ces filtres: table vide typée (résultat vide, compteurs à zéro)
+    underserved = points[flag_underserved(points).to_numpy()] if not points.empty else empty_points()
+    located = (underserved['precision'] == LOCATED_PRECISION).to_numpy()
+    unlocated = [
+        {'code': code, 'name': name, 'precision': precision}
+        for code, name, precision in zip(underserved['code'][~located], underserved['name'][~located],
+                                         underserved['precision'][~located])
+    ]
+    underserved = underserved[located]
+    index = get_nearest_index(age_filter, transit_threshold)
+    distances, positions = index.query(underserved['lat'], underserved['lon'], k) if len(underserved) else (
+        np.empty((0, 0)), np.empty((0, 0), dtype=np.int64))
+
+    candidates = index.points
+    candidate_codes = candidates['code'].to_numpy(dtype=object)
+    candidate_names = candidates['name'].to_numpy(dtype=object)
+    candidate_transit = candidates['transport_commun_percentage'].to_numpy(dtype=float).round(1)
+
+    communes = []
+    for row, (code, name, green, no_transport) in enumerate(zip(
+            underserved['code'], underserved['name'],
+            underserved['green_mobility_index'].to_numpy(dtype=float),
+            underserved['pas_transport_percentage'].to_numpy(dtype=float))):
+        communes.append({
+            'code': code,
+            'name': name,
+            'green_mobility_index': None if np.isnan(green) else round(float(green), 1),
+            'pas_transport_percentage': None if np.isnan(no_transport) else round(float(no_transport), 1),
+            'nearest': [
+                {
+                    'code': candidate_codes[p],
+                    'name': candidate_names[p],
+                    'distance_km': round(float(d), 2),
+                    'transport_commun_percentage': float(candidate_transit[p]),
+                }
+                for d, p in zip(distances[row], positions[row])
+            ],
+        })
+    # La plus isolée d'abord
+    communes.sort(key=lambda c: (-(c['nearest'][0]['distance_km'] if c['nearest'] else np.inf), c['code']))
+
+    first = distances[:, 0] if distances.size else np.empty(0)
+    result = {
+        'k': k,
+        'transit_threshold': float(transit_threshold),
+        'summary': {
+            'underserved': len(communes),
+            'unlocated': len(unlocated),
+            'well_served': len(index),
+            'median_distance_km': round(float(np.median(first)), 2) if len(first) else None,
+            'max_distance_km': round(float(first.max()), 2) if len(first) else None,
+        },
+        'communes': communes,
+        'unlocated': unlocated,
+    }
+
+    with _nearest_lock:
+        _nearest_results[key] = result
+        _nearest_results.move_to_end(key)
+        while len(_nearest_results) > MAX_NEAREST_ENTRIES:
+            _nearest_results.popitem(last=False)
+    return result
+
+
+def get_nearest_well_served_json(region_filter: str = '', department_filter: str = '', age_filter: str = '',
+                                 k: int = DEFAULT_NEIGHBOURS,
+                                 transit_threshold: float = DEFAULT_TRANSIT_THRESHOLD) -> bytes:
+    """Résultat de find_nearest_well_served encodé en JSON (avec cache)"""
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter,
+               'k': int(k), 'transit': float(transit_threshold)}
+    cache_key = make_cache_key('nearest', filters, get_points_version())
+    cached = nearest_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = find_nearest_well_served(region_filter, department_filter, age_filter, k, transit_threshold)
+    content = json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    nearest_cache.set(cache_key, content)
+    return content
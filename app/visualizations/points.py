@@ -0,0 +1,162 @@
+"""
+Table des points des communes
+
+Une ligne par commune localisée: code, nom, population, coordonnées
+géographiques et projetées (Web Mercator normalisé dans [0, 1]) et indicateurs
+de prepare_communes_data. La table est triée par population décroissante, de
+sorte que les premières lignes d'une zone sont les communes les plus importantes.
+
+Elle est calculée une fois par combinaison de filtres et par version des
+données/coordonnées, puis partagée par les tuiles et les couches de cartes.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_loader import DataLoader
+from app.utils.gazetteer import get_gazetteer_version
+
+logger = logging.getLogger(__name__)
+
+# Indicateurs conservés dans la table (colonnes de prepare_communes_data)
+INDICATOR_COLUMNS = [
+    'green_mobility_index',
+    'avg_commute_time',
+    'velo_percentage',
+    'voiture_percentage',
+    'transport_commun_percentage',
+    'marche_percentage',
+    'deux_roues_percentage',
+    'pas_transport_percentage',
+]
+
+# Latitude maximale de la projection Web Mercator
+MAX_MERCATOR_LAT = 85.0511287798
+
+# Nombre maximal de tables gardées en mémoire (une par combinaison de filtres)
+MAX_POINT_TABLES = 16
+
+_point_tables = OrderedDict()
+_point_tables_lock = threading.Lock()
+
+data_loader = DataLoader()
+
+
+def project_mercator(lat, lon):
+    """
+    Projette des coordonnées en Web Mercator normalisé (x, y dans [0, 1],
+    y croissant vers le sud comme les indices de tuiles).
+    """
+    lat = np.clip(np.asarray(lat, dtype=float), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lon = np.asarray(lon, dtype=float)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / np.pi) / 2.0
+    return x, y
+
+
+def unproject_mercator(x, y):
+    """Inverse de project_mercator: retourne (lat, lon) en degrés"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lon = x * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y))))
+    return lat, lon
+
+
+def importance_order(population, values, codes) -> np.ndarray:
+    """
+    Ordre d'importance déterministe des communes (positions, la plus importante d'abord).
+
+    Les deux classements sont entrelacés: la plus peuplée, puis la plus extrême
+    pour l'indicateur (écart à la médiane, dans les deux sens), puis la deuxième
+    plus peuplée, etc. Une commune déjà placée n'est pas répétée; les égalités
+    sont départagées par le code.
+    """
+    population = np.nan_to_num(np.asarray(population, dtype=float))
+    values = np.asarray(values, dtype=float)
+    codes = np.asarray(codes).astype(str)
+    n = len(population)
+
+    extremeness = np.full(n, -np.inf)
+    valid = ~np.isnan(values)
+    if valid.any():
+        extremeness[valid] = np.abs(values[valid] - np.median(values[valid]))
+
+    population_rank = np.empty(n, dtype=np.int64)
+    population_rank[np.lexsort((codes, -population))] = np.arange(n)
+    extreme_rank = np.empty(n, dtype=np.int64)
+    extreme_rank[np.lexsort((codes, -extremeness))] = np.arange(n)
+
+    # Rangs pairs pour la population, impairs pour les extrêmes: scores tous distincts
+    return np.argsort(np.minimum(2 * population_rank, 2 * extreme_rank + 1), kind='stable')
+
+
+def build_point_table(communes_df: pd.DataFrame) -> pd.DataFrame:
+    """Construit la table des points à partir du résultat de prepare_communes_data"""
+    from app.visualizations.maps import locate_communes
+
+    codes = communes_df['COMMUNE_CODE'].fillna('').astype(str).str.strip().str.zfill(5)
+    coordinates = locate_communes(codes)
+
+    table = pd.DataFrame({
+        'code': codes.to_numpy(),
+        'name': (communes_df['Commune'].astype(str).to_numpy()
+                 if 'Commune' in communes_df.columns else codes.to_numpy()),
+        'population': (pd.to_numeric(communes_df['PTOT'], errors='coerce').fillna(0).to_numpy()
+                       if 'PTOT' in communes_df.columns else 0),
+        'lat': coordinates['lat'].to_numpy(),
+        'lon': coordinates['lon'].to_numpy(),
+        'precision': coordinates['precision'].to_numpy(),
+    })
+    for col in INDICATOR_COLUMNS:
+        table[col] = communes_df[col].to_numpy() if col in communes_df.columns else np.nan
+
+    table = table[(table['code'] != '00000') & table['lat'].notna()]
+    table = table.drop_duplicates('code')
+    table['x'], table['y'] = project_mercator(table['lat'], table['lon'])
+
+    # Plus grandes communes d'abord, puis par code (ordre stable)
+    table = table.sort_values(['population', 'code'], ascending=[False, True], kind='stable')
+    return table.reset_index(drop=True)
+
+
+def get_points_version() -> str:
+    """Version des entrées de la table: données sources et gazetteer"""
+    return f"{data_loader.get_data_version()}-{get_gazetteer_version()}"
+
+
+def get_point_table(region_filter: str = '', department_filter: str = '', age_filter: str = '',
+                    communes_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Retourne la table des points pour ces filtres (calculée une fois par version).
+
+    Args:
+        communes_df: Résultat de prepare_communes_data pour ces filtres, s'il est déjà calculé
+
+    Returns:
+        DataFrame partagé, à ne pas modifier
+    """
+    key = (get_points_version(), region_filter or '', department_filter or '', age_filter or '')
+
+    with _point_tables_lock:
+        if key in _point_tables:
+            _point_tables.move_to_end(key)
+            return _point_tables[key]
+
+    if communes_df is None:
+        from app.routes.export import prepare_communes_data
+        communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
+
+    table = build_point_table(communes_df) if not communes_df.empty else pd.DataFrame()
+
+    with _point_tables_lock:
+        _point_tables[key] = table
+        _point_tables.move_to_end(key)
+        while len(_point_tables) > MAX_POINT_TABLES:
+            _point_tables.popitem(last=False)
+    logger.debug(f"Table des points construite: {len(table)} communes, filtres {key[1:]}")
+    return table
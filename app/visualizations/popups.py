@@ -0,0 +1,105 @@
+"""
+Index des popups de cartes
+
+Les cartes ne contiennent que le code et l'indice de chaque commune; le contenu
+des popups est demandé au clic à /visualizations/api/communes/<code>/popup.
+Cet endpoint lit un index pré-calculé (une table indexée par code commune) par
+combinaison de filtres et par version des données, gardé dans un cache borné.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from app.utils.data_loader import DataLoader
+
+logger = logging.getLogger(__name__)
+
+# Colonnes renvoyées dans un popup (nom -> colonne de prepare_communes_data)
+POPUP_COLUMNS = {
+    'name': 'Commune',
+    'population': 'PTOT',
+    'green_mobility_index': 'green_mobility_index',
+    'avg_commute_time': 'avg_commute_time',
+    'velo_percentage': 'velo_percentage',
+    'voiture_percentage': 'voiture_percentage',
+    'transport_commun_percentage': 'transport_commun_percentage',
+    'marche_percentage': 'marche_percentage',
+    'deux_roues_percentage': 'deux_roues_percentage',
+    'pas_transport_percentage': 'pas_transport_percentage',
+}
+
+# Nombre maximal d'index gardés en mémoire (un par combinaison de filtres)
+MAX_POPUP_INDEXES = 32
+
+_popup_indexes = OrderedDict()
+_popup_indexes_lock = threading.Lock()
+
+data_loader = DataLoader()
+
+
+def build_popup_index(communes_df: pd.DataFrame) -> pd.DataFrame:
+    """Table des champs de popup indexée par code commune (5 caractères)"""
+    columns = {name: col for name, col in POPUP_COLUMNS.items() if col in communes_df.columns}
+    if 'name' not in columns and 'LIBGEO' in communes_df.columns:
+        columns['name'] = 'LIBGEO'
+    index = communes_df[list(columns.values())].rename(columns={col: name for name, col in columns.items()})
+    index.index = communes_df['COMMUNE_CODE'].astype(str).str.zfill(5)
+    return index[~index.index.duplicated()]
+
+
+def get_popup_index(region_filter: str = '', department_filter: str = '', age_filter: str = '',
+                    communes_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Retourne l'index des popups pour ces filtres (calculé une fois par version des données).
+
+    Args:
+        communes_df: Résultat de prepare_communes_data pour ces filtres, s'il est
+            déjà calculé (les routes de cartes l'utilisent pour pré-remplir l'index)
+    """
+    key = (data_loader.get_data_version(), region_filter or '', department_filter or '', age_filter or '')
+
+    with _popup_indexes_lock:
+        if key in _popup_indexes:
+            _popup_indexes.move_to_end(key)
+            return _popup_indexes[key]
+
+    if communes_df is None:
+        from app.routes.export import prepare_communes_data
+        communes_df = prepare_communes_data(region_filter, department_filter, age_filter)
+
+    index = build_popup_index(communes_df) if not communes_df.empty else pd.DataFrame()
+
+    with _popup_indexes_lock:
+        _popup_indexes[key] = index
+        _popup_indexes.move_to_end(key)
+        while len(_popup_indexes) > MAX_POPUP_INDEXES:
+            _popup_indexes.popitem(last=False)
+    logger.debug(f"Index des popups construit: {len(index)} communes, filtres {key[1:]}")
+    return index
+
+
+def get_popup_record(commune_code: str, region_filter: str = '', department_filter: str = '',
+                     age_filter: str = ''):
+    """
+    Returns:
+        Dictionnaire JSON-compatible des champs du popup, ou None si la commune est absente
+    """
+    code = str(commune_code).strip().zfill(5)
+    index = get_popup_index(region_filter, department_filter, age_filter)
+    if index.empty or code not in index.index:
+        return None
+
+    record = {'code': code}
+    for name, value in index.loc[code].items():
+        if pd.isna(value):
+            record[name] = None
+        elif name == 'population':
+            record[name] = int(value)
+        elif name == 'name':
+            record[name] = str(value)
+        else:
+            record[name] = round(float(value), 1)
+    return record
@@ -0,0 +1,191 @@
+"""
+Tuiles de points des communes
+
+Les communes sont découpées selon la grille de tuiles standard (z/x/y, Web
+Mercator) et servies en GeoJSON compact par /visualizations/tiles/<couche>/<z>/<x>/<y>.
+Une carte ne charge ainsi que les tuiles visibles, au fil des déplacements.
+
+Aux petits zooms, les points sont éclaircis: une seule commune (la plus peuplée)
+est gardée par cellule de THINNING_CELL_PX pixels. À partir de FULL_DETAIL_ZOOM,
+toutes les communes sont présentes.
+
+Pour chaque couche et chaque zoom, un index trie les points par tuile (une
+tuile = une tranche contiguë, trouvée par np.searchsorted); les tuiles encodées
+sont gardées dans un cache mémoire. Index et tuiles dépendent de la version des
+données et des coordonnées.
+"""
+
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.utils.render_cache import RenderCache, make_cache_key
+from app.visualizations.points import get_point_table, get_points_version
+
+logger = logging.getLogger(__name__)
+
+# Couches disponibles: nom -> indicateur porté par la propriété "value"
+TILE_LAYERS = {
+    'green_mobility': 'green_mobility_index',
+    'commute_time': 'avg_commute_time',
+    'velo': 'velo_percentage',
+    'voiture': 'voiture_percentage',
+    'transport_commun': 'transport_commun_percentage',
+    'marche': 'marche_percentage',
+    'deux_roues': 'deux_roues_percentage',
+    'pas_transport': 'pas_transport_percentage',
+    # Zones mal desservies uniquement (même règle que la carte dédiée)
+    'underserved': 'green_mobility_index',
+}
+UNDERSERVED_LAYER = 'underserved'
+
+TILE_SIZE = 256
+MAX_TILE_ZOOM = 18
+
+# Zoom à partir duquel toutes les communes sont gardées
+FULL_DETAIL_ZOOM = 10
+
+# Taille (en pixels) des cellules d'éclaircissement aux petits zooms
+THINNING_CELL_PX = 16
+
+# Nombre maximal d'index (couche, zoom, filtres) gardés en mémoire
+MAX_TILE_INDEXES = 64
+
+_tile_indexes = OrderedDict()
+_tile_indexes_lock = threading.Lock()
+
+# Tuiles encodées (mémoire uniquement: elles se recalculent en quelques millisecondes)
+tile_cache = RenderCache(cache_dir=None, max_entries=2048, suffix='.json')
+
+
+class TileIndex:
+    """
+    Points d'une couche à un niveau de zoom, éclaircis et triés par tuile.
+
+    Dans chaque tuile, les points restent par population décroissante.
+    """
+
+    def __init__(self, points: pd.DataFrame, zoom: int):
+        self.zoom = zoom
+        n = 1 << zoom
+        x = points['x'].to_numpy()
+        y = points['y'].to_numpy()
+
+        if zoom < FULL_DETAIL_ZOOM and len(points) > 0:
+            # Table triée par population: la première commune de chaque cellule est gardée
+            cells = n * (TILE_SIZE // THINNING_CELL_PX)
+            cell_x = np.clip((x * cells).astype(np.int64), 0, cells - 1)
+            cell_y = np.clip((y * cells).astype(np.int64), 0, cells - 1)
+            keep = ~pd.Series(cell_x * cells + cell_y).duplicated().to_numpy()
+            points, x, y = points[keep], x[keep], y[keep]
+
+        tile_x = np.clip((x * n).astype(np.int64), 0, n - 1)
+        tile_y = np.clip((y * n).astype(np.int64), 0, n - 1)
+        keys = tile_x * n + tile_y
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.points = points.iloc[order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def get(self, x: int, y: int) -> pd.DataFrame:
+        """Points de la tuile (x, y)"""
+        key = x * (1 << self.zoom) + y
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        return self.points.iloc[start:end]
+
+
+def coordinate_decimals(zoom: int) -> int:
+    """Nombre de décimales des coordonnées: environ un pixel au zoom demandé"""
+    degrees_per_pixel = 360.0 / (TILE_SIZE * (1 << zoom))
+    return min(6, max(2, math.ceil(-math.log10(degrees_per_pixel))))
+
+
+def validate_tile(layer: str, z: int, x: int, y: int):
+    """Lève ValueError si la couche ou les coordonnées de tuile sont invalides"""
+    if layer not in TILE_LAYERS:
+        raise ValueError(f"Couche inconnue: {layer} (attendu: {', '.join(TILE_LAYERS)})")
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f"Zoom hors limites: {z} (0 à {MAX_TILE_ZOOM})")
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tuile hors limites: {z}/{x}/{y}")
+
+
+def get_tile_index(layer: str, zoom: int, region_filter: str = '', department_filter: str = '',
+                   age_filter: str = '') -> TileIndex:
+    """Retourne l'index de la couche à ce zoom (calculé une fois par version et filtres)"""
+    key = (get_points_version(), layer, zoom, region_filter or '', department_filter or '', age_filter or '')
+
+    with _tile_indexes_lock:
+        if key in _tile_indexes:
+            _tile_indexes.move_to_end(key)
+            return _tile_indexes[key]
+
+    points = get_point_table(region_filter, department_filter, age_filter)
+    if points.empty:
+        # Colonnes numériques typées: la table vide passe par les mêmes calculs de tuiles
+        text, number = pd.Series(dtype=object), pd.Series(dtype=float)
+        points = pd.DataFrame({'code': text, 'name': text, 'lat': number, 'lon': number,
+                               'x': number, 'y': number, TILE_LAYERS[layer]: number})
+    elif layer == UNDERSERVED_LAYER:
+        from app.visualizations.maps import flag_underserved
+        points = points[flag_underserved(points).to_numpy()]
+    index = TileIndex(points, zoom)
+
+    with _tile_indexes_lock:
+        _tile_indexes[key] = index
+        _tile_indexes.move_to_end(key)
+        while len(_tile_indexes) > MAX_TILE_INDEXES:
+            _tile_indexes.popitem(last=False)
+    logger.debug(f"Index de tuiles construit: couche {layer}, zoom {zoom}, {len(index)} points")
+    return index
+
+
+def encode_tile(points: pd.DataFrame, column: str, zoom: int) -> dict:
+    """Encode les points d'une tuile en FeatureCollection GeoJSON (propriétés code, name, value)"""
+    decimals = coordinate_decimals(zoom)
+    lats = points['lat'].round(decimals).tolist()
+    lons = points['lon'].round(decimals).tolist()
+    values = points[column].astype(float).round(1)
+    values = values.astype(object).where(values.notna(), None).tolist()
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'code': code, 'name': name, 'value': value},
+        }
+        for code, name, lat, lon, value in zip(points['code'], points['name'], lats, lons, values)
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_tile(layer: str, z: int, x: int, y: int, region_filter: str = '', department_filter: str = '',
+             age_filter: str = '') -> bytes:
+    """
+    Retourne une tuile encodée en JSON (avec cache).
+
+    Raises:
+        ValueError: Couche ou coordonnées de tuile invalides
+    """
+    validate_tile(layer, z, x, y)
+
+    filters = {'region': region_filter, 'department': department_filter, 'age': age_filter}
+    cache_key = make_cache_key(f'tile/{layer}/{z}/{x}/{y}', filters, get_points_version())
+    cached = tile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    index = get_tile_index(layer, z, region_filter, department_filter, age_filter)
+    tile = encode_tile(index.get(x, y), TILE_LAYERS[layer], z)
+    content = json.dumps(tile, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    tile_cache.set(cache_key, content)
+    return content
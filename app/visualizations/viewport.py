@@ -0,0 +1,198 @@
+"""
+Communes d'une emprise de carte (bbox), par ordre d'importance
+
+Pour chaque combinaison de filtres et version des données, un index spatial
+est construit une fois sur les centroïdes des communes: grille régulière de
+INDEX_CELLS x INDEX_CELLS cellules en Web Mercator, points triés par cellule
+(une colonne de cellules = une tranche contiguë, trouvée par np.searchsorted).
+
+Une requête rassemble les cellules couvertes par l'emprise, garde les points
+réellement dedans puis retourne les premiers dans l'ordre d'importance
+(points.importance_order: population et valeurs extrêmes de l'indicateur),
+jusqu'à un plafond. Le résultat est déterministe: en zoomant, une carte garde
+les mêmes communes et en ajoute de nouvelles.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.visualizations.points import (
+    INDICATOR_COLUMNS,
+    get_point_table,
+    get_points_version,
+    importance_order,
+    project_mercator,
+)
+from app.visualizations.tiles import MAX_TILE_ZOOM, coordinate_decimals
+
+logger = logging.getLogger(__name__)
+
+# Résolution de l'index (cellules de la taille d'une tuile de zoom 12, ~6 km en France)
+INDEX_CELLS = 1 << 12
+
+# Plafond par défaut et maximal du nombre de communes retournées
+DEFAULT_POINT_LIMIT = 500
+MAX_POINT_LIMIT = 5000
+
+MAX_VIEWPORT_INDEXES = 32
+
+_viewport_indexes = OrderedDict()
+_viewport_indexes_lock = threading.Lock()
+
+
+class ViewportIndex:
+    """
+    Index spatial des communes d'une table de points, pour un indicateur.
+
+    points est réordonné par importance: la position d'une commune est son rang.
+    """
+
+    def __init__(self, points: pd.DataFrame, indicator: str):
+        order = importance_order(points['population'], points[indicator], points['code'])
+        self.points = points.iloc[order].reset_index(drop=True)
+        self.x = self.points['x'].to_numpy(dtype=float)
+        self.y = self.points['y'].to_numpy(dtype=float)
+
+        # Colonnes prêtes à encoder (évite pandas dans les requêtes)
+        self.codes = self.points['code'].to_numpy(dtype=object)
+        self.names = self.points['name'].to_numpy(dtype=object)
+        self.population = self.points['population'].to_numpy(dtype=float).astype(np.int64)
+        self.lat = self.points['lat'].to_numpy(dtype=float)
+        self.lon = self.points['lon'].to_numpy(dtype=float)
+        self.values = self.points[indicator].to_numpy(dtype=float).round(1)
+
+        cell_x = np.clip((self.x * INDEX_CELLS).astype(np.int64), 0, INDEX_CELLS - 1)
+        cell_y = np.clip((self.y * INDEX_CELLS).astype(np.int64), 0, INDEX_CELLS - 1)
+        keys = cell_x * INDEX_CELLS + cell_y
+        # Tri stable: dans une cellule, les rangs restent croissants
+        self.ranks = np.argsort(keys, kind='stable')
+        self.keys = keys[self.ranks]
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """Rangs (croissants) des communes dans l'emprise, en coordonnées Mercator"""
+        n = len(self.points)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        cx0, cx1 = (np.clip(np.array([x_min, x_max]) * INDEX_CELLS, 0, INDEX_CELLS - 1)).astype(np.int64)
+        cy0, cy1 = (np.clip(np.array([y_min, y_max]) * INDEX_CELLS, 0, INDEX_CELLS - 1)).astype(np.int64)
+
+        # Une tranche de clés par colonne de cellules
+        columns = np.arange(cx0, cx1 + 1, dtype=np.int64) * INDEX_CELLS
+        starts = np.searchsorted(self.keys, columns + cy0, side='left')
+        ends = np.searchsorted(self.keys, columns + cy1, side='right')
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        if total > n // 4:
+            # Grande emprise: un parcours direct (déjà dans l'ordre d'importance) est plus rapide
+            inside = (self.x >= x_min) & (self.x <= x_max) & (self.y >= y_min) & (self.y <= y_max)
+            return np.flatnonzero(inside)
+
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        ranks = self.ranks[offsets + np.arange(total)]
+
+        # Cellules du bord: ne garder que les points réellement dans l'emprise
+        x, y = self.x[ranks], self.y[ranks]
+        ranks = ranks[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)]
+
+        # Remettre dans l'ordre d'importance sans tri: marquage sur un tableau de booléens
+        selected = np.zeros(n, dtype=bool)
+        selected[ranks] = True
+        return np.flatnonzero(selected)
+
+
+def parse_bbox(value: str) -> tuple:
+    """
+    Lit une emprise "ouest,sud,est,nord" (degrés, comme Leaflet toBBoxString).
+
+    Raises:
+        ValueError: Emprise mal formée
+    """
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError(f"bbox invalide: {value!r} (attendu: ouest,sud,est,nord)")
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise ValueError(f"bbox hors limites ou inversée: {value}")
+    return west, south, east, north
+
+
+def get_viewport_index(indicator: str = 'green_mobility_index', region_filter: str = '',
+                       department_filter: str = '', age_filter: str = '') -> ViewportIndex:
+    """Retourne l'index de ces filtres (construit une fois par version des données)"""
+    key = (get_points_version(), indicator, region_filter or '', department_filter or '', age_filter or '')
+    with _viewport_indexes_lock:
+        if key in _viewport_indexes:
+            _viewport_indexes.move_to_end(key)
+            return _viewport_indexes[key]
+
+    points = get_point_table(region_filter, department_filter, age_filter)
+    if points.empty:
+        points = pd.DataFrame(columns=['code', 'name', 'population', 'lat', 'lon', 'x', 'y', indicator])
+    index = ViewportIndex(points, indicator)
+
+    with _viewport_indexes_lock:
+        _viewport_indexes[key] = index
+        _viewport_indexes.move_to_end(key)
+        while len(_viewport_indexes) > MAX_VIEWPORT_INDEXES:
+            _viewport_indexes.popitem(last=False)
+    logger.debug(f"Index d'emprise construit: {len(index)} communes, filtres {key[1:]}")
+    return index
+
+
+def get_viewport_points(bbox: str, zoom: int, indicator: str = 'green_mobility_index',
+                        limit: int = DEFAULT_POINT_LIMIT, region_filter: str = '',
+                        department_filter: str = '', age_filter: str = '') -> bytes:
+    """
+    Communes de l'emprise en GeoJSON (propriétés code, name, population, value),
+    les plus importantes d'abord, au plus limit.
+
+    La réponse indique aussi le nombre de communes dans l'emprise (total) et si
+    elles sont toutes présentes (complete): sinon, zoomer en montrera davantage.
+
+    Raises:
+        ValueError: Emprise, zoom, plafond ou indicateur invalide
+    """
+    if indicator not in INDICATOR_COLUMNS:
+        raise ValueError(f"Indicateur inconnu: {indicator} (attendu: {', '.join(INDICATOR_COLUMNS)})")
+    if not 0 <= zoom <= MAX_TILE_ZOOM:
+        raise ValueError(f"Zoom hors limites: {zoom} (0 à {MAX_TILE_ZOOM})")
+    if not 1 <= limit <= MAX_POINT_LIMIT:
+        raise ValueError(f"limit hors limites: {limit} (1 à {MAX_POINT_LIMIT})")
+    west, south, east, north = parse_bbox(bbox)
+
+    index = get_viewport_index(indicator, region_filter, department_filter, age_filter)
+    # y croît vers le sud: le nord donne y_min
+    (x_min, x_max), (y_max, y_min) = project_mercator([south, north], [west, east])
+    ranks = index.query(x_min, y_min, x_max, y_max)
+    shown = ranks[:limit]
+
+    decimals = coordinate_decimals(zoom)
+    values = [None if value != value else value for value in index.values[shown].tolist()]
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'code': code, 'name': name, 'population': population, 'value': value},
+        }
+        for code, name, population, lat, lon, value in zip(
+            index.codes[shown], index.names[shown], index.population[shown].tolist(),
+            index.lat[shown].round(decimals).tolist(), index.lon[shown].round(decimals).tolist(), values)
+    ]
+    result = {
+        'type': 'FeatureCollection',
+        'features': features,
+        'total': int(len(ranks)),
+        'complete': bool(len(ranks) <= limit),
+    }
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
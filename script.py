@@ -1,5 +1,4 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -206,5 +205,6 @@ def main():
     return {'pourcentage_sans_transport': pourcentage_population_sans_transport, 'pourcentage_temps_moyen': float(pourcentage_temps_moyen), 'pourcentage_velo': float(taux_velo), 'pourcentage_transport_commun': float(taux_transport_commun)}
 
 
-test = main()
-print(test)
\ No newline at end of file
+if __name__ == '__main__':
+    test = main()
+    print(test)
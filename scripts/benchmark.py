@@ -0,0 +1,455 @@
+"""
+Benchmarks de la couche de données et des routes HTTP
+
+Mesure, dans le processus courant:
+- data: DataLoader (chargements à froid, caches vidés, et à chaud) et script.main,
+- filters: prepare_communes_data / prepare_regions_data pour chaque combinaison
+  de filtres représentative (sans filtre, région, département, chaque tranche
+  d'âge, région + âge, département + âge),
+- routes: chaque route GET de /mobilite/api/*, /export/* et /visualizations/*
+  via le client de test Flask (premier appel séparé des appels suivants, qui
+  profitent des caches).
+
+Pour chaque cas: percentiles de latence (p50, p90, p95, p99), allocations
+Python (tracemalloc, sur un appel supplémentaire non chronométré) et RSS
+maximal du processus. Le surcoût de l'instrumentation /metrics est vérifié
+à chaque exécution (voir app/utils/metrics.py). Les résultats sont écrits en
+JSON; la sous-commande compare signale les régressions entre deux exécutions.
+
+Usage:
+    python scripts/benchmark.py run --output bench/avant.json
+    python scripts/benchmark.py run --output bench/apres.json --repeat 10 --only routes
+    python scripts/benchmark.py run --quick --match visualizations
+    python scripts/benchmark.py compare bench/avant.json bench/apres.json --threshold 0.2
+"""
+
+import sys
+import os
+import argparse
+import gc
+import json
+import platform
+import re
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+GROUPS = ('data', 'filters', 'routes')
+
+# Tranches d'âge du filtre (voir DataLoader.map_age_filter_to_agerevq_values)
+AGE_FILTERS = ('0-18', '19-35', '36-50', '51-65', '65+')
+
+# Préfixes des routes mesurées
+ROUTE_PREFIXES = ('/mobilite/api/', '/export/', '/visualizations/')
+
+# Percentiles rapportés
+PERCENTILES = (50, 90, 95, 99)
+
+# Seuil de régression par défaut (+20 % sur le p50)
+DEFAULT_THRESHOLD = 0.2
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile par interpolation linéaire (values non vide)"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """RSS maximal du processus depuis son démarrage (Mo)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(func, repeat: int, setup=None, first_call: bool = False) -> dict:
+    """
+    Chronomètre func repeat fois.
+
+    Args:
+        setup: Fonction appelée avant chaque appel, hors chronométrage (ex: vider les caches)
+        first_call: Mesurer à part un premier appel (caches applicatifs vides)
+    """
+    result = {}
+    if first_call:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        result['first_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    latencies = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Allocations sur un appel supplémentaire (tracemalloc ralentit l'exécution)
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result.update({
+        'runs': repeat,
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'min_ms': round(min(latencies), 3),
+        'max_ms': round(max(latencies), 3),
+        **{f'p{q}_ms': round(percentile(latencies, q), 3) for q in PERCENTILES},
+        'alloc_peak_kb': round(peak / 1024, 1),
+        'alloc_retained_kb': round(current / 1024, 1),
+        'rss_peak_mb': round(peak_rss_mb(), 1),
+    })
+    return result
+
+
+def clear_data_caches():
+    """Vide les caches de DataLoader et des statistiques globales (chargement à froid)"""
+    from app.utils import data_loader as data_loader_module
+    from app.utils.cache import clear_cache
+    data_loader_module._data_cache.clear()
+    data_loader_module._cache_timestamps.clear()
+    clear_cache()
+
+
+def filter_combinations(data_loader, quick: bool) -> list:
+    """Combinaisons de filtres représentatives (region, department, age)"""
+    regions = [str(r['REG']) for r in data_loader.get_regions_list()]
+    departments = data_loader.get_departments_list()
+    department = str(departments[0]['DEP']) if departments else ''
+    region = regions[0] if regions else ''
+
+    combinations = [('', '', '')]
+    if region:
+        combinations.append((region, '', ''))
+    if department:
+        combinations.append(('', department, ''))
+    ages = AGE_FILTERS[:1] if quick else AGE_FILTERS
+    combinations += [('', '', age) for age in ages]
+    if region:
+        combinations.append((region, '', AGE_FILTERS[1]))
+    if department:
+        combinations.append(('', department, AGE_FILTERS[1]))
+    return combinations
+
+
+def data_cases(quick: bool) -> list:
+    """Cas du groupe data: (nom, fonction, setup, premier appel séparé)"""
+    from app.utils.data_loader import DataLoader
+    from script import main as script_main
+
+    loader = DataLoader()
+    cases = []
+    for name, load in (('communes', loader.load_communes_data), ('regions', loader.load_regions_data),
+                       ('mobility', loader.load_mobility_data)):
+        cases.append((f'data_loader.{name}.cold', load, clear_data_caches, False))
+        cases.append((f'data_loader.{name}.warm', load, None, True))
+    # script.main lit les fichiers CSV depuis le répertoire courant
+    cases.append(('script.main', lambda: script_main(), None, False))
+    return cases
+
+
+def filter_cases(quick: bool) -> list:
+    """Cas du groupe filters: préparation des indicateurs par combinaison de filtres"""
+    from app.routes.export import prepare_communes_data, prepare_regions_data
+    from app.utils.data_loader import DataLoader
+
+    cases = []
+    for region, department, age in filter_combinations(DataLoader(), quick):
+        label = ','.join(f'{k}={v}' for k, v in (('region', region), ('department', department), ('age', age)) if v)
+        label = label or 'sans filtre'
+        cases.append((f'prepare_communes_data[{label}]',
+                      lambda r=region, d=department, a=age: prepare_communes_data(r, d, a), None, False))
+    for age in ('',) + (AGE_FILTERS[:1] if quick else AGE_FILTERS):
+        cases.append((f'prepare_regions_data[{f"age={age}" if age else "sans filtre"}]',
+                      lambda a=age: prepare_regions_data(a), None, False))
+    return cases
+
+
+def route_samples(data_loader) -> dict:
+    """Valeurs des paramètres d'URL (codes réels des données)"""
+    communes = data_loader.load_communes_data()
+    code_col = 'COM' if 'COM' in communes.columns else 'CODCOM'
+    commune = str(communes.nlargest(1, 'PTOT')[code_col].iloc[0]).zfill(5) if not communes.empty else '75056'
+    regions = data_loader.get_regions_list()
+    return {
+        'code': commune,
+        'region_code': str(regions[0]['REG']) if regions else '11',
+        'indicator': 'green_mobility_index',
+        'level': 'departements',
+        'layer': 'green_mobility',
+        'shape': 'hex',
+        'name': 'travel-time',
+        'image_format': 'png',
+        # Tuile de zoom 6 couvrant le centre de la France
+        'z': 6, 'x': 32, 'y': 22,
+    }
+
+
+def route_urls(app, samples: dict) -> tuple:
+    """
+    URL mesurées pour chaque route GET des préfixes, et routes ignorées.
+
+    Returns:
+        (liste de (nom, url), liste des règles ignorées)
+    """
+    # Paramètres de requête nécessaires (ou représentatifs) par endpoint
+    queries = {
+        'mobilite.api_communes': '?page=1&per_page=50',
+        'mobilite.api_communes_batch': f"?codes={samples['code']}",
+        'visualizations.api_viewport_points': '?bbox=-5.2,41.3,9.6,51.1&zoom=6',
+    }
+    path_values = {
+        'mobilite.api_region_detail': {'code': samples['region_code']},
+        'visualizations.boundaries_topojson': {'z': 6},
+    }
+    urls, skipped = [], []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or not rule.rule.startswith(ROUTE_PREFIXES):
+            continue
+        if rule.endpoint.startswith('export.export_job'):
+            continue  # mesurés à part (soumission puis suivi d'un job)
+        values = {**samples, **path_values.get(rule.endpoint, {})}
+        missing = [arg for arg in rule.arguments if arg not in values]
+        if missing:
+            skipped.append(rule.rule)
+            continue
+        path = rule.build({arg: values[arg] for arg in rule.arguments}, append_unknown=False)[1]
+        urls.append((rule.endpoint, path + queries.get(rule.endpoint, '')))
+    return urls, skipped
+
+
+def route_cases(quick: bool) -> tuple:
+    """Cas du groupe routes, via le client de test Flask"""
+    from app import create_app
+    from app.utils.data_loader import DataLoader
+
+    app = create_app()
+    client = app.test_client()
+    urls, skipped = route_urls(app, route_samples(DataLoader()))
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            response.close()
+            if response.status_code >= 500:
+                raise RuntimeError(f"{url}: statut {response.status_code}")
+            return response.status_code
+        return call
+
+    cases = [(f'GET {url}', get(url), None, True) for _, url in urls]
+
+    # Exports asynchrones: soumission (dédupliquée après le premier appel) puis suivi
+    def submit():
+        response = client.post('/export/jobs', json={'type': 'csv_regions'})
+        return response.get_json()
+
+    job = submit()
+    if job and job.get('job_id'):
+        deadline = time.time() + 120
+        while time.time() < deadline and client.get(f"/export/jobs/{job['job_id']}").get_json().get('status') not in (
+                'done', 'failed'):
+            time.sleep(0.1)
+        cases.append(('POST /export/jobs', submit, None, False))
+        cases.append((f"GET /export/jobs/<id>", get(f"/export/jobs/{job['job_id']}"), None, False))
+        cases.append((f"GET /export/jobs/<id>/download", get(f"/export/jobs/{job['job_id']}/download"), None, False))
+    return cases, skipped
+
+
+def metrics_overhead() -> dict:
+    """Surcoût des mesures par étape et par requête, comparé aux budgets"""
+    from app import create_app
+    from app.utils.metrics import METRICS_ENABLED, measure_overhead
+
+    if not METRICS_ENABLED:
+        return {'enabled': False}
+    return {'enabled': True, **measure_overhead(create_app())}
+
+
+def run(args) -> int:
+    # Caches disque des rendus dans un répertoire temporaire: premiers appels comparables
+    if not args.keep_disk_cache:
+        cache_root = tempfile.mkdtemp(prefix='benchmark_cache_')
+        os.environ.setdefault('MAP_CACHE_DIR', os.path.join(cache_root, 'maps'))
+        os.environ.setdefault('CHART_CACHE_DIR', os.path.join(cache_root, 'charts'))
+    os.chdir(root_dir)
+
+    groups = args.only or list(GROUPS)
+    repeat = 3 if args.quick else args.repeat
+    print(f"Benchmarks: {', '.join(groups)} ({repeat} mesures par cas)")
+    print("=" * 50)
+
+    results, skipped = {}, []
+    builders = {'data': data_cases, 'filters': filter_cases}
+    for group in groups:
+        if group == 'routes':
+            cases, skipped = route_cases(args.quick)
+        else:
+            cases = builders[group](args.quick)
+        if args.match:
+            cases = [case for case in cases if re.search(args.match, case[0])]
+
+        print(f"\n[{group}] {len(cases)} cas")
+        for name, func, setup, first_call in cases:
+            try:
+                stats = measure(func, repeat, setup=setup, first_call=first_call)
+            except Exception as e:
+                print(f"  ❌ {name}: {e}")
+                results[name] = {'group': group, 'error': str(e)}
+                continue
+            results[name] = {'group': group, **stats}
+            first = f", 1er appel {stats['first_ms']:.1f}" if 'first_ms' in stats else ''
+            print(f"  {name}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms{first}, "
+                  f"alloc {stats['alloc_peak_kb']:.0f} Ko, RSS max {stats['rss_peak_mb']:.0f} Mo")
+
+    overhead = metrics_overhead()
+    print("\n[metrics] surcoût de l'instrumentation")
+    if overhead['enabled']:
+        print(f"  étape: {overhead['stage_us']:.2f} µs (imbriquée {overhead['nested_stage_us']:.2f} µs, "
+              f"budget {overhead['stage_budget_us']} µs), "
+              f"requête: {overhead['request_us']:.2f} µs (budget {overhead['request_budget_us']} µs)")
+    else:
+        print("  métriques désactivées (METRICS_ENABLED=0)")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'selection': {'only': groups, 'match': args.match, 'quick': args.quick},
+        'rss_peak_mb': round(peak_rss_mb(), 1),
+        'skipped_routes': skipped,
+        'metrics_overhead': overhead,
+        'results': results,
+    }
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\nRésultats écrits dans {output}")
+
+    print("=" * 50)
+    if skipped:
+        print(f"Routes ignorées (paramètres inconnus): {', '.join(skipped)}")
+    errors = [name for name, stats in results.items() if 'error' in stats]
+    if errors:
+        print(f"❌ {len(errors)} cas en erreur")
+        return 1
+    if overhead['enabled'] and not overhead['within_budget']:
+        print("❌ Surcoût de l'instrumentation hors budget")
+        return 1
+    print(f"✅ {len(results)} cas mesurés, RSS max {report['rss_peak_mb']:.0f} Mo")
+    return 0
+
+
+def is_selected(name: str, stats: dict, selection: dict) -> bool:
+    """Indique si un cas fait partie de la sélection (--only, --match) d'une exécution"""
+    if not selection:
+        return True
+    if stats.get('group') not in selection.get('only', GROUPS):
+        return False
+    return not selection.get('match') or re.search(selection['match'], name) is not None
+
+
+def compare(args) -> int:
+    """
+    Compare deux exécutions: régression si la métrique augmente de plus du seuil.
+
+    Un cas mesuré dans la référence mais en erreur ou absent de la nouvelle
+    exécution compte aussi comme régression, sauf s'il est exclu par la sélection
+    de celle-ci (--only, --match) ou avec --allow-missing.
+    """
+    base = json.loads(Path(args.base).read_text(encoding='utf-8'))['results']
+    new_report = json.loads(Path(args.new).read_text(encoding='utf-8'))
+    new, selection = new_report['results'], new_report.get('selection')
+    metric = f'{args.metric}_ms' if not args.metric.endswith(('_ms', '_kb', '_mb')) else args.metric
+
+    regressions, improvements = [], []
+    print(f"Comparaison {args.base} -> {args.new} ({metric}, seuil {args.threshold:+.0%})")
+    print("=" * 50)
+    for name in sorted(set(base) | set(new)):
+        before, after = base.get(name, {}), new.get(name, {})
+        if metric not in before:
+            status = 'absent de la référence' if name not in base else 'erreur dans la référence'
+            print(f"  {'?':>8}  {name} ({status})")
+            continue
+        if metric not in after:
+            if name in new:
+                status = f"erreur: {after.get('error', 'métrique absente')}"
+            elif not is_selected(name, before, selection):
+                print(f"  {'?':>8}  {name} (hors sélection)")
+                continue
+            else:
+                status = 'absent'
+            flag = ''
+            if name in new or not args.allow_missing:
+                regressions.append(name)
+                flag = '  ❌ régression'
+            print(f"  {'?':>8}  {name} ({status}){flag}")
+            continue
+        old_value, new_value = before[metric], after[metric]
+        # Différences absolues négligeables ignorées (bruit de mesure sur les cas très rapides)
+        change = (new_value - old_value) / old_value if old_value > 0 else 0.0
+        significant = abs(new_value - old_value) >= args.min_delta
+        flag = ''
+        if significant and change > args.threshold:
+            regressions.append(name)
+            flag = '  ❌ régression'
+        elif significant and change < -args.threshold:
+            improvements.append(name)
+            flag = '  ✅'
+        print(f"  {change:+8.1%}  {name}: {old_value:.2f} -> {new_value:.2f}{flag}")
+
+    print("=" * 50)
+    print(f"{len(improvements)} amélioration(s), {len(regressions)} régression(s)")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la couche de données et des routes HTTP")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Exécuter les benchmarks')
+    run_parser.add_argument('--output', '-o', help='Fichier JSON des résultats')
+    run_parser.add_argument('--repeat', type=int, default=5, help='Nombre de mesures par cas (défaut: 5)')
+    run_parser.add_argument('--only', choices=GROUPS, action='append', help='Ne mesurer que ce groupe (répétable)')
+    run_parser.add_argument('--match', help='Ne mesurer que les cas dont le nom correspond à cette regex')
+    run_parser.add_argument('--quick', action='store_true',
+                            help='3 mesures par cas et moins de combinaisons de filtres')
+    run_parser.add_argument('--keep-disk-cache', action='store_true',
+                            help='Utiliser les caches disque des cartes/graphiques existants')
+
+    compare_parser = subparsers.add_parser('compare', help='Comparer deux exécutions')
+    compare_parser.add_argument('base', help='Résultats de référence (JSON)')
+    compare_parser.add_argument('new', help='Nouveaux résultats (JSON)')
+    compare_parser.add_argument('--metric', default='p50',
+                                help='Métrique comparée: p50, p95, p99, mean, first, alloc_peak_kb... (défaut: p50)')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help=f'Hausse relative signalée comme régression (défaut: {DEFAULT_THRESHOLD})')
+    compare_parser.add_argument('--min-delta', type=float, default=1.0,
+                                help='Différence absolue minimale prise en compte (défaut: 1.0)')
+    compare_parser.add_argument('--allow-missing', action='store_true',
+                                help="Ne pas compter comme régression un cas absent de la nouvelle exécution")
+
+    args = parser.parse_args()
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Construit les contours simplifiés d'un niveau (data/processed/boundaries_<niveau>.npz)
+
+Source: un fichier GeoJSON local (ou téléchargé une fois) de polygones, avec le
+code INSEE et le nom de chaque territoire en propriétés, par exemple les fichiers
+*-version-simplifiee.geojson de france-geojson (propriétés "code" et "nom").
+
+Le script extrait la topologie (frontières partagées stockées une fois),
+calcule l'importance Douglas–Peucker de chaque point puis affiche, pour chaque
+zoom servi, le nombre de points gardés et la taille du TopoJSON par rapport au
+budget du niveau.
+
+Usage:
+    python scripts/build_boundaries.py --level departements --input departements.geojson
+    python scripts/build_boundaries.py --level regions --download
+    python scripts/build_boundaries.py --level communes --input communes.geojson --id-property codgeo
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+import requests
+from app.visualizations import boundaries
+from app.visualizations.boundaries import (
+    BOUNDARY_LEVELS,
+    DEFAULT_QUANTIZATION,
+    MAX_BOUNDARY_ZOOM,
+    MIN_BOUNDARY_ZOOM,
+    POINT_BUDGETS,
+    build_topology,
+    save_boundaries,
+)
+
+DEFAULT_SOURCE_URL = 'https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/{level}-version-simplifiee.geojson'
+
+
+def load_features(args):
+    """Lit les features GeoJSON depuis un fichier local ou une URL"""
+    if args.input:
+        print(f"Lecture de {args.input}...")
+        with open(args.input, encoding='utf-8') as f:
+            collection = json.load(f)
+    else:
+        url = args.url or DEFAULT_SOURCE_URL.format(level=args.level)
+        print(f"Téléchargement depuis {url}...")
+        response = requests.get(url, timeout=120)
+        response.raise_for_status()
+        collection = response.json()
+    return collection.get('features', [])
+
+
+def report_zoom_levels(level: str):
+    """Affiche points gardés et taille du TopoJSON pour chaque zoom servi"""
+    budget = POINT_BUDGETS.get(level)
+    print(f"\nZoom | points | taille | tolérance (budget: {budget} points)")
+    for zoom in range(MIN_BOUNDARY_ZOOM, MAX_BOUNDARY_ZOOM + 1):
+        start = time.perf_counter()
+        content = boundaries.get_topojson(level, zoom)
+        elapsed = time.perf_counter() - start
+        topology = boundaries.load_boundaries(level)
+        mask, tolerance = boundaries.simplify_mask(topology, level, zoom)
+        status = '' if budget is None or mask.sum() <= budget else '  ⚠️ au-delà du budget'
+        print(f"{zoom:>4} | {int(mask.sum()):>6} | {len(content) / 1024:>6.0f} Ko | "
+              f"{tolerance:.5f}° ({elapsed * 1000:.0f} ms){status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit les contours simplifiés d'un niveau")
+    parser.add_argument('--level', required=True, choices=BOUNDARY_LEVELS, help='Niveau territorial')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Fichier GeoJSON local')
+    source.add_argument('--download', action='store_true', help='Télécharger la source par défaut')
+    source.add_argument('--url', help='URL d\'un fichier GeoJSON à télécharger')
+    parser.add_argument('--id-property', default='code', help='Propriété portant le code INSEE (défaut: code)')
+    parser.add_argument('--name-property', default='nom', help='Propriété portant le nom (défaut: nom)')
+    parser.add_argument('--quantization', type=int, default=DEFAULT_QUANTIZATION,
+                        help=f'Taille de la grille de quantification (défaut: {DEFAULT_QUANTIZATION})')
+    parser.add_argument('--output', help='Fichier de sortie (défaut: data/processed/boundaries_<niveau>.npz)')
+    args = parser.parse_args()
+
+    features = load_features(args)
+    print(f"{len(features)} territoires lus")
+
+    start = time.perf_counter()
+    topology = build_topology(features, id_property=args.id_property, name_property=args.name_property,
+                              quantization=args.quantization)
+    n_arcs = len(topology['arc_offsets']) - 1
+    n_refs = len(topology['arc_refs'])
+    print(f"Topologie: {len(topology['ids'])} territoires, {n_arcs} arcs "
+          f"({n_refs - n_arcs} frontières partagées), {len(topology['points'])} points "
+          f"en {time.perf_counter() - start:.1f}s")
+
+    output_path = save_boundaries(topology, args.level, args.output)
+    print(f"✅ Contours enregistrés: {output_path} ({output_path.stat().st_size / 1024:.0f} Ko)")
+
+    if not args.output:
+        report_zoom_levels(args.level)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
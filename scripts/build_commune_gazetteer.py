@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Construit le gazetteer local des centroïdes de communes (data/processed/communes_centroids.npy)
+
+Sources possibles:
+- l'API GéoAPI (une seule requête pour toutes les communes et arrondissements municipaux)
+- un fichier CSV local (ex: communes-departement-region.csv de data.gouv.fr)
+
+Usage:
+    python scripts/build_commune_gazetteer.py
+    python scripts/build_commune_gazetteer.py --csv data/raw/communes-departement-region.csv
+    python scripts/build_commune_gazetteer.py --csv centroides.csv --code-col code --lat-col lat --lon-col lon
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pandas as pd
+import requests
+from app.utils.data_loader import DataLoader
+from app.utils.gazetteer import (
+    build_gazetteer,
+    encode_commune_codes,
+    get_default_gazetteer_path,
+    save_gazetteer,
+)
+
+DEFAULT_API_URL = 'https://geo.api.gouv.fr'
+
+# Noms de colonnes reconnus automatiquement dans les CSV
+CODE_COLUMNS = ['code_commune_INSEE', 'code_insee', 'code', 'COM', 'CODGEO', 'insee']
+LAT_COLUMNS = ['latitude', 'lat', 'LATITUDE', 'y']
+LON_COLUMNS = ['longitude', 'lon', 'lng', 'LONGITUDE', 'x']
+
+
+def fetch_from_api(base_url=DEFAULT_API_URL, timeout=60):
+    """Télécharge les centroïdes de toutes les communes en une requête"""
+    url = f"{base_url.rstrip('/')}/communes"
+    params = {
+        'type': 'commune-actuelle,arrondissement-municipal',
+        'fields': 'code,centre',
+        'format': 'json',
+    }
+    print(f"Téléchargement depuis {url}...")
+    response = requests.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    records = [
+        (item['code'], item['centre']['coordinates'][1], item['centre']['coordinates'][0])
+        for item in response.json()
+        if item.get('centre') and item['centre'].get('coordinates')
+    ]
+    return pd.DataFrame(records, columns=['code', 'lat', 'lon'])
+
+
+def _find_column(df, requested, candidates, label):
+    if requested:
+        if requested not in df.columns:
+            raise ValueError(f"Colonne {label} introuvable: {requested}")
+        return requested
+    for col in candidates:
+        if col in df.columns:
+            return col
+    raise ValueError(f"Colonne {label} introuvable (essayées: {', '.join(candidates)}); "
+                     f"utiliser --{label}-col")
+
+
+def read_from_csv(path, code_col=None, lat_col=None, lon_col=None):
+    """Lit un CSV de centroïdes (séparateur détecté automatiquement)"""
+    print(f"Lecture de {path}...")
+    df = pd.read_csv(path, sep=None, engine='python', dtype=str, encoding='utf-8-sig')
+    code_col = _find_column(df, code_col, CODE_COLUMNS, 'code')
+    lat_col = _find_column(df, lat_col, LAT_COLUMNS, 'lat')
+    lon_col = _find_column(df, lon_col, LON_COLUMNS, 'lon')
+
+    # Certains fichiers utilisent la virgule comme séparateur décimal
+    return pd.DataFrame({
+        'code': df[code_col],
+        'lat': df[lat_col].str.replace(',', '.', regex=False),
+        'lon': df[lon_col].str.replace(',', '.', regex=False),
+    })
+
+
+def report_coverage(table):
+    """Affiche la part des communes de donnees_communes.csv couvertes"""
+    communes_df = DataLoader().load_communes_data()
+    if communes_df.empty or 'COM' not in communes_df.columns:
+        return
+    codes = encode_commune_codes(communes_df['COM'].astype(str).str.zfill(5))
+    covered = pd.Series(codes).isin(table['code']).sum()
+    print(f"Couverture: {covered}/{len(codes)} communes de donnees_communes.csv "
+          f"({covered / len(codes) * 100:.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construit le gazetteer des centroïdes de communes")
+    parser.add_argument('--csv', help="Fichier CSV local au lieu de l'API")
+    parser.add_argument('--code-col', help="Colonne du code INSEE dans le CSV")
+    parser.add_argument('--lat-col', help="Colonne de latitude dans le CSV")
+    parser.add_argument('--lon-col', help="Colonne de longitude dans le CSV")
+    parser.add_argument('--api-url', default=DEFAULT_API_URL, help="URL de base de l'API GéoAPI")
+    parser.add_argument('--output', help="Fichier .npy de sortie (défaut: data/processed/communes_centroids.npy "
+                                         "sous DATA_ROOT, ou GAZETTEER_PATH)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.csv:
+        source_df = read_from_csv(args.csv, args.code_col, args.lat_col, args.lon_col)
+    else:
+        source_df = fetch_from_api(args.api_url)
+
+    table = build_gazetteer(source_df['code'], source_df['lat'], source_df['lon'])
+    if len(table) == 0:
+        print("❌ Aucune coordonnée valide trouvée")
+        return 1
+
+    output_path = save_gazetteer(table, args.output or get_default_gazetteer_path())
+    print(f"✅ {len(table)} communes ({len(source_df) - len(table)} lignes ignorées) -> {output_path} "
+          f"({output_path.stat().st_size / 1024:.0f} Ko, {time.perf_counter() - start:.1f}s)")
+    report_coverage(table)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
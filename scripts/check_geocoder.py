@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Vérifie le géocodeur par lot contre un serveur HTTP local simulant GéoAPI
+
+Le serveur de test répond sur /communes/<code>: centre connu (200), code
+inconnu (404) ou panne (500) selon le code demandé. Aucun appel n'est fait
+vers l'API réelle et le cache SQLite est créé dans un répertoire temporaire.
+
+Contrôles:
+    - les codes connus sont résolus en coordonnées
+    - un second appel sur les mêmes codes ne génère aucune requête (cache)
+    - un code inconnu (404) est mis en cache comme introuvable
+    - le disjoncteur s'ouvre après des erreurs 500 consécutives
+
+Usage:
+    python scripts/check_geocoder.py
+    python scripts/check_geocoder.py --codes 200
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.utils.geocoder import BatchGeocoder, CircuitBreaker
+
+# Préfixes de codes pilotant la réponse du serveur de test
+UNKNOWN_PREFIX = '98'
+FAILING_PREFIX = '99'
+
+
+def stub_coordinates(code: str):
+    """Coordonnées déterministes (lat, lon) attribuées à un code par le serveur de test"""
+    n = int(code)
+    return (42.0 + (n % 900) / 100, -4.0 + (n % 1200) / 100)
+
+
+class StubGeoAPIHandler(BaseHTTPRequestHandler):
+    """Simule GET /communes/<code>?fields=centre de GéoAPI"""
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        parts = path.strip('/').split('/')
+        self.server.request_count += 1
+
+        if len(parts) != 2 or parts[0] != 'communes':
+            self._send(404, {'message': 'Not found'})
+            return
+
+        code = parts[1]
+        if code.startswith(FAILING_PREFIX):
+            self._send(500, {'message': 'Internal error'})
+        elif code.startswith(UNKNOWN_PREFIX):
+            self._send(404, {'message': 'Commune non trouvée'})
+        else:
+            lat, lon = stub_coordinates(code)
+            # Même format que l'API: [longitude, latitude]
+            self._send(200, {'code': code, 'centre': {'type': 'Point', 'coordinates': [lon, lat]}})
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """Démarre le serveur de test sur un port libre de 127.0.0.1"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGeoAPIHandler)
+    server.request_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def check(label: str, condition: bool, detail: str = '') -> bool:
+    print(f"{'✅' if condition else '❌'} {label}{f' ({detail})' if detail else ''}")
+    return condition
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vérifie le géocodeur contre un serveur GéoAPI local')
+    parser.add_argument('--codes', type=int, default=50,
+                        help='Nombre de codes connus à résoudre (défaut: 50)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Nombre de threads du géocodeur (défaut: 8)')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Vérification du géocodeur (serveur local)")
+    print("=" * 50)
+
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Serveur de test: {base_url}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = Path(tmp_dir) / 'geocode_cache.sqlite'
+        geocoder = BatchGeocoder(base_url=base_url, cache_path=cache_path,
+                                 max_workers=args.workers, timeout=2)
+
+        known = [f"{10000 + i:05d}" for i in range(args.codes)]
+        unknown = [f"{UNKNOWN_PREFIX}{i:03d}" for i in range(3)]
+
+        # 1. Résolution des codes connus
+        resolved = geocoder.geocode_many(known + unknown)
+        exact = all(resolved.get(code) == stub_coordinates(code) for code in known)
+        results.append(check("Codes connus résolus",
+                             len(resolved) == len(known) and exact,
+                             f"{len(resolved)}/{len(known)}"))
+        results.append(check("Codes inconnus absents du résultat",
+                             not any(code in resolved for code in unknown)))
+
+        # 2. Second appel servi entièrement par le cache
+        before = server.request_count
+        again = geocoder.geocode_many(known + unknown)
+        extra = server.request_count - before
+        results.append(check("Second appel sans requête HTTP", extra == 0 and again == resolved,
+                             f"{extra} requête(s)"))
+
+        # 3. Les 404 sont en cache négatif
+        cached = geocoder.cache.get_many(unknown)
+        results.append(check("Codes 404 en cache négatif",
+                             all(code in cached and cached[code] is None for code in unknown)))
+
+        # 4. Le disjoncteur s'ouvre sur des erreurs 500
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        failing = BatchGeocoder(base_url=base_url, cache_path=cache_path,
+                                max_workers=1, timeout=2, breaker=breaker)
+        failing_codes = [f"{FAILING_PREFIX}{i:03d}" for i in range(10)]
+        failing.geocode_many(failing_codes)
+        results.append(check("Disjoncteur ouvert après les erreurs 500",
+                             breaker.state == CircuitBreaker.OPEN,
+                             f"{failing.stats['requests']} requête(s), {failing.stats['skipped']} évitée(s)"))
+        results.append(check("Échecs non mis en cache", not failing.cache.get_many(failing_codes)))
+
+        before = server.request_count
+        failing.geocode_many(failing_codes)
+        results.append(check("Aucun appel tant que le disjoncteur est ouvert",
+                             server.request_count == before))
+
+    server.shutdown()
+
+    print("=" * 50)
+    if all(results):
+        print("✅ Géocodeur conforme")
+        return 0
+    print(f"❌ {results.count(False)} contrôle(s) en échec")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Génération en lot des rapports PDF et CSV pour chaque département et région
+
+Les données sont chargées et les indicateurs calculés une seule fois pour toute
+la France, puis découpés par département et par région. Le rendu des fichiers
+est réparti sur un pool de processus (un par cœur par défaut).
+
+Usage:
+    python scripts/generate_batch_reports.py --output-dir data/processed/reports
+    python scripts/generate_batch_reports.py --age 19-35 --workers 8 --departments 01 69
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pandas as pd
+from app.utils.data_loader import DataLoader
+from app.utils.cache import get_cached_stats
+from app.routes.export import (
+    prepare_communes_data,
+    prepare_regions_data,
+    build_communes_pdf,
+    build_regions_pdf,
+    COMMUNES_CSV_COLUMNS,
+    REGIONS_CSV_COLUMNS,
+    REPORTLAB_AVAILABLE,
+)
+from script import main
+
+
+def compute_indicator_tables(age_filter=''):
+    """
+    Calcule en une passe les tables d'indicateurs de toutes les communes et régions.
+
+    Le temps de trajet moyen dépend de la population maximale du périmètre
+    filtré: il est recalculé par département et par région pour obtenir
+    exactement les mêmes valeurs que /export/*?department=XX.
+
+    Returns:
+        Tuple (communes_df avec colonnes REG/DEP et temps par périmètre, regions_df, stats)
+    """
+    stats = get_cached_stats(main)
+    data_loader = DataLoader()
+
+    communes_df = prepare_communes_data('', '', age_filter)
+    regions_df = prepare_regions_data(age_filter)
+    if communes_df.empty:
+        return communes_df, regions_df, stats
+
+    # Rattacher chaque commune à son département et sa région
+    geo_df = data_loader.load_communes_data()
+    geo_df = pd.DataFrame({
+        'COMMUNE_CODE': geo_df['COM'].astype(str).str.zfill(5),
+        'DEP': geo_df['DEP'].astype(str),
+        'REG': geo_df['REG'].astype(str),
+    }).drop_duplicates('COMMUNE_CODE')
+    communes_df = communes_df.merge(geo_df, on='COMMUNE_CODE', how='left')
+
+    base_avg_commute = stats.get('pourcentage_temps_moyen', 30)
+    for scope in ('DEP', 'REG'):
+        population_max = communes_df.groupby(scope)['PTOT'].transform('max')
+        population_factor = (communes_df['PTOT'] / population_max.where(population_max > 0)).fillna(0)
+        communes_df[f'avg_commute_time_{scope}'] = (base_avg_commute + population_factor * 5).round(1)
+
+    return communes_df, regions_df, stats
+
+
+# Colonnes ajoutées par compute_indicator_tables, absentes des exports
+_SCOPE_COLUMNS = ['REG', 'DEP', 'avg_commute_time_DEP', 'avg_commute_time_REG']
+
+
+def _scope_frame(communes_df, scope):
+    """Colonnes d'export d'un périmètre (DEP ou REG), identiques à prepare_communes_data"""
+    df = communes_df.copy()
+    df['avg_commute_time'] = df[f'avg_commute_time_{scope}']
+    return df.drop(columns=_SCOPE_COLUMNS)
+
+
+def _render_task(task):
+    """Exécuté dans un processus du pool: écrit un fichier et mesure son temps"""
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    path = Path(task['path'])
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    df = task['df']
+
+    if task['format'] == 'csv':
+        columns = REGIONS_CSV_COLUMNS if task['type'] == 'regions' else COMMUNES_CSV_COLUMNS
+        df.rename(columns=columns).to_csv(tmp_path, index=False, sep=';', encoding='utf-8-sig')
+    elif task['type'] == 'regions':
+        build_regions_pdf(df, str(tmp_path), task['age'], stats=task['stats'])
+    else:
+        build_communes_pdf(df, str(tmp_path),
+                           region_filter=task.get('region', ''),
+                           department_filter=task.get('department', ''),
+                           age_filter=task['age'],
+                           full=True,
+                           stats=task['stats'],
+                           title=task['title'])
+    os.replace(tmp_path, path)
+
+    return {
+        'type': task['type'],
+        'code': task['code'],
+        'name': task['name'],
+        'format': task['format'],
+        'path': str(path.relative_to(task['output_dir'])),
+        'rows': len(df),
+        'bytes': path.stat().st_size,
+        'seconds': round(time.perf_counter() - start, 3),
+        'cpu_seconds': round(time.process_time() - cpu_start, 3),
+    }
+
+
+def build_tasks(communes_df, regions_df, stats, output_dir, age_filter, formats,
+                departments=None, include_regions=True):
+    """Construit la liste des fichiers à produire"""
+    data_loader = DataLoader()
+    dept_names = {d['DEP']: d['Nom'] for d in data_loader.get_departments_list()}
+    region_names = {}
+    if not regions_df.empty:
+        region_names = dict(zip(regions_df['REG'].astype(str), regions_df['Région']))
+
+    tasks = []
+    base = {'age': age_filter, 'stats': stats, 'output_dir': str(output_dir)}
+
+    dept_frame = _scope_frame(communes_df, 'DEP')
+    for dep_code, group_index in communes_df.groupby('DEP').groups.items():
+        if departments and dep_code not in departments:
+            continue
+        name = dept_names.get(dep_code, dep_code)
+        df = dept_frame.loc[group_index]
+        for fmt in formats:
+            tasks.append({
+                **base, 'type': 'department', 'code': dep_code, 'name': name, 'format': fmt, 'df': df,
+                'department': dep_code,
+                'title': f"Rapport - Mobilité des communes - {name} ({dep_code})",
+                'path': str(output_dir / 'departements' / f'departement_{dep_code}.{fmt}'),
+            })
+
+    if include_regions:
+        reg_frame = _scope_frame(communes_df, 'REG')
+        for reg_code, group_index in communes_df.groupby('REG').groups.items():
+            name = region_names.get(reg_code, reg_code)
+            df = reg_frame.loc[group_index]
+            for fmt in formats:
+                tasks.append({
+                    **base, 'type': 'region', 'code': reg_code, 'name': name, 'format': fmt, 'df': df,
+                    'region': reg_code,
+                    'title': f"Rapport - Mobilité des communes - {name}",
+                    'path': str(output_dir / 'regions' / f'region_{reg_code}.{fmt}'),
+                })
+
+        if not regions_df.empty:
+            for fmt in formats:
+                tasks.append({
+                    **base, 'type': 'regions', 'code': 'FR', 'name': 'Synthèse régionale', 'format': fmt,
+                    'df': regions_df, 'title': None,
+                    'path': str(output_dir / f'regions_synthese.{fmt}'),
+                })
+
+    # Les plus gros fichiers d'abord pour équilibrer la charge entre processus
+    tasks.sort(key=lambda t: len(t['df']), reverse=True)
+    return tasks
+
+
+def run(output_dir, age_filter='', workers=None, formats=('pdf', 'csv'), departments=None,
+        include_regions=True):
+    """Génère tous les rapports et écrit le manifeste. Retourne le manifeste."""
+    started = time.perf_counter()
+    output_dir = Path(output_dir)
+    (output_dir / 'departements').mkdir(parents=True, exist_ok=True)
+    (output_dir / 'regions').mkdir(parents=True, exist_ok=True)
+
+    if 'pdf' in formats and not REPORTLAB_AVAILABLE:
+        print("reportlab n'est pas installé: seuls les CSV seront générés")
+        formats = tuple(f for f in formats if f != 'pdf')
+
+    print("Calcul des indicateurs (une seule passe)...")
+    communes_df, regions_df, stats = compute_indicator_tables(age_filter)
+    compute_seconds = time.perf_counter() - started
+    if communes_df.empty:
+        print("Aucune donnée de commune disponible")
+        return None
+    print(f"  {len(communes_df)} communes, {len(regions_df)} régions en {compute_seconds:.2f}s")
+
+    tasks = build_tasks(communes_df, regions_df, stats, output_dir, age_filter, formats,
+                        departments=departments, include_regions=include_regions)
+    workers = workers or os.cpu_count() or 1
+    print(f"Rendu de {len(tasks)} fichiers sur {workers} processus...")
+
+    render_started = time.perf_counter()
+    files = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_task, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+                files.append(result)
+                print(f"  ✓ {result['path']} ({result['rows']} lignes, {result['seconds']:.2f}s)")
+            except Exception as e:
+                errors.append({'type': task['type'], 'code': task['code'], 'format': task['format'], 'error': str(e)})
+                print(f"  ✗ {task['path']}: {e}")
+    render_seconds = time.perf_counter() - render_started
+
+    files.sort(key=lambda f: f['path'])
+    cpu_seconds = sum(f['cpu_seconds'] for f in files)
+    manifest = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'filters': {'age': age_filter},
+        'workers': workers,
+        'compute_seconds': round(compute_seconds, 3),
+        'render_seconds': round(render_seconds, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        # Temps CPU cumulé / temps réel: proche du nombre de processus si le passage à l'échelle est linéaire
+        'parallel_speedup': round(cpu_seconds / render_seconds, 2) if render_seconds > 0 else None,
+        'files': files,
+        'errors': errors,
+    }
+    with open(output_dir / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"Manifeste: {output_dir / 'manifest.json'}")
+    print(f"Terminé en {manifest['total_seconds']:.2f}s "
+          f"(rendu {render_seconds:.2f}s, accélération x{manifest['parallel_speedup']})")
+    return manifest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Génère les rapports PDF/CSV par département et par région")
+    parser.add_argument('--output-dir', default=str(root_dir / 'data' / 'processed' / 'reports' / datetime.now().strftime('%Y%m%d')),
+                        help="Répertoire de sortie (défaut: data/processed/reports/AAAAMMJJ)")
+    parser.add_argument('--age', default='', help="Filtre de tranche d'âge (ex: 19-35)")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut: nombre de cœurs)")
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'csv'], choices=['pdf', 'csv'])
+    parser.add_argument('--departments', nargs='*', default=None, help="Limiter à certains départements")
+    parser.add_argument('--no-regions', action='store_true', help="Ne pas générer les rapports régionaux")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    manifest = run(args.output_dir, age_filter=args.age, workers=args.workers,
+                   formats=tuple(args.formats), departments=args.departments,
+                   include_regions=not args.no_regions)
+    sys.exit(0 if manifest and not manifest['errors'] else 1)
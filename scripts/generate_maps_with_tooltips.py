@@ -1,369 +1,234 @@
 """
-Script pour régénérer les cartes statiques avec tooltips
+Script pour régénérer les cartes statiques de la page d'accueil
+
+Les indicateurs réels (prepare_communes_data) sont calculés une seule fois, puis
+les trois cartes sont rendues en parallèle dans des processus séparés:
+- static/map_communes.html: toutes les communes
+- static/map_zones_mal_desservies.html: communes + zones mal desservies
+- static/map_mobilite_verte.html: communes colorées selon la mobilité verte
+
+Un manifeste (data/processed/maps_manifest.json) garde pour chaque carte
+l'empreinte de ses entrées (version des données, du gazetteer et du code de
+rendu): une carte dont les entrées n'ont pas changé n'est pas régénérée.
+Les fichiers sont écrits de façon atomique (fichier temporaire puis os.replace),
+la page d'accueil ne sert donc jamais une carte à moitié écrite.
+
+Usage:
+    python scripts/generate_maps_with_tooltips.py
+    python scripts/generate_maps_with_tooltips.py --force --workers 2
 """
 
 import sys
 import os
+import argparse
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Ajouter le répertoire racine au path
 root_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(root_dir))
 
-import pandas as pd
 import folium
+from app.utils import render_cache
 from app.utils.data_loader import DataLoader
-from app.visualizations.maps import get_commune_coordinates, create_communes_map
+from app.utils.gazetteer import get_gazetteer_version
+from app.visualizations.maps import (
+    FRANCE_CENTER,
+    CommunesDataLayer,
+    add_underserved_layer,
+    build_communes_layer_data,
+    create_communes_map,
+    create_green_mobility_map,
+    locate_communes,
+)
 
-def generate_map_communes():
-    """Génère la carte des communes avec tooltips"""
-    print("Génération de la carte des communes...")
-    
-    data_loader = DataLoader()
-    communes_df = data_loader.load_communes_data()
-    
-    if communes_df.empty:
-        print("Aucune donnée de commune disponible")
-        return
-    
-    # Créer COMMUNE_CODE si nécessaire
-    if 'COMMUNE_CODE' not in communes_df.columns:
-        if 'COM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['COM'].astype(str).str.zfill(5)
-        elif 'CODCOM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['CODCOM'].astype(str).str.zfill(5)
-    
-    # Limiter le nombre de communes pour la performance (échantillon)
-    max_communes = 200
-    if len(communes_df) > max_communes:
-        communes_df = communes_df.sample(n=max_communes)
-        print(f"Échantillonnage: {max_communes} communes sur {len(data_loader.load_communes_data())}")
-    
-    # Créer la carte
-    m = folium.Map(
-        location=[46.2276, 2.2137],
-        zoom_start=6,
-        tiles='OpenStreetMap'
-    )
-    
-    # Identifier les colonnes
-    commune_col = 'COMMUNE_CODE' if 'COMMUNE_CODE' in communes_df.columns else None
-    if not commune_col:
-        for col in ['COM', 'CODCOM']:
-            if col in communes_df.columns:
-                commune_col = col
-                break
-    
-    name_col = None
-    for col in ['Commune', 'LIBGEO']:
-        if col in communes_df.columns:
-            name_col = col
-            break
-    
-    if not commune_col:
-        print("Colonne commune non trouvée")
-        return
-    
-    # Ajouter les marqueurs avec tooltips
-    added = 0
-    for idx, row in communes_df.iterrows():
-        try:
-            commune_code = str(row[commune_col]).zfill(5) if pd.notna(row.get(commune_col)) else None
-            if not commune_code or commune_code == '00000':
-                continue
-            
-            commune_name = str(row[name_col]) if name_col and pd.notna(row.get(name_col)) else commune_code
-            
-            lat, lon = get_commune_coordinates(commune_code, commune_name)
-            
-            if lat and lon:
-                # Créer le tooltip
-                tooltip_text = f"<b>{commune_name}</b>"
-                if 'PTOT' in row and pd.notna(row.get('PTOT')):
-                    tooltip_text += f"<br>Population: {int(row['PTOT']):,}"
-                
-                # Créer le popup avec plus d'infos
-                popup_html = f"""
-                <div style="min-width: 200px;">
-                    <h6 style="margin: 0 0 10px 0; font-weight: bold;">{commune_name}</h6>
-                    <p style="margin: 5px 0;"><strong>Code:</strong> {commune_code}</p>
-                """
-                if 'PTOT' in row and pd.notna(row.get('PTOT')):
-                    popup_html += f'<p style="margin: 5px 0;"><strong>Population:</strong> {int(row["PTOT"]):,}</p>'
-                popup_html += '</div>'
-                
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=6,
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=folium.Tooltip(tooltip_text, permanent=False),
-                    color='blue',
-                    fill=True,
-                    fillColor='blue',
-                    fillOpacity=0.7,
-                    weight=2
-                ).add_to(m)
-                added += 1
-        except Exception as e:
-            print(f"Erreur pour la ligne {idx}: {e}")
-            continue
-    
-    # Sauvegarder
-    output_path = root_dir / 'static' / 'map_communes.html'
-    m.save(str(output_path))
-    print(f"Carte des communes générée: {added} marqueurs -> {output_path}")
+STATIC_DIR = root_dir / 'static'
+MANIFEST_PATH = root_dir / 'data' / 'processed' / 'maps_manifest.json'
 
+# URL des popups servie par l'application (les cartes statiques sont servies par Flask)
+DEFAULT_POPUP_URL = '/visualizations/api/communes/__CODE__/popup'
 
-def generate_map_zones_mal_desservies():
-    """Génère la carte des zones mal desservies avec tooltips"""
-    print("Génération de la carte des zones mal desservies...")
-    
-    data_loader = DataLoader()
-    communes_df = data_loader.load_communes_data()
-    
+# Cartes à générer: nom -> fichier de sortie
+MAPS = {
+    'communes': 'map_communes.html',
+    'zones_mal_desservies': 'map_zones_mal_desservies.html',
+    'mobilite_verte': 'map_mobilite_verte.html',
+}
+
+# Code dont dépend le rendu: le script et les paquets qu'il importe (calcul des
+# indicateurs, positions, popups, cache). Toute modification invalide les cartes.
+CODE_PATHS = (
+    Path(__file__).resolve(),
+    root_dir / 'app' / 'routes',
+    root_dir / 'app' / 'utils',
+    root_dir / 'app' / 'visualizations',
+)
+
+
+def get_code_version() -> str:
+    """Empreinte du code de calcul et de rendu des cartes"""
+    return render_cache.get_code_version(*CODE_PATHS)
+
+
+def get_map_fingerprint(name: str, versions: dict, popup_url: str) -> str:
+    """Empreinte des entrées d'une carte"""
+    payload = json.dumps({'map': name, 'popup_url': popup_url, **versions}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path: Path, content: bytes):
+    """Écrit un fichier via un fichier temporaire du même répertoire puis os.replace"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def build_map(name: str, communes_df, popup_url: str):
+    """Construit la carte demandée (exécuté dans un processus de travail)"""
+    if name == 'communes':
+        # Toutes les communes, sans échelle de couleur
+        m = folium.Map(location=list(FRANCE_CENTER), zoom_start=6, tiles='OpenStreetMap')
+        name_col = 'Commune' if 'Commune' in communes_df.columns else None
+        coordinates = locate_communes(communes_df['COMMUNE_CODE'].fillna(''))
+        data = build_communes_layer_data(communes_df, 'COMMUNE_CODE', name_col, coordinates,
+                                         include_names=not popup_url)
+        CommunesDataLayer(data, color='blue', popup_url=popup_url or None).add_to(m)
+        return m, len(data['code'])
+
+    if name == 'zones_mal_desservies':
+        m = create_communes_map(communes_df, show_legend=True, render_mode='geojson',
+                                popup_url=popup_url or None)
+        return m, add_underserved_layer(m, communes_df, popup_url=popup_url or None)
+
+    if name == 'mobilite_verte':
+        m = create_green_mobility_map(communes_df, render_mode='geojson', popup_url=popup_url or None)
+        return m, int(communes_df['green_mobility_index'].notna().sum())
+
+    raise ValueError(f"Carte inconnue: {name}")
+
+
+def render_map(name: str, communes_df, output_path: str, popup_url: str) -> dict:
+    """Rend une carte et l'écrit de façon atomique"""
+    start = time.perf_counter()
+    m, count = build_map(name, communes_df, popup_url)
+    html = m.get_root().render().encode('utf-8')
+    write_atomic(Path(output_path), html)
+    return {'name': name, 'count': count, 'size': len(html), 'seconds': time.perf_counter() - start}
+
+
+def prepare_indicators():
+    """Calcule les indicateurs réels de toutes les communes (une seule fois)"""
+    from app.routes.export import prepare_communes_data
+
+    communes_df = prepare_communes_data('', '', '')
     if communes_df.empty:
-        print("Aucune donnée de commune disponible")
-        return
-    
-    # Créer COMMUNE_CODE si nécessaire
-    if 'COMMUNE_CODE' not in communes_df.columns:
-        if 'COM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['COM'].astype(str).str.zfill(5)
-        elif 'CODCOM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['CODCOM'].astype(str).str.zfill(5)
-    
-    # Simuler des zones mal desservies (exemple: communes avec population < 1000)
-    if 'PTOT' in communes_df.columns:
-        communes_df['is_underserved'] = communes_df['PTOT'] < 1000
-    else:
-        communes_df['is_underserved'] = False
-    
-    # Limiter le nombre
-    underserved = communes_df[communes_df['is_underserved'] == True]
-    if len(underserved) > 100:
-        underserved = underserved.sample(n=100)
-    
-    # Créer la carte
-    m = folium.Map(
-        location=[46.2276, 2.2137],
-        zoom_start=6,
-        tiles='OpenStreetMap'
-    )
-    
-    # Identifier les colonnes
-    commune_col = 'COMMUNE_CODE' if 'COMMUNE_CODE' in communes_df.columns else None
-    if not commune_col:
-        for col in ['COM', 'CODCOM']:
-            if col in communes_df.columns:
-                commune_col = col
-                break
-    
-    name_col = None
-    for col in ['Commune', 'LIBGEO']:
-        if col in communes_df.columns:
-            name_col = col
-            break
-    
-    # Ajouter les marqueurs
-    added = 0
-    for idx, row in underserved.iterrows():
-        try:
-            commune_code = str(row[commune_col]).zfill(5) if pd.notna(row.get(commune_col)) else None
-            if not commune_code or commune_code == '00000':
-                continue
-            
-            commune_name = str(row[name_col]) if name_col and pd.notna(row.get(name_col)) else commune_code
-            lat, lon = get_commune_coordinates(commune_code, commune_name)
-            
-            if lat and lon:
-                tooltip_text = f"<b>{commune_name}</b><br>Zone mal desservie"
-                if 'PTOT' in row and pd.notna(row.get('PTOT')):
-                    tooltip_text += f"<br>Population: {int(row['PTOT']):,}"
-                
-                popup_html = f"<b>{commune_name}</b><br>Zone mal desservie"
-                if 'PTOT' in row and pd.notna(row.get('PTOT')):
-                    popup_html += f"<br>Population: {int(row['PTOT']):,}"
-                
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=10,
-                    popup=folium.Popup(popup_html, max_width=200),
-                    tooltip=folium.Tooltip(tooltip_text, permanent=False),
-                    color='red',
-                    fill=True,
-                    fillColor='red',
-                    fillOpacity=0.5,
-                    weight=3
-                ).addTo(m)
-                added += 1
-        except Exception as e:
-            print(f"Erreur pour la ligne {idx}: {e}")
-            continue
-    
-    # Sauvegarder
-    output_path = root_dir / 'static' / 'map_zones_mal_desservies.html'
-    m.save(str(output_path))
-    print(f"Carte des zones mal desservies générée: {added} marqueurs -> {output_path}")
+        return communes_df
+
+    # Résoudre les coordonnées une fois: les codes absents du gazetteer sont
+    # géocodés ici et mis en cache, les processus de travail lisent ce cache
+    located = locate_communes(communes_df['COMMUNE_CODE'].fillna(''))
+    print(f"Communes localisées: {located['lat'].notna().sum()}/{len(located)}")
+    return communes_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère les cartes statiques de la page d'accueil")
+    parser.add_argument('--force', action='store_true',
+                        help="Régénérer toutes les cartes même si leurs entrées n'ont pas changé")
+    parser.add_argument('--workers', type=int, default=len(MAPS),
+                        help='Nombre de processus de rendu (défaut: une par carte)')
+    parser.add_argument('--only', choices=list(MAPS), action='append',
+                        help='Ne générer que cette carte (option répétable)')
+    parser.add_argument('--popup-url', default=DEFAULT_POPUP_URL,
+                        help="URL des popups chargés au clic ('' pour embarquer les noms dans la carte)")
+    args = parser.parse_args()
 
+    print("Génération des cartes statiques...")
+    print("=" * 50)
 
-def generate_map_mobilite_verte():
-    """Génère la carte de mobilité verte avec tooltips"""
-    print("Génération de la carte de mobilité verte...")
-    
     data_loader = DataLoader()
-    communes_df = data_loader.load_communes_data()
-    
-    if communes_df.empty:
-        print("Aucune donnée de commune disponible")
-        return
-    
-    # Créer COMMUNE_CODE si nécessaire
-    if 'COMMUNE_CODE' not in communes_df.columns:
-        if 'COM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['COM'].astype(str).str.zfill(5)
-        elif 'CODCOM' in communes_df.columns:
-            communes_df['COMMUNE_CODE'] = communes_df['CODCOM'].astype(str).str.zfill(5)
-    
-    # Simuler un indice de mobilité verte (exemple basé sur la population)
-    if 'PTOT' in communes_df.columns:
-        max_pop = communes_df['PTOT'].max()
-        communes_df['green_mobility_index'] = (communes_df['PTOT'] / max_pop * 100).round(1)
-    else:
-        communes_df['green_mobility_index'] = 50.0
-    
-    # Limiter le nombre
-    max_communes = 200
-    if len(communes_df) > max_communes:
-        communes_df = communes_df.sample(n=max_communes)
-    
-    # Créer la carte
-    m = folium.Map(
-        location=[46.2276, 2.2137],
-        zoom_start=6,
-        tiles='OpenStreetMap'
-    )
-    
-    # Identifier les colonnes
-    commune_col = 'COMMUNE_CODE' if 'COMMUNE_CODE' in communes_df.columns else None
-    if not commune_col:
-        for col in ['COM', 'CODCOM']:
-            if col in communes_df.columns:
-                commune_col = col
-                break
-    
-    name_col = None
-    for col in ['Commune', 'LIBGEO']:
-        if col in communes_df.columns:
-            name_col = col
-            break
-    
-    # Calculer min/max pour les couleurs
-    green_values = communes_df['green_mobility_index'].dropna()
-    if len(green_values) > 0:
-        min_green = float(green_values.min())
-        max_green = float(green_values.max())
-    else:
-        min_green, max_green = 0, 100
-    
-    def get_color(value):
-        if pd.isna(value):
-            return 'blue'
-        if max_green == min_green:
-            return 'green'
-        normalized = (value - min_green) / (max_green - min_green)
-        if normalized < 0.33:
-            return 'red'
-        elif normalized < 0.66:
-            return 'orange'
-        else:
-            return 'green'
-    
-    # Ajouter les marqueurs
-    added = 0
-    for idx, row in communes_df.iterrows():
-        try:
-            commune_code = str(row[commune_col]).zfill(5) if pd.notna(row.get(commune_col)) else None
-            if not commune_code or commune_code == '00000':
-                continue
-            
-            commune_name = str(row[name_col]) if name_col and pd.notna(row.get(name_col)) else commune_code
-            lat, lon = get_commune_coordinates(commune_code, commune_name)
-            
-            if lat and lon:
-                green_index = row.get('green_mobility_index', 0)
-                color = get_color(green_index)
-                
-                tooltip_text = f"<b>{commune_name}</b>"
-                if pd.notna(green_index):
-                    tooltip_text += f"<br>Mobilité Verte: {green_index:.1f}%"
-                
-                popup_html = f"""
-                <div style="min-width: 200px;">
-                    <h6 style="margin: 0 0 10px 0; font-weight: bold;">{commune_name}</h6>
-                    <p style="margin: 5px 0;"><strong>Code:</strong> {commune_code}</p>
-                """
-                if 'PTOT' in row and pd.notna(row.get('PTOT')):
-                    popup_html += f'<p style="margin: 5px 0;"><strong>Population:</strong> {int(row["PTOT"]):,}</p>'
-                if pd.notna(green_index):
-                    popup_html += f'<p style="margin: 5px 0;"><strong>Mobilité Verte:</strong> {green_index:.1f}%</p>'
-                popup_html += '</div>'
-                
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=6,
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=folium.Tooltip(tooltip_text, permanent=False),
-                    color=color,
-                    fill=True,
-                    fillColor=color,
-                    fillOpacity=0.7,
-                    weight=2
-                ).add_to(m)
-                added += 1
-        except Exception as e:
-            print(f"Erreur pour la ligne {idx}: {e}")
+    versions = {
+        'data_version': data_loader.get_data_version(),
+        'gazetteer_version': get_gazetteer_version(),
+        'code_version': get_code_version(),
+    }
+    print(f"Versions: données {versions['data_version']}, code {versions['code_version']}")
+
+    manifest = load_manifest()
+    todo = {}
+    for name in args.only or MAPS:
+        output_path = STATIC_DIR / MAPS[name]
+        fingerprint = get_map_fingerprint(name, versions, args.popup_url)
+        entry = manifest.get(name, {})
+        if not args.force and entry.get('fingerprint') == fingerprint and output_path.exists():
+            print(f"  {MAPS[name]}: à jour, ignorée")
             continue
-    
-    # Ajouter une légende
-    legend_html = f'''
-    <div style="position: fixed; 
-                bottom: 50px; left: 50px; width: 220px; height: 140px; 
-                background-color: white; border:2px solid grey; z-index:9999; 
-                font-size:14px; padding: 10px; border-radius: 5px; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">
-    <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px;">Légende</p>
-    <p style="margin: 5px 0;"><span style="color:green; font-size: 20px;">●</span> Mobilité Verte Élevée ({max_green:.1f}%)</p>
-    <p style="margin: 5px 0;"><span style="color:orange; font-size: 20px;">●</span> Mobilité Verte Moyenne</p>
-    <p style="margin: 5px 0;"><span style="color:red; font-size: 20px;">●</span> Mobilité Verte Faible ({min_green:.1f}%)</p>
-    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">Survolez un marqueur pour plus d'infos</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-    
-    # Sauvegarder
-    output_path = root_dir / 'static' / 'map_mobilite_verte.html'
-    m.save(str(output_path))
-    print(f"Carte de mobilité verte générée: {added} marqueurs -> {output_path}")
+        todo[name] = (output_path, fingerprint)
 
+    if not todo:
+        print("✅ Toutes les cartes sont à jour")
+        return 0
 
-if __name__ == '__main__':
-    print("Génération des cartes avec tooltips...")
-    print("=" * 50)
-    
-    try:
-        generate_map_communes()
-        print()
-        generate_map_zones_mal_desservies()
-        print()
-        generate_map_mobilite_verte()
-        print()
-        print("=" * 50)
-        print("✅ Toutes les cartes ont été générées avec succès!")
-    except Exception as e:
-        print(f"❌ Erreur: {e}")
-        import traceback
-        traceback.print_exc()
+    start = time.perf_counter()
+    communes_df = prepare_indicators()
+    if communes_df.empty:
+        print("❌ Aucune donnée de commune disponible")
+        return 1
+    print(f"Indicateurs calculés pour {len(communes_df)} communes en {time.perf_counter() - start:.1f}s")
+    if not versions['gazetteer_version']:
+        print("⚠️  Gazetteer absent: communes placées au centre de leur département "
+              "(générer avec scripts/build_commune_gazetteer.py)")
 
+    failed = []
+    workers = max(1, min(args.workers, len(todo)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(render_map, name, communes_df, str(output_path), args.popup_url): name
+            for name, (output_path, _) in todo.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"  ❌ {MAPS[name]}: {e}")
+                failed.append(name)
+                continue
+            manifest[name] = {
+                'file': MAPS[name],
+                'fingerprint': todo[name][1],
+                'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'communes': result['count'],
+                **versions,
+            }
+            print(f"  {MAPS[name]}: {result['count']} communes, "
+                  f"{result['size'] / 1024:.0f} Ko en {result['seconds']:.1f}s")
 
+    write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8'))
 
+    print("=" * 50)
+    print(f"Durée totale: {time.perf_counter() - start:.1f}s")
+    if failed:
+        print(f"❌ {len(failed)} carte(s) en erreur")
+        return 1
+    print("✅ Toutes les cartes ont été générées avec succès!")
+    return 0
 
 
+if __name__ == '__main__':
+    sys.exit(main())
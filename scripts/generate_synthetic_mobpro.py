@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Génération de fichiers MOBPRO synthétiques pour les tests de montée en charge
+
+Produit un fichier au schéma de l'extrait réel (COMMUNE, DCLT, TRANS, AGEREVQ,
+IPONDI, ILTUU), au format décodé (libellés, comme Commune_1001-13101_2.csv) ou
+brut (codes, comme Commune_1001-13101.csv):
+
+- les distributions sont apprises sur l'extrait source: loi jointe du mode de
+  transport, de la tranche d'âge, de l'indicateur ILTUU et du lieu de travail
+  (même commune, même département, autre département), par classe de
+  population de la commune de résidence (les communes rurales et les grandes
+  villes n'ont pas les mêmes parts modales), et distribution des poids IPONDI;
+- les codes communes viennent de ensemble/donnees_communes.csv: chaque commune
+  reçoit un nombre de lignes proportionnel à sa population, et les lieux de
+  travail hors de la commune sont tirés au prorata de la population (dans le
+  département, ou dans toute la France);
+- l'échelle 1× applique à toutes les communes retenues la densité de l'extrait
+  source (lignes par habitant): avec --departments limité aux départements de
+  l'extrait, 1× en reproduit la taille. Échelles de 1× à 50×;
+- les lignes sont écrites par blocs (--chunk-rows): la mémoire ne dépend pas
+  de l'échelle.
+
+Le fichier est écrit dans une racine de données autonome (le nom de fichier
+attendu par DataLoader, et un lien vers ensemble/): l'application et les
+benchmarks l'utilisent avec DATA_ROOT.
+
+Usage:
+    python scripts/generate_synthetic_mobpro.py --scale 1
+    python scripts/generate_synthetic_mobpro.py --scale 10 --output-root data/synthetic/x10 --seed 7
+    python scripts/generate_synthetic_mobpro.py --scale 1 --departments 01 02 03 --format raw
+    DATA_ROOT=data/synthetic/x10 python scripts/benchmark.py run --output bench/x10.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+import pandas as pd
+
+MOBPRO_DIR = root_dir / 'data' / 'RP2021_mobpro'
+
+# Extraits sources possibles, par ordre de préférence
+SOURCE_CANDIDATES = (
+    MOBPRO_DIR / 'Commune_1001-13101_2.csv',
+    MOBPRO_DIR / 'Commune_1001-13101.csv',
+    MOBPRO_DIR / 'Commune_1001-1004_2.csv',
+    MOBPRO_DIR / 'Commune_1001-1004.csv',
+)
+
+# Noms de fichier lus par DataLoader selon le format
+OUTPUT_NAMES = {'decoded': 'Commune_1001-13101_2.csv', 'raw': 'Commune_1001-13101.csv'}
+
+MOBPRO_COLUMNS = ['COMMUNE', 'DCLT', 'TRANS', 'AGEREVQ', 'IPONDI', 'ILTUU']
+CATEGORY_COLUMNS = ['TRANS', 'AGEREVQ', 'ILTUU']
+
+# Largeur des codes dans varmod_mobpro_2021.csv (voir script.py)
+CODE_WIDTHS = {'TRANS': 1, 'AGEREVQ': 3, 'ILTUU': 1}
+
+# Lieu de travail: 0 même commune, 1 même département, 2 autre département
+LOCALITY_LABELS = ('même commune', 'même département', 'autre département')
+
+# Bornes inférieures des classes de population des communes de résidence
+POPULATION_CLASSES = (0, 2000, 10000, 50000)
+
+# Lignes minimales pour utiliser la distribution d'une classe (sinon distribution globale)
+MIN_CLASS_ROWS = 500
+
+# Taille de l'échantillon des poids IPONDI
+IPONDI_POOL_SIZE = 200_000
+
+MIN_SCALE, MAX_SCALE = 1, 50
+
+
+def department_of(codes: pd.Series) -> pd.Series:
+    """Département d'un code commune (3 caractères outre-mer, 2A/2B en Corse)"""
+    codes = codes.astype(str)
+    return pd.Series(np.where(codes.str.startswith('97'), codes.str[:3], codes.str[:2]), index=codes.index)
+
+
+def commune_codes(values: pd.Series, decoded: bool) -> pd.Series:
+    """Codes communes sur 5 caractères depuis COMMUNE/DCLT ("Nom (01001)" ou 1001)"""
+    if decoded:
+        return values.astype(str).str.extract(r'\(([0-9AB]{5})\)\s*$', expand=False)
+    return values.astype(str).str.strip().str.zfill(5)
+
+
+def population_class(population) -> np.ndarray:
+    """Indice de classe de population (-1 si inconnue)"""
+    population = np.asarray(population, dtype=float)
+    classes = np.searchsorted(POPULATION_CLASSES, np.nan_to_num(population, nan=-1), side='right') - 1
+    return np.where(np.isnan(population), -1, classes)
+
+
+def detect_decoded(path: Path) -> bool:
+    """Format décodé si les communes sont des libellés "Nom (code)" """
+    sample = pd.read_csv(path, usecols=['COMMUNE'], nrows=100)
+    return bool(sample['COMMUNE'].astype(str).str.contains(r'\(', regex=True).any())
+
+
+def load_communes(path: Path) -> pd.DataFrame:
+    """Référentiel des communes (COM, nom, DEP, population), trié par code"""
+    df = pd.read_csv(path, sep=';', dtype={'COM': str, 'DEP': str}, encoding='utf-8')
+    df = df[['COM', 'Commune', 'DEP', 'PTOT']].dropna(subset=['COM']).drop_duplicates('COM')
+    df['COM'] = df['COM'].str.zfill(5)
+    df['PTOT'] = pd.to_numeric(df['PTOT'], errors='coerce').fillna(0)
+    return df.sort_values(['DEP', 'COM']).reset_index(drop=True)
+
+
+def learn_distributions(source: Path, decoded: bool, population_by_code: pd.Series,
+                        rng: np.random.Generator, chunk_rows: int) -> dict:
+    """
+    Apprend les distributions de l'extrait source (lu par blocs).
+
+    Returns:
+        Dictionnaire: combos (DataFrame TRANS/AGEREVQ/ILTUU/locality), probabilities
+        (classe -> vecteur sur combos, 'global' compris), ipondi (échantillon),
+        density (lignes par habitant), rows
+    """
+    counts = []
+    ipondi_samples = []
+    rows = 0
+    home_communes = set()
+
+    for chunk in pd.read_csv(source, usecols=MOBPRO_COLUMNS, dtype=str, chunksize=chunk_rows):
+        chunk = chunk.dropna(subset=MOBPRO_COLUMNS)
+        home = commune_codes(chunk['COMMUNE'], decoded)
+        work = commune_codes(chunk['DCLT'], decoded)
+        chunk = chunk.assign(
+            locality=np.where(home == work, 0, np.where(department_of(home) == department_of(work), 1, 2)),
+            population_class=population_class(home.map(population_by_code)),
+        )
+        counts.append(chunk.groupby(['population_class', *CATEGORY_COLUMNS, 'locality']).size())
+
+        ipondi = pd.to_numeric(chunk['IPONDI'], errors='coerce').dropna().to_numpy()
+        ipondi_samples.append(rng.choice(ipondi, size=min(len(ipondi), IPONDI_POOL_SIZE // 10), replace=False))
+        home_communes.update(home.dropna().unique())
+        rows += len(chunk)
+
+    if rows == 0:
+        raise ValueError(f"Extrait source vide: {source}")
+
+    table = pd.concat(counts).groupby(level=list(range(5))).sum()
+    by_combo = table.unstack('population_class', fill_value=0)
+    combos = by_combo.index.to_frame(index=False)
+
+    probabilities = {'global': by_combo.sum(axis=1).to_numpy(dtype=float)}
+    for klass in range(len(POPULATION_CLASSES)):
+        if klass in by_combo.columns and by_combo[klass].sum() >= MIN_CLASS_ROWS:
+            probabilities[klass] = by_combo[klass].to_numpy(dtype=float)
+    probabilities = {key: value / value.sum() for key, value in probabilities.items()}
+
+    # Densité: lignes par habitant des communes de résidence présentes dans le référentiel
+    known = [code for code in home_communes if code in population_by_code.index]
+    population = population_by_code.loc[known].sum()
+    if population <= 0:
+        raise ValueError("Aucune commune de l'extrait source n'est dans le référentiel des communes")
+
+    ipondi = np.concatenate(ipondi_samples)
+    if len(ipondi) > IPONDI_POOL_SIZE:
+        ipondi = rng.choice(ipondi, size=IPONDI_POOL_SIZE, replace=False)
+
+    return {
+        'combos': combos,
+        'probabilities': probabilities,
+        'ipondi': ipondi,
+        'density': rows / population,
+        'rows': rows,
+        'source_population': population,
+    }
+
+
+def load_varmod_labels(path: Path) -> dict:
+    """Libellés des modalités (COD_VAR -> {code: libellé}) depuis varmod_mobpro_2021.csv"""
+    df = pd.read_csv(path, sep=';', usecols=['COD_VAR', 'COD_MOD', 'LIB_MOD'], dtype=str).drop_duplicates()
+    return {column: df[df['COD_VAR'] == column].set_index('COD_MOD')['LIB_MOD'].to_dict()
+            for column in CATEGORY_COLUMNS}
+
+
+def convert_categories(combos: pd.DataFrame, to_decoded: bool, varmod_path: Path) -> pd.DataFrame:
+    """Convertit les modalités apprises vers l'autre format (codes <-> libellés)"""
+    if not varmod_path.exists():
+        raise ValueError(f"Conversion de format impossible sans {varmod_path}")
+    labels = load_varmod_labels(varmod_path)
+    combos = combos.copy()
+    for column in CATEGORY_COLUMNS:
+        if to_decoded:
+            mapping = labels[column]
+            values = combos[column].str.zfill(CODE_WIDTHS[column]).map(mapping)
+        else:
+            mapping = {label: code.lstrip('0') or '0' for code, label in labels[column].items()}
+            values = combos[column].map(mapping)
+        missing = combos.loc[values.isna(), column].unique()
+        if len(missing):
+            raise ValueError(f"Modalités {column} absentes de {varmod_path.name}: {', '.join(missing[:5])}")
+        combos[column] = values
+    return combos
+
+
+def prepare_output_root(output_root: Path, output_format: str) -> Path:
+    """Racine de données autonome: data/RP2021_mobpro/<fichier> et lien vers ensemble/"""
+    target_dir = output_root / 'data' / 'RP2021_mobpro'
+    target_dir.mkdir(parents=True, exist_ok=True)
+    ensemble = output_root / 'ensemble'
+    if not ensemble.exists():
+        try:
+            os.symlink((root_dir / 'ensemble').resolve(), ensemble, target_is_directory=True)
+        except OSError:
+            shutil.copytree(root_dir / 'ensemble', ensemble)
+    return target_dir / OUTPUT_NAMES[output_format]
+
+
+def generate(communes: pd.DataFrame, selected: np.ndarray, model: dict, scale: float, decoded: bool,
+             output_path: Path, rng: np.random.Generator, chunk_rows: int) -> dict:
+    """
+    Écrit le fichier synthétique par blocs de lignes.
+
+    Args:
+        communes: Référentiel trié par (DEP, COM): communes de résidence et lieux de travail possibles
+        selected: Positions (dans communes) des communes de résidence retenues
+
+    Returns:
+        Compteurs du fichier généré (lignes, tirages par combinaison)
+    """
+    codes = communes['COM'].to_numpy()
+    if decoded:
+        labels = (communes['Commune'].astype(str) + ' (' + communes['COM'] + ')').to_numpy()
+    else:
+        labels = np.array([str(int(code)) if code.isdigit() else code for code in codes], dtype=object)
+
+    # Tirage des lieux de travail au prorata de la population (segments contigus par département)
+    population = communes['PTOT'].to_numpy(dtype=float)
+    cumulative = np.cumsum(population)
+    departments, department_index = np.unique(communes['DEP'].to_numpy(), return_inverse=True)
+    department_total = np.bincount(department_index, weights=population, minlength=len(departments))
+    # Référentiel trié par département: population cumulée au début de chaque segment
+    first_positions = np.searchsorted(department_index, np.arange(len(departments)))
+    department_start = np.concatenate([[0.0], cumulative])[first_positions]
+
+    combos = model['combos']
+    trans = combos['TRANS'].to_numpy(dtype=object)
+    ages = combos['AGEREVQ'].to_numpy(dtype=object)
+    iltuu = combos['ILTUU'].to_numpy(dtype=object)
+    locality = combos['locality'].to_numpy()
+    probabilities = model['probabilities']
+    ipondi = model['ipondi']
+
+    # Lignes par commune de résidence
+    expected = model['density'] * scale * population[selected]
+    rows_per_commune = rng.poisson(expected)
+    classes = population_class(population[selected])
+
+    combo_counts = np.zeros(len(combos), dtype=np.int64)
+    written = 0
+    boundaries = np.searchsorted(np.cumsum(rows_per_commune), np.arange(chunk_rows, rows_per_commune.sum(), chunk_rows),
+                                 side='left') + 1
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        for block in np.split(np.arange(len(selected)), boundaries):
+            if len(block) == 0:
+                continue
+            home = np.repeat(selected[block], rows_per_commune[block])
+            home_class = np.repeat(classes[block], rows_per_commune[block])
+            n = len(home)
+            if n == 0:
+                continue
+
+            combo = np.empty(n, dtype=np.int64)
+            for klass in np.unique(home_class):
+                mask = home_class == klass
+                p = probabilities.get(int(klass), probabilities['global'])
+                combo[mask] = rng.choice(len(p), size=int(mask.sum()), p=p)
+            combo_counts += np.bincount(combo, minlength=len(combos))
+
+            work = home.copy()
+            same_department = locality[combo] == 1
+            elsewhere = locality[combo] == 2
+            if same_department.any():
+                dep = department_index[home[same_department]]
+                target = department_start[dep] + rng.random(int(same_department.sum())) * department_total[dep]
+                work[same_department] = np.searchsorted(cumulative, target, side='right')
+            if elsewhere.any():
+                target = rng.random(int(elsewhere.sum())) * cumulative[-1]
+                work[elsewhere] = np.searchsorted(cumulative, target, side='right')
+            work = np.minimum(work, len(codes) - 1)
+
+            weights = ipondi[rng.integers(len(ipondi), size=n)]
+            frame = pd.DataFrame({
+                'COMMUNE': labels[home],
+                'DCLT': labels[work],
+                'TRANS': trans[combo],
+                'AGEREVQ': ages[combo],
+                'IPONDI': weights.round(2) if decoded else weights,
+                'ILTUU': iltuu[combo],
+            })
+            if decoded:
+                # Index numéroté comme dans le fichier produit par script.py
+                frame.index = pd.RangeIndex(written, written + n)
+            frame.to_csv(f, header=written == 0, index=decoded)
+            written += n
+            print(f"  {written:,} lignes écrites ({block[-1] + 1}/{len(selected)} communes)", flush=True)
+
+    return {'rows': written, 'combo_counts': combo_counts}
+
+
+def distribution_gaps(combos: pd.DataFrame, expected: np.ndarray, generated: np.ndarray) -> dict:
+    """Écart maximal (points de pourcentage) entre distributions marginales attendues et générées"""
+    gaps = {}
+    for column in ['TRANS', 'AGEREVQ', 'locality']:
+        expected_share = pd.Series(expected, index=combos[column]).groupby(level=0).sum()
+        generated_share = pd.Series(generated / max(generated.sum(), 1), index=combos[column]).groupby(level=0).sum()
+        gaps[column] = float((expected_share - generated_share).abs().max() * 100)
+    return gaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de fichiers MOBPRO synthétiques (tests de charge)")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f'Échelle: multiple de la densité de l\'extrait source ({MIN_SCALE} à {MAX_SCALE})')
+    parser.add_argument('--output-root', type=Path,
+                        help='Racine de données générée (défaut: data/synthetic/x<échelle>), à passer dans DATA_ROOT')
+    parser.add_argument('--source', type=Path,
+                        help='Extrait MOBPRO source (défaut: Commune_1001-13101_2.csv ou le plus grand disponible)')
+    parser.add_argument('--communes', type=Path, default=root_dir / 'ensemble' / 'donnees_communes.csv',
+                        help='Référentiel des communes (défaut: ensemble/donnees_communes.csv)')
+    parser.add_argument('--varmod', type=Path, default=MOBPRO_DIR / 'varmod_mobpro_2021.csv',
+                        help='Libellés des modalités (conversion entre formats brut et décodé)')
+    parser.add_argument('--departments', nargs='+', help='Départements de résidence générés (défaut: tous)')
+    parser.add_argument('--format', choices=sorted(OUTPUT_NAMES), help='Format du fichier (défaut: celui de la source)')
+    parser.add_argument('--seed', type=int, default=42, help='Graine aléatoire (défaut: 42)')
+    parser.add_argument('--chunk-rows', type=int, default=500_000, help='Lignes par bloc écrit (défaut: 500000)')
+    args = parser.parse_args()
+
+    if not MIN_SCALE <= args.scale <= MAX_SCALE:
+        print(f"❌ Échelle hors bornes: {args.scale} (attendu: {MIN_SCALE} à {MAX_SCALE})")
+        return 1
+
+    source = args.source or next((path for path in SOURCE_CANDIDATES if path.exists()), None)
+    if source is None or not source.exists():
+        print(f"❌ Aucun extrait MOBPRO source trouvé dans {MOBPRO_DIR}")
+        return 1
+    if not args.communes.exists():
+        print(f"❌ Référentiel des communes introuvable: {args.communes}")
+        return 1
+
+    start = time.time()
+    rng = np.random.default_rng(args.seed)
+    source_decoded = detect_decoded(source)
+    output_format = args.format or ('decoded' if source_decoded else 'raw')
+    output_root = args.output_root or root_dir / 'data' / 'synthetic' / f'x{args.scale:g}'
+
+    print("Génération d'un fichier MOBPRO synthétique...")
+    print("=" * 50)
+    print(f"Source: {source} (format {'décodé' if source_decoded else 'brut'})")
+
+    communes = load_communes(args.communes)
+    population_by_code = communes.set_index('COM')['PTOT']
+    try:
+        model = learn_distributions(source, source_decoded, population_by_code, rng, args.chunk_rows)
+        if (output_format == 'decoded') != source_decoded:
+            model['combos'] = convert_categories(model['combos'], output_format == 'decoded', args.varmod)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    classes = [key for key in model['probabilities'] if key != 'global']
+    print(f"Distributions apprises sur {model['rows']:,} lignes: {len(model['combos'])} combinaisons, "
+          f"classes de population {classes}, {model['density'] * 1000:.2f} lignes pour 1000 habitants")
+
+    selected = communes.index[communes['PTOT'] > 0]
+    if args.departments:
+        wanted = {dep.zfill(2) for dep in args.departments}
+        selected = selected[communes.loc[selected, 'DEP'].isin(wanted)]
+    if len(selected) == 0:
+        print("❌ Aucune commune retenue")
+        return 1
+    expected_rows = model['density'] * args.scale * communes.loc[selected, 'PTOT'].sum()
+    print(f"Communes de résidence: {len(selected):,}, environ {expected_rows:,.0f} lignes attendues "
+          f"(échelle {args.scale:g}×)")
+
+    output_path = prepare_output_root(output_root, output_format)
+    result = generate(communes, selected.to_numpy(), model, args.scale, output_format == 'decoded',
+                      output_path, rng, args.chunk_rows)
+
+    # Écarts aux distributions de la source, à mix de classes de population égal
+    selected_classes = population_class(communes.loc[selected, 'PTOT'].to_numpy())
+    class_weights = pd.Series(communes.loc[selected, 'PTOT'].to_numpy()).groupby(selected_classes).sum()
+    expected = sum(model['probabilities'].get(int(klass), model['probabilities']['global']) * weight
+                   for klass, weight in class_weights.items())
+    gaps = distribution_gaps(model['combos'], expected / expected.sum(), result['combo_counts'])
+
+    metadata = {
+        'source': str(source),
+        'source_rows': model['rows'],
+        'scale': args.scale,
+        'seed': args.seed,
+        'format': output_format,
+        'departments': args.departments or 'all',
+        'communes': int(len(selected)),
+        'rows': result['rows'],
+        'rows_per_1000_inhabitants': round(model['density'] * 1000 * args.scale, 3),
+        'distribution_gaps_pp': {column: round(gap, 3) for column, gap in gaps.items()},
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(output_path.parent / 'synthetic.json', 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    elapsed = time.time() - start
+    size_mb = output_path.stat().st_size / (1024 * 1024)
+    print("=" * 50)
+    print(f"Écart maximal aux distributions de la source (points): "
+          + ', '.join(f"{column} {gap:.2f}" for column, gap in gaps.items()))
+    print(f"✅ {result['rows']:,} lignes, {size_mb:.1f} Mo en {elapsed:.1f}s ({result['rows'] / elapsed:,.0f} lignes/s)")
+    print(f"   {output_path}")
+    print(f"   Utilisation: DATA_ROOT={output_root} python app.py")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
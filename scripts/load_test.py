@@ -0,0 +1,458 @@
+"""
+Test de charge: sessions d'analystes rejouées contre un serveur local
+
+Chaque session reproduit la navigation d'un utilisateur du tableau de bord:
+page d'accueil, page des communes (changements de filtres, pagination via
+/mobilite/api/communes, clics sur le détail d'une commune), vue régionale,
+graphiques et cartes (tableau de bord, images, tuiles, carte des communes) et,
+pour une partie des sessions, un export (CSV direct ou PDF asynchrone, suivi
+jusqu'au téléchargement). Les codes (régions, départements, communes) sont
+pris dans les réponses du serveur, comme le ferait la page.
+
+Deux modèles de charge:
+- fermé (--users N): N utilisateurs enchaînent des sessions, avec un temps de
+  réflexion entre les pages; le débit s'adapte à la latence du serveur;
+- ouvert (--arrival-rate R): des sessions arrivent selon un processus de
+  Poisson (R sessions/s), que le serveur suive ou non; le retard de démarrage
+  des sessions (--max-sessions atteint) signale la saturation.
+
+Rapport par endpoint: requêtes, débit, p50/p95/p99, erreurs (5xx et échecs de
+connexion) et réponses 4xx. Aucun service externe n'est utilisé: le serveur
+est celui de --url, ou un serveur local lancé par le script (--start-server).
+
+Usage:
+    python scripts/load_test.py --start-server --users 50 --duration 120
+    python scripts/load_test.py --url http://127.0.0.1:5000 --arrival-rate 2 --duration 300 --json charge.json
+    python scripts/load_test.py --start-server --users 10 --think-time 0 --export-rate 0
+"""
+
+import sys
+import os
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+# Tranches d'âge du filtre (voir DataLoader.map_age_filter_to_agerevq_values)
+AGE_FILTERS = ('0-18', '19-35', '36-50', '51-65', '65+')
+
+# Graphiques de la page des visualisations (voir chart_images.CHART_SPECS)
+CHART_NAMES = ('travel-time', 'bike-usage', 'public-transport', 'green-mobility-by-region', 'travel-time-by-region')
+
+# Tuiles de zoom 6 couvrant la France métropolitaine
+MAP_TILES = [(6, x, y) for x in (31, 32, 33) for y in (21, 22, 23)]
+
+# Lignes par page des tableaux (comme les pages communes et régions)
+PER_PAGE = 10
+
+# Percentiles rapportés
+PERCENTILES = (50, 95, 99)
+
+# Intervalle de suivi des exports asynchrones (s)
+EXPORT_POLL_INTERVAL = 0.5
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile par interpolation linéaire (values non vide)"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class Recorder:
+    """Mesures par endpoint (thread-safe); les requêtes terminées pendant la montée en charge sont ignorées"""
+
+    def __init__(self, record_after: float):
+        self.record_after = record_after
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.bytes = defaultdict(int)
+        self.session_delays = []
+        self.sessions = 0
+        self.first = None
+        self.last = None
+
+    def record(self, label: str, status: int, latency: float, size: int = 0):
+        now = time.time()
+        if now < self.record_after:
+            return
+        with self.lock:
+            self.latencies[label].append(latency)
+            self.statuses[label][status] += 1
+            self.bytes[label] += size
+            self.first = min(self.first or now - latency, now - latency)
+            self.last = max(self.last or now, now)
+
+    def session_done(self, start_delay: float = None):
+        """Session terminée; start_delay: retard de démarrage (modèle ouvert)"""
+        if time.time() < self.record_after:
+            return
+        with self.lock:
+            self.sessions += 1
+            if start_delay is not None:
+                self.session_delays.append(start_delay)
+
+    def report(self) -> dict:
+        """Statistiques par endpoint et globales"""
+        with self.lock:
+            elapsed = max((self.last or 0) - (self.first or 0), 1e-9)
+            endpoints = {}
+            for label in sorted(self.latencies):
+                latencies = self.latencies[label]
+                statuses = dict(self.statuses[label])
+                errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+                client_errors = sum(count for status, count in statuses.items() if 400 <= status < 500)
+                endpoints[label] = {
+                    'requests': len(latencies),
+                    'throughput_rps': round(len(latencies) / elapsed, 2),
+                    **{f'p{q}_ms': round(percentile(latencies, q) * 1000, 1) for q in PERCENTILES},
+                    'mean_ms': round(statistics.fmean(latencies) * 1000, 1),
+                    'max_ms': round(max(latencies) * 1000, 1),
+                    'errors': errors,
+                    'error_rate': round(errors / len(latencies), 4),
+                    'client_errors': client_errors,
+                    'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                    'kb': round(self.bytes[label] / 1024, 1),
+                }
+            all_latencies = [latency for values in self.latencies.values() for latency in values]
+            total = len(all_latencies)
+            errors = sum(endpoint['errors'] for endpoint in endpoints.values())
+            summary = {
+                'duration_s': round(elapsed, 1),
+                'requests': total,
+                'throughput_rps': round(total / elapsed, 2),
+                'sessions': self.sessions,
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else 0.0,
+            }
+            if all_latencies:
+                summary.update({f'p{q}_ms': round(percentile(all_latencies, q) * 1000, 1) for q in PERCENTILES})
+            if self.session_delays:
+                summary['session_start_delay_p95_ms'] = round(percentile(self.session_delays, 95) * 1000, 1)
+                summary['session_start_delay_max_ms'] = round(max(self.session_delays) * 1000, 1)
+            return {'summary': summary, 'endpoints': endpoints}
+
+
+class Catalog:
+    """Codes des filtres, découverts auprès du serveur (comme les listes déroulantes des pages)"""
+
+    def __init__(self, base_url: str, timeout: float):
+        http = requests.Session()
+        regions = http.get(f'{base_url}/mobilite/api/regions', params={'per_page': 100}, timeout=timeout)
+        regions.raise_for_status()
+        self.regions = [str(region['REG']) for region in regions.json().get('regions', [])]
+        self.departments = {}
+        for region in self.regions:
+            response = http.get(f'{base_url}/mobilite/api/departments', params={'region': region}, timeout=timeout)
+            if response.ok:
+                self.departments[region] = [str(d['DEP']) for d in response.json().get('departments', [])]
+        if not self.regions:
+            raise RuntimeError("Aucune région renvoyée par /mobilite/api/regions")
+
+    def random_filters(self, rng: random.Random) -> dict:
+        """Filtres choisis comme sur la page: région, puis éventuellement département, et tranche d'âge"""
+        filters = {}
+        if rng.random() < 0.6:
+            filters['region'] = rng.choice(self.regions)
+            departments = self.departments.get(filters['region'])
+            if departments and rng.random() < 0.4:
+                filters['department'] = rng.choice(departments)
+        if rng.random() < 0.4:
+            filters['age'] = rng.choice(AGE_FILTERS)
+        return filters
+
+
+class UserSession:
+    """Une session d'analyste: enchaînement de pages et d'appels API"""
+
+    def __init__(self, args, catalog: Catalog, recorder: Recorder, stop: threading.Event, rng: random.Random):
+        self.base_url = args.url.rstrip('/')
+        self.args = args
+        self.catalog = catalog
+        self.recorder = recorder
+        self.stop = stop
+        self.rng = rng
+        self.http = requests.Session()
+
+    def request(self, method: str, label: str, path: str, **kwargs):
+        """Envoie une requête et l'enregistre sous label (None en cas d'échec de connexion)"""
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.args.timeout, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(label, 0, time.perf_counter() - start)
+            return None
+        self.recorder.record(label, response.status_code, time.perf_counter() - start, len(response.content))
+        return response
+
+    def get(self, label: str, path: str, params: dict = None):
+        return self.request('GET', label, path, params=params)
+
+    def think(self) -> bool:
+        """Temps de réflexion entre deux pages; False si le test est terminé"""
+        if self.args.think_time > 0:
+            self.stop.wait(self.rng.expovariate(1 / self.args.think_time))
+        return not self.stop.is_set()
+
+    def run(self):
+        steps = [self.home, self.communes_page]
+        if self.rng.random() < 0.6:
+            steps.append(self.regions_page)
+        if self.rng.random() < 0.7:
+            steps.append(self.visualizations)
+        if self.rng.random() < self.args.export_rate:
+            steps.append(self.export)
+        for step in steps:
+            if not self.think():
+                return
+            step()
+
+    def home(self):
+        self.get('GET /', '/')
+
+    def communes_page(self):
+        self.get('GET /mobilite/communes', '/mobilite/communes')
+        self.communes_list({}, pages=1)
+        # Changements de filtres, pagination et clics sur des communes
+        for _ in range(self.rng.randint(1, 3)):
+            if not self.think():
+                return
+            filters = self.catalog.random_filters(self.rng)
+            if 'region' in filters:
+                self.get('GET /mobilite/api/departments', '/mobilite/api/departments', {'region': filters['region']})
+            self.communes_list(filters, pages=self.rng.randint(1, 4))
+
+    def communes_list(self, filters: dict, pages: int):
+        codes = []
+        for page in range(1, pages + 1):
+            response = self.get('GET /mobilite/api/communes', '/mobilite/api/communes',
+                                {'page': page, 'per_page': PER_PAGE, **filters})
+            if response is None or not response.ok:
+                return
+            data = response.json()
+            codes = [str(c.get('COM') or c.get('CODCOM')) for c in data.get('communes', [])]
+            if page >= data.get('total_pages', 1) or self.stop.is_set():
+                break
+        for code in self.rng.sample(codes, min(len(codes), self.rng.randint(0, 2))):
+            self.get('GET /mobilite/api/communes/<code>', f'/mobilite/api/communes/{code}', filters)
+
+    def regions_page(self):
+        self.get('GET /mobilite/regions', '/mobilite/regions')
+        age = {'age': self.rng.choice(AGE_FILTERS)} if self.rng.random() < 0.3 else {}
+        response = self.get('GET /mobilite/api/regions', '/mobilite/api/regions',
+                            {'page': 1, 'per_page': PER_PAGE, **age})
+        if response is not None and response.ok:
+            regions = [str(r['REG']) for r in response.json().get('regions', [])]
+            if regions:
+                code = self.rng.choice(regions)
+                self.get('GET /mobilite/api/regions/<code>', f'/mobilite/api/regions/{code}', age)
+
+    def visualizations(self):
+        filters = self.catalog.random_filters(self.rng) if self.rng.random() < 0.5 else {}
+        self.get('GET /visualizations/api/dashboard', '/visualizations/api/dashboard', filters)
+        for name in CHART_NAMES:
+            self.get('GET /visualizations/chart/<name>.png', f'/visualizations/chart/{name}.png', filters)
+        if not self.think():
+            return
+        if self.rng.random() < 0.3:
+            self.get('GET /visualizations/map/communes', '/visualizations/map/communes', filters)
+        else:
+            for z, x, y in self.rng.sample(MAP_TILES, 4):
+                self.get('GET /visualizations/tiles/<layer>/<z>/<x>/<y>',
+                         f'/visualizations/tiles/green_mobility/{z}/{x}/{y}', filters)
+
+    def export(self):
+        filters = self.catalog.random_filters(self.rng)
+        if self.rng.random() < 0.5:
+            self.get('GET /export/csv/communes', '/export/csv/communes', filters)
+            return
+
+        response = self.request('POST', 'POST /export/jobs', '/export/jobs', json={'type': 'pdf_communes', **filters})
+        if response is None or response.status_code not in (200, 202):
+            return
+        job_id = response.json()['job_id']
+        deadline = time.time() + self.args.timeout
+        while time.time() < deadline and not self.stop.is_set():
+            status = self.get('GET /export/jobs/<id>', f'/export/jobs/{job_id}')
+            if status is None or not status.ok:
+                return
+            if status.json().get('status') in ('done', 'failed'):
+                self.get('GET /export/jobs/<id>/download', f'/export/jobs/{job_id}/download')
+                return
+            self.stop.wait(EXPORT_POLL_INTERVAL)
+
+
+def run_closed(args, catalog: Catalog, recorder: Recorder, stop: threading.Event):
+    """Modèle fermé: args.users utilisateurs enchaînent des sessions jusqu'à la fin du test"""
+    def user(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        # Démarrages répartis sur la montée en charge
+        stop.wait(args.ramp_up * index / max(args.users, 1))
+        while not stop.is_set():
+            UserSession(args, catalog, recorder, stop, rng).run()
+            recorder.session_done()
+
+    threads = [threading.Thread(target=user, args=(i,), name=f'user-{i}', daemon=True) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_open(args, catalog: Catalog, recorder: Recorder, stop: threading.Event):
+    """Modèle ouvert: arrivées de Poisson à args.arrival_rate sessions/s, au plus args.max_sessions simultanées"""
+    executor = ThreadPoolExecutor(max_workers=args.max_sessions, thread_name_prefix='session')
+    rng = random.Random(args.seed)
+
+    def session(scheduled: float, seed: int):
+        if stop.is_set():
+            return
+        # Mesuré avant la session: attente d'un thread libre, sans la session elle-même
+        start_delay = time.time() - scheduled
+        UserSession(args, catalog, recorder, stop, random.Random(seed)).run()
+        recorder.session_done(start_delay)
+
+    def arrivals():
+        next_arrival = time.time()
+        while not stop.is_set():
+            # Retard de démarrage = attente d'un thread libre (saturation)
+            executor.submit(session, next_arrival, rng.getrandbits(32))
+            next_arrival += rng.expovariate(args.arrival_rate)
+            stop.wait(max(0.0, next_arrival - time.time()))
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    thread = threading.Thread(target=arrivals, name='arrivals', daemon=True)
+    thread.start()
+    return [thread]
+
+
+def start_server(args) -> subprocess.Popen:
+    """Lance l'application sur --url (serveur Flask multi-thread, sans rechargement automatique)"""
+    host, _, port = args.url.split('://', 1)[-1].rstrip('/').partition(':')
+    program = (f"from app import create_app; "
+               f"create_app().run(host={host!r}, port={int(port or 80)}, threaded=True, use_reloader=False)")
+    return subprocess.Popen([sys.executable, '-c', program], cwd=root_dir, env=os.environ.copy(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for_server(url: str, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f'{url}/health', timeout=2).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def print_report(report: dict):
+    summary = report['summary']
+    print(f"{'Endpoint':<48} {'req':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'4xx':>5}")
+    for label, stats in report['endpoints'].items():
+        print(f"{label:<48} {stats['requests']:>6} {stats['throughput_rps']:>7.2f} {stats['p50_ms']:>8.1f} "
+              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['error_rate'] * 100:>6.2f} "
+              f"{stats['client_errors']:>5}")
+    print()
+    print(f"Durée mesurée: {summary['duration_s']}s, {summary['sessions']} sessions, {summary['requests']} requêtes "
+          f"({summary['throughput_rps']} req/s)")
+    if summary['requests']:
+        print(f"Latence globale: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+    if 'session_start_delay_p95_ms' in summary:
+        print(f"Retard de démarrage des sessions: p95 {summary['session_start_delay_p95_ms']} ms, "
+              f"max {summary['session_start_delay_max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge: sessions d'analystes rejouées contre un serveur local")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='URL du serveur (défaut: http://127.0.0.1:5000)')
+    parser.add_argument('--start-server', action='store_true', help='Lancer l\'application sur --url pendant le test')
+    model = parser.add_mutually_exclusive_group()
+    model.add_argument('--users', type=int, help='Modèle fermé: nombre d\'utilisateurs simultanés (défaut: 10)')
+    model.add_argument('--arrival-rate', type=float, help='Modèle ouvert: sessions par seconde (arrivées de Poisson)')
+    parser.add_argument('--max-sessions', type=int, default=200,
+                        help='Modèle ouvert: sessions simultanées au plus (défaut: 200)')
+    parser.add_argument('--duration', type=float, default=60, help='Durée mesurée en secondes (défaut: 60)')
+    parser.add_argument('--ramp-up', type=float, default=10,
+                        help='Montée en charge en secondes, non mesurée (défaut: 10)')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='Temps de réflexion moyen entre deux pages, en secondes (défaut: 1.0, 0 pour enchaîner)')
+    parser.add_argument('--export-rate', type=float, default=0.1, help='Part des sessions avec un export (défaut: 0.1)')
+    parser.add_argument('--timeout', type=float, default=60, help='Délai maximal d\'une requête en secondes (défaut: 60)')
+    parser.add_argument('--seed', type=int, default=42, help='Graine aléatoire (défaut: 42)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Taux d\'erreurs (5xx, échecs) au-delà duquel le test échoue (défaut: 0.01)')
+    parser.add_argument('--json', help='Écrire le rapport dans ce fichier JSON')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    if args.users is None and args.arrival_rate is None:
+        args.users = 10
+
+    server = start_server(args) if args.start_server else None
+    try:
+        if not wait_for_server(args.url, 60 if server else 5):
+            print(f"❌ Serveur injoignable: {args.url}")
+            return 1
+        try:
+            catalog = Catalog(args.url, args.timeout)
+        except Exception as e:
+            print(f"❌ Impossible de lire les filtres: {e}")
+            return 1
+
+        workload = (f"modèle fermé, {args.users} utilisateurs" if args.users is not None
+                    else f"modèle ouvert, {args.arrival_rate} sessions/s (max {args.max_sessions} simultanées)")
+        print(f"Test de charge sur {args.url}: {workload}")
+        print(f"Montée en charge {args.ramp_up:g}s, mesure {args.duration:g}s, réflexion {args.think_time:g}s, "
+              f"exports {args.export_rate:.0%}")
+        print("=" * 50)
+
+        recorder = Recorder(record_after=time.time() + args.ramp_up)
+        stop = threading.Event()
+        threads = (run_closed if args.users is not None else run_open)(args, catalog, recorder, stop)
+        stop.wait(args.ramp_up + args.duration)
+        stop.set()
+        # Requêtes en cours terminées avant le rapport
+        for thread in threads:
+            thread.join(timeout=args.timeout)
+
+        report = recorder.report()
+        report['config'] = {k: v for k, v in vars(args).items() if k != 'json'}
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"Rapport écrit dans {args.json}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print("=" * 50)
+    summary = report['summary']
+    if summary['requests'] == 0:
+        print("❌ Aucune requête mesurée")
+        return 1
+    if summary['error_rate'] > args.max_error_rate:
+        print(f"❌ Taux d'erreurs {summary['error_rate']:.2%} > {args.max_error_rate:.2%}")
+        return 1
+    print(f"✅ Taux d'erreurs {summary['error_rate']:.2%} (seuil {args.max_error_rate:.2%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Profil du démarrage de l'application
+
+Lance un interpréteur neuf (python -X importtime) qui importe l'application,
+appelle create_app() puis sert une première requête (/health par défaut), et
+rapporte:
+- le temps d'import de chaque module (cumulé, modules les plus coûteux d'abord),
+- le temps d'import par paquet (temps propre cumulé: pandas, flask, ...),
+- les durées import de l'application, create_app et première réponse,
+- les bibliothèques lourdes chargées au démarrage (elles doivent l'être au
+  premier usage seulement: matplotlib, seaborn, folium, reportlab, requests).
+
+Le temps jusqu'à la première réponse est comparé à un budget (--budget-ms):
+le script échoue (code 1) si le budget est dépassé ou si une bibliothèque
+lourde est chargée au démarrage.
+
+Usage:
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --runs 5 --budget-ms 1500 --top 30
+    python scripts/profile_startup.py --url /mobilite/api/regions --json startup.json
+"""
+
+import sys
+import os
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+# Budget par défaut du temps jusqu'à la première réponse (interpréteur compris)
+DEFAULT_BUDGET_MS = 2000
+
+# Bibliothèques qui ne doivent être importées qu'au premier usage
+LAZY_MODULES = ('matplotlib', 'seaborn', 'folium', 'branca', 'reportlab', 'requests', 'scipy')
+
+# Programme exécuté dans l'interpréteur neuf: mesures en JSON sur la dernière ligne de stdout
+CHILD_PROGRAM = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get({url!r})
+answered = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_response_ms': (answered - created) * 1000,
+    'status': response.status_code,
+    'lazy_loaded': sorted(m for m in {lazy!r} if m in sys.modules),
+}}))
+'''
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def run_once(url: str) -> dict:
+    """Un démarrage dans un interpréteur neuf: mesures et lignes -X importtime"""
+    program = CHILD_PROGRAM.format(root=str(root_dir), url=url, lazy=LAZY_MODULES)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', program],
+                            cwd=root_dir, capture_output=True, text=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Démarrage en erreur (code {result.returncode}):\n{result.stderr[-2000:]}")
+
+    measures = json.loads(result.stdout.strip().splitlines()[-1])
+    measures['process_ms'] = total_ms
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({'module': name, 'depth': len(indent) // 2,
+                            'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+    measures['modules'] = modules
+    return measures
+
+
+def summarize_modules(modules: list, top: int) -> tuple:
+    """Modules les plus coûteux (cumulé) et temps propre par paquet de premier niveau"""
+    by_module = sorted(modules, key=lambda m: m['cumulative_ms'], reverse=True)[:top]
+    packages = defaultdict(float)
+    for module in modules:
+        packages[module['module'].split('.')[0]] += module['self_ms']
+    by_package = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return by_module, by_package
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profil du démarrage de l'application (imports et première réponse)")
+    parser.add_argument('--url', default='/health', help='Route de la première requête (défaut: /health)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Nombre de démarrages mesurés (la médiane est comparée au budget)')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'Budget du temps jusqu\'à la première réponse (défaut: {DEFAULT_BUDGET_MS} ms)')
+    parser.add_argument('--top', type=int, default=20, help='Nombre de modules et de paquets affichés')
+    parser.add_argument('--json', help='Écrire les mesures dans ce fichier JSON')
+    args = parser.parse_args()
+
+    print("Profil du démarrage de l'application...")
+    print("=" * 50)
+
+    runs = []
+    for i in range(max(1, args.runs)):
+        try:
+            runs.append(run_once(args.url))
+        except Exception as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"  Démarrage {i + 1}: {runs[-1]['process_ms']:.0f} ms jusqu'à la première réponse "
+              f"(statut {runs[-1]['status']})")
+
+    # Démarrage médian (au sens du temps total) pour le détail des imports
+    median_ms = statistics.median(run['process_ms'] for run in runs)
+    reference = min(runs, key=lambda run: abs(run['process_ms'] - median_ms))
+    by_module, by_package = summarize_modules(reference['modules'], args.top)
+
+    print()
+    print(f"Modules les plus coûteux (temps cumulé, {args.top} premiers):")
+    for module in by_module:
+        print(f"  {module['cumulative_ms']:8.1f} ms  {'  ' * module['depth']}{module['module']}")
+
+    print()
+    print("Temps d'import propre par paquet:")
+    for package, self_ms in by_package:
+        print(f"  {self_ms:8.1f} ms  {package}")
+
+    print()
+    print("Durées (démarrage médian):")
+    print(f"  Import de l'application: {reference['import_ms']:.0f} ms")
+    print(f"  create_app():            {reference['create_app_ms']:.0f} ms")
+    print(f"  Première réponse:        {reference['first_response_ms']:.0f} ms ({args.url})")
+    print(f"  Total (interpréteur compris): {median_ms:.0f} ms, budget {args.budget_ms:.0f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': args.url,
+                'budget_ms': args.budget_ms,
+                'median_ms': median_ms,
+                'runs': [{k: v for k, v in run.items() if k != 'modules'} for run in runs],
+                'modules': by_module,
+                'packages': [{'package': p, 'self_ms': ms} for p, ms in by_package],
+            }, f, indent=2, ensure_ascii=False)
+        print(f"Mesures écrites dans {args.json}")
+
+    print("=" * 50)
+    failed = False
+    if reference['lazy_loaded']:
+        print(f"❌ Bibliothèques chargées au démarrage au lieu du premier usage: {', '.join(reference['lazy_loaded'])}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"❌ Budget dépassé: {median_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        return 1
+    print(f"✅ Démarrage dans le budget ({median_ms:.0f} ms <= {args.budget_ms:.0f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())